@@ -1,8 +1,8 @@
 import csv
 import datetime
 import logging
-import tempfile
-from wsgiref.util import FileWrapper
+import re
+import zlib
 
 import dateutil
 import django
@@ -13,7 +13,7 @@ from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib.auth.models import User
 from django.db import IntegrityError
 from django.http import JsonResponse, HttpResponseForbidden, HttpResponse, HttpResponseBadRequest, \
-    HttpResponseNotFound
+    HttpResponseNotFound, HttpResponseRedirect, StreamingHttpResponse
 from django.utils.text import get_valid_filename
 from rest_framework import generics, status
 from rest_framework.decorators import api_view, renderer_classes
@@ -32,11 +32,12 @@ from forecast_app.serializers import ProjectSerializer, UserSerializer, Forecast
 from forecast_app.views import is_user_ok_edit_project, is_user_ok_edit_model, is_user_ok_create_model, \
     _upload_truth_worker, enqueue_delete_forecast, is_user_ok_delete_forecast, is_user_ok_create_project, \
     is_user_ok_view_project
-from forecast_repo.settings.base import QUERY_FORECAST_QUEUE_NAME
-from utils.forecast import json_io_dict_from_forecast
+from forecast_repo.settings.base import JOB_DATA_DOWNLOAD_MODE, QUERY_FORECAST_QUEUE_NAME
+from utils.forecast import json_io_dict_from_forecast, INGEST_MODE_DEFAULT, INGEST_MODES
 from utils.project import create_project_from_json, config_dict_from_project, latest_forecast_cols_for_project
 from utils.project_diff import execute_project_config_diff, project_config_diff
 from utils.project_queries import _forecasts_query_worker, _truth_query_worker
+from utils.query_cache import follow_leader_job, lookup_query_cache, query_cache_key, query_cache_output_json
 from utils.utilities import YYYY_MM_DD_DATE_FORMAT
 from utils.visualization import viz_cache_data
 
@@ -448,6 +449,9 @@ class ForecastModelForecastList(UserPassesTestMixin, generics.ListCreateAPIView)
         - 'timezero_date' (required): The TimeZero.timezero_date to use to look up the TimeZero to associate with the
             upload. The date format is utils.utilities.YYYY_MM_DD_DATE_FORMAT. The TimeZero must exist, and will not be
             created if one corresponding to 'timezero_date' isn't found.
+
+        - 'ingest_mode' (optional): one of `utils.forecast.INGEST_MODES`. 'streaming' loads the file using bounded
+            memory, which is useful for very large forecasts. defaults to 'default'
         """
         # todo xx merge below with views.upload_forecast() and views.validate_data_file()
 
@@ -499,6 +503,12 @@ class ForecastModelForecastList(UserPassesTestMixin, generics.ListCreateAPIView)
             return JsonResponse({'error': f"Bad 'format' value (was neither 'csv' nor 'json'): {data_format}."},
                                 status=status.HTTP_400_BAD_REQUEST)
 
+        # validate 'ingest_mode'
+        ingest_mode = request.data.get('ingest_mode', INGEST_MODE_DEFAULT)
+        if ingest_mode not in INGEST_MODES:
+            return JsonResponse({'error': f"Bad 'ingest_mode' value (must be one of {INGEST_MODES}): {ingest_mode}."},
+                                status=status.HTTP_400_BAD_REQUEST)
+
         # check for existing forecast for time_zero and the about-to-be-set issued_at by creating the new Forecast.
         # this will fail if there's already a version that matches the 'unique_version' constraint ('forecast_model',
         # 'time_zero', 'issued_at'). we pass the new Forecast's id through `_upload_file()` to
@@ -517,7 +527,7 @@ class ForecastModelForecastList(UserPassesTestMixin, generics.ListCreateAPIView)
 
         # upload to cloud and enqueue a job to process a new Job
         is_error, job = _upload_file(request.user, data_file, _upload_forecast_worker, type=JOB_TYPE_UPLOAD_FORECAST,
-                                     format=data_format, forecast_pk=new_forecast.pk)
+                                     format=data_format, forecast_pk=new_forecast.pk, ingest_mode=ingest_mode)
         if is_error:
             return JsonResponse({'error': f"There was an error uploading the file. The error was: '{is_error}'. "
                                           f"forecast_model={forecast_model}"},
@@ -878,21 +888,43 @@ def _query_endpoint(request, project_pk, query_validation_fcn, query_job_type, q
 
     query = request.data['query']
     logger.debug(f"query_forecasts_endpoint(): query={query}")
-    error_messages, _ = query_validation_fcn(project, query)
+    error_messages, validated_values = query_validation_fcn(project, query)
     if error_messages:
         return JsonResponse({'error': f"Invalid query. error_messages='{error_messages}', query={query}"},
                             status=status.HTTP_400_BAD_REQUEST)
 
-    job = _create_query_job(project_pk, query, query_job_type, query_worker_fcn, request)
+    # the query cache is keyed on the validated IDs, so it is bypassed if the validation function returned none
+    cache_key = query_cache_key(query_job_type, validated_values, query) if validated_values is not None else None
+    job = _create_query_job(project_pk, query, query_job_type, query_worker_fcn, request, cache_key)
     job_serializer = JobSerializer(job, context={'request': request})
-    logger.debug(f"query_forecasts_endpoint(): query enqueued. job={job}")
+    logger.debug(f"query_forecasts_endpoint(): query enqueued or completed from cache. job={job}")
     return JsonResponse(job_serializer.data)
 
 
-def _create_query_job(project_pk, query, query_job_type, query_worker_fcn, request):
+def _create_query_job(project_pk, query, query_job_type, query_worker_fcn, request, cache_key=None):
+    """
+    :param cache_key: optional key as returned by query_cache_key(). if passed, and the query cache has a result for
+        it, then the Job is completed immediately rather than being enqueued. similarly, if an identical query is
+        already queued or running, the Job follows it rather than being enqueued
+    """
+    is_hit, cache_entry = lookup_query_cache(project_pk, cache_key) if cache_key else (False, None)
     job = Job.objects.create(user=request.user)  # status = PENDING
     job.input_json = {'type': query_job_type, 'project_pk': project_pk, 'query': query}
+    if cache_entry:
+        job.input_json['cache_key'] = cache_key
+        job.output_json = {'query_cache': query_cache_output_json(cache_entry, is_hit)}
+    if is_hit:
+        job.output_json.update({'num_rows': cache_entry.num_rows, 'artifact_job_pk': cache_entry.job_id})
+        job.status = Job.SUCCESS
+        job.save()
+        return job
+
     job.save()
+    if cache_entry and follow_leader_job(cache_entry, job):  # an identical query is in flight. its worker completes job
+        job.status = Job.QUEUED
+        job.save()
+        return job
+
     queue = django_rq.get_queue(QUERY_FORECAST_QUEUE_NAME)
     queue.enqueue(query_worker_fcn, job.pk)
     job.status = Job.QUEUED
@@ -948,7 +980,7 @@ def download_job_data(request, pk):
     A note regarding Job "type": Currently there is no Job.type IV, so we have to infer it from Job.input_json, which
     will have a 'query' key if it was created by `query_forecasts_endpoint()`.
 
-    :return: a Job's data as CSV
+    :return: a Job's data in its query's output format (see utils.query_output), e.g., CSV
     """
     job = get_object_or_404(Job, pk=pk)
     if (not request.user.is_authenticated) or ((not request.user.is_superuser) and (not request.user == job.user)):
@@ -957,36 +989,146 @@ def download_job_data(request, pk):
     if (not isinstance(job.input_json, dict)) or ('query' not in job.input_json):
         return HttpResponseBadRequest(f"job.input_json did not contain a `query` key. job={job}")
 
-    return _download_job_data_request(job)
+    return _download_job_data_request(request, job)
+
+
+# the number of bytes that _download_job_data_request() reads from a job's file at a time
+JOB_DATA_DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
+# per django.middleware.gzip.GZipMiddleware
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
 
-def _download_job_data_request(job):
+# a single HTTP Range request: 'bytes=start-end', 'bytes=start-', or 'bytes=-suffix_length'
+BYTE_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _download_job_data_request(request, job):
     """
+    Returns a job's file without downloading all of it to the web process first. How depends on JOB_DATA_DOWNLOAD_MODE:
+    'redirect' redirects to a short-lived presigned URL that the client downloads from directly, and 'stream' relays the
+    file in chunks as it is read from the cloud.
+
+    Files that were gzipped when uploaded (see `_run_query_job()`) are served with a `Content-Encoding: gzip` header,
+    except to requests that do not accept that encoding, which are always streamed and decompressed on the fly.
+    Streamed files support single-range HTTP Range requests, except when they are decompressed. Like S3's, ranges are of
+    the file's stored (i.e., encoded) bytes.
+
+    :param request: the request, for its Accept-Encoding and Range headers
     :param job: a Job
-    :return: the data file corresponding to `job` as a CSV file
+    :return: the data file corresponding to `job`. query jobs' files have their query's output format (see
+        utils.query_output), and other jobs' files are CSV files
     """
     # imported here so that tests can patch via mock:
-    from utils.cloud_file import download_file, _file_name_for_object
+    from utils.cloud_file import is_file_exists, open_file, presigned_url, _file_name_for_object
+    from utils.query_output import OUTPUT_FORMATS, query_output_format
 
 
-    with tempfile.TemporaryFile() as cloud_file_fp:  # <class '_io.BufferedRandom'>
-        try:
-            download_file(job, cloud_file_fp)
-            cloud_file_fp.seek(0)  # yes you have to do this!
-
-            # https://stackoverflow.com/questions/16538210/downloading-files-from-amazon-s3-using-django
-            csv_filename = get_valid_filename(f'job-{_file_name_for_object(job)}-data.csv')
-            wrapper = FileWrapper(cloud_file_fp)
-            response = HttpResponse(wrapper, content_type='text/csv')
-            # response['Content-Length'] = os.path.getsize('/tmp/'+fname)
-            response['Content-Disposition'] = 'attachment; filename="{}"'.format(str(csv_filename))
-            return response
-        except (BotoCoreError, Boto3Error, ClientError, ConnectionClosedError) as aws_exc:
-            logger.debug(f"download_job_data(): AWS error: {aws_exc!r}. job={job}")
-            return HttpResponseNotFound(f"AWS error: {aws_exc!r}, job={job}")
-        except Exception as ex:
-            logger.debug(f"download_job_data(): error: {ex!r}. job={job}")
-            return HttpResponseNotFound(f"error downloading job data. ex={ex!r}, job={job}")
+    artifact_job = job.artifact_job()  # job's file might be another job's if it was completed from the query cache
+    if not artifact_job:
+        return HttpResponseNotFound(f"job's data was deleted. job={job}")
+
+    is_gzipped = (artifact_job.output_json or {}).get('content_encoding') == 'gzip'
+    is_pass_gzip = is_gzipped and bool(ACCEPTS_GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    is_accept_ranges = (not is_gzipped) or is_pass_gzip
+    content_type, file_extension = OUTPUT_FORMATS[query_output_format(artifact_job.input_json.get('query', {}))]
+    data_filename = get_valid_filename(f'job-{_file_name_for_object(job)}-data.{file_extension}')
+    content_disposition = 'attachment; filename="{}"'.format(str(data_filename))
+    try:
+        if (JOB_DATA_DOWNLOAD_MODE == 'redirect') and ((not is_gzipped) or is_pass_gzip):
+            return HttpResponseRedirect(presigned_url(artifact_job, content_type=content_type,
+                                                      content_disposition=content_disposition,
+                                                      content_encoding='gzip' if is_gzipped else None))
+
+        # errors opening the file are reported, but ones while streaming can't be
+        byte_range, size = None, None
+        if is_accept_ranges and ('HTTP_RANGE' in request.META):
+            is_exists, _, size = is_file_exists(artifact_job)[:3]  # S3 returns extra Nones if not is_exists
+            if not is_exists:
+                return HttpResponseNotFound(f"job's file was not found. job={job}")
+
+            byte_range = _byte_range(request.META['HTTP_RANGE'], size)
+            if byte_range and (byte_range[0] >= size):
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        cloud_file_fp = open_file(artifact_job, byte_range)
+    except (BotoCoreError, Boto3Error, ClientError, ConnectionClosedError) as aws_exc:
+        logger.debug(f"download_job_data(): AWS error: {aws_exc!r}. job={job}")
+        return HttpResponseNotFound(f"AWS error: {aws_exc!r}, job={job}")
+    except Exception as ex:
+        logger.debug(f"download_job_data(): error: {ex!r}. job={job}")
+        return HttpResponseNotFound(f"error downloading job data. ex={ex!r}, job={job}")
+
+    num_bytes = byte_range[1] - byte_range[0] + 1 if byte_range else None
+    response = StreamingHttpResponse(_job_file_chunks(cloud_file_fp, is_gzipped and not is_pass_gzip, num_bytes),
+                                     status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+                                     content_type=content_type)  # closes the generator, and therefore the file
+    if byte_range:
+        response['Content-Range'] = f'bytes {byte_range[0]}-{byte_range[1]}/{size}'
+        response['Content-Length'] = str(num_bytes)
+    if is_accept_ranges:
+        response['Accept-Ranges'] = 'bytes'
+    if is_pass_gzip:
+        response['Content-Encoding'] = 'gzip'
+    if is_gzipped:
+        response['Vary'] = 'Accept-Encoding'
+    response['Content-Disposition'] = content_disposition
+    return response
+
+
+def _byte_range(range_header, size):
+    """
+    _download_job_data_request() helper that parses an HTTP Range header.
+
+    :param range_header: a Range header's value
+    :param size: the number of bytes in the file
+    :return: a 2-tuple of inclusive byte offsets: (start, end), or None if range_header should be ignored, i.e., the
+        whole file returned, b/c it is invalid or requests multiple ranges. start >= size if the range is not
+        satisfiable
+    """
+    match = BYTE_RANGE_RE.match(range_header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+
+    if not match.group(1):  # suffix range: the last suffix_length bytes
+        suffix_length = int(match.group(2))
+        return (max(0, size - suffix_length), size - 1) if suffix_length and size else (size, size)
+
+    start = int(match.group(1))
+    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if match.group(2) and (int(match.group(2)) < start):
+        return None
+
+    return start, end
+
+
+def _job_file_chunks(cloud_file_fp, is_gunzip, num_bytes=None):
+    """
+    _download_job_data_request() helper that yields cloud_file_fp's bytes in chunks, closing it when done.
+
+    :param cloud_file_fp: as returned by open_file()
+    :param is_gunzip: True if the chunks should be decompressed from gzip
+    :param num_bytes: the number of bytes to read, or None to read to the end
+    """
+    # wbits=31 expects a gzip header and trailer rather than zlib's
+    decompressor = zlib.decompressobj(31) if is_gunzip else None
+    try:
+        while (num_bytes is None) or (num_bytes > 0):
+            chunk = cloud_file_fp.read(JOB_DATA_DOWNLOAD_CHUNK_SIZE if num_bytes is None
+                                       else min(JOB_DATA_DOWNLOAD_CHUNK_SIZE, num_bytes))
+            if not chunk:
+                break
+
+            if num_bytes is not None:
+                num_bytes -= len(chunk)
+            chunk = decompressor.decompress(chunk) if decompressor else chunk
+            if chunk:
+                yield chunk
+        if decompressor:
+            yield decompressor.flush()
+    finally:
+        cloud_file_fp.close()
 
 
 #
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.10 on 2026-10-16 09:12
+
+from django.db import migrations, models
+import forecast_app.models.project
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecast_app', '0025_pred_ele_target_meta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='config_version',
+            field=models.CharField(default=forecast_app.models.project.new_config_version, editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.10 on 2026-10-16 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecast_app', '0026_project_config_version'),
+    ]
+
+    operations = [
+        # existing rows were hashed with md5_json (0). new ones default to the current version (blake2b)
+        migrations.AddField(
+            model_name='predictionelement',
+            name='hash_version',
+            field=models.IntegerField(choices=[(0, 'md5_json'), (1, 'blake2b')], default=0),
+        ),
+        migrations.AlterField(
+            model_name='predictionelement',
+            name='hash_version',
+            field=models.IntegerField(choices=[(0, 'md5_json'), (1, 'blake2b')], default=1),
+        ),
+    ]
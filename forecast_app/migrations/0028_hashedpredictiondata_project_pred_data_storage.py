@@ -0,0 +1,27 @@
+# Generated by Django 4.1.10 on 2026-10-16 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecast_app', '0027_predictionelement_hash_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HashedPredictionData',
+            fields=[
+                ('data_hash', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('data', models.JSONField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='pred_data_storage',
+            field=models.IntegerField(choices=[(0, 'per_element'), (1, 'hashed')], default=0,
+                                      help_text="How new prediction data is stored. 'hashed' stores identical "
+                                                "prediction data only once."),
+        ),
+    ]
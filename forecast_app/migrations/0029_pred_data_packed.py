@@ -0,0 +1,30 @@
+# Generated by Django 4.1.10 on 2026-10-16 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecast_app', '0028_hashedpredictiondata_project_pred_data_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hashedpredictiondata',
+            name='packed',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='predictiondata',
+            name='packed',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='pred_data_encoding',
+            field=models.IntegerField(choices=[(0, 'json'), (1, 'packed')], default=0,
+                                      help_text="How new prediction data is encoded. 'packed' stores numeric lists as "
+                                                "arrays."),
+        ),
+    ]
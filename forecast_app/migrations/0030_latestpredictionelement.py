@@ -0,0 +1,63 @@
+# Generated by Django 4.1.10 on 2026-10-16 17:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+#
+# This file creates LatestPredictionElement and then populates it for existing forecasts. I edited the Django-generated
+# file to add the RunSQL, which does the same ranking as utils.project_queries._query_forecasts_sql_for_pred_class().
+# It may take a while on large databases.
+#
+
+POPULATE_SQL = """
+    INSERT INTO forecast_app_latestpredictionelement (pred_ele_id, forecast_model_id, time_zero_id, unit_id, target_id,
+                                                      pred_class)
+    SELECT ranked_rows.pred_ele_id, ranked_rows.fm_id, ranked_rows.tz_id, ranked_rows.unit_id, ranked_rows.target_id,
+           ranked_rows.pred_class
+    FROM (SELECT pred_ele.id          AS pred_ele_id,
+                 f.forecast_model_id  AS fm_id,
+                 f.time_zero_id       AS tz_id,
+                 pred_ele.unit_id     AS unit_id,
+                 pred_ele.target_id   AS target_id,
+                 pred_ele.pred_class  AS pred_class,
+                 RANK() OVER (
+                     PARTITION BY f.forecast_model_id, f.time_zero_id, pred_ele.unit_id, pred_ele.target_id, pred_ele.pred_class
+                     ORDER BY f.issued_at DESC) AS rownum
+          FROM forecast_app_predictionelement AS pred_ele
+                   JOIN forecast_app_forecast AS f ON pred_ele.forecast_id = f.id) AS ranked_rows
+    WHERE ranked_rows.rownum = 1;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecast_app', '0029_pred_data_packed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestPredictionElement',
+            fields=[
+                ('pred_ele', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                                  related_name='latest', serialize=False,
+                                                  to='forecast_app.predictionelement')),
+                ('pred_class', models.IntegerField(
+                    choices=[(0, 'bin'), (1, 'named'), (2, 'point'), (3, 'sample'), (4, 'quantile'), (5, 'mean'),
+                             (6, 'median'), (7, 'mode')])),
+                ('forecast_model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                                     to='forecast_app.forecastmodel')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='forecast_app.target')),
+                ('time_zero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                                to='forecast_app.timezero')),
+                ('unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='forecast_app.unit')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='latestpredictionelement',
+            constraint=models.UniqueConstraint(fields=('forecast_model', 'time_zero', 'unit', 'target', 'pred_class'),
+                                               name='unique_latest_pred_ele'),
+        ),
+        migrations.RunSQL(POPULATE_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
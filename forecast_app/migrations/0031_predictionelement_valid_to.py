@@ -0,0 +1,43 @@
+# Generated by Django 4.1.10 on 2026-10-16 18:21
+
+from django.db import migrations, models
+
+
+#
+# This file adds PredictionElement.valid_to and then sets it for existing prediction elements. I edited the
+# Django-generated file to add the RunSQL, which does the same as utils.forecast._update_version_pred_ele_valid_tos(),
+# but for all versions at once. It may take a while on large databases.
+#
+
+POPULATE_SQL = """
+    UPDATE forecast_app_predictionelement
+    SET valid_to = intervals.next_issued_at
+    FROM (SELECT pred_ele.id AS pred_ele_id,
+                 LEAD(f.issued_at) OVER (
+                     PARTITION BY f.forecast_model_id, f.time_zero_id, pred_ele.unit_id, pred_ele.target_id, pred_ele.pred_class
+                     ORDER BY f.issued_at) AS next_issued_at
+          FROM forecast_app_predictionelement AS pred_ele
+                   JOIN forecast_app_forecast AS f ON pred_ele.forecast_id = f.id) AS intervals
+    WHERE forecast_app_predictionelement.id = intervals.pred_ele_id
+      AND intervals.next_issued_at IS NOT NULL;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecast_app', '0030_latestpredictionelement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictionelement',
+            name='valid_to',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunSQL(POPULATE_SQL, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='predictionelement',
+            index=models.Index(fields=['forecast', 'valid_to'], name='pred_ele_validity_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.10 on 2026-10-16 20:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import forecast_app.models.project
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecast_app', '0031_predictionelement_valid_to'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='data_version',
+            field=models.CharField(default=forecast_app.models.project.new_data_version, editable=False, max_length=32),
+        ),
+        migrations.CreateModel(
+            name='QueryCacheEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=64)),
+                ('data_version', models.CharField(max_length=32, null=True)),
+                ('num_rows', models.IntegerField(null=True)),
+                ('num_bytes', models.BigIntegerField(default=0)),
+                ('num_hits', models.IntegerField(default=0)),
+                ('num_misses', models.IntegerField(default=0)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('job', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='forecast_app.job')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='query_cache_entries', to='forecast_app.project')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='querycacheentry',
+            constraint=models.UniqueConstraint(fields=('project', 'cache_key'), name='unique_query_cache_key'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.10 on 2026-10-16 21:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecast_app', '0032_project_data_version_querycacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='querycacheentry',
+            name='leader_job',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='forecast_app.job'),
+        ),
+        migrations.AddField(
+            model_name='querycacheentry',
+            name='leader_data_version',
+            field=models.CharField(max_length=32, null=True),
+        ),
+    ]
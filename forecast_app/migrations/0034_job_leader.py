@@ -0,0 +1,19 @@
+# Generated by Django 4.1.10 on 2026-10-16 23:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forecast_app', '0033_querycacheentry_leader_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='leader',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='followers', to='forecast_app.job'),
+        ),
+    ]
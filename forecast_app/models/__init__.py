@@ -5,9 +5,10 @@ from .forecast import Forecast
 from .forecast_metadata import ForecastMetadataCache, ForecastMetaPrediction, ForecastMetaUnit, ForecastMetaTarget
 from .forecast_model import ForecastModel
 from .job import Job
-from .prediction_data import PredictionData
-from .prediction_element import PredictionElement
+from .prediction_data import PredictionData, HashedPredictionData
+from .prediction_element import PredictionElement, LatestPredictionElement
 from .project import Project, Unit, TimeZero
+from .query_cache import QueryCacheEntry
 from .target import Target, TargetCat, TargetLwr, TargetRange
 
 # __all__ = ['Article', 'Publication']
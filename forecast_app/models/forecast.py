@@ -1,11 +1,11 @@
 import django
 from django.db import models, connection
-from django.db.models.signals import pre_save, pre_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.urls import reverse
 
 from forecast_app.models.forecast_model import ForecastModel
-from forecast_app.models.project import TimeZero
+from forecast_app.models.project import Project, TimeZero, update_project_data_version
 from utils.utilities import basic_str
 
 
@@ -114,6 +114,9 @@ def pre_validate_new_or_edited_forecast(instance, **kwargs):
         db_forecasts = list(Forecast.objects.filter(forecast_model=instance.forecast_model,
                                                     time_zero=instance.time_zero) \
                             .order_by('issued_at'))  # includes `instance`'s pre-saved state
+        # saved for update_pred_ele_valid_tos_for_edited_forecast()
+        instance._db_issued_at = next((forecast.issued_at for forecast in db_forecasts if forecast.pk == instance.pk),
+                                      None)
         new_forecasts = sorted([forecast for forecast in db_forecasts if forecast.pk != instance.pk] + [instance],
                                key=lambda forecast: forecast.issued_at)
         if db_forecasts != new_forecasts:  # edited forecast's position changed
@@ -131,6 +134,36 @@ def pre_validate_deleted_forecast(instance, **kwargs):
         raise RuntimeError(f"you cannot delete a forecast that has any newer versions. forecast={instance}")
 
 
+@receiver(post_save, sender=Forecast)
+@receiver(post_delete, sender=Forecast)
+def update_data_version_for_forecast(instance, **kwargs):
+    # loading data into a forecast also updates the data version, but creating or editing one (e.g., its issued_at) can
+    # change as_of query results by itself. see Project.data_version
+    update_project_data_version(Project.objects.filter(models__pk=instance.forecast_model_id))
+
+
+@receiver(post_save, sender=Forecast)
+def update_pred_ele_valid_tos_for_edited_forecast(instance, created, **kwargs):
+    # PredictionElement.valid_to values are copies of issued_ats, and so must be updated if this one's was edited. other
+    # edits (e.g., to notes) leave them alone
+    from utils.forecast import _update_version_pred_ele_valid_tos  # avoid circular imports
+
+    if (not created) and (getattr(instance, '_db_issued_at', None) != instance.issued_at):
+        _update_version_pred_ele_valid_tos(instance.forecast_model_id, instance.time_zero_id)
+
+
+@receiver(post_delete, sender=Forecast)
+def update_latest_pred_eles_for_deleted_forecast(instance, **kwargs):
+    # the deleted forecast's LatestPredictionElements were deleted along with its PredictionElements. replace them with
+    # the previous versions' ones, which are also now valid until further notice
+    # avoid circular imports:
+    from utils.forecast import _insert_missing_latest_pred_eles, _update_version_pred_ele_valid_tos
+
+
+    _update_version_pred_ele_valid_tos(instance.forecast_model_id, instance.time_zero_id)
+    _insert_missing_latest_pred_eles(instance.forecast_model_id, instance.time_zero_id)
+
+
 #
 # _newest_forecast_version()
 #
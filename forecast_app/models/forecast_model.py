@@ -1,9 +1,11 @@
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
 
-from forecast_app.models.project import Project
+from forecast_app.models.project import Project, update_project_data_version
 from utils.utilities import basic_str
 
 
@@ -152,3 +154,13 @@ class ForecastModel(models.Model):
         :return: the first Forecast in me corresponding to time_zero. returns None o/w. NB: tests for object equality
         """
         return self.forecasts.filter(time_zero=time_zero).first()
+
+
+#
+# set up signals to invalidate cached query results when a project's models change. see Project.data_version
+#
+
+@receiver(post_save, sender=ForecastModel)
+@receiver(post_delete, sender=ForecastModel)
+def update_data_version_for_forecast_model(instance, **kwargs):
+    update_project_data_version(Project.objects.filter(pk=instance.project_id))  # abbreviations are in query results
@@ -79,6 +79,10 @@ class Job(models.Model):
     # app-specific results from a successful completion of the upload. ex: 'forecast_pk':
     output_json = models.JSONField(null=True, blank=True)
 
+    # the query Job that I am following, if any - see leader_job(). a column rather than an input_json key so that a
+    # leader's followers can be found via an index:
+    leader = models.ForeignKey('self', related_name='followers', on_delete=models.SET_NULL, blank=True, null=True)
+
 
     def __repr__(self):
         return str((self.pk, self.user, self.status_as_str(),
@@ -128,6 +132,32 @@ class Job(models.Model):
         return self.updated_at - self.created_at
 
 
+    def artifact_job(self):
+        """
+        :return: the Job whose cloud file has my output data: the one in my output_json's 'artifact_job_pk' if I am a
+            query that was completed from the query cache (see utils/query_cache.py), or me o/w
+        """
+        if isinstance(self.output_json, dict) and ('artifact_job_pk' in self.output_json):
+            return Job.objects.filter(pk=self.output_json['artifact_job_pk']).first()
+        else:
+            return self
+
+
+    def leader_job(self):
+        """
+        :return: the Job I am following if I am a query that was coalesced with an identical in-flight one (see
+            utils.query_cache.follow_leader_job()), or None o/w. I receive its results when it finishes
+        """
+        return self.leader
+
+
+    def follower_jobs(self):
+        """
+        :return: a QuerySet of the Jobs that are following me. see leader_job()
+        """
+        return self.followers.order_by('pk')
+
+
     #
     # RQ service-specific functions
     #
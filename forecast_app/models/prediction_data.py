@@ -1,3 +1,8 @@
+import array
+import math
+import struct
+import sys
+
 from django.db import models
 
 from utils.utilities import basic_str
@@ -39,10 +44,44 @@ class PredictionData(models.Model):
     Notes:
     - None of the values are transformed in any way. For example, 'family' is not changed to an int.
     - This field is the data that each PredictionElement.data_hash is calculated on.
+    - For projects whose pred_data_encoding is Project.PACKED_PRED_DATA_ENCODING, numeric lists (e.g., quantile
+      values and samples) are stored in `packed` rather than in `data`. See packed_pred_data(). Use
+      unpacked_pred_data() to get the original prediction data from the two fields.
     """
     pred_ele = models.OneToOneField('PredictionElement', related_name='pred_data', on_delete=models.CASCADE,
                                     primary_key=True)
     data = models.JSONField()
+    packed = models.BinaryField(null=True)
+
+
+    def __repr__(self):
+        return str((self.pk, list(self.data.keys())))
+
+
+    def __str__(self):  # todo
+        return basic_str(self)
+
+
+#
+# ---- HashedPredictionData ----
+#
+
+class HashedPredictionData(models.Model):
+    """
+    A content-addressed alternative to PredictionData that stores each distinct prediction data dict only once, keyed
+    by its PredictionElement.data_hash. Used by projects whose pred_data_storage is Project.HASHED_PRED_DATA_STORAGE,
+    which helps when many prediction elements have identical data, e.g., baseline and ensemble models that repeat
+    quantiles across units, or versions that repeat across re-uploads.
+
+    PredictionElements reference rows here via their data_hash rather than via a foreign key, and so a
+    PredictionElement's data is in exactly one of: its PredictionData (pred_ele.pred_data), or the HashedPredictionData
+    with the same data_hash (when it has no PredictionData). Only hashes that use PredictionElement.CURRENT_HASH_VERSION
+    are stored here. Rows are not deleted when the last PredictionElement that references them is - see
+    utils.forecast.delete_unreferenced_hashed_pred_data().
+    """
+    data_hash = models.CharField(max_length=32, primary_key=True)
+    data = models.JSONField()
+    packed = models.BinaryField(null=True)  # same as PredictionData.packed
 
 
     def __repr__(self):
@@ -51,3 +90,122 @@ class PredictionData(models.Model):
 
     def __str__(self):  # todo
         return basic_str(self)
+
+
+#
+# packed_pred_data() and unpacked_pred_data()
+#
+
+# the first byte of every `packed` value. lets us change the format later
+PACKED_FORMAT_VERSION = 1
+
+# type codes for packed lists: code -> (array typecode, item type)
+_PACKED_TYPE_CODE_TO_ARRAY_INFO = {b'd': ('d', float), b'q': ('q', int)}
+
+# the largest magnitude int that packed_pred_data() packs into 8 bytes
+_MAX_INT64 = 2 ** 63 - 1
+
+# floats at least this large have exponents in their repr() (e.g., '1e+16'), which postgres jsonb outputs as ints
+_MIN_EXPONENT_FLOAT = 1e16
+
+
+def packed_pred_data(prediction_data):
+    """
+    Encodes prediction_data for storage in a PredictionData's (or HashedPredictionData's) `data` and `packed` fields.
+    Top-level lists whose items are all ints or all floats, e.g., quantile values and samples, are packed into a small
+    header and little-endian int64 or float64 arrays. Their keys are kept in the returned data (with null values) so
+    that the json's key order is the same as if nothing were packed. Everything else, e.g., string cats and named
+    families, stays json.
+
+    Only lists whose values come back from the json storage unchanged are packed, so that unpacked_pred_data() returns
+    exactly what reading the json would have: empty lists, ints outside int64, and floats that are not finite, are
+    -0.0, or are large enough to have exponents in their repr() are left as json.
+
+    :param prediction_data: a json_io_dict "prediction" value, e.g., {"quantile": [0.25, 0.75], "value": [0, 50]}
+    :return: a 2-tuple: (data, packed) where data is prediction_data with packed values replaced by None, and packed
+        is bytes, or None if nothing was packed (in which case data is prediction_data)
+    """
+    key_type_code_values = []
+    for key, value in prediction_data.items():
+        type_code = _packed_type_code(value)
+        if type_code:
+            key_type_code_values.append((key, type_code, value))
+    if not key_type_code_values:
+        return prediction_data, None
+
+    header_chunks = [struct.pack('<BH', PACKED_FORMAT_VERSION, len(key_type_code_values))]
+    array_chunks = []
+    for key, type_code, value in key_type_code_values:
+        key_bytes = key.encode('utf-8')
+        header_chunks.append(struct.pack('<H', len(key_bytes)) + key_bytes + type_code + struct.pack('<I', len(value)))
+        the_array = array.array(_PACKED_TYPE_CODE_TO_ARRAY_INFO[type_code][0], value)
+        if sys.byteorder != 'little':
+            the_array.byteswap()
+        array_chunks.append(the_array.tobytes())
+    packed_keys = {key for key, _, _ in key_type_code_values}
+    data = {key: None if key in packed_keys else value for key, value in prediction_data.items()}
+    return data, b''.join(header_chunks + array_chunks)
+
+
+def _packed_type_code(value):
+    # packed_pred_data() helper that returns the type code to pack value as, or None if it should stay json
+    if (type(value) is not list) or (not value):
+        return None
+
+    item_types = set(map(type, value))
+    if (item_types == {int}) and all(-_MAX_INT64 <= item <= _MAX_INT64 for item in value):
+        return b'q'
+    elif (item_types == {float}) \
+            and all(math.isfinite(item) and (abs(item) < _MIN_EXPONENT_FLOAT)
+                    and not ((item == 0) and (math.copysign(1, item) < 0))  # -0.0
+                    for item in value):
+        return b'd'
+    else:
+        return None
+
+
+def unpacked_pred_data(data, packed, is_numpy=False):
+    """
+    The inverse of packed_pred_data().
+
+    :param data: a PredictionData's (or HashedPredictionData's) `data` as a dict. it is modified in place
+    :param packed: "" `packed`: bytes, a memoryview, or None
+    :param is_numpy: True if packed lists should be returned as numpy arrays rather than lists, which is faster for
+        callers that do vectorized math on them
+    :return: data with its packed values restored
+    """
+    if packed is None:
+        return data
+
+    if is_numpy:
+        import numpy as np  # only needed by callers that want arrays
+
+    packed = memoryview(packed)
+    format_version, num_keys = struct.unpack_from('<BH', packed, 0)
+    if format_version != PACKED_FORMAT_VERSION:
+        raise RuntimeError(f"unsupported packed format version: {format_version}")
+
+    offset = 3
+    key_type_code_lens = []
+    for _ in range(num_keys):
+        key_len, = struct.unpack_from('<H', packed, offset)
+        offset += 2
+        key = bytes(packed[offset:offset + key_len]).decode('utf-8')
+        offset += key_len
+        type_code = bytes(packed[offset:offset + 1])
+        value_len, = struct.unpack_from('<I', packed, offset + 1)
+        offset += 5
+        key_type_code_lens.append((key, type_code, value_len))
+    for key, type_code, value_len in key_type_code_lens:
+        typecode = _PACKED_TYPE_CODE_TO_ARRAY_INFO[type_code][0]
+        num_bytes = 8 * value_len
+        if is_numpy:
+            data[key] = np.frombuffer(packed[offset:offset + num_bytes], dtype='<' + ('f8' if typecode == 'd' else 'i8'))
+        else:
+            the_array = array.array(typecode)
+            the_array.frombytes(packed[offset:offset + num_bytes])
+            if sys.byteorder != 'little':
+                the_array.byteswap()
+            data[key] = the_array.tolist()
+        offset += num_bytes
+    return data
@@ -1,5 +1,8 @@
+import array
 import hashlib
 import json
+import struct
+import sys
 
 from django.db import models
 
@@ -15,6 +18,13 @@ class PredictionElement(models.Model):
     Represents a prediction element as loaded from a "JSON IO dict" (aka 'json_io_dict' by callers).
     """
 
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['forecast', 'valid_to'], name='pred_ele_validity_idx'),
+        ]
+
+
     # prediction classes. corresponds to json_io_dict's 'class' key
     BIN_CLASS = 0
     NAMED_CLASS = 1
@@ -35,13 +45,22 @@ class PredictionElement(models.Model):
         (MODE_CLASS, 'mode'),
     )
 
+    # data_hash algorithms. see hash_for_prediction_data_dict()
+    MD5_JSON_HASH_VERSION = 0  # MD5 of the data as a sorted json string. used by all data loaded before hash_version
+    BLAKE2B_HASH_VERSION = 1  # BLAKE2b of a type-tagged binary encoding of the data
+    HASH_VERSION_CHOICES = (
+        (MD5_JSON_HASH_VERSION, 'md5_json'),
+        (BLAKE2B_HASH_VERSION, 'blake2b'),
+    )
+    CURRENT_HASH_VERSION = BLAKE2B_HASH_VERSION  # the one used to load new data
+
     forecast = models.ForeignKey('Forecast', related_name='pred_eles', on_delete=models.CASCADE)
     pred_class = models.IntegerField(choices=PRED_CLASS_CHOICES)
     unit = models.ForeignKey('Unit', on_delete=models.CASCADE)
     target = models.ForeignKey('Target', on_delete=models.CASCADE)
     is_retract = models.BooleanField(default=False)
 
-    # A binary MD5 hex hash of input "prediction" dict (converted to a json string), e.g., input dicts like:
+    # A 128-bit hex hash of input "prediction" dict, e.g., input dicts like:
     #
     #   {"family": "pois", "param1": 1.1}
     #   {"value": 5}
@@ -51,8 +70,17 @@ class PredictionElement(models.Model):
     #
     # This hash is used by `load_predictions_from_json_io_dict()` to compare prediction elements for equality so that
     # duplicate data can be skipped. The algorithm we use to calculate this hash is as implemented in
-    # `hash_for_prediction_data_dict()`. we store '' if is_retract b/c there is no PredictionData and therefore no hash
+    # `hash_for_prediction_data_dict()`, and is identified by hash_version. we store '' if is_retract b/c there is no
+    # PredictionData and therefore no hash
     data_hash = models.CharField(max_length=32)  # length based on output from hashlib.md5(s).hexdigest()
+    hash_version = models.IntegerField(choices=HASH_VERSION_CHOICES, default=CURRENT_HASH_VERSION)
+
+    # this element's validity interval is [forecast.issued_at, valid_to): valid_to is the issued_at of the next newer
+    # version of forecast that has an element (possibly a retraction) for the same unit, target, and pred_class, or NULL
+    # if there is none, i.e., if this element is the latest one. an `as_of` query therefore returns the elements whose
+    # interval contains as_of, without having to rank versions. maintained by utils.forecast._update_pred_ele_valid_tos()
+    # and utils.forecast._update_version_pred_ele_valid_tos()
+    valid_to = models.DateTimeField(null=True)
 
 
     def __repr__(self):
@@ -74,20 +102,128 @@ class PredictionElement(models.Model):
 
 
     @classmethod
-    def hash_for_prediction_data_dict(cls, prediction_data):
+    def hash_for_prediction_data_dict(cls, prediction_data, hash_version=CURRENT_HASH_VERSION):
         """
         Top-level method for computing the hash of a json_io_dict's "prediction" value. This function is not meant to be
-        general to any dict, just json_io_dict ones. Recall MD5 is 128 bits (16 bytes).
+        general to any dict, just json_io_dict ones. Both algorithms return 128 bits (16 bytes).
 
         :param prediction_data: the json_io_dict's "prediction" value, e.g.,
-            {"family": "pois", "param1": 1.1}  -> '845e3d041b6be23a381b6afd263fb113'
+            {"family": "pois", "param1": 1.1}  -> 'cdf2f407de221f37c66bfdec0b880031'
             {"value": 5}
             {"sample": [0, 2, 5]}
             {"cat": [0, 2, 50], "prob": [0.0, 0.1, 0.9]}
             {"quantile": [0.25, 0.75], "value": [0, 50]}
-        :return: MD5 hex hash of `prediction_data` as `str`
+        :param hash_version: one of HASH_VERSION_CHOICES
+        :return: hex hash of `prediction_data` as `str`
         """
-        return hashlib.md5(json.dumps(prediction_data, sort_keys=True).encode('utf-8')).hexdigest()
+        if hash_version == PredictionElement.MD5_JSON_HASH_VERSION:
+            return hashlib.md5(json.dumps(prediction_data, sort_keys=True).encode('utf-8')).hexdigest()
+
+        chunks = []
+        _encode_hash_value(prediction_data, chunks)
+        return hashlib.blake2b(b''.join(chunks), digest_size=16).hexdigest()
+
+
+#
+# LatestPredictionElement
+#
+
+class LatestPredictionElement(models.Model):
+    """
+    A materialization of the "latest merged version" of every forecast: for each (forecast_model, time_zero, unit,
+    target, pred_class), the PredictionElement from the newest version (by issued_at) that has one, including
+    retractions. This is what ranking all of a project's PredictionElements by issued_at returns when there is no
+    as_of, and so queries for the latest data use it instead. Rows are maintained incrementally as prediction elements
+    are loaded (see utils.forecast._update_latest_pred_eles()) and as forecasts are deleted (see
+    utils.forecast._insert_missing_latest_pred_eles()). Editing a version's issued_at does not change rows here b/c
+    versions cannot be repositioned.
+    """
+
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['forecast_model', 'time_zero', 'unit', 'target', 'pred_class'],
+                                    name='unique_latest_pred_ele'),
+        ]
+
+
+    pred_ele = models.OneToOneField('PredictionElement', related_name='latest', on_delete=models.CASCADE,
+                                    primary_key=True)
+    forecast_model = models.ForeignKey('ForecastModel', on_delete=models.CASCADE)
+    time_zero = models.ForeignKey('TimeZero', on_delete=models.CASCADE)
+    unit = models.ForeignKey('Unit', on_delete=models.CASCADE)
+    target = models.ForeignKey('Target', on_delete=models.CASCADE)
+    pred_class = models.IntegerField(choices=PredictionElement.PRED_CLASS_CHOICES)
+
+
+    def __repr__(self):
+        return str((self.pk, self.forecast_model_id, self.time_zero_id, self.unit_id, self.target_id, self.pred_class))
+
+
+    def __str__(self):  # todo
+        return basic_str(self)
+
+
+#
+# _encode_hash_value()
+#
+
+# the largest magnitude int that _encode_hash_value() packs into 8 bytes. larger ones are encoded as decimal strs
+_MAX_INT64 = 2 ** 63 - 1
+
+
+def _encode_hash_value(value, chunks):
+    """
+    PredictionElement.hash_for_prediction_data_dict() helper that appends a canonical binary encoding of `value` to
+    `chunks` (a list of bytes). Each value is prefixed by a one-byte type tag so that, as with json, 1, 1.0, '1', and
+    True all encode differently. Dicts are encoded with sorted keys, and lists whose items are all floats or all ints
+    (the common case for cat, prob, quantile, value, and sample) are packed as arrays rather than item by item. Numbers
+    are little-endian regardless of platform.
+
+    :param value: a json_io_dict "prediction" value, or a part of one
+    :param chunks: a list of bytes to append to
+    """
+    value_type = type(value)
+    if value_type is list:
+        item_types = set(map(type, value))
+        if (item_types == {int}) and all(-_MAX_INT64 <= item <= _MAX_INT64 for item in value):
+            chunks.append(b'Q' + struct.pack('<Q', len(value)))
+            chunks.append(_little_endian_array_bytes(array.array('q', value)))
+        elif item_types == {float}:
+            chunks.append(b'F' + struct.pack('<Q', len(value)))
+            chunks.append(_little_endian_array_bytes(array.array('d', value)))
+        else:  # empty or mixed types
+            chunks.append(b'l' + struct.pack('<Q', len(value)))
+            for item in value:
+                _encode_hash_value(item, chunks)
+    elif value_type is dict:
+        chunks.append(b'd' + struct.pack('<Q', len(value)))
+        for key in sorted(value):
+            _encode_hash_value(key, chunks)
+            _encode_hash_value(value[key], chunks)
+    elif value_type is str:
+        value_bytes = value.encode('utf-8')
+        chunks.append(b's' + struct.pack('<Q', len(value_bytes)) + value_bytes)
+    elif value_type is float:
+        chunks.append(b'f' + struct.pack('<d', value))
+    elif value_type is bool:
+        chunks.append(b't' if value else b'b')
+    elif (value_type is int) and (-_MAX_INT64 <= value <= _MAX_INT64):
+        chunks.append(b'i' + struct.pack('<q', value))
+    elif value_type is int:
+        value_bytes = str(value).encode('utf-8')
+        chunks.append(b'I' + struct.pack('<Q', len(value_bytes)) + value_bytes)
+    elif value is None:
+        chunks.append(b'n')
+    else:  # not a json type
+        raise RuntimeError(f"cannot hash value: {value!r}, type={value_type}")
+
+
+def _little_endian_array_bytes(the_array):
+    # _encode_hash_value() helper
+    if sys.byteorder != 'little':
+        the_array.byteswap()
+    return the_array.tobytes()
 
 
 #
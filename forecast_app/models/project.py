@@ -1,9 +1,14 @@
 import logging
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import ManyToManyField
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
 
 from utils.utilities import basic_str
@@ -16,6 +21,20 @@ logger = logging.getLogger(__name__)
 # ---- Project class ----
 #
 
+def new_config_version():
+    """
+    :return: a new, unique value for Project.config_version
+    """
+    return uuid.uuid4().hex
+
+
+def new_data_version():
+    """
+    :return: a new, unique value for Project.data_version
+    """
+    return uuid.uuid4().hex
+
+
 class Project(models.Model):
     """
     The make_cdc_flu_contests_project_app class representing a forecast challenge, including metadata, core data,
@@ -56,6 +75,41 @@ class Project(models.Model):
     viz_options = models.JSONField(null=True, blank=True,
                                    help_text="Optional object containing options to pass to zoltar_viz.js")
 
+    # an opaque token that is replaced every time the project's configuration (units, targets, and their cats and
+    # ranges) changes. used to invalidate cached utils.validation_context.ValidationContexts. we use a random token
+    # rather than a counter so that values are never re-used, e.g., after a transaction that changed the config is
+    # rolled back, or after a deleted project's id is re-used
+    config_version = models.CharField(max_length=32, default=new_config_version, editable=False)
+
+    # like config_version, but replaced every time the project's query results might change: forecast and truth loads,
+    # forecast edits and deletes, and changes to models and timezeros. used to invalidate cached query results - see
+    # utils/query_cache.py
+    data_version = models.CharField(max_length=32, default=new_data_version, editable=False)
+
+    # how new prediction data is stored: one PredictionData per PredictionElement, or one HashedPredictionData per
+    # distinct data_hash. existing data is not affected by changing this - see utils/pred_data_storage_util.py
+    PER_ELEMENT_PRED_DATA_STORAGE = 0
+    HASHED_PRED_DATA_STORAGE = 1
+    PRED_DATA_STORAGE_CHOICES = (
+        (PER_ELEMENT_PRED_DATA_STORAGE, 'per_element'),
+        (HASHED_PRED_DATA_STORAGE, 'hashed'),
+    )
+    pred_data_storage = models.IntegerField(choices=PRED_DATA_STORAGE_CHOICES, default=PER_ELEMENT_PRED_DATA_STORAGE,
+                                            help_text="How new prediction data is stored. 'hashed' stores identical "
+                                                      "prediction data only once.")
+
+    # how new prediction data is encoded: as json, or with numeric lists packed into arrays. existing data is not
+    # affected by changing this - see utils/pred_data_storage_util.py. see PredictionData.packed
+    JSON_PRED_DATA_ENCODING = 0
+    PACKED_PRED_DATA_ENCODING = 1
+    PRED_DATA_ENCODING_CHOICES = (
+        (JSON_PRED_DATA_ENCODING, 'json'),
+        (PACKED_PRED_DATA_ENCODING, 'packed'),
+    )
+    pred_data_encoding = models.IntegerField(choices=PRED_DATA_ENCODING_CHOICES, default=JSON_PRED_DATA_ENCODING,
+                                             help_text="How new prediction data is encoded. 'packed' stores numeric "
+                                                       "lists as arrays.")
+
 
     def __repr__(self):
         return str((self.pk, self.name))
@@ -77,7 +131,13 @@ class Project(models.Model):
                 else:
                     raise ValidationError("found duplicate TimeZero.timezero_date: {}".format(timezero.timezero_date))
 
-        # done
+        # done. an existing project's versions are only replaced via update_project_versions() (none of my own fields
+        # are in validation or query results), so leave them out of the UPDATE lest a stale instance restore old ones
+        if (not self._state.adding) and (not args) and ('update_fields' not in kwargs) \
+                and (not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if (not field.primary_key)
+                                       and (field.name not in ['config_version', 'data_version'])]
         super().save(*args, **kwargs)
 
 
@@ -304,6 +364,72 @@ class Unit(models.Model):
         return basic_str(self)
 
 
+#
+# set up signals to invalidate cached ValidationContexts and query results when a project's configuration changes. see
+# Project.config_version and Project.data_version
+#
+
+def update_project_data_version(project_qs):
+    """
+    Replaces the data_version of the Projects in project_qs. Uses an UPDATE rather than Project.save() so that any
+    in-memory Project instances can't overwrite the new value with a stale one.
+
+    :param project_qs: a Project QuerySet
+    """
+    project_qs.update(data_version=new_data_version())
+
+
+# the pks of Projects whose update_project_versions() calls are being deferred by deferred_project_version_updates(),
+# mapped to whether any of the deferred calls was a config change. None if no batch is in progress
+_DEFERRED_PROJECT_ID_TO_IS_CONFIG = ContextVar('deferred_project_id_to_is_config', default=None)
+
+
+def update_project_versions(project_id, is_config_change=True):
+    """
+    Replaces the data_version of the Project with pk project_id and, if is_config_change, its config_version, in one
+    UPDATE. Called once per configuration change, e.g., a unit or target edit, or a Target.set_cats() call. Inside a
+    deferred_project_version_updates() block the UPDATE is instead done once when the block exits.
+
+    :param project_id: a Project pk
+    :param is_config_change: True if the change affects validation (see ValidationContext) as well as query results
+    """
+    project_id_to_is_config = _DEFERRED_PROJECT_ID_TO_IS_CONFIG.get()
+    if project_id_to_is_config is not None:
+        project_id_to_is_config[project_id] = project_id_to_is_config.get(project_id, False) or is_config_change
+    elif is_config_change:
+        Project.objects.filter(pk=project_id).update(config_version=new_config_version(),
+                                                     data_version=new_data_version())
+    else:
+        Project.objects.filter(pk=project_id).update(data_version=new_data_version())
+
+
+@contextmanager
+def deferred_project_version_updates():
+    """
+    A context manager for batches of configuration changes such as creating a project's units and targets, or executing
+    a config diff. It defers the update_project_versions() calls that the batch makes, and then updates each affected
+    Project once when the block exits without error. Nested blocks are part of the outermost one.
+    """
+    if _DEFERRED_PROJECT_ID_TO_IS_CONFIG.get() is not None:
+        yield
+        return
+
+    project_id_to_is_config = {}
+    token = _DEFERRED_PROJECT_ID_TO_IS_CONFIG.set(project_id_to_is_config)
+    try:
+        yield
+    finally:
+        _DEFERRED_PROJECT_ID_TO_IS_CONFIG.reset(token)
+    for project_id, is_config_change in project_id_to_is_config.items():
+        update_project_versions(project_id, is_config_change)
+
+
+@receiver(post_save, sender=Unit)
+@receiver(post_delete, sender=Unit)
+def update_versions_for_unit(instance, **kwargs):
+    update_project_versions(instance.project_id)  # abbreviations are also in query results
+
+
 #
 # ---- TimeZero class ----
 #
@@ -352,3 +478,9 @@ class TimeZero(models.Model):
 
         # done
         super().save(*args, **kwargs)
+
+
+@receiver(post_save, sender=TimeZero)
+@receiver(post_delete, sender=TimeZero)
+def update_data_version_for_timezero(instance, **kwargs):
+    update_project_versions(instance.project_id, is_config_change=False)  # dates and seasons are in query results
@@ -0,0 +1,53 @@
+from django.db import models
+from django.utils import timezone
+
+from forecast_app.models import Job, Project
+from utils.utilities import basic_str
+
+
+#
+# ---- QueryCacheEntry ----
+#
+
+class QueryCacheEntry(models.Model):
+    """
+    An entry in the query result cache. Maps a canonical form of a forecast or truth query (see
+    utils.query_cache.query_cache_key()) to the Job whose cloud file has that query's results, as of the project's
+    data_version when the Job ran. An entry is a hit only while that data_version is still the project's current one.
+    Entries also track the Job that is currently running their query, keep hit and miss counts for it, and are evicted
+    in least recently used order - see utils.query_cache.evict_query_cache_entries().
+    """
+    project = models.ForeignKey(Project, related_name='query_cache_entries', on_delete=models.CASCADE)
+    cache_key = models.CharField(max_length=64)  # sha256 hex digest
+
+    # the Job whose cloud file has the results, and the Project.data_version it was run at. both are null until the
+    # first Job for cache_key succeeds
+    job = models.ForeignKey(Job, related_name='+', null=True, on_delete=models.SET_NULL)
+    data_version = models.CharField(max_length=32, null=True)
+    num_rows = models.IntegerField(null=True)
+    num_bytes = models.BigIntegerField(default=0)  # size of job's cloud file
+
+    # the queued or running Job for cache_key, if any, and the Project.data_version when it was queued. identical queries
+    # submitted while it is in flight follow it rather than being queued themselves - see
+    # utils.query_cache.follow_leader_job()
+    leader_job = models.ForeignKey(Job, related_name='+', null=True, on_delete=models.SET_NULL)
+    leader_data_version = models.CharField(max_length=32, null=True)
+
+    num_hits = models.IntegerField(default=0)
+    num_misses = models.IntegerField(default=0)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'cache_key'], name='unique_query_cache_key'),
+        ]
+
+
+    def __repr__(self):
+        return str((self.pk, self.project_id, self.cache_key[:8], self.job_id, self.data_version, self.num_rows,
+                    self.num_bytes, self.leader_job_id, self.num_hits, self.num_misses, str(self.last_used_at)))
+
+
+    def __str__(self):  # todo
+        return basic_str(self)
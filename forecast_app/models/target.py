@@ -6,9 +6,12 @@ from dateutil import relativedelta
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import BooleanField, IntegerField
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from rest_framework.test import APIRequestFactory
 
 from forecast_app.models import Project
+from forecast_app.models.project import update_project_versions
 from utils.utilities import basic_str, YYYY_MM_DD_DATE_FORMAT
 
 
@@ -239,13 +242,14 @@ class Target(models.Model):
         # delete and save the new TargetCats
         TargetCat.objects.filter(target=self).delete()
         preferred_data_type = self.data_types()[0]
-        for cat in cats:
-            TargetCat.objects.create(target=self,
-                                     cat_i=cat if (preferred_data_type == Target.INTEGER_DATA_TYPE) else None,
-                                     cat_f=cat if (preferred_data_type == Target.FLOAT_DATA_TYPE) else None,
-                                     cat_t=cat if (preferred_data_type == Target.TEXT_DATA_TYPE) else None,
-                                     cat_d=cat if (preferred_data_type == Target.DATE_DATA_TYPE) else None,
-                                     cat_b=cat if (preferred_data_type == Target.BOOLEAN_DATA_TYPE) else None)
+        TargetCat.objects.bulk_create(
+            [TargetCat(target=self,
+                       cat_i=cat if (preferred_data_type == Target.INTEGER_DATA_TYPE) else None,
+                       cat_f=cat if (preferred_data_type == Target.FLOAT_DATA_TYPE) else None,
+                       cat_t=cat if (preferred_data_type == Target.TEXT_DATA_TYPE) else None,
+                       cat_d=cat if (preferred_data_type == Target.DATE_DATA_TYPE) else None,
+                       cat_b=cat if (preferred_data_type == Target.BOOLEAN_DATA_TYPE) else None)
+             for cat in cats])
 
         # ditto for TargetLwrs for continuous and discrete cases (required for scoring), calculating `upper` via zip().
         # NB: we use infinity for the last bin's upper!
@@ -253,8 +257,11 @@ class Target(models.Model):
             cats = sorted(cats)
             if extra_lwr:
                 cats.append(extra_lwr)
-            for lwr, upper in itertools.zip_longest(cats, cats[1:], fillvalue=float('inf')):
-                TargetLwr.objects.create(target=self, lwr=lwr, upper=upper)
+            TargetLwr.objects.bulk_create([TargetLwr(target=self, lwr=lwr, upper=upper) for lwr, upper
+                                           in itertools.zip_longest(cats, cats[1:], fillvalue=float('inf'))])
+
+        # cats are in validation and in converted query results. once per call rather than once per TargetCat
+        update_project_versions(self.project_id)
 
 
     def set_range(self, lower, upper):
@@ -280,12 +287,12 @@ class Target(models.Model):
 
         # delete and save the new TargetRanges
         TargetRange.objects.filter(target=self).delete()
-        TargetRange.objects.create(target=self,
-                                   value_i=lower if (data_types[0] == Target.INTEGER_DATA_TYPE) else None,
-                                   value_f=lower if (data_types[0] == Target.FLOAT_DATA_TYPE) else None)
-        TargetRange.objects.create(target=self,
-                                   value_i=upper if (data_types[0] == Target.INTEGER_DATA_TYPE) else None,
-                                   value_f=upper if (data_types[0] == Target.FLOAT_DATA_TYPE) else None)
+        TargetRange.objects.bulk_create(
+            [TargetRange(target=self,
+                         value_i=value if (data_types[0] == Target.INTEGER_DATA_TYPE) else None,
+                         value_f=value if (data_types[0] == Target.FLOAT_DATA_TYPE) else None)
+             for value in (lower, upper)])
+        update_project_versions(self.project_id)  # ranges are in validation
 
 
     @staticmethod
@@ -577,3 +584,15 @@ class TargetRange(models.Model):
 
     def __str__(self):  # todo
         return basic_str(self)
+
+
+#
+# set up signals to invalidate cached ValidationContexts and query results when a project's targets change. see
+# Project.config_version and Project.data_version. changes to their cats and ranges are covered by set_cats() and
+# set_range(), which update the versions once per call
+#
+
+@receiver(post_save, sender=Target)
+@receiver(post_delete, sender=Target)
+def update_versions_for_target(instance, **kwargs):
+    update_project_versions(instance.project_id)  # names are also in query results
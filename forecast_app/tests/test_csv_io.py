@@ -1,8 +1,9 @@
 import csv
+import io
 import json
 from unittest import TestCase
 
-from utils.csv_io import json_io_dict_from_csv_rows
+from utils.csv_io import json_io_dict_from_csv_rows, prediction_dicts_from_csv_fp
 from utils.project_queries import CSV_HEADER
 
 
@@ -70,3 +71,24 @@ class CsvIOTestCase(TestCase):
             act_dict = json_io_dict_from_csv_rows(list(csv.reader(csv_fp)))
             self.assertEqual(sorted(exp_dict['predictions'], key=lambda _: (_['unit'], _['target'], _['class'])),
                              sorted(act_dict['predictions'], key=lambda _: (_['unit'], _['target'], _['class'])))
+
+
+    def test_prediction_dicts_from_csv_fp(self):
+        # bad header
+        with self.assertRaises(RuntimeError) as context:
+            list(prediction_dicts_from_csv_fp(io.StringIO('bad header\n')))
+        self.assertIn('first row was not the proper header', str(context.exception))
+
+        # no data rows
+        self.assertEqual([], list(prediction_dicts_from_csv_fp(io.StringIO(','.join(CSV_HEADER) + '\n'))))
+
+        # same output as json_io_dict_from_csv_rows(), both in memory (one chunk) and via temp files (many chunks,
+        # which tests that rows within a group that span chunks are merged in file order)
+        for csv_file in ['forecast_app/tests/predictions/docs-predictions.csv',
+                         'forecast_app/tests/predictions/docs-predictions-all-retracted.csv']:
+            with open(csv_file) as csv_fp:
+                exp_pred_dicts = json_io_dict_from_csv_rows(list(csv.reader(csv_fp)))['predictions']
+                for chunk_num_rows in [1_000, 3, 1]:
+                    csv_fp.seek(0)
+                    act_pred_dicts = list(prediction_dicts_from_csv_fp(csv_fp, chunk_num_rows))
+                    self.assertEqual(exp_pred_dicts, act_pred_dicts)
@@ -11,12 +11,13 @@ from django.test import TestCase
 from rest_framework.test import APIRequestFactory
 from rq.timeouts import JobTimeoutException
 
-from forecast_app.models import Project, TimeZero, Job, PredictionElement
+from forecast_app.models import Project, TimeZero, Job, PredictionElement, PredictionData
 from forecast_app.models.forecast import Forecast
 from forecast_app.models.forecast_model import ForecastModel
 from forecast_app.views import _upload_forecast_worker
 from utils.cdc_io import load_cdc_csv_forecast_file, make_cdc_units_and_targets
-from utils.forecast import json_io_dict_from_forecast, load_predictions_from_json_io_dict
+from utils.forecast import json_io_dict_from_forecast, load_predictions_from_json_io_dict, \
+    load_predictions_from_prediction_dicts
 from utils.make_minimal_projects import _make_docs_project
 from utils.make_thai_moph_project import load_cdc_csv_forecasts_from_dir
 from utils.project import create_project_from_json
@@ -332,6 +333,64 @@ class ForecastTestCase(TestCase):
                 self.assertIsNone(Forecast.objects.filter(id=forecast2.id).first())  # deleted
 
 
+    def test_load_predictions_from_prediction_dicts(self):
+        # tests that streaming loading is equivalent to load_predictions_from_json_io_dict(), including when data spans
+        # chunks and when some prediction data is duplicated across chunks
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        project = create_project_from_json(Path('forecast_app/tests/projects/docs-project.json'), po_user)
+        forecast_model = ForecastModel.objects.create(project=project, name='name', abbreviation='abbrev')
+        time_zero = TimeZero.objects.create(project=project, timezero_date=datetime.date(2017, 1, 1))
+        with open('forecast_app/tests/predictions/docs-predictions.json') as fp:
+            pred_dicts = json.load(fp)['predictions']
+
+        for chunk_size in [1_000, 4]:
+            forecast = Forecast.objects.create(forecast_model=forecast_model, time_zero=time_zero)
+            load_predictions_from_prediction_dicts(forecast, iter(pred_dicts), is_validate_cats=False,
+                                                   chunk_size=chunk_size)
+            json_io_dict_out = json_io_dict_from_forecast(forecast, None)
+            self.assertEqual(sorted(pred_dicts, key=lambda _: (_['unit'], _['target'], _['class'])),
+                             sorted(json_io_dict_out['predictions'],
+                                    key=lambda _: (_['unit'], _['target'], _['class'])))
+            self.assertEqual(forecast.pred_eles.filter(is_retract=False).count(),
+                             PredictionData.objects.filter(pred_ele__forecast=forecast).count())
+            forecast.delete()
+
+        # empty data
+        forecast = Forecast.objects.create(forecast_model=forecast_model, time_zero=time_zero)
+        with self.assertRaisesRegex(RuntimeError, "cannot load empty data"):
+            load_predictions_from_prediction_dicts(forecast, iter([]))
+
+        # validation errors
+        with self.assertRaisesRegex(RuntimeError, "Within a Prediction, there cannot be more than 1 Prediction "
+                                                  "Element of the same class"):
+            load_predictions_from_prediction_dicts(forecast, [pred_dicts[0], pred_dicts[0]], chunk_size=1)
+        with self.assertRaisesRegex(RuntimeError, "prediction_dict referred to an undefined Unit"):
+            load_predictions_from_prediction_dicts(forecast, [dict(pred_dicts[0], unit='bad unit')])
+
+
+    def test__upload_forecast_worker_streaming(self):
+        # tests that `_upload_forecast_worker()` uses the streaming functions when 'ingest_mode' == 'streaming'
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        project, time_zero, forecast_model, forecast = _make_docs_project(po_user)
+        for data_format in ['csv', 'json']:
+            # use a new model each time so that the data is not 100% duplicate data
+            forecast_model2 = ForecastModel.objects.create(project=project, name=data_format, abbreviation=data_format)
+            forecast2 = Forecast.objects.create(forecast_model=forecast_model2, time_zero=time_zero)
+            with patch('forecast_app.models.job.job_cloud_file') as job_cloud_file_mock, \
+                    patch('utils.forecast.load_predictions_from_json_io_dict') as load_preds_mock, \
+                    open(f'forecast_app/tests/predictions/docs-predictions.{data_format}') as cloud_file_fp:
+                job = Job.objects.create()
+                job.input_json = {'forecast_pk': forecast2.pk, 'filename': 'a name!', 'format': data_format,
+                                  'ingest_mode': 'streaming'}
+                job.save()
+                job_cloud_file_mock.return_value.__enter__.return_value = (job, cloud_file_fp)
+                _upload_forecast_worker(job.pk)
+                job.refresh_from_db()
+                load_preds_mock.assert_not_called()
+                self.assertEqual(Job.SUCCESS, job.status)
+                self.assertEqual(forecast.pred_eles.count(), forecast2.pred_eles.count())
+
+
     def test__upload_forecast_worker_atomic(self):
         # test `_upload_forecast_worker()` does not create a Forecast if subsequent calls to
         # `load_predictions_from_json_io_dict()` or `cache_forecast_metadata()` fail. this test is complicated by that
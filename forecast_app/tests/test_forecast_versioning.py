@@ -2,18 +2,21 @@ import datetime
 import json
 import time
 from pathlib import Path
+from unittest.mock import patch
 
 import django
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
 
-from forecast_app.models import Forecast, TimeZero, ForecastModel
+from forecast_app.models import Forecast, TimeZero, ForecastModel, PredictionElement, LatestPredictionElement
+from utils.dedup_index import DedupIndex
 from utils.forecast import load_predictions_from_json_io_dict, json_io_dict_from_forecast, cache_forecast_metadata, \
-    forecast_metadata, data_rows_from_forecast
+    forecast_metadata, data_rows_from_forecast, _validated_pred_ele_rows_for_pred_dicts
 from utils.make_minimal_projects import _make_docs_project
 from utils.project import models_summary_table_rows_for_project, latest_forecast_ids_for_project, \
     create_project_from_json, latest_forecast_cols_for_project
+from utils.project_queries import query_forecasts_for_project
 from utils.utilities import get_or_create_super_po_mo_users
 
 
@@ -236,7 +239,7 @@ class ForecastVersionsTestCase(TestCase):
             pred_dicts = json_io_dict['predictions']  # get some prediction elements to work with (29)
 
         # load progressively more data into f1 and f2. NB: it is OK to create f2 before we've loaded f1 b/c
-        # _is_pred_eles_subset_prev_versions() handles the special case of. o/w it would be invalid (version validation will fail b/c
+        # DedupIndex.is_subset_of_prev_versions() handles the special case of. o/w it would be invalid (version validation will fail b/c
         # f2 will be empty and therefore f1 will be a superset of it)
         f1 = Forecast.objects.create(forecast_model=forecast_model, source='f1', time_zero=tz1,
                                      issued_at=datetime.datetime.combine(tz1.timezero_date, datetime.time(),
@@ -316,6 +319,159 @@ class ForecastVersionsTestCase(TestCase):
             load_predictions_from_json_io_dict(f3, {'meta': {}, 'predictions': pred_dicts[2:4]})  # 0 & 1 missing
 
 
+    def test_dedup_index(self):
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        project = create_project_from_json(Path('forecast_app/tests/projects/docs-project.json'), po_user)
+        tz1 = TimeZero.objects.create(project=project, timezero_date=datetime.date(2020, 10, 4))
+        forecast_model = ForecastModel.objects.create(project=project, name='name', abbreviation='abbrev')
+
+        with open('forecast_app/tests/predictions/docs-predictions.json') as fp:
+            json_io_dict = json.load(fp)
+            pred_dicts = json_io_dict['predictions']  # get some prediction elements to work with (29)
+
+        f1 = Forecast.objects.create(forecast_model=forecast_model, source='f1', time_zero=tz1,
+                                     issued_at=datetime.datetime.combine(tz1.timezero_date, datetime.time(),
+                                                                         tzinfo=datetime.timezone.utc))
+        f2 = Forecast.objects.create(forecast_model=forecast_model, source='f2', time_zero=tz1,
+                                     issued_at=f1.issued_at + datetime.timedelta(days=1))
+        f3 = Forecast.objects.create(forecast_model=forecast_model, source='f3', time_zero=tz1,
+                                     issued_at=f1.issued_at + datetime.timedelta(days=2))
+        load_predictions_from_json_io_dict(f1, {'meta': {}, 'predictions': pred_dicts[:2]})
+        load_predictions_from_json_io_dict(f2, {'meta': {}, 'predictions': pred_dicts[:4]})  # 0 & 1 are dups
+
+        # the index covers all versions, but only versions before the forecast count for the subset rule
+        with self.assertNumQueries(2):
+            dedup_index = DedupIndex(f3)
+        self.assertEqual(4, len(dedup_index.keys))
+        self.assertFalse(dedup_index.is_legacy_hash)
+        f2_unit_target_pred_classes = set(f2.pred_eles.values_list('unit_id', 'target_id', 'pred_class'))
+        self.assertEqual(set(f1.pred_eles.values_list('unit_id', 'target_id', 'pred_class'))
+                         | f2_unit_target_pred_classes, dedup_index.prev_unit_target_pred_classes)
+        self.assertTrue(dedup_index.is_subset_of_prev_versions(f2_unit_target_pred_classes))
+        self.assertEqual(2, len(DedupIndex(f2).prev_unit_target_pred_classes))
+
+        # only the fifth prediction dict is new
+        _, pred_ele_rows = _validated_pred_ele_rows_for_pred_dicts(f3, pred_dicts[:5], False, True,
+                                                                   dedup_index=dedup_index)
+        self.assertEqual(pred_ele_rows[4:], dedup_index.unique_pred_ele_rows(pred_ele_rows))
+
+
+    def test_latest_pred_eles(self):
+        def exp_latest_pred_ele_ids():  # the rank 1 rows from _query_forecasts_sql_for_pred_class()
+            key_to_issued_at_id = {}
+            for pred_ele in PredictionElement.objects.filter(forecast__forecast_model=forecast_model) \
+                    .select_related('forecast'):
+                key = (pred_ele.forecast.time_zero_id, pred_ele.unit_id, pred_ele.target_id, pred_ele.pred_class)
+                if (key not in key_to_issued_at_id) or (pred_ele.forecast.issued_at > key_to_issued_at_id[key][0]):
+                    key_to_issued_at_id[key] = (pred_ele.forecast.issued_at, pred_ele.pk)
+            return {pred_ele_id for _, pred_ele_id in key_to_issued_at_id.values()}
+
+
+        def act_latest_pred_ele_ids():
+            return set(LatestPredictionElement.objects.filter(forecast_model=forecast_model)
+                       .values_list('pred_ele_id', flat=True))
+
+
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        project = create_project_from_json(Path('forecast_app/tests/projects/docs-project.json'), po_user)
+        tz1 = TimeZero.objects.create(project=project, timezero_date=datetime.date(2020, 10, 4))
+        forecast_model = ForecastModel.objects.create(project=project, name='name', abbreviation='abbrev')
+        with open('forecast_app/tests/predictions/docs-predictions.json') as fp:
+            pred_dicts = json.load(fp)['predictions']
+
+        f1 = Forecast.objects.create(forecast_model=forecast_model, source='f1', time_zero=tz1,
+                                     issued_at=datetime.datetime.combine(tz1.timezero_date, datetime.time(),
+                                                                         tzinfo=datetime.timezone.utc))
+        f2 = Forecast.objects.create(forecast_model=forecast_model, source='f2', time_zero=tz1,
+                                     issued_at=f1.issued_at + datetime.timedelta(days=1))
+        f3 = Forecast.objects.create(forecast_model=forecast_model, source='f3', time_zero=tz1,
+                                     issued_at=f1.issued_at + datetime.timedelta(days=2))
+
+        # load the middle version first, then the older one: f1's [0] stays masked by f2's, but its new [4] is latest
+        load_predictions_from_json_io_dict(f2, {'meta': {}, 'predictions': pred_dicts[:4]})
+        self.assertEqual(set(f2.pred_eles.values_list('id', flat=True)), act_latest_pred_ele_ids())
+        f1_pred_dicts = [dict(pred_dicts[0], prediction={'value': 9.9}), pred_dicts[4]]
+        load_predictions_from_json_io_dict(f1, {'meta': {}, 'predictions': f1_pred_dicts})
+        self.assertEqual(exp_latest_pred_ele_ids(), act_latest_pred_ele_ids())
+        self.assertEqual(5, len(act_latest_pred_ele_ids()))
+
+        # the newest version retracts [0] and duplicates the rest
+        f3_pred_dicts = [dict(pred_dicts[0], prediction=None)] + pred_dicts[1:5]
+        load_predictions_from_json_io_dict(f3, {'meta': {}, 'predictions': f3_pred_dicts})
+        self.assertEqual(exp_latest_pred_ele_ids(), act_latest_pred_ele_ids())
+
+        # queries that use the table return the same as ones that rank
+        as_of = (f3.issued_at + datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(sorted(query_forecasts_for_project(project, {'as_of': as_of}), key=str),
+                         sorted(query_forecasts_for_project(project, {}), key=str))
+
+        # deleting the newest version restores the previous ones
+        f3.delete()
+        self.assertEqual(exp_latest_pred_ele_ids(), act_latest_pred_ele_ids())
+        self.assertEqual(sorted(query_forecasts_for_project(project, {'as_of': f2.issued_at.isoformat()}), key=str),
+                         sorted(query_forecasts_for_project(project, {}), key=str))
+
+
+    def test_pred_ele_valid_tos(self):
+        def class_to_value(forecast):
+            return {pred_dict['class']: pred_dict['prediction']['value']
+                    for pred_dict in json_io_dict_from_forecast(forecast, None)['predictions']}
+
+
+        def class_to_valid_to(forecast):
+            return {PredictionElement.prediction_class_int_as_str(pred_class): valid_to
+                    for pred_class, valid_to in forecast.pred_eles.values_list('pred_class', 'valid_to')}
+
+
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        project = create_project_from_json(Path('forecast_app/tests/projects/docs-project.json'), po_user)
+        tz1 = TimeZero.objects.create(project=project, timezero_date=datetime.date(2020, 10, 4))
+        forecast_model = ForecastModel.objects.create(project=project, name='name', abbreviation='abbrev')
+        with open('forecast_app/tests/predictions/docs-predictions.json') as fp:
+            pred_dicts = json.load(fp)['predictions']  # [0] to [3]: point, mean, median, mode for the same unit/target
+
+        f1 = Forecast.objects.create(forecast_model=forecast_model, source='f1', time_zero=tz1,
+                                     issued_at=datetime.datetime.combine(tz1.timezero_date, datetime.time(),
+                                                                         tzinfo=datetime.timezone.utc))
+        f2 = Forecast.objects.create(forecast_model=forecast_model, source='f2', time_zero=tz1,
+                                     issued_at=f1.issued_at + datetime.timedelta(days=1))
+        f3 = Forecast.objects.create(forecast_model=forecast_model, source='f3', time_zero=tz1,
+                                     issued_at=f1.issued_at + datetime.timedelta(days=2))
+
+        # f2 retracts the point, changes the mean, and duplicates the median
+        load_predictions_from_json_io_dict(f1, {'meta': {}, 'predictions': pred_dicts[:3]})
+        self.assertEqual({'point': None, 'mean': None, 'median': None}, class_to_valid_to(f1))
+        load_predictions_from_json_io_dict(f2, {'meta': {}, 'predictions': [
+            dict(pred_dicts[0], prediction=None), dict(pred_dicts[1], prediction={'value': 9.9}), pred_dicts[2]]})
+        self.assertEqual({'point': f2.issued_at, 'mean': f2.issued_at, 'median': None}, class_to_valid_to(f1))
+        self.assertEqual({'point': None, 'mean': None}, class_to_valid_to(f2))
+
+        # f3 changes the point and adds a mode
+        load_predictions_from_json_io_dict(f3, {'meta': {}, 'predictions': [
+            dict(pred_dicts[0], prediction={'value': 3.3}), dict(pred_dicts[1], prediction={'value': 9.9}),
+            pred_dicts[2], pred_dicts[3]]})
+        self.assertEqual({'point': f3.issued_at, 'mean': None}, class_to_valid_to(f2))
+
+        # as_of queries (f1 and f2) and latest ones (f3) agree
+        self.assertEqual({'point': 2.1, 'mean': 2.11, 'median': 2.12}, class_to_value(f1))
+        self.assertEqual({'mean': 9.9, 'median': 2.12}, class_to_value(f2))
+        self.assertEqual({'point': 3.3, 'mean': 9.9, 'median': 2.12, 'mode': 2.13}, class_to_value(f3))
+
+        # editing issued_at moves the intervals, but other edits do not recompute them
+        with patch('utils.forecast._update_version_pred_ele_valid_tos') as update_mock:
+            f3.notes = 'edited notes'
+            f3.save()
+            update_mock.assert_not_called()
+
+        f3.issued_at += datetime.timedelta(hours=1)
+        f3.save()
+        self.assertEqual({'point': f3.issued_at, 'mean': None}, class_to_valid_to(f2))
+
+        # deleting the newest version makes the previous ones valid until further notice
+        f3.delete()
+        self.assertEqual({'point': None, 'mean': None}, class_to_valid_to(f2))
+
+
     def test_non_subset_forecast_version_rules(self):
         """
         Tests these forecast rules:
@@ -0,0 +1,42 @@
+import io
+import json
+from unittest import TestCase
+
+from utils.json_io import prediction_dicts_from_json_fp
+
+
+class JsonIOTestCase(TestCase):
+    """
+    Tests incremental parsing of "JSON IO dict" files.
+    """
+
+
+    def test_prediction_dicts_from_json_fp(self):
+        # same output as json.load(), including when values are split across reads
+        with open('forecast_app/tests/predictions/docs-predictions.json') as json_fp:
+            json_str = json_fp.read()
+        exp_pred_dicts = json.loads(json_str)['predictions']
+        for read_size in [1, 7, 1_000, 1_000_000]:
+            self.assertEqual(exp_pred_dicts, list(prediction_dicts_from_json_fp(io.StringIO(json_str), read_size)))
+
+        # 'meta' is ignored regardless of position, and numbers split across reads are not truncated
+        json_str = '{"predictions": [{"value": 12345}, {"value": 6.5e3}], "meta": {"a": [1, 2]}}'
+        for read_size in [1, 2, 3, 1_000]:
+            self.assertEqual([{'value': 12345}, {'value': 6500.0}],
+                             list(prediction_dicts_from_json_fp(io.StringIO(json_str), read_size)))
+
+        # empty predictions
+        self.assertEqual([], list(prediction_dicts_from_json_fp(io.StringIO('{"meta": {}, "predictions": []}'))))
+
+        # errors
+        for json_str, exp_error in [('', "json_io_dict was not a dict"),
+                                    ('[]', "json_io_dict was not a dict"),
+                                    ('{}', "json_io_dict had no 'predictions' key"),
+                                    ('{"meta": {}}', "json_io_dict had no 'predictions' key"),
+                                    ('{"predictions": {}}', "'predictions' was not a list"),
+                                    ('{"predictions": [1 2]}', "invalid json"),
+                                    ('{"predictions": [1,]}', "invalid json"),
+                                    ('{"predictions": [{"a": 1}', "invalid json"),
+                                    ('{"predictions": []} x', "extra data after json_io_dict")]:
+            with self.assertRaisesRegex(RuntimeError, exp_error):
+                list(prediction_dicts_from_json_fp(io.StringIO(json_str), 3))
@@ -1,16 +1,21 @@
 import datetime
+import json
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 from django.test import TestCase
 
 from forecast_app.models import ForecastModel, TimeZero, Forecast, Target
 from forecast_app.models.prediction_data import PredictionData
+from forecast_app.models.project import update_project_versions
 from forecast_app.models.target import TargetRange
-from utils.forecast import load_predictions_from_json_io_dict, NamedData
+from utils.forecast import load_predictions_from_json_io_dict, NamedData, _validate_prediction_dicts, \
+    _validated_pred_ele_rows_for_pred_dicts
 from utils.project import create_project_from_json
 from utils.project_truth import load_truth_data, truth_data_qs, oracle_model_for_project
 from utils.utilities import get_or_create_super_po_mo_users
+from utils.validation_context import validation_context_for_project
 
 
 #
@@ -646,6 +651,71 @@ class PredictionValidationTestCase(TestCase):
             self.fail(f"unexpected exception: {ex}")
 
 
+    def test_batch_validation(self):
+        # tests that `_validate_prediction_dicts()`'s NumPy screens pass valid predictions, including ones that are
+        # within tolerances, and that an invalid prediction among many valid ones is reported with its unit and target
+        validation_context = validation_context_for_project(self.project)
+        ok_pred_dicts = [
+            {"unit": "loc1", "target": "pct next week", "class": "quantile",
+             "prediction": {"quantile": [0.975, 0.025, 0.5], "value": [50.0, 1.0, 1.0 - 1e-06]}},  # sorted, ~equal
+            {"unit": "loc1", "target": "cases next week", "class": "quantile",
+             "prediction": {"quantile": [0, 1], "value": [0, 99_999]}},
+            {"unit": "loc1", "target": "pct next week", "class": "bin",
+             "prediction": {"cat": [1.1, 2.2], "prob": [0.5, 0.5009]}},  # sum within BIN_SUM_REL_TOL
+            {"unit": "loc1", "target": "cases next week", "class": "sample",
+             "prediction": {"sample": [0, 2, 50]}}]
+        try:
+            _validate_prediction_dicts(ok_pred_dicts * 100, validation_context, True)
+        except Exception as ex:
+            self.fail(f"unexpected exception: {ex}")
+
+        bad_pred_dict_exp_messages = [
+            ({"unit": "loc3", "target": "pct next week", "class": "quantile",
+              "prediction": {"quantile": [0.25, 0.75], "value": [2.0, 1.0]}}, "must be non-decreasing"),
+            ({"unit": "loc3", "target": "pct next week", "class": "quantile",
+              "prediction": {"quantile": [0.25, 0.25], "value": [1.0, 1.0]}}, "must be unique"),
+            ({"unit": "loc3", "target": "cases next week", "class": "quantile",
+              "prediction": {"quantile": [0.25, 0.75], "value": [1, 100_000]}}, "must obey existing ranges"),
+            ({"unit": "loc3", "target": "pct next week", "class": "bin",
+              "prediction": {"cat": [1.1, 2.2], "prob": [0.5, 0.6]}}, "must sum to 1.0"),
+            ({"unit": "loc3", "target": "pct next week", "class": "bin",
+              "prediction": {"cat": [1.1, 2.2], "prob": [-0.5, 1.5]}}, "must be numbers in [0, 1]"),
+            ({"unit": "loc3", "target": "pct next week", "class": "bin",
+              "prediction": {"cat": [1.1, 4.4], "prob": [0.5, 0.5]}}, "must be a subset of `Target.cats`"),
+            ({"unit": "loc3", "target": "cases next week", "class": "sample",
+              "prediction": {"sample": [0, 2, 1.5]}}, "The data format of `sample` should correspond"),
+            ({"unit": "loc3", "target": "pct next week", "class": "sample",
+              "prediction": {"sample": [0.0, 100.0]}}, "should be contained within `range`")]
+        for bad_pred_dict, exp_message in bad_pred_dict_exp_messages:
+            pred_dicts = ok_pred_dicts * 10 + [bad_pred_dict] + ok_pred_dicts * 10
+            with self.assertRaises(RuntimeError) as context:
+                _validate_prediction_dicts(pred_dicts, validation_context, True)
+            self.assertIn(exp_message, str(context.exception))
+            self.assertIn("'unit': 'loc3'", str(context.exception))
+
+
+    def test_parallel_validation(self):
+        # tests that sharding by unit across processes gives the same rows (in the same order) as serial validation,
+        # and that a worker's validation error is raised in the caller
+        with open('forecast_app/tests/predictions/docs-predictions.json') as fp:
+            prediction_dicts = json.load(fp)['predictions']
+        exp_rows = _validated_pred_ele_rows_for_pred_dicts(self.forecast, prediction_dicts, False, True)
+        with patch('utils.forecast.PARALLEL_VALIDATION_MIN_NUM_PRED_DICTS', 0):
+            for num_workers in [2, 3, 10]:
+                self.assertEqual(exp_rows, _validated_pred_ele_rows_for_pred_dicts(self.forecast, prediction_dicts,
+                                                                                   False, True, num_workers))
+
+            bad_pred_dict = {"unit": "loc3", "target": "pct next week", "class": "point", "prediction": {"value": -1.0}}
+            with self.assertRaisesRegex(RuntimeError, "should be contained within `range`"):
+                _validated_pred_ele_rows_for_pred_dicts(self.forecast, prediction_dicts + [bad_pred_dict], False, True,
+                                                        2)
+
+            # "prediction"-level validation is done within a shard
+            with self.assertRaisesRegex(RuntimeError, "cannot be more than 1 Prediction Element of the same"):
+                _validated_pred_ele_rows_for_pred_dicts(self.forecast, prediction_dicts + prediction_dicts[:1], False,
+                                                        True, 2)
+
+
     # `value` (i, f, d)
     def test_entries_in_value_must_obey_existing_ranges_for_targets(self):
         # 'pct next week': continuous. range: [0.0, 100.0]
@@ -1045,6 +1115,7 @@ class PredictionValidationTestCase(TestCase):
         # - docs-ground-truth-bad-continuous-range-equal-upper.csv: is now valid
         pct_next_week_target = Target.objects.filter(name='pct next week').first()
         TargetRange.objects.filter(target=pct_next_week_target).delete()
+        update_project_versions(self.project.pk)  # set_range() does this, but there's no API to remove a range
         with self.assertRaises(RuntimeError) as context:
             load_truth_data(self.project, Path('forecast_app/tests/truth_data',
                                                'docs-ground-truth-bad-continuous-range-lt-lower.csv'))
@@ -1077,6 +1148,7 @@ class PredictionValidationTestCase(TestCase):
         # - docs-ground-truth-bad-discrete-range-equal-upper.csv: is now valid
         cases_next_week_target = Target.objects.filter(name='cases next week').first()
         TargetRange.objects.filter(target=cases_next_week_target).delete()
+        update_project_versions(self.project.pk)  # set_range() does this, but there's no API to remove a range
         with self.assertRaises(RuntimeError) as context:
             load_truth_data(self.project, Path('forecast_app/tests/truth_data',
                                                'docs-ground-truth-bad-discrete-range-lt-lower.csv'))
@@ -5,11 +5,14 @@ from pathlib import Path
 
 from django.test import TestCase
 
-from forecast_app.models import Forecast, PredictionElement, PredictionData
-from forecast_app.models import ForecastModel, TimeZero
+from forecast_app.models import Forecast, PredictionElement, PredictionData, HashedPredictionData
+from forecast_app.models import ForecastModel, TimeZero, Project
+from forecast_app.models.prediction_data import packed_pred_data, unpacked_pred_data
 from forecast_app.models.prediction_element import PRED_CLASS_NAME_TO_INT
 from forecast_app.tests.test_project_queries import ProjectQueriesTestCase
-from utils.forecast import load_predictions_from_json_io_dict, _validated_pred_ele_rows_for_pred_dicts
+from utils.forecast import load_predictions_from_json_io_dict, _validated_pred_ele_rows_for_pred_dicts, \
+    rehash_forecast, load_predictions_from_prediction_dicts, json_io_dict_from_forecast, hash_forecast_pred_data, \
+    pred_data_storage_report, delete_unreferenced_hashed_pred_data, pack_forecast_pred_data
 from utils.make_minimal_projects import _make_docs_project
 from utils.project import create_project_from_json
 from utils.project_queries import query_truth_for_project, query_forecasts_for_project
@@ -40,7 +43,22 @@ class PredictionsTestCase(TestCase):
             ('c74e3f626224eeb482368d9fb7a387da',
              {"cat": ["2019-12-15", "2019-12-22", "2019-12-29"], "prob": [0.01, 0.1, 0.89]}),
         ]:
-            self.assertEqual(exp_hash, PredictionElement.hash_for_prediction_data_dict(prediction_dict))
+            self.assertEqual(exp_hash, PredictionElement.hash_for_prediction_data_dict(
+                prediction_dict, PredictionElement.MD5_JSON_HASH_VERSION))
+
+        # current version. like the json-based one, types are distinguished and key order does not matter
+        self.assertEqual('cdf2f407de221f37c66bfdec0b880031',
+                         PredictionElement.hash_for_prediction_data_dict({"family": "pois", "param1": 1.1}))
+        distinct_prediction_dicts = [{"value": 1}, {"value": 1.0}, {"value": "1"}, {"value": True},
+                                     {"sample": [0, 2, 5]}, {"sample": [0, 2.0, 5]}, {"sample": [0.0, 2.0, 5.0]},
+                                     {"sample": [2 ** 70, 1]}, {"sample": [2 ** 70, 2]}, {"sample": []},
+                                     {"cat": ["a", "bc"], "prob": [0.5, 0.5]}, {"cat": ["ab", "c"], "prob": [0.5, 0.5]}]
+        self.assertEqual(len(distinct_prediction_dicts),
+                         len({PredictionElement.hash_for_prediction_data_dict(prediction_dict)
+                              for prediction_dict in distinct_prediction_dicts}))
+        self.assertEqual(
+            PredictionElement.hash_for_prediction_data_dict({"quantile": [0.25, 0.75], "value": [0, 50]}),
+            PredictionElement.hash_for_prediction_data_dict({"value": [0, 50], "quantile": [0.25, 0.75]}))
 
 
     def test_load_predictions_from_json_io_dict_existing_pred_eles(self):
@@ -72,38 +90,38 @@ class PredictionsTestCase(TestCase):
         self.assertEqual(32, forecast.pred_eles.count())
         self.assertEqual(0, PredictionElement.objects.filter(is_retract=True).count())
 
-        exp_rows = [('point', 'location1', 'pct next week', '2c343e1ea37e8b493c219066a8664276'),
-                    ('mean', 'location1', 'pct next week', '4723aed2e3667f67e470bd8580d5510c'),
-                    ('median', 'location1', 'pct next week', '4e5842f95986fb7e64c484990d6387cf'),
-                    ('mode', 'location1', 'pct next week', '61ba7e3fbe6d0961a70ca041c089e7c1'),
-                    ('named', 'location1', 'pct next week', '58a7f8487958446d57333b262aaa8271'),
-                    ('point', 'location2', 'pct next week', '2b9db448ae1a3b7065ffee67d4857268'),
-                    ('bin', 'location2', 'pct next week', '7d1485af48de540dbcd954ee5cba51cb'),
-                    ('quantile', 'location2', 'pct next week', '0d3698e4e39456b8e36c750d73bb6870'),
-                    ('point', 'location3', 'pct next week', '5d321ea39f0af08cb3f40a58fa7c54d4'),
-                    ('sample', 'location3', 'pct next week', '0b431a76d5ad343981944c4b0792d738'),
-                    ('named', 'location1', 'cases next week', '845e3d041b6be23a381b6afd263fb113'),
-                    ('point', 'location2', 'cases next week', '2ed5d7d59eb10044644ab28a1b292efb'),
-                    ('sample', 'location2', 'cases next week', '74135c30ddfd5427c8b1e86b2989a642'),
-                    ('point', 'location3', 'cases next week', 'a6ff82cc0637f67254df41352e1c00f9'),
-                    ('bin', 'location3', 'cases next week', 'a74ea3f2472e0aec511eb1f604282220'),
-                    ('quantile', 'location3', 'cases next week', '838e6e3f77075f69eef3bb3d7bcdffdc'),
-                    ('point', 'location1', 'season severity', 'bc55989f596fd157ccc6e3279b1f694a'),
-                    ('bin', 'location1', 'season severity', 'ac263a19694da72f65e903c2ec2000d1'),
-                    ('point', 'location2', 'season severity', 'ec5add7ea7a8abf3e68e9570d0b73898'),
-                    ('sample', 'location2', 'season severity', '51d07bda3e8a39da714f5767d93704ff'),
-                    ('point', 'location1', 'above baseline', '19d0e94bc24114abfa0d07ca41b8b3bf'),
-                    ('bin', 'location2', 'above baseline', '1b98c3c7b5b09d3ba0ea43566d5e9d03'),
-                    ('sample', 'location2', 'above baseline', 'ae168d5bfdad1463672120d51787fed2'),
-                    ('sample', 'location3', 'above baseline', '380b79bea27bfa66e8864cfec9e3403a'),
-                    ('point', 'location1', 'Season peak week', 'fad04bc4cd443ca7cd7cd53f5de4fa99'),
-                    ('bin', 'location1', 'Season peak week', 'c74e3f626224eeb482368d9fb7a387da'),
-                    ('sample', 'location1', 'Season peak week', '2f0fdc8a293046d38eb912601cf0a5cf'),
-                    ('point', 'location2', 'Season peak week', '39c511635eb21cfde3657ab144521b94'),
-                    ('bin', 'location2', 'Season peak week', '4fa62ed754c3fc9b9ede90926efe8f7f'),
-                    ('quantile', 'location2', 'Season peak week', 'd06cb30665b099e471c6dd9d50ba2c30'),
-                    ('point', 'location3', 'Season peak week', 'f15fab078daf9adb53f464272b31dbf6'),
-                    ('sample', 'location3', 'Season peak week', '213d829834bceaaa4376a79b989161c3'), ]
+        exp_rows = [('point', 'location1', 'pct next week', 'b5d12c50f19893b7b79ac28e4cd4cc28'),
+                    ('mean', 'location1', 'pct next week', 'b0ee711ae20d122ba1456113fafd986e'),
+                    ('median', 'location1', 'pct next week', 'd1534b9b90b309d5383bd9de7422220f'),
+                    ('mode', 'location1', 'pct next week', '66cba1f6032fe5375963a165fc1994c0'),
+                    ('named', 'location1', 'pct next week', 'a8e8fd3a2588362c16308393922616b1'),
+                    ('point', 'location2', 'pct next week', '1d544c2919e439bdaab4868d0df6c607'),
+                    ('bin', 'location2', 'pct next week', '8eb5213ef5d69994a0aa118a7b14cb11'),
+                    ('quantile', 'location2', 'pct next week', 'ccdf488ea16e2d49e6558089059cf2ee'),
+                    ('point', 'location3', 'pct next week', 'c266cd55fae23f823b84c16241f22163'),
+                    ('sample', 'location3', 'pct next week', '3f9491f00f2553e5ecbb6a4b84e7a8d5'),
+                    ('named', 'location1', 'cases next week', 'cdf2f407de221f37c66bfdec0b880031'),
+                    ('point', 'location2', 'cases next week', '9dced738e286bde6b10561b919555534'),
+                    ('sample', 'location2', 'cases next week', '4e0d263a002a42b59434355e477811db'),
+                    ('point', 'location3', 'cases next week', 'b9de244f42795848a5ff60577df4dd9c'),
+                    ('bin', 'location3', 'cases next week', '4b8bd95f6f393f76ae39a948ffdb29c3'),
+                    ('quantile', 'location3', 'cases next week', '2c10425dbeae464afd73a9b6e2e7419a'),
+                    ('point', 'location1', 'season severity', 'b7510587257699dab94dfa7bd1df93ad'),
+                    ('bin', 'location1', 'season severity', '9852e323835160f25125755633a68cb0'),
+                    ('point', 'location2', 'season severity', '5bec0a576526f939aebfe7860215ff09'),
+                    ('sample', 'location2', 'season severity', 'fe12f2f98edca7a48542c82f5c015e7a'),
+                    ('point', 'location1', 'above baseline', '36507afe348f58d83f19700ff746a77e'),
+                    ('bin', 'location2', 'above baseline', '08c37abb2337d02d15327ce22092f709'),
+                    ('sample', 'location2', 'above baseline', 'abcc4aaaa773db333fdd546448e40ba1'),
+                    ('sample', 'location3', 'above baseline', '3502696cee32ab67abd81980bb486751'),
+                    ('point', 'location1', 'Season peak week', '0657cc88561e4fde6f8e260789eacc64'),
+                    ('bin', 'location1', 'Season peak week', 'fd7605f2acd5d48e754841e91ef7a92e'),
+                    ('sample', 'location1', 'Season peak week', '9f830b12e70c1ea69cb1edc0f29a0809'),
+                    ('point', 'location2', 'Season peak week', '588cd8534b4a45f9c6f258d3ddd6ae17'),
+                    ('bin', 'location2', 'Season peak week', '424ce811e9ce1aa62580770e9912b52e'),
+                    ('quantile', 'location2', 'Season peak week', '16831d19813cafb07f227c25d180e5c4'),
+                    ('point', 'location3', 'Season peak week', '69db2c800be9fb88e1cde54af048740c'),
+                    ('sample', 'location3', 'Season peak week', 'c560f4ed037f66eec5317d84607f77c7'), ]
         pred_data_qs = PredictionElement.objects \
             .filter(forecast=forecast) \
             .values_list('pred_class', 'unit__name', 'target__name', 'data_hash') \
@@ -272,6 +290,156 @@ class PredictionsTestCase(TestCase):
         self.assertEqual(30 + 31 + 2 + 1, project.num_pred_ele_rows_all_models(is_oracle=False))
 
 
+    def test_load_predictions_from_json_io_dict_dups_hash_versions(self):
+        # duplicates of previous versions are skipped regardless of the version's hash_version, and rehash_forecast()
+        # updates old ones
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        project, time_zero, forecast_model, f1 = _make_docs_project(po_user)  # loads docs-predictions.json
+        with open('forecast_app/tests/predictions/docs-predictions.json') as fp:
+            pred_dicts = json.load(fp)['predictions']
+
+        # simulate f1 having been loaded before hash_version existed
+        for pred_ele in f1.pred_eles.filter(is_retract=False):
+            pred_ele.data_hash = PredictionElement.hash_for_prediction_data_dict(
+                pred_ele.pred_data.data, PredictionElement.MD5_JSON_HASH_VERSION)
+            pred_ele.hash_version = PredictionElement.MD5_JSON_HASH_VERSION
+            pred_ele.save()
+        num_pred_eles = f1.pred_eles.count()
+
+        f1.issued_at -= datetime.timedelta(days=1)
+        f1.save()
+        f2 = Forecast.objects.create(forecast_model=forecast_model, time_zero=time_zero)
+        with self.assertRaisesRegex(RuntimeError, "cannot load 100% duplicate data"):
+            load_predictions_from_json_io_dict(f2, {'predictions': pred_dicts}, is_validate_cats=False)
+
+        pred_dicts[0]['prediction']['value'] += 1  # a point prediction
+        load_predictions_from_json_io_dict(f2, {'predictions': pred_dicts}, is_validate_cats=False)
+        self.assertEqual(1, f2.pred_eles.count())
+        self.assertEqual(PredictionElement.CURRENT_HASH_VERSION, f2.pred_eles.first().hash_version)
+
+        # re-hash f1. then the same file is still 100% duplicate data
+        self.assertEqual(num_pred_eles, rehash_forecast(f1, batch_size=7))
+        self.assertEqual(0, rehash_forecast(f1))
+        for pred_ele in f1.pred_eles.all():
+            self.assertEqual(PredictionElement.CURRENT_HASH_VERSION, pred_ele.hash_version)
+            self.assertEqual(PredictionElement.hash_for_prediction_data_dict(pred_ele.pred_data.data),
+                             pred_ele.data_hash)
+
+        f2.issued_at -= datetime.timedelta(hours=1)
+        f2.save()
+        f3 = Forecast.objects.create(forecast_model=forecast_model, time_zero=time_zero)
+        with self.assertRaisesRegex(RuntimeError, "cannot load 100% duplicate data"):
+            load_predictions_from_json_io_dict(f3, {'predictions': pred_dicts}, is_validate_cats=False)
+
+
+    def test_hashed_pred_data_storage(self):
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        project = create_project_from_json(Path('forecast_app/tests/projects/docs-project.json'), po_user)
+        project.pred_data_storage = Project.HASHED_PRED_DATA_STORAGE
+        project.save()
+        time_zero = project.timezeros.filter(timezero_date=datetime.date(2011, 10, 2)).first()
+        with open('forecast_app/tests/predictions/docs-predictions.json') as fp:
+            pred_dicts = json.load(fp)['predictions']
+        exp_pred_dicts = sorted([pred_dict for pred_dict in pred_dicts if pred_dict['prediction'] is not None],
+                                key=lambda _: (_['unit'], _['target'], _['class']))
+        num_data_hashes = len({PredictionElement.hash_for_prediction_data_dict(pred_dict['prediction'])
+                               for pred_dict in exp_pred_dicts})
+
+        # two models with the same data share it, via both load functions
+        forecasts = []
+        for abbreviation in ['mod1', 'mod2']:
+            forecast_model = ForecastModel.objects.create(project=project, name=abbreviation, abbreviation=abbreviation)
+            forecasts.append(Forecast.objects.create(forecast_model=forecast_model, time_zero=time_zero))
+        load_predictions_from_json_io_dict(forecasts[0], {'predictions': pred_dicts}, is_validate_cats=False)
+        load_predictions_from_prediction_dicts(forecasts[1], pred_dicts, is_validate_cats=False, chunk_size=5)
+        self.assertEqual(0, PredictionData.objects.filter(pred_ele__forecast__forecast_model__project=project).count())
+        self.assertEqual(num_data_hashes, HashedPredictionData.objects.count())
+        self.assertEqual({'num_pred_eles': 2 * len(exp_pred_dicts), 'num_pred_data': 0,
+                          'num_hashed_pred_eles': 2 * len(exp_pred_dicts), 'num_hashed_pred_data': num_data_hashes,
+                          'dedup_ratio': 2 * len(exp_pred_dicts) / num_data_hashes},
+                         pred_data_storage_report(project))
+        for forecast in forecasts:
+            act_pred_dicts = json_io_dict_from_forecast(forecast, None)['predictions']
+            self.assertEqual(exp_pred_dicts, sorted(act_pred_dicts, key=lambda _: (_['unit'], _['target'], _['class'])))
+
+        # move a per-element forecast's data
+        project.pred_data_storage = Project.PER_ELEMENT_PRED_DATA_STORAGE
+        project.save()
+        forecast_model = ForecastModel.objects.create(project=project, name='mod3', abbreviation='mod3')
+        forecasts.append(Forecast.objects.create(forecast_model=forecast_model, time_zero=time_zero))
+        load_predictions_from_json_io_dict(forecasts[2], {'predictions': pred_dicts}, is_validate_cats=False)
+        self.assertEqual(len(exp_pred_dicts), PredictionData.objects.filter(pred_ele__forecast=forecasts[2]).count())
+        self.assertEqual(len(exp_pred_dicts), hash_forecast_pred_data(forecasts[2]))
+        self.assertEqual(0, PredictionData.objects.filter(pred_ele__forecast=forecasts[2]).count())
+        self.assertEqual(num_data_hashes, HashedPredictionData.objects.count())
+        act_pred_dicts = json_io_dict_from_forecast(forecasts[2], None)['predictions']
+        self.assertEqual(exp_pred_dicts, sorted(act_pred_dicts, key=lambda _: (_['unit'], _['target'], _['class'])))
+
+        # unreferenced data is only deleted once no forecast uses it
+        self.assertEqual(0, delete_unreferenced_hashed_pred_data())
+        for forecast in forecasts:
+            forecast.delete()
+        self.assertEqual(num_data_hashes, delete_unreferenced_hashed_pred_data())
+
+
+    def test_packed_pred_data(self):
+        for prediction_data, exp_data, is_exp_packed in [
+            ({"quantile": [0.25, 0.75], "value": [0, 50]}, {"quantile": None, "value": None}, True),
+            ({"cat": ["mild", "severe"], "prob": [0.1, 0.9]}, {"cat": ["mild", "severe"], "prob": None}, True),
+            ({"sample": [0, 2.5]}, {"sample": [0, 2.5]}, False),  # mixed types
+            ({"sample": [1.0, -0.0]}, {"sample": [1.0, -0.0]}, False),  # -0.0 is not preserved by jsonb
+            ({"sample": [1e16]}, {"sample": [1e16]}, False),  # "" exponents
+            ({"sample": [2 ** 63]}, {"sample": [2 ** 63]}, False),  # > int64
+            ({"sample": []}, {"sample": []}, False),
+            ({"family": "norm", "param1": 1.1}, {"family": "norm", "param1": 1.1}, False),
+            ({"value": 5}, {"value": 5}, False),
+        ]:
+            act_data, act_packed = packed_pred_data(prediction_data)
+            self.assertEqual(exp_data, act_data)
+            self.assertEqual(is_exp_packed, act_packed is not None)
+            self.assertEqual(json.dumps(prediction_data), json.dumps(unpacked_pred_data(act_data, act_packed)))
+
+
+    def test_packed_pred_data_encoding(self):
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        project = create_project_from_json(Path('forecast_app/tests/projects/docs-project.json'), po_user)
+        time_zero = project.timezeros.filter(timezero_date=datetime.date(2011, 10, 2)).first()
+        with open('forecast_app/tests/predictions/docs-predictions.json') as fp:
+            pred_dicts = json.load(fp)['predictions']
+        exp_pred_dicts = sorted([pred_dict for pred_dict in pred_dicts if pred_dict['prediction'] is not None],
+                                key=lambda _: (_['unit'], _['target'], _['class']))
+
+        # one json-encoded forecast, then packed ones via both load functions and both storages
+        forecasts = []
+        for abbreviation in ['mod1', 'mod2', 'mod3', 'mod4']:
+            forecast_model = ForecastModel.objects.create(project=project, name=abbreviation, abbreviation=abbreviation)
+            forecasts.append(Forecast.objects.create(forecast_model=forecast_model, time_zero=time_zero))
+        load_predictions_from_json_io_dict(forecasts[0], {'predictions': pred_dicts}, is_validate_cats=False)
+        self.assertEqual(0, PredictionData.objects.filter(packed__isnull=False).count())
+
+        project.pred_data_encoding = Project.PACKED_PRED_DATA_ENCODING
+        project.save()
+        load_predictions_from_json_io_dict(forecasts[1], {'predictions': pred_dicts}, is_validate_cats=False)
+        load_predictions_from_prediction_dicts(forecasts[2], pred_dicts, is_validate_cats=False, chunk_size=5)
+        project.pred_data_storage = Project.HASHED_PRED_DATA_STORAGE
+        project.save()
+        load_predictions_from_prediction_dicts(forecasts[3], pred_dicts, is_validate_cats=False, chunk_size=5)
+        for forecast in forecasts[1:3]:
+            pred_data = PredictionData.objects.get(pred_ele__forecast=forecast, pred_ele__unit__abbreviation='loc2',
+                                                   pred_ele__target__name='pct next week',
+                                                   pred_ele__pred_class=PRED_CLASS_NAME_TO_INT['quantile'])
+            self.assertEqual({'quantile': None, 'value': None}, pred_data.data)
+            self.assertIsNotNone(pred_data.packed)
+        self.assertNotEqual(0, HashedPredictionData.objects.filter(packed__isnull=False).count())
+
+        # migrate the json-encoded one
+        self.assertNotEqual(0, pack_forecast_pred_data(forecasts[0]))
+        self.assertEqual(0, pack_forecast_pred_data(forecasts[0]))  # already packed
+        for forecast in forecasts:
+            act_pred_dicts = json_io_dict_from_forecast(forecast, None)['predictions']
+            self.assertEqual(exp_pred_dicts, sorted(act_pred_dicts, key=lambda _: (_['unit'], _['target'], _['class'])))
+
+
     #
     # test "retracted" and skipped predictions for truth
     #
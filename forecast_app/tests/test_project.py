@@ -1,4 +1,5 @@
 import datetime
+import io
 import json
 import logging
 from pathlib import Path
@@ -112,6 +113,37 @@ class ProjectTestCase(TestCase):
         self.assertEqual(14 * 2, truth_data_qs(project).count())
 
 
+    def test_load_truth_data_partial_dups(self):
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        project, time_zero, forecast_model, forecast = _make_docs_project(po_user)  # loads docs-ground-truth.csv
+        oracle_model = oracle_model_for_project(project)
+
+        # change one value in the 2011-10-09 timezero and add one unit/target to the 2011-10-16 one. only those two
+        # timezeros get new oracle forecasts, each containing only the new rows
+        with open('forecast_app/tests/truth_data/docs-ground-truth.csv') as fp:
+            csv_str = fp.read().replace('2011-10-09,loc2,cases next week,3', '2011-10-09,loc2,cases next week,4') \
+                      + '\n2011-10-16,loc2,cases next week,7\n'
+        num_queries_fp = io.StringIO(csv_str)
+        # constant regardless of the number of timezeros. includes one query each to update PredictionElement.valid_to
+        # and LatestPredictionElement, and one to bump Project.data_version
+        with self.assertNumQueries(23):
+            num_rows, forecasts, _, _, _ = load_truth_data(project, num_queries_fp, file_name='partial.csv')
+        self.assertEqual(15, num_rows)
+        self.assertEqual(['2011-10-09', '2011-10-16'],
+                         [forecast.time_zero.timezero_date.strftime('%Y-%m-%d') for forecast in forecasts])
+        self.assertEqual(1, len({(forecast.source, forecast.issued_at) for forecast in forecasts}))
+        self.assertEqual(3 + 2, oracle_model.forecasts.count())
+        self.assertEqual([[('loc2', 'cases next week', {'value': 4})], [('loc2', 'cases next week', {'value': 7})]],
+                         [[(pred_ele.unit.abbreviation, pred_ele.target.name, pred_ele.pred_data.data)
+                           for pred_ele in forecast.pred_eles.all()] for forecast in forecasts])
+
+        # test "you cannot position a new forecast before any existing versions"
+        csv_str = csv_str.replace('2011-10-16,loc2,cases next week,7', '2011-10-16,loc2,cases next week,8')
+        with self.assertRaisesRegex(RuntimeError, "you cannot position a new forecast before any existing versions"):
+            load_truth_data(project, io.StringIO(csv_str), file_name='partial.csv',
+                            issued_at=(forecasts[0].issued_at - datetime.timedelta(days=1)).isoformat())
+
+
     def test_load_truth_data_diff(self):
         """
         Tests the relaxing of this forecast version rule when loading truth (issue
@@ -1,25 +1,35 @@
+import csv
 import datetime
+import gzip
+import io
 import json
 import logging
 import statistics
+import tempfile
+from itertools import groupby
 from numbers import Number
 from pathlib import Path
+from types import SimpleNamespace
 from unittest.mock import patch
 
 import numpy
 from botocore.exceptions import BotoCoreError
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
 
 from forecast_app.models import TimeZero, Forecast, Job, Unit, Target
 from forecast_app.models.forecast_model import ForecastModel
-from forecast_app.models.prediction_element import PRED_CLASS_INT_TO_NAME
-from utils.forecast import load_predictions_from_json_io_dict, NamedData
+from forecast_app.models.prediction_element import PRED_CLASS_INT_TO_NAME, PRED_CLASS_NAME_TO_INT
+from utils.cloud_file import LocalFileUploadStream, upload_stream
+from utils.forecast import load_predictions_from_json_io_dict, NamedData, pack_forecast_pred_data
 from utils.make_minimal_projects import _make_docs_project
 from utils.project import create_project_from_json
 from utils.project_queries import FORECAST_CSV_HEADER, query_forecasts_for_project, _forecasts_query_worker, \
-    validate_truth_query, _truth_query_worker, query_truth_for_project
+    validate_truth_query, _truth_query_worker, query_truth_for_project, PARTITION_BY_MODEL, PARTITION_BY_TIMEZERO, \
+    _query_partitions, _query_forecasts_sql_for_pred_class, _decoded_pred_data
 from utils.project_queries import validate_forecasts_query
 from utils.project_truth import TRUTH_CSV_HEADER, oracle_model_for_project, load_truth_data
+from utils.query_output import FLOAT_COLUMNS
 from utils.utilities import get_or_create_super_po_mo_users, YYYY_MM_DD_DATE_FORMAT
 
 
@@ -137,7 +147,13 @@ class ProjectQueriesTestCase(TestCase):
                         (model, tz, seas, 'loc3', 'cases next week', 'bin', 50, 0.9)]  # sorted
         # model, timezero, season, unit, target, class, value, cat, prob, sample, quantile, family, param1, 2, 3
         act_rows = [(row[0], row[1], row[2], row[3], row[4], row[5], row[7], row[8]) for row in rows]
-        self.assertEqual(exp_rows_bin, sorted(act_rows))
+        # loc1's named 'pct next week' and 'cases next week' predictions are converted to bins. their probabilities are
+        # estimates - see test_query_forecasts_for_project_convert_named()
+        converted_unit_targets = {('loc1', 'pct next week'), ('loc1', 'cases next week')}
+        self.assertEqual(converted_unit_targets, {(row[3], row[4]) for row in act_rows
+                                                  if (row[3], row[4]) in converted_unit_targets})
+        self.assertEqual(exp_rows_bin, sorted([row for row in act_rows
+                                               if (row[3], row[4]) not in converted_unit_targets]))
 
         # ----  case: all named data in project. check family, and param1, 2, and 3 columns ----
         rows = list(query_forecasts_for_project(self.project, {'types': ['named'], 'options': {'convert.bin': True}}))
@@ -325,6 +341,97 @@ class ProjectQueriesTestCase(TestCase):
                          len(rows))
 
 
+    def test_query_forecasts_for_project_quantiles_columns(self):
+        # case: 'quantiles' limits quantile rows, including for date values and with conversion
+        for options in [None, {'convert.bin': True}]:
+            query = {'types': ['quantile'], 'quantiles': [0.975, 0.25]}
+            if options:
+                query['options'] = options
+            rows = list(query_forecasts_for_project(self.project, query))
+            self.assertEqual(FORECAST_CSV_HEADER, rows.pop(0))
+            # model, timezero, season, unit, target, class, value, cat, prob, sample, quantile, family, param1, 2, 3
+            self.assertEqual([('Season peak week', 0.975, '2020-01-05'), ('cases next week', 0.25, 0),
+                              ('pct next week', 0.25, 2.2), ('pct next week', 0.975, 50.0)],
+                             sorted([(row[4], row[10], row[6]) for row in rows]))
+
+        # case: 'columns' selects columns, in order, including the header's
+        rows = list(query_forecasts_for_project(self.project, {'units': ['loc3'], 'types': ['quantile'],
+                                                               'columns': ['quantile', 'value', 'unit']}))
+        self.assertEqual([['quantile', 'value', 'unit'], [0.25, 0, 'loc3'], [0.75, 50, 'loc3']],
+                         [rows[0]] + sorted(rows[1:]))
+
+        # case: invalid
+        for query, exp_error in [({'quantiles': []}, "quantile_list was not a non-empty list"),
+                                 ({'quantiles': [1.1]}, "must be numbers in [0, 1]"),
+                                 ({'columns': 'model'}, "'columns' was not a non-empty list"),
+                                 ({'columns': ['model', 'model']}, "'columns' was not a non-empty list"),
+                                 ({'columns': ['bad column']}, "'columns' was not a non-empty list")]:
+            error_messages, _ = validate_forecasts_query(self.project, query)
+            self.assertEqual(1, len(error_messages))
+            self.assertIn(exp_error, error_messages[0])
+
+
+    def test_query_forecasts_sql_quantiles_columns(self):
+        # case: json quantile data is limited to the selected levels in the database, and unneeded keys are removed
+        quantile_class = PRED_CLASS_NAME_TO_INT['quantile']
+        sql = _query_forecasts_sql_for_pred_class([quantile_class], None, None, None, None, None, True,
+                                                  quantiles=[0.975, 0.25], columns=['unit', 'quantile'])
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (self.project.pk,))
+            unit_id_to_abbrev = {unit.pk: unit.abbreviation for unit in self.project.units.all()}
+            target_id_to_name = {target.pk: target.name for target in self.project.targets.all()}
+            act_unit_target_data = sorted([(unit_id_to_abbrev[unit_id], target_id_to_name[target_id],
+                                            _decoded_pred_data(pred_data, pred_data_packed))
+                                           for _, _, _, unit_id, target_id, _, pred_data, pred_data_packed
+                                           in cursor.fetchall()])
+        self.assertEqual([('loc2', 'Season peak week', {'quantile': [0.975]}),
+                          ('loc2', 'pct next week', {'quantile': [0.25, 0.975]}),
+                          ('loc3', 'cases next week', {'quantile': [0.25]})],
+                         act_unit_target_data)
+
+        # case: removed keys do not change the number of rows, and packed data gives the same rows as json data
+        for query in [{'columns': ['unit', 'class']}, {'columns': ['class', 'param1'], 'types': ['named', 'bin']},
+                      {'quantiles': [0.975, 0.25], 'columns': ['target', 'value']}]:
+            exp_rows = list(query_forecasts_for_project(self.project, {key: value for key, value in query.items()
+                                                                       if key != 'columns'}))
+            column_idxs = [FORECAST_CSV_HEADER.index(column) for column in query['columns']]
+            exp_rows = sorted([[row[column_idx] for column_idx in column_idxs] for row in exp_rows[1:]], key=str)
+            self.assertEqual(exp_rows, sorted(list(query_forecasts_for_project(self.project, query))[1:], key=str))
+
+        self.assertNotEqual(0, pack_forecast_pred_data(self.forecast))
+        query = {'types': ['quantile'], 'quantiles': [0.975, 0.25], 'columns': ['target', 'quantile', 'value']}
+        self.assertEqual([['Season peak week', 0.975, '2020-01-05'], ['cases next week', 0.25, 0],
+                          ['pct next week', 0.25, 2.2], ['pct next week', 0.975, 50.0]],
+                         sorted(list(query_forecasts_for_project(self.project, query))[1:], key=str))
+
+
+    def test_query_forecasts_for_project_wide(self):
+        # case: one row per quantile prediction, with a column per level in increasing order. with and w/o conversion
+        for options in [None, {'convert.bin': True}]:
+            query = {'quantiles': [0.975, 0.25], 'wide': True}
+            if options:
+                query['options'] = options
+            rows = list(query_forecasts_for_project(self.project, query))
+            self.assertEqual(['model', 'timezero', 'season', 'unit', 'target', 'q0.25', 'q0.975'], rows.pop(0))
+            self.assertEqual([['loc2', 'Season peak week', '', '2020-01-05'], ['loc2', 'pct next week', 2.2, 50.0],
+                              ['loc3', 'cases next week', 0, '']],
+                             sorted([row[3:] for row in rows]))
+
+            # max_num_rows counts wide rows
+            list(query_forecasts_for_project(self.project, query, max_num_rows=3))
+            with self.assertRaises(RuntimeError) as context:
+                list(query_forecasts_for_project(self.project, query, max_num_rows=2))
+            self.assertIn("number of rows exceeded maximum", str(context.exception))
+
+        # case: invalid
+        for query in [{'wide': 'yes', 'quantiles': [0.5]}, {'wide': True},
+                      {'wide': True, 'quantiles': [0.5], 'columns': ['model']},
+                      {'wide': True, 'quantiles': [0.5], 'types': ['point']}]:
+            error_messages, _ = validate_forecasts_query(self.project, query)
+            self.assertEqual(1, len(error_messages))
+            self.assertIn("'wide'", error_messages[0])
+
+
     def test_query_forecasts_for_project_max_num_rows(self):
         try:
             list(query_forecasts_for_project(self.project, {}, max_num_rows=32))  # actual number of rows = 32
@@ -353,22 +460,31 @@ class ProjectQueriesTestCase(TestCase):
         # ensure query_forecasts_for_project() is called
         job = Job.objects.create(user=self.po_user, input_json={'project_pk': self.project.pk, 'query': {}})
         with patch('utils.project_queries.query_forecasts_for_project') as query_mock, \
-                patch('utils.cloud_file.upload_file'):
+                patch('utils.cloud_file.upload_stream'):
             _forecasts_query_worker(job.pk)
             query_mock.assert_called_once_with(self.project, {})
 
-        # case: upload_file() does not error
+        # case: upload_stream() does not error. uses the local file implementation so we can check the file
         job = Job.objects.create(user=self.po_user, input_json={'project_pk': self.project.pk, 'query': {}})
-        with patch('utils.cloud_file.upload_file') as upload_mock:
+        with tempfile.TemporaryDirectory() as local_dir, \
+                patch('utils.cloud_file.CLOUD_FILE_LOCAL_DIR', local_dir):
             _forecasts_query_worker(job.pk)
-            upload_mock.assert_called_once()
-
             job.refresh_from_db()
             self.assertEqual(Job.SUCCESS, job.status)
 
-        # case: upload_file() errors. BotoCoreError: alt: Boto3Error, ClientError, ConnectionClosedError:
+            string_io = io.StringIO(newline='')
+            csv.writer(string_io).writerows(query_forecasts_for_project(self.project, {}))
+            string_io.seek(0)
+            exp_rows = list(csv.reader(string_io))
+            with gzip.open(Path(local_dir) / 'job' / str(job.pk), 'rt', newline='') as csv_fp:
+                act_rows = list(csv.reader(csv_fp))
+            self.assertEqual(exp_rows, act_rows)
+            self.assertEqual(len(exp_rows), job.output_json['num_rows'])
+            self.assertEqual('gzip', job.output_json['content_encoding'])
+
+        # case: upload_stream() errors. BotoCoreError: alt: Boto3Error, ClientError, ConnectionClosedError:
         job = Job.objects.create(user=self.po_user, input_json={'project_pk': self.project.pk, 'query': {}})
-        with patch('utils.cloud_file.upload_file', side_effect=BotoCoreError()) as upload_mock, \
+        with patch('utils.cloud_file.upload_stream', side_effect=BotoCoreError()) as upload_mock, \
                 patch('forecast_app.notifications.send_notification_email'):
             _forecasts_query_worker(job.pk)
             upload_mock.assert_called_once()
@@ -377,13 +493,126 @@ class ProjectQueriesTestCase(TestCase):
             self.assertEqual(Job.FAILED, job.status)
             self.assertIn("_query_worker(): error", job.failure_message)
 
-        # case: allow actual utils.cloud_file.upload_file(), which calls Bucket.put_object(). we don't actually do this
+        # case: allow actual utils.cloud_file.upload_stream(), which does an S3 upload. we don't actually do this
         # in this test b/c we don't want to hit S3, but it's commented here for debugging:
         # _forecasts_query_worker(job.pk)
         # job.refresh_from_db()
         # self.assertEqual(Job.SUCCESS, job.status)
 
 
+    def test__forecasts_query_worker_output_formats(self):
+        query = {'units': ['loc1'], 'targets': ['pct next week']}
+        exp_rows = list(query_forecasts_for_project(self.project, query))
+        with tempfile.TemporaryDirectory() as local_dir, \
+                patch('utils.cloud_file.CLOUD_FILE_LOCAL_DIR', local_dir):
+            def job_file_path(output_format):
+                input_json = {'project_pk': self.project.pk, 'query': {**query, 'output_format': output_format}}
+                job = Job.objects.create(user=self.po_user, input_json=input_json)
+                _forecasts_query_worker(job.pk)
+                job.refresh_from_db()
+                self.assertEqual(Job.SUCCESS, job.status)
+                self.assertEqual(len(exp_rows), job.output_json['num_rows'])
+                return Path(local_dir) / 'job' / str(job.pk)
+
+
+            # case: ndjson: one object per row without empty cells
+            with gzip.open(job_file_path('ndjson'), 'rt') as ndjson_fp:
+                act_dicts = [json.loads(line) for line in ndjson_fp]
+            self.assertEqual([{column: cell for column, cell in zip(exp_rows[0], row) if cell not in ('', None)}
+                              for row in exp_rows[1:]], act_dicts)
+
+            # case: parquet and arrow: nulls for empty cells. float columns are floats and the rest are strings. parquet
+            # files are not gzipped
+            import pyarrow.ipc
+            import pyarrow.parquet
+
+
+            exp_columns = {column: [None if cell in ('', None) else (float(cell) if column in FLOAT_COLUMNS
+                                                                      else str(cell))
+                                    for cell in cells]
+                           for column, cells in zip(exp_rows[0], zip(*exp_rows[1:]))}
+            for output_format in ['parquet', 'arrow']:
+                file_path = job_file_path(output_format)
+                table = pyarrow.parquet.read_table(file_path) if output_format == 'parquet' \
+                    else pyarrow.ipc.open_file(pyarrow.py_buffer(gzip.decompress(file_path.read_bytes()))).read_all()
+                self.assertEqual(FORECAST_CSV_HEADER, table.column_names)
+                self.assertEqual(exp_columns, table.to_pydict())
+
+            # case: wide parquet and arrow: quantile columns are floats
+            wide_query = {'targets': ['pct next week', 'cases next week'], 'quantiles': [0.975, 0.25], 'wide': True}
+            for output_format in ['parquet', 'arrow']:
+                input_json = {'project_pk': self.project.pk, 'query': {**wide_query, 'output_format': output_format}}
+                job = Job.objects.create(user=self.po_user, input_json=input_json)
+                _forecasts_query_worker(job.pk)
+                job.refresh_from_db()
+                self.assertEqual(Job.SUCCESS, job.status)
+                file_path = Path(local_dir) / 'job' / str(job.pk)
+                table = pyarrow.parquet.read_table(file_path) if output_format == 'parquet' \
+                    else pyarrow.ipc.open_file(pyarrow.py_buffer(gzip.decompress(file_path.read_bytes()))).read_all()
+                self.assertEqual([pyarrow.float64()] * 2, [table.schema.field(column).type
+                                                           for column in ['q0.25', 'q0.975']])
+                self.assertEqual([('cases next week', 0.0, None), ('pct next week', 2.2, 50.0)],
+                                 sorted(zip(*[table.column(column).to_pylist()
+                                              for column in ['target', 'q0.25', 'q0.975']])))
+
+        # case: invalid output_format
+        error_messages, _ = validate_forecasts_query(self.project, {'output_format': 'xlsx'})
+        self.assertEqual(1, len(error_messages))
+        self.assertIn("'output_format' was invalid", error_messages[0])
+
+        # case: wide parquet and arrow queries cannot include date targets, whose quantiles are not floats
+        for output_format in ['parquet', 'arrow']:
+            error_messages, _ = validate_forecasts_query(self.project, {'quantiles': [0.5], 'wide': True,
+                                                                        'output_format': output_format})
+            self.assertEqual(1, len(error_messages))
+            self.assertIn("cannot include date targets", error_messages[0])
+        error_messages, _ = validate_forecasts_query(self.project, {'quantiles': [0.5], 'wide': True})
+        self.assertEqual([], error_messages)
+
+
+    def test_upload_stream_parts(self):
+        job = Job.objects.create(user=self.po_user)
+        with tempfile.TemporaryDirectory() as local_dir, \
+                patch('utils.cloud_file.CLOUD_FILE_LOCAL_DIR', local_dir):
+            local_file_path = Path(local_dir) / 'job' / str(job.pk)
+
+            # case: data is split into parts of exactly part_size bytes, except the last one
+            with patch('utils.cloud_file.LocalFileUploadStream._write_part', autospec=True,
+                       side_effect=LocalFileUploadStream._write_part) as write_part_mock:
+                with upload_stream(job, part_size=4) as stream:
+                    stream.write('abc')
+                    stream.write(b'defgh')
+                    stream.write('ijk\u00e9')  # 2-byte utf-8 char that's split across parts
+            self.assertEqual([b'abcd', b'efgh', b'ijk\xc3', b'\xa9'],
+                             [call_args.args[1] for call_args in write_part_mock.call_args_list])
+            self.assertEqual((4, 13), (stream.num_parts, stream.num_bytes))
+            self.assertEqual('abcdefghijk\u00e9', local_file_path.read_text(encoding='utf-8'))
+
+            # case: empty file
+            with upload_stream(job) as stream:
+                pass
+            self.assertEqual((1, 0), (stream.num_parts, stream.num_bytes))
+            self.assertEqual(b'', local_file_path.read_bytes())
+
+            # case: an error discards the new file and leaves the existing one alone
+            with self.assertRaises(RuntimeError):
+                with upload_stream(job, part_size=4) as stream:
+                    stream.write('abcdefgh')
+                    raise RuntimeError('query failed')
+            self.assertEqual(b'', local_file_path.read_bytes())
+            self.assertEqual([str(job.pk)], [path.name for path in local_file_path.parent.iterdir()])
+
+            # case: gzipped. parts and num_bytes are of the compressed data
+            data = 'abcdefgh' * 1000
+            with upload_stream(job, part_size=4, gzip_level=6) as stream:
+                stream.write(data[:5])
+                stream.write(data[5:].encode('utf-8'))
+            compressed_bytes = local_file_path.read_bytes()
+            self.assertEqual(data, gzip.decompress(compressed_bytes).decode('utf-8'))
+            self.assertEqual(len(compressed_bytes), stream.num_bytes)
+            self.assertLess(stream.num_bytes, len(data) / 10)
+
+
     #
     # test forecast queries with auto-convert
     #
@@ -588,6 +817,97 @@ class ProjectQueriesTestCase(TestCase):
         self.assertEqual(exp_rows, act_rows)
 
 
+    def test_query_forecasts_for_project_convert_batches(self):
+        # conversions are done in batches that stack equal-length samples. test elements with different numbers of
+        # samples, split across batches, match converting each element on its own
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        project = create_project_from_json(Path('forecast_app/tests/projects/docs-project.json'), po_user)
+        forecast_model = ForecastModel.objects.create(project=project, name='convert model', abbreviation='convs_model')
+        tz1 = project.timezeros.filter(timezero_date=datetime.date(2011, 10, 2)).first()
+        f1 = Forecast.objects.create(forecast_model=forecast_model, source='f1', time_zero=tz1)
+        unit_target_samples = [('loc1', 'cases next week', [0, 2, 2, 5]), ('loc2', 'cases next week', [1, 3, 8, 9]),
+                               ('loc3', 'cases next week', [4, 4, 7]), ('loc1', 'pct next week', [1.1, 2.2, 0.5]),
+                               ('loc2', 'pct next week', [3.3, 1.0, 2.5, 2.0, 0.1])]
+        predictions = [{"unit": unit, "target": target, "class": "sample", "prediction": {"sample": samples}}
+                       for unit, target, samples in unit_target_samples]
+        load_predictions_from_json_io_dict(f1, {'predictions': predictions}, is_validate_cats=False)
+
+        quant_option = [0.9, 0.1, 0.5]
+        exp_rows = []
+        for unit, target, samples in unit_target_samples:
+            row_prefix = ['convs_model', '2011-10-02', '2011-2012', unit, target]
+            exp_rows.append(row_prefix + ['point', statistics.median(samples), '', '', '', '', '', '', '', ''])
+            exp_rows.append(row_prefix + ['mean', statistics.mean(samples), '', '', '', '', '', '', '', ''])
+            for quantile, value in zip(sorted(quant_option), numpy.quantile(samples, sorted(quant_option))):
+                exp_rows.append(row_prefix + ['quantile', value, '', '', '', quantile, '', '', '', ''])
+        query = {'types': ['point', 'mean', 'quantile'],
+                 'options': {'convert.point': 'median', 'convert.mean': True, 'convert.quantile': quant_option}}
+        with patch('utils.project_queries.SAMPLE_CONVERSION_BATCH_SIZE', 4):
+            act_rows = list(query_forecasts_for_project(project, query))
+        self.assertEqual(FORECAST_CSV_HEADER, act_rows[0])
+        self.assertEqual(len(exp_rows), len(act_rows) - 1)
+        row_key = lambda row: (row[3], row[4], row[5], row[10])  # unit, target, class, quantile
+        for exp_row, act_row in zip(sorted(exp_rows, key=row_key), sorted(act_rows[1:], key=row_key)):
+            self.assertEqual(exp_row[:6] + exp_row[7:], act_row[:6] + act_row[7:])
+            self.assertAlmostEqual(exp_row[6], act_row[6])
+
+
+    def test_query_forecasts_for_project_convert_named(self):
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        project = create_project_from_json(Path('forecast_app/tests/projects/docs-project.json'), po_user)
+        forecast_model = ForecastModel.objects.create(project=project, name='convert model', abbreviation='convs_model')
+        tz1 = project.timezeros.filter(timezero_date=datetime.date(2011, 10, 2)).first()
+        f1 = Forecast.objects.create(forecast_model=forecast_model, source='f1', time_zero=tz1)
+        predictions = [
+            {"unit": 'loc1', "target": 'pct next week', "class": "named",
+             "prediction": {"family": "norm", "param1": 2.0, "param2": 0.5}},
+            {"unit": 'loc2', "target": 'cases next week', "class": "named",
+             "prediction": {"family": "pois", "param1": 3.0}},
+            {"unit": 'loc3', "target": 'pct next week', "class": "named",
+             "prediction": {"family": "gamma", "param1": 4.0, "param2": 2.0}}]
+        load_predictions_from_json_io_dict(f1, {'predictions': predictions}, is_validate_cats=False)
+
+        def unit_to_class_rows(query):
+            rows = list(query_forecasts_for_project(project, query))[1:]  # skip header
+            unit_to_rows = {}
+            for row in rows:
+                unit_to_rows.setdefault((row[3], row[5]), []).append(row)
+            return unit_to_rows
+
+
+        # case: N->Mean, N->P (median). means are exact, as are norm medians
+        unit_to_rows = unit_to_class_rows({'types': ['mean', 'point'],
+                                           'options': {'convert.mean': True, 'convert.point': 'median'}})
+        self.assertEqual([2.0, 3.0, 2.0], [unit_to_rows[(unit, 'mean')][0][6] for unit in ['loc1', 'loc2', 'loc3']])
+        self.assertAlmostEqual(2.0, unit_to_rows[('loc1', 'point')][0][6])
+        self.assertEqual(3, unit_to_rows[('loc2', 'point')][0][6])  # pois(3) median
+        self.assertAlmostEqual(1.836, unit_to_rows[('loc3', 'point')][0][6], delta=0.05)  # gamma(4, rate=2) median
+
+        # case: N->Q. norm is exact, and discrete families' quantiles are integers
+        quantiles = [0.1, 0.5, 0.9]
+        unit_to_rows = unit_to_class_rows({'types': ['quantile'], 'options': {'convert.quantile': quantiles}})
+        std_norm = statistics.NormalDist()
+        self.assertEqual(quantiles, [row[10] for row in unit_to_rows[('loc1', 'quantile')]])
+        for row, quantile in zip(unit_to_rows[('loc1', 'quantile')], quantiles):
+            self.assertAlmostEqual(2.0 + 0.5 * std_norm.inv_cdf(quantile), row[6])
+        self.assertEqual([1, 3, 5], [row[6] for row in unit_to_rows[('loc2', 'quantile')]])
+        self.assertEqual(3, len(unit_to_rows[('loc3', 'quantile')]))
+
+        # case: N->S
+        unit_to_rows = unit_to_class_rows({'types': ['sample'], 'options': {'convert.sample': 5}})
+        self.assertEqual([5, 5, 5], [len(unit_to_rows[(unit, 'sample')]) for unit in ['loc1', 'loc2', 'loc3']])
+        self.assertTrue(all(isinstance(row[9], int) for row in unit_to_rows[('loc2', 'sample')]))
+
+        # case: N->B: probabilities of the target's cats' bins
+        unit_to_rows = unit_to_class_rows({'types': ['bin'], 'options': {'convert.bin': True}})
+        for unit, target_cats in [('loc1', [0.0, 1.0, 1.1, 2.0, 2.2, 3.0, 3.3, 5.0, 10.0, 50.0]), ('loc2', [0, 2, 50])]:
+            bin_rows = unit_to_rows[(unit, 'bin')]
+            self.assertTrue({row[7] for row in bin_rows} <= set(target_cats))
+            self.assertAlmostEqual(1.0, sum(row[8] for row in bin_rows))
+        loc2_cat_to_prob = {row[7]: row[8] for row in unit_to_rows[('loc2', 'bin')]}
+        self.assertAlmostEqual(0.199, loc2_cat_to_prob[0], delta=0.02)  # pois(3): P(X < 2)
+
+
     #
     # test truth queries
     #
@@ -814,22 +1134,31 @@ class ProjectQueriesTestCase(TestCase):
         # ensure query_truth_for_project() is called
         job = Job.objects.create(user=self.po_user, input_json={'project_pk': self.project.pk, 'query': {}})
         with patch('utils.project_queries.query_truth_for_project') as query_mock, \
-                patch('utils.cloud_file.upload_file'):
+                patch('utils.cloud_file.upload_stream'):
             _truth_query_worker(job.pk)
             query_mock.assert_called_once_with(self.project, {})
 
-        # case: upload_file() does not error
+        # case: upload_stream() does not error. uses the local file implementation so we can check the file
         job = Job.objects.create(user=self.po_user, input_json={'project_pk': self.project.pk, 'query': {}})
-        with patch('utils.cloud_file.upload_file') as upload_mock:
+        with tempfile.TemporaryDirectory() as local_dir, \
+                patch('utils.cloud_file.CLOUD_FILE_LOCAL_DIR', local_dir):
             _truth_query_worker(job.pk)
-            upload_mock.assert_called_once()
-
             job.refresh_from_db()
             self.assertEqual(Job.SUCCESS, job.status)
 
-        # case: upload_file() errors. BotoCoreError: alt: Boto3Error, ClientError, ConnectionClosedError:
+            string_io = io.StringIO(newline='')
+            csv.writer(string_io).writerows(query_truth_for_project(self.project, {}))
+            string_io.seek(0)
+            exp_rows = list(csv.reader(string_io))
+            with gzip.open(Path(local_dir) / 'job' / str(job.pk), 'rt', newline='') as csv_fp:
+                act_rows = list(csv.reader(csv_fp))
+            self.assertEqual(exp_rows, act_rows)
+            self.assertEqual(len(exp_rows), job.output_json['num_rows'])
+            self.assertEqual('gzip', job.output_json['content_encoding'])
+
+        # case: upload_stream() errors. BotoCoreError: alt: Boto3Error, ClientError, ConnectionClosedError:
         job = Job.objects.create(user=self.po_user, input_json={'project_pk': self.project.pk, 'query': {}})
-        with patch('utils.cloud_file.upload_file', side_effect=BotoCoreError()) as upload_mock, \
+        with patch('utils.cloud_file.upload_stream', side_effect=BotoCoreError()) as upload_mock, \
                 patch('forecast_app.notifications.send_notification_email'):
             _truth_query_worker(job.pk)
             upload_mock.assert_called_once()
@@ -838,7 +1167,7 @@ class ProjectQueriesTestCase(TestCase):
             self.assertEqual(Job.FAILED, job.status)
             self.assertIn("_query_worker(): error", job.failure_message)
 
-        # case: allow actual utils.cloud_file.upload_file(), which calls Bucket.put_object(). we don't actually do this
+        # case: allow actual utils.cloud_file.upload_stream(), which does an S3 upload. we don't actually do this
         # in this test b/c we don't want to hit S3, but it's commented here for debugging:
         # _truth_query_worker(job.pk)
         # job.refresh_from_db()
@@ -1450,3 +1779,61 @@ class ProjectQueriesTestCase(TestCase):
         act_rows = list(query_forecasts_for_project(project, {'as_of': f2.issued_at.isoformat(),
                                                               'options': {'convert.bin': True}}))[1:]  # skip header
         self.assertEqual(sorted(exp_rows), sorted(act_rows))
+
+
+class ProjectQueriesParallelTestCase(TransactionTestCase):
+    """
+    A TransactionTestCase b/c parallel queries' worker threads use their own database connections, which cannot see a
+    TestCase's uncommitted data.
+    """
+
+
+    def setUp(self):
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        self.project, _, self.forecast_model, _ = _make_docs_project(po_user)
+
+        # add a second model with a forecast for every timezero so that there is something to partition
+        self.forecast_model_2 = ForecastModel.objects.create(project=self.project, name='docs model 2',
+                                                             abbreviation='docs_mod_2')
+        with open('forecast_app/tests/predictions/docs-predictions.json') as fp:
+            json_io_dict_in = json.load(fp)
+        for time_zero in self.project.timezeros.all():
+            forecast = Forecast.objects.create(forecast_model=self.forecast_model_2, source='docs-predictions.json',
+                                               time_zero=time_zero)
+            load_predictions_from_json_io_dict(forecast, json_io_dict_in, is_validate_cats=False)
+
+
+    def test__query_partitions(self):
+        model_id_to_obj = {model_id: SimpleNamespace(is_oracle=model_id == 4) for model_id in [1, 2, 3, 4]}
+        timezero_id_to_obj = {10: None, 20: None}
+        self.assertEqual([([1, 3], [10, 20]), ([2], [10, 20])],
+                         _query_partitions([], [], model_id_to_obj, timezero_id_to_obj, 2, None))
+        self.assertEqual([([1, 2, 3], [10]), ([1, 2, 3], [20])],
+                         _query_partitions([], [], model_id_to_obj, timezero_id_to_obj, 4, PARTITION_BY_TIMEZERO))
+        self.assertEqual([([2], [20]), ([3], [20])],
+                         _query_partitions([3, 2], [20], model_id_to_obj, timezero_id_to_obj, 2, PARTITION_BY_MODEL))
+        with self.assertRaisesRegex(RuntimeError, 'invalid partition_by'):
+            _query_partitions([], [], model_id_to_obj, timezero_id_to_obj, 2, 'unit')
+
+
+    def test_query_forecasts_for_project_parallel(self):
+        for query in [{}, {'units': ['loc1', 'loc3']}, {'options': {'convert.bin': True, 'convert.point': 'mean'}}]:
+            exp_rows = list(query_forecasts_for_project(self.project, query, num_workers=1))
+            for partition_by in [None, PARTITION_BY_MODEL, PARTITION_BY_TIMEZERO]:
+                act_rows = list(query_forecasts_for_project(self.project, query, num_workers=3,
+                                                            partition_by=partition_by))
+                self.assertEqual(FORECAST_CSV_HEADER, act_rows[0])
+                self.assertEqual(sorted(exp_rows[1:]), sorted(act_rows[1:]))
+
+        # rows are partition-major: all of one model's rows come before the next's
+        act_rows = list(query_forecasts_for_project(self.project, {}, num_workers=2, partition_by=PARTITION_BY_MODEL))
+        act_models = [row[0] for row in act_rows[1:]]
+        self.assertEqual(sorted(set(act_models)), sorted(model for model, _ in groupby(act_models)))
+
+        # max_num_rows applies to the whole query, not to each partition. it counts prediction elements, each of which
+        # is the rows with the same (model, timezero, season, unit, target, class)
+        num_pred_eles = len({tuple(row[:6]) for row in act_rows[1:]})
+        self.assertEqual(len(act_rows), len(list(query_forecasts_for_project(self.project, {}, num_workers=2,
+                                                                              max_num_rows=num_pred_eles))))
+        with self.assertRaisesRegex(RuntimeError, 'number of rows exceeded maximum'):
+            list(query_forecasts_for_project(self.project, {}, max_num_rows=num_pred_eles - 1, num_workers=2))
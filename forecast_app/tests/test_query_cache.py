@@ -0,0 +1,251 @@
+import datetime
+import logging
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import dateutil
+from django.test import TestCase
+
+from forecast_app.api_views import _create_query_job
+from forecast_app.models import Job, Project, QueryCacheEntry
+from forecast_app.models.job import JOB_TYPE_QUERY_FORECAST, JOB_TYPE_QUERY_TRUTH
+from utils.make_minimal_projects import _make_docs_project
+from utils.project_queries import _forecasts_query_worker, validate_forecasts_query
+from utils.query_cache import evict_query_cache_entries, query_cache_key
+from utils.utilities import get_or_create_super_po_mo_users
+
+
+logging.getLogger().setLevel(logging.ERROR)
+
+
+class QueryCacheTestCase(TestCase):
+    """
+    """
+
+
+    @classmethod
+    def setUpTestData(cls):
+        _, _, cls.po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        cls.project, cls.time_zero, cls.forecast_model, cls.forecast = _make_docs_project(cls.po_user)
+
+
+    def _data_version(self):
+        return Project.objects.filter(pk=self.project.pk).values_list('data_version', flat=True).first()
+
+
+    def test_query_cache_key(self):
+        def cache_key(query, query_job_type=JOB_TYPE_QUERY_FORECAST):
+            error_messages, validated_values = validate_forecasts_query(self.project, query)
+            self.assertEqual([], error_messages)
+            return query_cache_key(query_job_type, validated_values, query)
+
+
+        # list order, duplicates, and as_of's timezone do not matter
+        self.assertEqual(cache_key({'units': ['loc1', 'loc2'], 'as_of': '2020-07-10 12:00+00:00'}),
+                         cache_key({'units': ['loc2', 'loc1', 'loc2'], 'as_of': '2020-07-10 14:00+02:00'}))
+
+        # different values, options, and job types do
+        self.assertNotEqual(cache_key({'units': ['loc1']}), cache_key({'units': ['loc2']}))
+        self.assertNotEqual(cache_key({'as_of': '2020-07-10 12:00+00:00'}),
+                            cache_key({'as_of': '2020-07-11 12:00+00:00'}))
+        self.assertNotEqual(cache_key({}), cache_key({'options': {'convert.bin': True}}))
+        self.assertNotEqual(cache_key({}), cache_key({}, JOB_TYPE_QUERY_TRUTH))
+
+        # quantiles' order does not matter, but columns' does
+        self.assertEqual(cache_key({'quantiles': [0.5, 0.25]}), cache_key({'quantiles': [0.25, 0.5]}))
+        self.assertNotEqual(cache_key({}), cache_key({'quantiles': [0.5]}))
+        self.assertNotEqual(cache_key({'columns': ['model', 'unit']}), cache_key({'columns': ['unit', 'model']}))
+
+        # the default output_format is the same as none, but others differ
+        self.assertEqual(cache_key({}), cache_key({'output_format': 'csv'}))
+        self.assertNotEqual(cache_key({}), cache_key({'output_format': 'parquet'}))
+
+
+    def test_data_version(self):
+        data_version = self._data_version()
+
+        # editing a forecast
+        self.forecast.issued_at = self.forecast.issued_at - datetime.timedelta(days=1)
+        self.forecast.save()
+        self.assertNotEqual(data_version, self._data_version())
+
+        # renaming a model
+        data_version = self._data_version()
+        self.forecast_model.abbreviation = 'new abbrev'
+        self.forecast_model.save()
+        self.assertNotEqual(data_version, self._data_version())
+
+        # changing a target's cats
+        data_version = self._data_version()
+        target = self.project.targets.get(name='pct next week')
+        target.set_cats(target.cats_values() + [100.0])
+        self.assertNotEqual(data_version, self._data_version())
+
+        # deleting a forecast
+        data_version = self._data_version()
+        self.forecast.delete()
+        self.assertNotEqual(data_version, self._data_version())
+
+
+    @patch('rq.queue.Queue.enqueue')
+    def test_query_cache_hit_miss(self, enqueue_mock):
+        query = {'units': ['loc1'], 'as_of': '2100-01-01 00:00+00:00'}
+        _, validated_values = validate_forecasts_query(self.project, query)
+        cache_key = query_cache_key(JOB_TYPE_QUERY_FORECAST, validated_values, query)
+        request = SimpleNamespace(user=self.po_user)
+        with tempfile.TemporaryDirectory() as local_dir, \
+                patch('utils.cloud_file.CLOUD_FILE_LOCAL_DIR', local_dir):
+            # first query misses and is enqueued. running it stores its results
+            job_1 = _create_query_job(self.project.pk, query, JOB_TYPE_QUERY_FORECAST, _forecasts_query_worker,
+                                      request, cache_key)
+            enqueue_mock.assert_called_once_with(_forecasts_query_worker, job_1.pk)
+            self.assertEqual(Job.QUEUED, job_1.status)
+            self.assertEqual({'is_hit': False, 'num_hits': 0, 'num_misses': 1}, job_1.output_json['query_cache'])
+
+            _forecasts_query_worker(job_1.pk)
+            job_1.refresh_from_db()
+            self.assertEqual(Job.SUCCESS, job_1.status)
+            entry = QueryCacheEntry.objects.get(project=self.project, cache_key=cache_key)
+            self.assertEqual((job_1, self._data_version(), job_1.output_json['num_rows']),
+                             (entry.job, entry.data_version, entry.num_rows))
+            self.assertGreater(entry.num_bytes, 0)
+
+            # same query hits: completed immediately, pointing to the first job's file
+            enqueue_mock.reset_mock()
+            job_2 = _create_query_job(self.project.pk, query, JOB_TYPE_QUERY_FORECAST, _forecasts_query_worker,
+                                      request, cache_key)
+            enqueue_mock.assert_not_called()
+            self.assertEqual(Job.SUCCESS, job_2.status)
+            self.assertEqual({'query_cache': {'is_hit': True, 'num_hits': 1, 'num_misses': 1},
+                              'num_rows': job_1.output_json['num_rows'], 'artifact_job_pk': job_1.pk},
+                             job_2.output_json)
+            self.assertEqual(job_1, job_2.artifact_job())
+            self.assertEqual(job_1, job_1.artifact_job())
+
+            # changing the project's data makes the entry stale -> miss
+            self.forecast.issued_at = self.forecast.issued_at - datetime.timedelta(days=1)
+            self.forecast.save()
+            job_3 = _create_query_job(self.project.pk, query, JOB_TYPE_QUERY_FORECAST, _forecasts_query_worker,
+                                      request, cache_key)
+            enqueue_mock.assert_called_once_with(_forecasts_query_worker, job_3.pk)
+            self.assertEqual({'is_hit': False, 'num_hits': 1, 'num_misses': 2}, job_3.output_json['query_cache'])
+
+            # a cached job that's been deleted is a miss
+            _forecasts_query_worker(job_3.pk)
+            job_3.delete()
+            job_4 = _create_query_job(self.project.pk, query, JOB_TYPE_QUERY_FORECAST, _forecasts_query_worker,
+                                      request, cache_key)
+            self.assertEqual(Job.QUEUED, job_4.status)
+
+
+    @patch('rq.queue.Queue.enqueue')
+    def test_query_cache_target_cats(self, enqueue_mock):
+        # named -> bin conversions depend on targets' cats, so editing them must make cached results stale
+        query = {'units': ['loc1'], 'types': ['bin'], 'options': {'convert.bin': True}}
+        _, validated_values = validate_forecasts_query(self.project, query)
+        cache_key = query_cache_key(JOB_TYPE_QUERY_FORECAST, validated_values, query)
+        request = SimpleNamespace(user=self.po_user)
+        with tempfile.TemporaryDirectory() as local_dir, \
+                patch('utils.cloud_file.CLOUD_FILE_LOCAL_DIR', local_dir):
+            job_1 = _create_query_job(self.project.pk, query, JOB_TYPE_QUERY_FORECAST, _forecasts_query_worker,
+                                      request, cache_key)
+            _forecasts_query_worker(job_1.pk)
+            job_2 = _create_query_job(self.project.pk, query, JOB_TYPE_QUERY_FORECAST, _forecasts_query_worker,
+                                      request, cache_key)
+            self.assertTrue(job_2.output_json['query_cache']['is_hit'])
+
+            target = self.project.targets.get(name='pct next week')
+            target.set_cats(target.cats_values() + [100.0])
+            enqueue_mock.reset_mock()
+            job_3 = _create_query_job(self.project.pk, query, JOB_TYPE_QUERY_FORECAST, _forecasts_query_worker,
+                                      request, cache_key)
+            enqueue_mock.assert_called_once_with(_forecasts_query_worker, job_3.pk)
+            self.assertFalse(job_3.output_json['query_cache']['is_hit'])
+
+
+    def test_evict_query_cache_entries(self):
+        now = dateutil.parser.parse('2022-01-01 12:00+00:00')
+        data_version = self._data_version()
+        entries = [QueryCacheEntry.objects.create(project=self.project, cache_key=str(idx), data_version=data_version,
+                                                  num_bytes=num_bytes, last_used_at=now - datetime.timedelta(hours=idx))
+                   for idx, num_bytes in enumerate([10, 20, 40, 30])]  # newest first
+
+        def entry_keys():
+            return sorted(QueryCacheEntry.objects.values_list('cache_key', flat=True))
+
+
+        # case: within limits
+        self.assertEqual(0, evict_query_cache_entries(max_entries=4, max_bytes=100))
+        self.assertEqual(['0', '1', '2', '3'], entry_keys())
+
+        # case: a stale entry is evicted before older current ones
+        QueryCacheEntry.objects.filter(pk=entries[1].pk).update(data_version='stale')
+        self.assertEqual(1, evict_query_cache_entries(max_entries=3, max_bytes=100))
+        self.assertEqual(['0', '2', '3'], entry_keys())
+
+        # case: size limit: an entry that does not fit is evicted, but an older one that does is kept
+        self.assertEqual(1, evict_query_cache_entries(max_entries=3, max_bytes=45))
+        self.assertEqual(['0', '3'], entry_keys())
+
+
+    @patch('rq.queue.Queue.enqueue')
+    def test_follow_leader_job(self, enqueue_mock):
+        query = {'units': ['loc2']}
+        _, validated_values = validate_forecasts_query(self.project, query)
+        cache_key = query_cache_key(JOB_TYPE_QUERY_FORECAST, validated_values, query)
+        request = SimpleNamespace(user=self.po_user)
+
+        def create_query_job():
+            return _create_query_job(self.project.pk, query, JOB_TYPE_QUERY_FORECAST, _forecasts_query_worker,
+                                     request, cache_key)
+
+
+        with tempfile.TemporaryDirectory() as local_dir, \
+                patch('utils.cloud_file.CLOUD_FILE_LOCAL_DIR', local_dir):
+            # first job leads and is enqueued. identical jobs submitted while it's queued follow it
+            leader_job = create_query_job()
+            follower_job_1 = create_query_job()
+            follower_job_2 = create_query_job()
+            enqueue_mock.assert_called_once_with(_forecasts_query_worker, leader_job.pk)
+            self.assertEqual([Job.QUEUED] * 3, [leader_job.status, follower_job_1.status, follower_job_2.status])
+            self.assertEqual(leader_job, follower_job_1.leader_job())
+            self.assertIsNone(leader_job.leader_job())
+            self.assertEqual([follower_job_1, follower_job_2], list(leader_job.follower_jobs()))
+
+            # followers get the leader's results when it finishes, and later jobs hit the cache
+            _forecasts_query_worker(leader_job.pk)
+            leader_job.refresh_from_db()
+            for follower_job in [follower_job_1, follower_job_2]:
+                follower_job.refresh_from_db()
+                self.assertEqual(Job.SUCCESS, follower_job.status)
+                self.assertEqual((leader_job.output_json['num_rows'], leader_job.pk),
+                                 (follower_job.output_json['num_rows'], follower_job.output_json['artifact_job_pk']))
+                self.assertEqual(leader_job, follower_job.artifact_job())
+            self.assertIsNone(QueryCacheEntry.objects.get(project=self.project, cache_key=cache_key).leader_job)
+            self.assertEqual(Job.SUCCESS, create_query_job().status)
+
+        # a leader queued before the project's data changed is not followed
+        self.forecast_model.abbreviation = 'new abbrev'
+        self.forecast_model.save()
+        enqueue_mock.reset_mock()
+        stale_leader_job = create_query_job()
+        self.forecast_model.abbreviation = 'newer abbrev'
+        self.forecast_model.save()
+        leader_job = create_query_job()
+        self.assertEqual(2, enqueue_mock.call_count)
+        self.assertIsNone(leader_job.leader_job())
+        follower_job = create_query_job()
+        self.assertEqual(leader_job, follower_job.leader_job())
+
+        # followers fail if their leader does. the stale leader has no followers
+        with patch('utils.project_queries.query_forecasts_for_project', side_effect=RuntimeError('query failed')), \
+                patch('forecast_app.notifications.send_notification_email'):
+            _forecasts_query_worker(stale_leader_job.pk)
+            follower_job.refresh_from_db()
+            self.assertEqual(Job.QUEUED, follower_job.status)
+
+            _forecasts_query_worker(leader_job.pk)
+            follower_job.refresh_from_db()
+            self.assertEqual(Job.FAILED, follower_job.status)
+            self.assertIn(f"leader job {leader_job.pk} did not succeed", follower_job.failure_message)
@@ -1,13 +1,15 @@
 import datetime
 from pathlib import Path
+from unittest.mock import patch
 
 import pymmwr
 from django.test import TestCase
 
-from forecast_app.models import Project, TimeZero
+from forecast_app.models import Forecast, PredictionElement, Project, TimeZero
 from forecast_app.models.forecast_model import ForecastModel
 from utils.cdc_io import load_cdc_csv_forecast_file, make_cdc_units_and_targets
 from utils.make_thai_moph_project import cdc_csv_filename_components
+from utils.utilities import batched_rows, streaming_cursor
 
 
 class UtilsTestCase(TestCase):
@@ -61,3 +63,20 @@ class UtilsTestCase(TestCase):
         }
         for cdc_csv_filename, exp_components in filename_to_exp_component_tuples.items():
             self.assertEqual(exp_components, cdc_csv_filename_components(cdc_csv_filename))
+
+
+    def test_streaming_cursor_batched_rows(self):
+        # all rows are returned regardless of how they're batched
+        exp_rows = sorted(PredictionElement.objects.filter(forecast__forecast_model=self.forecast_model)
+                          .values_list('id', flat=True))
+        for batch_size in [1, 7, len(exp_rows), len(exp_rows) + 1]:
+            with patch('utils.utilities.SQL_ROWS_BATCH_SIZE', batch_size), \
+                    streaming_cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT pred_ele.id
+                    FROM {PredictionElement._meta.db_table} AS pred_ele
+                    JOIN {Forecast._meta.db_table} AS f ON pred_ele.forecast_id = f.id
+                    WHERE f.forecast_model_id = %s
+                    ORDER BY pred_ele.id;
+                """, (self.forecast_model.pk,))
+                self.assertEqual(exp_rows, [row[0] for row in batched_rows(cursor)])
@@ -0,0 +1,123 @@
+import datetime
+import logging
+from pathlib import Path
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from forecast_app.models import Target, Unit, Project
+from utils.project import create_project_from_json
+from utils.utilities import get_or_create_super_po_mo_users
+from utils.validation_context import validation_context_for_project, ValidationContext
+
+
+logging.getLogger().setLevel(logging.ERROR)
+
+
+class ValidationContextTestCase(TestCase):
+    """
+    """
+
+
+    @classmethod
+    def setUpTestData(cls):
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        cls.project = create_project_from_json(Path('forecast_app/tests/projects/docs-project.json'), po_user)
+
+
+    def test_validation_context(self):
+        validation_context = ValidationContext(self.project, None)
+        self.assertEqual({unit.abbreviation: unit.pk for unit in self.project.units.all()},
+                         validation_context.unit_abbrev_to_id)
+        self.assertEqual({target.name for target in self.project.targets.all()},
+                         set(validation_context.target_name_to_target.keys()))
+
+        # compare to Target's (uncached) versions
+        for target in self.project.targets.all():
+            target_info = validation_context.target_name_to_target[target.name]
+            self.assertEqual((target.pk, target.name, target.type), target_info[:3])
+            self.assertEqual(set(target.cats_values()), target_info.cats)
+            self.assertEqual(target.range_tuple(), target_info.range)
+
+        # spot-check types
+        self.assertEqual({datetime.date(2019, 12, 15), datetime.date(2019, 12, 22), datetime.date(2019, 12, 29),
+                          datetime.date(2020, 1, 5)},
+                         validation_context.target_name_to_target['Season peak week'].cats)
+        self.assertEqual((0, 100000), validation_context.target_name_to_target['cases next week'].range)
+        self.assertIsNone(validation_context.target_name_to_target['season severity'].range)
+
+        # allowed prediction classes and named families, by target type
+        self.assertEqual({'bin', 'point', 'sample', 'mode'},
+                         validation_context.target_type_to_pred_classes[Target.NOMINAL_TARGET_TYPE])
+        self.assertEqual({'bin', 'point', 'sample', 'median', 'mode'},
+                         validation_context.target_type_to_pred_classes[Target.BINARY_TARGET_TYPE])
+        self.assertNotIn('named', validation_context.target_type_to_pred_classes[Target.DATE_TARGET_TYPE])
+        self.assertEqual(8, len(validation_context.target_type_to_pred_classes[Target.CONTINUOUS_TARGET_TYPE]))
+        self.assertEqual({'pois', 'nbinom', 'nbinom2'},
+                         validation_context.target_type_to_named_families[Target.DISCRETE_TARGET_TYPE])
+        self.assertEqual(set(), validation_context.target_type_to_named_families[Target.NOMINAL_TARGET_TYPE])
+
+
+    def test_validation_context_for_project_caching(self):
+        validation_context = validation_context_for_project(self.project)
+        self.assertIs(validation_context, validation_context_for_project(self.project))  # cached
+
+        # each configuration change invalidates the cached context
+        unit = Unit.objects.create(project=self.project, name='new unit', abbreviation='loc4')
+        validation_context_2 = validation_context_for_project(self.project)
+        self.assertIsNot(validation_context, validation_context_2)
+        self.assertIn('loc4', validation_context_2.unit_abbrev_to_id)
+
+        target = Target.objects.filter(project=self.project, name='pct next week').first()
+        target.set_range(1.0, 2.0)
+        validation_context_3 = validation_context_for_project(self.project)
+        self.assertIsNot(validation_context_2, validation_context_3)
+        self.assertEqual((1.0, 2.0), validation_context_3.target_name_to_target['pct next week'].range)
+
+        target.set_cats([1.0, 1.5])
+        validation_context_4 = validation_context_for_project(self.project)
+        self.assertEqual({1.0, 1.5}, validation_context_4.target_name_to_target['pct next week'].cats)
+
+        unit.delete()
+        validation_context_5 = validation_context_for_project(self.project)
+        self.assertNotIn('loc4', validation_context_5.unit_abbrev_to_id)
+
+        # a stale in-memory Project saving does not restore an old config_version
+        stale_project = Project.objects.get(pk=self.project.pk)
+        Unit.objects.create(project=self.project, name='new unit', abbreviation='loc5')
+        stale_project.save()
+        self.assertIn('loc5', validation_context_for_project(self.project).unit_abbrev_to_id)
+
+
+    def test_config_version_updates_are_batched(self):
+        def num_version_updates(queries):
+            return len([query for query in queries
+                        if query['sql'].startswith(f'UPDATE "{Project._meta.db_table}"')
+                        and ('"config_version"' in query['sql'])])
+
+
+        # setting a target's cats or range updates its project once, regardless of the number of cats
+        target = Target.objects.filter(project=self.project, name='pct next week').first()
+        for set_fcn, args in [(target.set_cats, ([1.0, 1.5, 2.0, 2.5],)), (target.set_range, (1.0, 2.0))]:
+            config_version = Project.objects.get(pk=self.project.pk).config_version
+            with CaptureQueriesContext(connection) as context:
+                set_fcn(*args)
+            self.assertEqual(1, num_version_updates(context.captured_queries))
+            self.assertNotEqual(config_version, Project.objects.get(pk=self.project.pk).config_version)
+
+        # ditto for creating a project's units, targets, and timezeros
+        _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
+        with CaptureQueriesContext(connection) as context:
+            project = create_project_from_json(Path('forecast_app/tests/projects/cdc-project.json'), po_user)
+        self.assertEqual(1, num_version_updates(context.captured_queries))
+        self.assertNotEqual(0, project.targets.count())
+
+        # editing a project's own fields does not change its versions
+        project = Project.objects.get(pk=project.pk)
+        config_version, data_version = project.config_version, project.data_version
+        project.description = 'new description'
+        project.save()
+        self.assertEqual((config_version, data_version, 'new description'),
+                         Project.objects.filter(pk=project.pk)
+                         .values_list('config_version', 'data_version', 'description').first())
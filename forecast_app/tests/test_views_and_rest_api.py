@@ -1,8 +1,10 @@
 import csv
 import datetime
+import gzip
 import io
 import json
 import logging
+import tempfile
 import unittest
 from pathlib import Path
 from unittest.mock import patch
@@ -23,6 +25,7 @@ from forecast_app.models.job import Job
 from forecast_app.serializers import TargetSerializer, TimeZeroSerializer
 from forecast_app.views import _delete_forecast_worker, HEATMAP_FILTER_ALL_TARGETS
 from utils.cdc_io import load_cdc_csv_forecast_file, make_cdc_units_and_targets
+from utils.cloud_file import upload_stream
 from utils.forecast import fm_ids_with_min_num_forecasts, forecast_ids_in_date_range, forecast_ids_in_target_group
 from utils.project import delete_project_iteratively, create_project_from_json, group_targets
 from utils.project_queries import _forecasts_query_worker, _truth_query_worker
@@ -1521,31 +1524,98 @@ class ViewsTestCase(TestCase):
         response = self.client.get(job_data_download_url)
         self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
 
-        # case: authorized: superuser + mocked `utils.cloud_file.download_file()` called once
-        with patch('utils.cloud_file.download_file') as download_file_mock:
+        # case: authorized: superuser + mocked `utils.cloud_file.open_file()` called once
+        with patch('utils.cloud_file.open_file', side_effect=lambda *_: io.BytesIO(b'a,b\n1,2\n')) as open_file_mock:
             job = Job.objects.create(user=self.po_user, input_json={'query': {}})
             job_data_download_url = reverse('api-job-data-download', args=[job.pk])
             self._authenticate_jwt_user(self.superuser, self.superuser_password)
             response = self.client.get(job_data_download_url)
-            download_file_mock.assert_called_once()
+            open_file_mock.assert_called_once()
             self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual(b'a,b\n1,2\n', b''.join(response.streaming_content))
 
             # case: authorized: self.po_user
             self._authenticate_jwt_user(self.po_user, self.po_user_password)
             response = self.client.get(job_data_download_url)
             self.assertEqual(status.HTTP_200_OK, response.status_code)
 
-            # case: authorized but `utils.cloud_file.download_file()` gives an error
-            download_file_mock.side_effect = BotoCoreError()  # alt: Boto3Error, ClientError, ConnectionClosedError
+            # case: authorized but `utils.cloud_file.open_file()` gives an error
+            open_file_mock.side_effect = BotoCoreError()  # alt: Boto3Error, ClientError, ConnectionClosedError
             self._authenticate_jwt_user(self.po_user, self.po_user_password)
             response = self.client.get(job_data_download_url)
             self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
 
-            download_file_mock.side_effect = Exception('download_file_mock Exception')
+            open_file_mock.side_effect = Exception('open_file_mock Exception')
             self._authenticate_jwt_user(self.po_user, self.po_user_password)
             response = self.client.get(job_data_download_url)
             self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
 
+        # case: a gzipped file is passed through if the client accepts gzip, and is decompressed o/w
+        gzipped_data = gzip.compress(b'a,b\n1,2\n')
+        with patch('utils.cloud_file.open_file', side_effect=lambda *_: io.BytesIO(gzipped_data)):
+            job = Job.objects.create(user=self.po_user, input_json={'query': {}},
+                                     output_json={'content_encoding': 'gzip'})
+            job_data_download_url = reverse('api-job-data-download', args=[job.pk])
+            self._authenticate_jwt_user(self.po_user, self.po_user_password)
+            response = self.client.get(job_data_download_url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(('gzip', 'Accept-Encoding'), (response['Content-Encoding'], response['Vary']))
+            self.assertEqual(gzipped_data, b''.join(response.streaming_content))
+
+            response = self.client.get(job_data_download_url)
+            self.assertNotIn('Content-Encoding', response)
+            self.assertEqual(b'a,b\n1,2\n', b''.join(response.streaming_content))
+
+        # case: Range requests and redirects, using local files
+        job = Job.objects.create(user=self.po_user, input_json={'query': {}})
+        job_data_download_url = reverse('api-job-data-download', args=[job.pk])
+        self._authenticate_jwt_user(self.po_user, self.po_user_password)
+        with tempfile.TemporaryDirectory() as local_dir, \
+                patch('utils.cloud_file.CLOUD_FILE_LOCAL_DIR', local_dir):
+            with upload_stream(job) as stream:
+                stream.write('a,b\n1,2\n')  # 8 bytes
+            for range_header, exp_content, exp_content_range in [('bytes=2-5', b'b\n1,', 'bytes 2-5/8'),
+                                                                 ('bytes=5-', b',2\n', 'bytes 5-7/8'),
+                                                                 ('bytes=-3', b',2\n', 'bytes 5-7/8')]:
+                response = self.client.get(job_data_download_url, HTTP_RANGE=range_header)
+                self.assertEqual(status.HTTP_206_PARTIAL_CONTENT, response.status_code)
+                self.assertEqual((exp_content_range, str(len(exp_content))),
+                                 (response['Content-Range'], response['Content-Length']))
+                self.assertEqual(exp_content, b''.join(response.streaming_content))
+
+            response = self.client.get(job_data_download_url, HTTP_RANGE='bytes=8-')
+            self.assertEqual(status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, response.status_code)
+            self.assertEqual('bytes */8', response['Content-Range'])
+
+            response = self.client.get(job_data_download_url, HTTP_RANGE='bytes=0-1,4-5')  # multiple: ignored
+            self.assertEqual((status.HTTP_200_OK, 'bytes'), (response.status_code, response['Accept-Ranges']))
+            self.assertEqual(b'a,b\n1,2\n', b''.join(response.streaming_content))
+
+            # redirects are to S3 presigned URLs. the local files' 'file://' ones are not allowed
+            s3_url = 'https://bucket.s3.amazonaws.com/job/1?X-Amz-Signature=abc'
+            with patch('forecast_app.api_views.JOB_DATA_DOWNLOAD_MODE', 'redirect'), \
+                    patch('utils.cloud_file.presigned_url', return_value=s3_url) as presigned_url_mock:
+                response = self.client.get(job_data_download_url)
+                self.assertEqual((status.HTTP_302_FOUND, s3_url), (response.status_code, response['Location']))
+                self.assertIsNone(presigned_url_mock.call_args.kwargs['content_encoding'])
+
+                # gzipped files redirect only if the client accepts gzip. o/w they are streamed decompressed
+                gzip_job = Job.objects.create(user=self.po_user, input_json={'query': {}},
+                                              output_json={'content_encoding': 'gzip'})
+                with upload_stream(gzip_job, gzip_level=6) as stream:
+                    stream.write('a,b\n1,2\n')
+                gzip_job_data_download_url = reverse('api-job-data-download', args=[gzip_job.pk])
+                presigned_url_mock.reset_mock()
+                response = self.client.get(gzip_job_data_download_url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+                self.assertEqual((status.HTTP_302_FOUND, s3_url), (response.status_code, response['Location']))
+                self.assertEqual('gzip', presigned_url_mock.call_args.kwargs['content_encoding'])
+
+                presigned_url_mock.reset_mock()
+                response = self.client.get(gzip_job_data_download_url)
+                presigned_url_mock.assert_not_called()
+                self.assertEqual(status.HTTP_200_OK, response.status_code)
+                self.assertNotIn('Content-Encoding', response)
+                self.assertEqual(b'a,b\n1,2\n', b''.join(response.streaming_content))
+
 
     def test_api_patch_forecast(self):
         _, _, po_user, _, _, _, _, _ = get_or_create_super_po_mo_users(is_create_super=True)
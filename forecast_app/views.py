@@ -34,14 +34,16 @@ from forecast_repo.settings.base import S3_BUCKET_PREFIX, UPLOAD_FILE_QUEUE_NAME
     MAX_NUM_QUERY_ROWS, MAX_UPLOAD_FILE_SIZE
 from utils.forecast import data_rows_from_forecast, is_forecast_metadata_available, forecast_metadata, \
     forecast_metadata_counts_for_f_ids, fm_ids_with_min_num_forecasts, forecast_ids_in_date_range, \
-    forecast_ids_in_target_group
+    forecast_ids_in_target_group, INGEST_MODE_DEFAULT, INGEST_MODES
 from utils.project import config_dict_from_project, create_project_from_json, group_targets, unit_rows_for_project, \
     models_summary_table_rows_for_project, target_rows_for_project, latest_forecast_ids_for_project
 from utils.project_diff import project_config_diff, database_changes_for_project_config_diff, Change, \
     execute_project_config_diff, order_project_config_diff
-from utils.project_queries import _forecasts_query_worker, _truth_query_worker
+from utils.project_queries import _forecasts_query_worker, _truth_query_worker, validate_forecasts_query, \
+    validate_truth_query
 from utils.project_truth import oracle_model_for_project, truth_batches, \
     truth_batch_summary_table, truth_delete_batch
+from utils.query_cache import query_cache_key
 from utils.utilities import YYYY_MM_DD_DATE_FORMAT
 
 
@@ -683,8 +685,13 @@ def query_project(request, project_pk, query_type):
             query_worker_fcn = {QueryType.FORECASTS: _forecasts_query_worker,
                                 QueryType.TRUTH: _truth_query_worker,
                                 }[query_type]
+            query_validation_fcn = {QueryType.FORECASTS: validate_forecasts_query,
+                                    QueryType.TRUTH: validate_truth_query,
+                                    }[query_type]
             query = json.loads(cleaned_query_data)
-            job = _create_query_job(project_pk, query, query_job_type, query_worker_fcn, request)
+            _, validated_values = query_validation_fcn(project, query)  # the form already validated the query
+            cache_key = query_cache_key(query_job_type, validated_values, query)
+            job = _create_query_job(project_pk, query, query_job_type, query_worker_fcn, request, cache_key)
             messages.success(request, f"Query has been submitted.")
             return redirect('job-detail', pk=job.pk)
     else:  # GET (or any other method): create the default form
@@ -1441,7 +1448,10 @@ class JobDetailView(UserPassesTestMixin, DetailView):
 
         job = self.get_object()
         context = super().get_context_data(**kwargs)
-        context['is_file_exists'] = is_file_exists(job)[0]  # is_exists, size
+        artifact_job = job.artifact_job()  # a cached or followed query's file is another job's
+        context['is_file_exists'] = is_file_exists(artifact_job)[0] if artifact_job else False  # is_exists, size
+        context['leader_job'] = job.leader_job()
+        context['follower_jobs'] = job.follower_jobs()
         return context
 
 
@@ -1470,7 +1480,7 @@ def download_forecast(request, forecast_pk):
 
 def download_job_data_file(request, pk):
     """
-    Returns a CSV file containing the data (if any) corresponding to the passed Job's pk.
+    Returns a file containing the data (if any) corresponding to the passed Job's pk. See _download_job_data_request().
     """
     from forecast_app.api_views import _download_job_data_request  # avoid circular imports
     from utils.cloud_file import is_file_exists
@@ -1485,7 +1495,7 @@ def download_job_data_file(request, pk):
                       context={'title': f"No data for job {job.pk}",
                                'message': f"The job {job.pk} has no associated data."})
 
-    return _download_job_data_request(job)
+    return _download_job_data_request(request, job)
 
 
 #
@@ -1639,8 +1649,14 @@ def upload_forecast(request, forecast_model_pk, timezero_pk):
                       context={'title': "Error uploading file.",
                                'message': f"Invalid file: content_type was neither 'text/csv' nor 'application/json': "
                                           f"{data_file.content_type!r}."})
+    ingest_mode = request.POST.get('ingest_mode', INGEST_MODE_DEFAULT)
+    if ingest_mode not in INGEST_MODES:
+        return render(request, 'message.html',
+                      context={'title': "Error uploading file.",
+                               'message': f"Invalid ingest_mode: {ingest_mode!r}. must be one of: {INGEST_MODES}"})
+
     is_error, job = _upload_file(request.user, data_file, _upload_forecast_worker, type=JOB_TYPE_UPLOAD_FORECAST,
-                                 format=data_format, forecast_pk=new_forecast.pk)
+                                 format=data_format, forecast_pk=new_forecast.pk, ingest_mode=ingest_mode)
     if is_error:
         return render(request, 'message.html',
                       context={'title': "Error uploading file.",
@@ -1656,14 +1672,18 @@ def _upload_forecast_worker(job_pk):
     empty Forecast's id to load into. Deletes that forecast if there were errors loading the data.
 
     - Required Job.input_json key(s) (passed to `_upload_file()`): 'forecast_pk', 'filename', 'format'
+    - Optional Job.input_json key(s): 'ingest_mode' - one of `utils.forecast.INGEST_MODES`. defaults to
+        INGEST_MODE_DEFAULT
     - Saves Job.output_json key(s): 'forecast_pk' (passed through from input_json for API caller convenience)
 
     :param job_pk: the Job's pk
     """
     # imported here so that tests can patch via mock:
     from forecast_app.models.job import job_cloud_file
-    from utils.forecast import load_predictions_from_json_io_dict, cache_forecast_metadata
-    from utils.csv_io import json_io_dict_from_csv_rows
+    from utils.forecast import load_predictions_from_json_io_dict, load_predictions_from_prediction_dicts, \
+        cache_forecast_metadata, INGEST_MODE_DEFAULT, INGEST_MODE_STREAMING
+    from utils.csv_io import json_io_dict_from_csv_rows, prediction_dicts_from_csv_fp
+    from utils.json_io import prediction_dicts_from_json_fp
 
 
     with job_cloud_file(job_pk) as (job, cloud_file_fp):
@@ -1703,16 +1723,32 @@ def _upload_forecast_worker(job_pk):
         # finally, load the predictions
         try:
             with transaction.atomic():
-                logger.debug(f"_upload_forecast_worker(): 1/4 loading json_io_dict. forecast={forecast}. job={job}")
-                # set json_io_dict based on data format
-                if job.input_json['format'] == 'csv':
-                    csv_rows = list(csv.reader(cloud_file_fp))
-                    json_io_dict = json_io_dict_from_csv_rows(csv_rows)
-                else:  # 'json' format
-                    json_io_dict = json.load(cloud_file_fp)
-
-                logger.debug(f"_upload_forecast_worker(): 2/4 loading predictions. job={job}")
-                load_predictions_from_json_io_dict(forecast, json_io_dict, is_validate_cats=False)  # transaction.atomic
+                ingest_mode = job.input_json.get('ingest_mode', INGEST_MODE_DEFAULT)
+                if ingest_mode == INGEST_MODE_STREAMING:
+                    # set prediction_dicts based on data format. nothing is read until loading starts
+                    logger.debug(f"_upload_forecast_worker(): 1/4 streaming prediction dicts. forecast={forecast}. "
+                                 f"job={job}")
+                    if job.input_json['format'] == 'csv':
+                        prediction_dicts = prediction_dicts_from_csv_fp(cloud_file_fp)
+                    else:  # 'json' format
+                        prediction_dicts = prediction_dicts_from_json_fp(cloud_file_fp)
+
+                    logger.debug(f"_upload_forecast_worker(): 2/4 loading predictions. job={job}")
+                    load_predictions_from_prediction_dicts(forecast, prediction_dicts,
+                                                           is_validate_cats=False)  # transaction.atomic
+                else:
+                    logger.debug(f"_upload_forecast_worker(): 1/4 loading json_io_dict. forecast={forecast}. "
+                                 f"job={job}")
+                    # set json_io_dict based on data format
+                    if job.input_json['format'] == 'csv':
+                        csv_rows = list(csv.reader(cloud_file_fp))
+                        json_io_dict = json_io_dict_from_csv_rows(csv_rows)
+                    else:  # 'json' format
+                        json_io_dict = json.load(cloud_file_fp)
+
+                    logger.debug(f"_upload_forecast_worker(): 2/4 loading predictions. job={job}")
+                    load_predictions_from_json_io_dict(forecast, json_io_dict,
+                                                       is_validate_cats=False)  # transaction.atomic
 
                 logger.debug(f"_upload_forecast_worker(): 3/4 caching metadata. job={job}")
                 cache_forecast_metadata(forecast)  # transaction.atomic
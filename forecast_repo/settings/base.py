@@ -216,7 +216,9 @@ QUERY_FORECAST_QUEUE_NAME = HIGH_QUEUE_NAME
 CACHE_FORECAST_METADATA_QUEUE_NAME = DEFAULT_QUEUE_NAME
 
 # low
-# none
+REHASH_FORECAST_QUEUE_NAME = LOW_QUEUE_NAME
+HASH_PRED_DATA_QUEUE_NAME = LOW_QUEUE_NAME
+PACK_PRED_DATA_QUEUE_NAME = LOW_QUEUE_NAME
 
 #
 # S3 support - used by cloud_file.py
@@ -227,6 +229,35 @@ S3_BUCKET_PREFIX = os.environ.get('S3_BUCKET_PREFIX')
 if not S3_BUCKET_PREFIX:
     raise RuntimeError('base.py: S3_BUCKET_PREFIX not configured!')
 
+# size in bytes of the parts that `utils.cloud_file.upload_stream()` uploads. S3 requires every part but the last to be
+# at least 5 MiB. this bounds the memory used to upload a file, regardless of its size
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+
+if 'UPLOAD_PART_SIZE' in os.environ:
+    upload_part_size_value = os.environ.get('UPLOAD_PART_SIZE')
+    try:
+        UPLOAD_PART_SIZE = int(upload_part_size_value)
+    except ValueError:
+        raise RuntimeError(f"base.py: UPLOAD_PART_SIZE config var could not be coerced to int: "
+                           f"{upload_part_size_value!r}")
+
+if UPLOAD_PART_SIZE < 5 * 1024 * 1024:
+    raise RuntimeError(f"base.py: UPLOAD_PART_SIZE must be at least 5 MiB: {UPLOAD_PART_SIZE}")
+
+# if set, `utils.cloud_file.upload_stream()` writes files under this directory rather than to S3. intended for tests and
+# local development
+CLOUD_FILE_LOCAL_DIR = os.environ.get('CLOUD_FILE_LOCAL_DIR')
+
+# how job data files are downloaded (see `forecast_app.api_views._download_job_data_request()`): 'stream' relays the
+# file through the web process in chunks, supporting HTTP Range requests, and 'redirect' redirects to a short-lived
+# presigned URL so that the client downloads it directly from the cloud
+JOB_DATA_DOWNLOAD_MODE = os.environ.get('JOB_DATA_DOWNLOAD_MODE', 'stream')
+
+if JOB_DATA_DOWNLOAD_MODE not in ['stream', 'redirect']:
+    raise RuntimeError(f"base.py: JOB_DATA_DOWNLOAD_MODE must be 'stream' or 'redirect': {JOB_DATA_DOWNLOAD_MODE!r}")
+elif (JOB_DATA_DOWNLOAD_MODE == 'redirect') and CLOUD_FILE_LOCAL_DIR:
+    raise RuntimeError("base.py: JOB_DATA_DOWNLOAD_MODE 'redirect' requires S3, but CLOUD_FILE_LOCAL_DIR was set")
+
 #
 # support for sending emails per https://www.sendinblue.com/ by way of https://github.com/anymail/django-anymail
 #
@@ -293,6 +324,28 @@ if 'MAX_NUM_QUERY_ROWS' in os.environ:
         raise RuntimeError(f"base.py: MAX_NUM_QUERY_ROWS config var could not be coerced to float: "
                            f"{max_num_query_rows_value!r}")
 
+# limits for the query result cache (see utils/query_cache.py). least recently used entries are evicted when either is
+# exceeded. QUERY_CACHE_MAX_ENTRIES = 0 disables the cache
+QUERY_CACHE_MAX_ENTRIES = 1000
+
+if 'QUERY_CACHE_MAX_ENTRIES' in os.environ:
+    query_cache_max_entries_value = os.environ.get('QUERY_CACHE_MAX_ENTRIES')
+    try:
+        QUERY_CACHE_MAX_ENTRIES = int(query_cache_max_entries_value)
+    except ValueError:
+        raise RuntimeError(f"base.py: QUERY_CACHE_MAX_ENTRIES config var could not be coerced to int: "
+                           f"{query_cache_max_entries_value!r}")
+
+QUERY_CACHE_MAX_BYTES = 10E+09
+
+if 'QUERY_CACHE_MAX_BYTES' in os.environ:
+    query_cache_max_bytes_value = os.environ.get('QUERY_CACHE_MAX_BYTES')
+    try:
+        QUERY_CACHE_MAX_BYTES = float(query_cache_max_bytes_value)
+    except ValueError:
+        raise RuntimeError(f"base.py: QUERY_CACHE_MAX_BYTES config var could not be coerced to float: "
+                           f"{query_cache_max_bytes_value!r}")
+
 # used by file uploading methods to limit them from being too large:
 MAX_UPLOAD_FILE_SIZE = 10E+06
 
@@ -305,6 +358,58 @@ if 'MAX_UPLOAD_FILE_SIZE' in os.environ:
             f"base.py: MAX_UPLOAD_FILE_SIZE config var could not be coerced to float: "
             f"{max_upload_file_size_value!r}")
 
+# number of processes that `load_predictions_from_json_io_dict()` uses to validate large forecasts. 1 means validate in
+# the calling process
+VALIDATION_NUM_WORKERS = 1
+
+if 'VALIDATION_NUM_WORKERS' in os.environ:
+    validation_num_workers_value = os.environ.get('VALIDATION_NUM_WORKERS')
+    try:
+        VALIDATION_NUM_WORKERS = int(validation_num_workers_value)
+    except ValueError:
+        raise RuntimeError(f"base.py: VALIDATION_NUM_WORKERS config var could not be coerced to int: "
+                           f"{validation_num_workers_value!r}")
+
+# number of threads that `query_forecasts_for_project()` uses to run a query's partitions concurrently, each with its
+# own database connection. 1 means run the query as a single statement in the calling thread
+QUERY_NUM_WORKERS = 1
+
+if 'QUERY_NUM_WORKERS' in os.environ:
+    query_num_workers_value = os.environ.get('QUERY_NUM_WORKERS')
+    try:
+        QUERY_NUM_WORKERS = int(query_num_workers_value)
+    except ValueError:
+        raise RuntimeError(f"base.py: QUERY_NUM_WORKERS config var could not be coerced to int: "
+                           f"{query_num_workers_value!r}")
+
+# number of rows that `utils.utilities.batched_rows()` fetches at a time. for server-side cursors (see
+# `utils.utilities.streaming_cursor()`) this is the number of rows per round trip, and so bounds how many rows a query
+# holds in memory
+QUERY_CURSOR_ITERSIZE = 2000
+
+if 'QUERY_CURSOR_ITERSIZE' in os.environ:
+    query_cursor_itersize_value = os.environ.get('QUERY_CURSOR_ITERSIZE')
+    try:
+        QUERY_CURSOR_ITERSIZE = int(query_cursor_itersize_value)
+    except ValueError:
+        raise RuntimeError(f"base.py: QUERY_CURSOR_ITERSIZE config var could not be coerced to int: "
+                           f"{query_cursor_itersize_value!r}")
+
+# gzip compression level (1-9) of query Jobs' files as they are uploaded (see `utils.cloud_file.upload_stream()`). 0
+# disables compression. parquet files are never gzipped b/c they are already compressed internally
+QUERY_GZIP_LEVEL = 6
+
+if 'QUERY_GZIP_LEVEL' in os.environ:
+    query_gzip_level_value = os.environ.get('QUERY_GZIP_LEVEL')
+    try:
+        QUERY_GZIP_LEVEL = int(query_gzip_level_value)
+    except ValueError:
+        raise RuntimeError(f"base.py: QUERY_GZIP_LEVEL config var could not be coerced to int: "
+                           f"{query_gzip_level_value!r}")
+
+if not 0 <= QUERY_GZIP_LEVEL <= 9:
+    raise RuntimeError(f"base.py: QUERY_GZIP_LEVEL must be between 0 and 9: {QUERY_GZIP_LEVEL}")
+
 # used to generate /robots.txt . format: CSV (comma-delimited)
 if 'BAD_BOTS' in os.environ:
     bad_bots_value = os.environ.get('BAD_BOTS')
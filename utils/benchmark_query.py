@@ -0,0 +1,103 @@
+import csv
+import datetime
+import random
+import timeit
+
+import click
+import django
+
+
+# set up django. must be done before loading models. NB: requires DJANGO_SETTINGS_MODULE to be set
+django.setup()
+
+from forecast_app.models import Forecast, ForecastModel, Project, Target, TimeZero, Unit
+from utils.forecast import load_predictions_from_json_io_dict
+from utils.project import delete_project_iteratively
+from utils.project_queries import query_forecasts_for_project
+
+
+#
+# ---- application ----
+#
+
+QUANTILES = [0.01, 0.025] + [round(0.05 * i, 2) for i in range(1, 20)] + [0.975, 0.99]  # 23 quantiles
+
+
+class _NullWriter(object):
+    # a file-like object that discards what's written to it, so that CSV encoding is timed but not I/O
+    def write(self, s):
+        return len(s)
+
+
+@click.command()
+@click.option('--num-models', default=8, show_default=True)
+@click.option('--num-timezeros', default=8, show_default=True)
+@click.option('--num-units', default=100, show_default=True)
+@click.option('--num-targets', default=10, show_default=True)
+@click.option('--num-workers', default='1,2,4,8', show_default=True,
+              help="comma-separated worker counts to compare. 1 means serial")
+@click.option('--partition-by', type=click.Choice(['model', 'timezero']), default=None,
+              help="the query dimension to partition. default: whichever has more ids")
+@click.option('--convert', is_flag=True, default=False,
+              help="query via the type conversion implementation (convert.point)")
+def benchmark_query_app(num_models, num_timezeros, num_units, num_targets, num_workers, partition_by, convert):
+    """
+    App to compare serial and parallel forecast queries (see utils.project_queries.query_forecasts_for_project()'s
+    `num_workers`). Creates a synthetic project with `num_models` models, each with a forecast for every one of
+    `num_timezeros` timezeros containing a 23-quantile prediction for every unit and target. The project is committed
+    (parallel queries' worker threads use their own database connections, and so only see committed data) and then
+    deleted when done.
+
+    NB: requires DJANGO_SETTINGS_MODULE to be set.
+    """
+    num_workers_list = [int(num_workers) for num_workers in num_workers.split(',')]
+    click.echo(f"* creating synthetic project. num_models={num_models}, num_timezeros={num_timezeros}, "
+               f"num_units={num_units}, num_targets={num_targets}")
+    project = Project.objects.create(name='benchmark_query_app')
+    try:
+        _make_synthetic_project(project, num_models, num_timezeros, num_units, num_targets)
+        query = {'options': {'convert.point': 'mean'}} if convert else {}
+        click.echo(f"\n{'num_workers':>11} {'num_rows':>9} {'secs':>8} {'speedup':>7}")
+        serial_secs = None
+        for num_workers in num_workers_list:
+            start_time = timeit.default_timer()
+            num_rows = 0
+            csv_writer = csv.writer(_NullWriter())
+            for row in query_forecasts_for_project(project, query, max_num_rows=float('inf'), num_workers=num_workers,
+                                                   partition_by=partition_by):
+                csv_writer.writerow(row)
+                num_rows += 1
+            secs = timeit.default_timer() - start_time
+            serial_secs = secs if serial_secs is None else serial_secs
+            click.echo(f"{num_workers:>11} {num_rows - 1:>9} {secs:>8.2f} {serial_secs / secs:>6.2f}x")
+    finally:
+        click.echo(f"\n* deleting synthetic project")
+        delete_project_iteratively(project)
+
+
+def _make_synthetic_project(project, num_models, num_timezeros, num_units, num_targets):
+    Unit.objects.bulk_create([Unit(project=project, name=f'unit {idx}', abbreviation=f'unit {idx}')
+                              for idx in range(num_units)])
+    for idx in range(num_targets):
+        target = Target.objects.create(project=project, name=f'target {idx}', type=Target.CONTINUOUS_TARGET_TYPE,
+                                       description='benchmark target', is_step_ahead=False)
+        target.set_range(0.0, 1_000_000.0)
+    time_zeros = [TimeZero.objects.create(project=project,
+                                          timezero_date=datetime.date(2020, 1, 1) + datetime.timedelta(weeks=idx))
+                  for idx in range(num_timezeros)]
+    for model_idx in range(num_models):
+        forecast_model = ForecastModel.objects.create(project=project, name=f'model {model_idx}',
+                                                      abbreviation=f'model_{model_idx}')
+        for time_zero in time_zeros:
+            forecast = Forecast.objects.create(forecast_model=forecast_model, source='benchmark', time_zero=time_zero)
+            prediction_dicts = [{'unit': f'unit {unit_idx}', 'target': f'target {target_idx}', 'class': 'quantile',
+                                 'prediction': {'quantile': QUANTILES,
+                                                'value': sorted(random.uniform(0, 1_000) for _ in QUANTILES)}}
+                                for unit_idx in range(num_units) for target_idx in range(num_targets)]
+            load_predictions_from_json_io_dict(forecast, {'meta': {}, 'predictions': prediction_dicts},
+                                               is_validate_cats=False)  # atomic
+        click.echo(f"- loaded model {model_idx + 1}/{num_models}")
+
+
+if __name__ == '__main__':
+    benchmark_query_app()
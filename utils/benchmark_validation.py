@@ -0,0 +1,74 @@
+import random
+import timeit
+
+import click
+import django
+from django.db import transaction
+
+
+# set up django. must be done before loading models. NB: requires DJANGO_SETTINGS_MODULE to be set
+django.setup()
+
+from forecast_app.models import Project, Target, Unit
+from utils.forecast import _unit_shard_pred_ele_rows, _unit_shard_pred_ele_rows_parallel
+from utils.validation_context import ValidationContext
+
+
+#
+# ---- application ----
+#
+
+QUANTILES = [0.01, 0.025] + [round(0.05 * i, 2) for i in range(1, 20)] + [0.975, 0.99]  # 23 quantiles
+
+
+@click.command()
+@click.option('--sizes', default='10000,100000,500000', show_default=True,
+              help="comma-separated numbers of prediction dicts to validate")
+@click.option('--num-workers', default='1,2,4,8', show_default=True,
+              help="comma-separated worker counts to compare. 1 means serial")
+@click.option('--num-units', default=500, show_default=True)
+def benchmark_validation_app(sizes, num_workers, num_units):
+    """
+    App to compare serial and parallel forecast validation (see utils.forecast._unit_shard_pred_ele_rows_parallel())
+    for a range of forecast sizes. Uses a throwaway project containing `num_units` units and enough continuous targets
+    to hold the largest size, with one 23-quantile prediction per unit and target. The project is rolled back when
+    done, so no data is saved.
+
+    NB: requires DJANGO_SETTINGS_MODULE to be set.
+    """
+    sizes = [int(size) for size in sizes.split(',')]
+    num_workers_list = [int(num_workers) for num_workers in num_workers.split(',')]
+    num_targets = -(-max(sizes) // num_units)  # ceiling division
+    click.echo(f"* creating throwaway project. num_units={num_units}, num_targets={num_targets}")
+    with transaction.atomic():
+        project = Project.objects.create(name='benchmark_validation_app')
+        Unit.objects.bulk_create([Unit(project=project, name=f'unit {idx}', abbreviation=f'unit {idx}')
+                                  for idx in range(num_units)])
+        for idx in range(num_targets):
+            target = Target.objects.create(project=project, name=f'target {idx}', type=Target.CONTINUOUS_TARGET_TYPE,
+                                           description='benchmark target', is_step_ahead=False)
+            target.set_range(0.0, 1_000_000.0)
+        validation_context = ValidationContext(project, project.config_version)
+        transaction.set_rollback(True)
+
+    click.echo(f"\n{'num_pred_dicts':>14} {'num_workers':>11} {'secs':>8} {'speedup':>7}")
+    for size in sizes:
+        prediction_dicts = [{'unit': f'unit {idx % num_units}', 'target': f'target {idx // num_units}',
+                             'class': 'quantile',
+                             'prediction': {'quantile': QUANTILES,
+                                            'value': sorted(random.uniform(0, 1_000) for _ in QUANTILES)}}
+                            for idx in range(size)]
+        serial_secs = None
+        for num_workers in num_workers_list:
+            start_time = timeit.default_timer()
+            if num_workers == 1:
+                _unit_shard_pred_ele_rows(prediction_dicts, validation_context, False, True)
+            else:
+                _unit_shard_pred_ele_rows_parallel(prediction_dicts, validation_context, False, True, num_workers)
+            secs = timeit.default_timer() - start_time
+            serial_secs = secs if serial_secs is None else serial_secs
+            click.echo(f"{size:>14} {num_workers:>11} {secs:>8.2f} {serial_secs / secs:>6.2f}x")
+
+
+if __name__ == '__main__':
+    benchmark_validation_app()
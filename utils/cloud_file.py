@@ -1,11 +1,16 @@
+import datetime
 import logging
+import os
+import shutil
+import zlib
+from pathlib import Path
 
 import boto3
 import botocore
 from boto3.exceptions import Boto3Error
 from botocore.exceptions import BotoCoreError, ClientError, ConnectionClosedError
 
-from forecast_repo.settings.base import S3_BUCKET_PREFIX
+from forecast_repo.settings.base import CLOUD_FILE_LOCAL_DIR, S3_BUCKET_PREFIX, UPLOAD_PART_SIZE
 
 
 logger = logging.getLogger(__name__)
@@ -14,6 +19,10 @@ logger = logging.getLogger(__name__)
 # per https://github.com/boto/boto3/issues/1713#issuecomment-468650931
 logging.getLogger("boto3.resources.action").setLevel(logging.INFO)
 
+# the default number of seconds until presigned_url()'s URLs expire. they only need to last until the client follows the
+# redirect to them
+PRESIGNED_URL_EXPIRES_IN = 5 * 60
+
 
 #
 # This file contains code to handle managing files on a cloud-based service. This is an attempt to abstract away some of
@@ -39,6 +48,9 @@ logging.getLogger("boto3.resources.action").setLevel(logging.INFO)
 # - folder name: 'job' (S3 bucket: 'reichlab.zoltarapp.job')
 # - filename: Job.pk as a string
 #
+# Local files: If CLOUD_FILE_LOCAL_DIR is set then files are stored under it rather than in S3, in a directory named by
+# the folder name, e.g., '<CLOUD_FILE_LOCAL_DIR>/job/<Job.pk>'. This is intended for tests and local development.
+#
 
 
 def _folder_name_for_object(the_object):
@@ -63,6 +75,10 @@ def _s3_bucket_name_for_object(the_object):
     return S3_BUCKET_PREFIX + '.' + _folder_name_for_object(the_object)
 
 
+def _local_file_path_for_object(the_object):
+    return Path(CLOUD_FILE_LOCAL_DIR) / _folder_name_for_object(the_object) / _file_name_for_object(the_object)
+
+
 def upload_file(the_object, data_file):
     """
     Uploads data_file to the S3 bucket corresponding to the_object.
@@ -94,8 +110,11 @@ def delete_file(the_object):
     """
     try:
         logger.debug("delete_file(): started: {}".format(the_object))
-        s3_resource = boto3.resource('s3')
-        s3_resource.Object(_s3_bucket_name_for_object(the_object), _file_name_for_object(the_object)).delete()
+        if CLOUD_FILE_LOCAL_DIR:
+            _local_file_path_for_object(the_object).unlink(missing_ok=True)
+        else:
+            s3_resource = boto3.resource('s3')
+            s3_resource.Object(_s3_bucket_name_for_object(the_object), _file_name_for_object(the_object)).delete()
         logger.debug("delete_file(): done: {}".format(the_object))
     except (BotoCoreError, Boto3Error, ClientError, ConnectionClosedError) as aws_exc:
         logger.error(f"delete_file(): error: {aws_exc!r}. the_object={the_object}")
@@ -111,16 +130,81 @@ def download_file(the_object, data_file):
     :param data_file: a file-like object
     :raises: S3 exceptions
     """
+    if CLOUD_FILE_LOCAL_DIR:
+        with open(_local_file_path_for_object(the_object), 'rb') as local_fp:
+            shutil.copyfileobj(local_fp, data_file)
+        return
+
     s3_client = boto3.client('s3')  # using client here instead of higher-level resource b/c want to save to a fp
     s3_client.download_fileobj(_s3_bucket_name_for_object(the_object), _file_name_for_object(the_object), data_file)
 
 
+def open_file(the_object, byte_range=None):
+    """
+    Opens the file corresponding to the_object for reading, rather than downloading all of it as download_file() does.
+    The caller is responsible for closing it.
+
+    :param the_object: a Model
+    :param byte_range: an optional 2-tuple of inclusive byte offsets: (start, end). if passed then only those bytes are
+        requested from S3. NB: local files are only positioned at start - the caller must stop reading at end
+    :return: a binary file-like object with read(amt) and close(): a local file if CLOUD_FILE_LOCAL_DIR is set, or the
+        S3 object's streaming body o/w
+    :raises: S3 exceptions
+    """
+    if CLOUD_FILE_LOCAL_DIR:
+        local_fp = open(_local_file_path_for_object(the_object), 'rb')
+        if byte_range:
+            local_fp.seek(byte_range[0])
+        return local_fp
+
+    s3_client = boto3.client('s3')
+    range_kwargs = {'Range': f'bytes={byte_range[0]}-{byte_range[1]}'} if byte_range else {}
+    return s3_client.get_object(Bucket=_s3_bucket_name_for_object(the_object), Key=_file_name_for_object(the_object),
+                                **range_kwargs)['Body']
+
+
+def presigned_url(the_object, expires_in=PRESIGNED_URL_EXPIRES_IN, content_type=None, content_disposition=None,
+                  content_encoding=None):
+    """
+    Returns a URL that allows downloading the file corresponding to the_object without credentials until it expires,
+    so that clients can download it directly rather than through the web process.
+
+    :param the_object: a Model
+    :param expires_in: the number of seconds until the URL expires
+    :param content_type: optional Content-Type header that S3 responds with
+    :param content_disposition: "" Content-Disposition ""
+    :param content_encoding: "" Content-Encoding ""
+    :return: a presigned S3 URL, or a 'file://' URL of the local file if CLOUD_FILE_LOCAL_DIR is set. the latter does
+        not expire or set any headers, is intended for tests, and is never redirected to (see JOB_DATA_DOWNLOAD_MODE)
+    :raises: S3 exceptions
+    """
+    if CLOUD_FILE_LOCAL_DIR:
+        return _local_file_path_for_object(the_object).resolve().as_uri()
+
+    params = {'Bucket': _s3_bucket_name_for_object(the_object), 'Key': _file_name_for_object(the_object)}
+    for param_name, value in [('ResponseContentType', content_type),
+                              ('ResponseContentDisposition', content_disposition),
+                              ('ResponseContentEncoding', content_encoding)]:
+        if value:
+            params[param_name] = value
+    s3_client = boto3.client('s3')
+    return s3_client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+
 def is_file_exists(the_object):
     """
     :param the_object: a Model
     :return: 3-tuple: (is_exists, last_modified, size). everything after is_exists is None if !is_exists
     :raises: S3 exceptions
     """
+    if CLOUD_FILE_LOCAL_DIR:
+        local_file_path = _local_file_path_for_object(the_object)
+        if not local_file_path.exists():
+            return False, None, None
+        stat_result = local_file_path.stat()
+        return True, datetime.datetime.fromtimestamp(stat_result.st_mtime, tz=datetime.timezone.utc), \
+               stat_result.st_size
+
     s3_resource = boto3.resource('s3')
     object_summary = s3_resource.ObjectSummary(_s3_bucket_name_for_object(the_object),
                                                _file_name_for_object(the_object))
@@ -132,3 +216,236 @@ def is_file_exists(the_object):
             return False, None, None, None, None
         else:  # something else has gone wrong
             raise ce
+
+
+#
+# upload_stream()
+#
+
+def upload_stream(the_object, part_size=UPLOAD_PART_SIZE, gzip_level=0):
+    """
+    Returns an UploadStream for writing the file corresponding to the_object incrementally, rather than all at once as
+    upload_file() does. Data is uploaded in parts of part_size bytes as it is written, so memory use is bounded
+    regardless of the file's size. Use it as a context manager - the file is completed on a normal exit, and discarded
+    if an exception is raised, e.g.,
+
+        with upload_stream(job) as stream:
+            csv.writer(stream).writerows(rows)
+
+    :param the_object: a Model
+    :param part_size: the number of bytes in each part except the last one. must be at least 5 MiB for S3
+    :param gzip_level: if >0, the file is gzip-compressed at that level (1-9) as it is written. 0 means uncompressed
+    :return: a LocalFileUploadStream if CLOUD_FILE_LOCAL_DIR is set, or an S3UploadStream o/w
+    """
+    if CLOUD_FILE_LOCAL_DIR:
+        return LocalFileUploadStream(the_object, part_size, gzip_level)
+    else:
+        return S3UploadStream(the_object, part_size, gzip_level)
+
+
+class UploadStream:
+    """
+    Abstract file-like class that accepts str (encoded as utf-8) or bytes via write() and passes it on to subclasses in
+    parts of exactly part_size bytes (except for the last part, which might be smaller). If gzip_level is >0 then the
+    parts are of the data's gzip compression. Subclasses implement _write_part(), _complete(), and _abort(). Not
+    thread-safe.
+    """
+
+
+    def __init__(self, the_object, part_size, gzip_level=0):
+        self.the_object = the_object
+        self.part_size = part_size
+        self.num_parts = 0  # number of parts passed to _write_part()
+        self.num_bytes = 0  # "" bytes written, after compression
+        self.closed = False  # True after close() or abort()
+        self._position = 0  # number of bytes passed to write(), before compression
+        self._buffer = bytearray()
+        # wbits=31 writes a gzip header and trailer rather than zlib's
+        self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31) if gzip_level else None
+
+
+    def write(self, data):
+        """
+        :param data: a str or bytes
+        :return: the number of characters or bytes written, i.e., len(data)
+        :raises: S3 exceptions
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+
+        data_bytes = data.encode('utf-8') if isinstance(data, str) else data
+        self._position += len(data_bytes)
+        self._buffer += self._compressor.compress(data_bytes) if self._compressor else data_bytes
+        while len(self._buffer) >= self.part_size:
+            self._write_buffered_part(self.part_size)
+        return len(data)
+
+
+    def flush(self):
+        """
+        Does nothing: data is uploaded only in whole parts (see write()) and when closed. Defined for writers that
+        flush their file, e.g., pyarrow's.
+        """
+        pass
+
+
+    def writable(self):
+        return True
+
+
+    def tell(self):
+        """
+        :return: the number of bytes written so far, before compression
+        """
+        return self._position
+
+
+    def close(self):
+        """
+        Writes any buffered data as the last part and then completes the file.
+
+        :raises: S3 exceptions
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+        if self._compressor:
+            self._buffer += self._compressor.flush()
+        if self._buffer or not self.num_parts:  # always write at least one (possibly empty) part
+            self._write_buffered_part(len(self._buffer))
+        self._complete()
+
+
+    def abort(self):
+        """
+        Discards the parts written so far. Errors are logged rather than raised so as not to mask the caller's error.
+        """
+        self.closed = True
+        try:
+            self._abort()
+        except Exception as ex:
+            logger.error(f"UploadStream.abort(): error: {ex!r}. the_object={self.the_object}")
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False  # re-raise exc_value, if any
+
+
+    def _write_buffered_part(self, num_bytes):
+        part = bytes(self._buffer[:num_bytes])
+        del self._buffer[:num_bytes]
+        self.num_parts += 1
+        self.num_bytes += len(part)
+        self._write_part(part, self.num_parts)
+
+
+    def _write_part(self, part, part_number):
+        """
+        :param part: bytes
+        :param part_number: 1-based number of part
+        """
+        raise NotImplementedError()
+
+
+    def _complete(self):
+        raise NotImplementedError()
+
+
+    def _abort(self):
+        raise NotImplementedError()
+
+
+class S3UploadStream(UploadStream):
+    """
+    An UploadStream that uses an S3 multipart upload. Files that fit in one part are uploaded with a single put_object()
+    call instead, which saves the create and complete calls that a multipart upload needs.
+    """
+
+
+    def __init__(self, the_object, part_size, gzip_level=0):
+        super().__init__(the_object, part_size, gzip_level)
+        self._s3_client = boto3.client('s3')
+        self._bucket_name = _s3_bucket_name_for_object(the_object)
+        self._key = _file_name_for_object(the_object)
+        self._upload_id = None  # set by the first part unless it is also the last one
+        self._etag_parts = []  # 'Parts' for complete_multipart_upload()
+        self._single_part = None  # set by _write_part() if the first part might be the only one
+
+
+    def _write_part(self, part, part_number):
+        # we don't know whether the first part is the only one until either a second one arrives or we're closed, so we
+        # defer uploading it. this holds at most one part in addition to the buffer
+        if part_number == 1:
+            self._single_part = part
+            return
+
+        if self._single_part is not None:
+            self._upload_part(self._single_part, 1)
+            self._single_part = None
+        self._upload_part(part, part_number)
+
+
+    def _upload_part(self, part, part_number):
+        if self._upload_id is None:
+            response = self._s3_client.create_multipart_upload(Bucket=self._bucket_name, Key=self._key)
+            self._upload_id = response['UploadId']
+        response = self._s3_client.upload_part(Bucket=self._bucket_name, Key=self._key, UploadId=self._upload_id,
+                                               PartNumber=part_number, Body=part)
+        self._etag_parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+
+    def _complete(self):
+        if self._single_part is not None:
+            self._s3_client.put_object(Bucket=self._bucket_name, Key=self._key, Body=self._single_part)
+            self._single_part = None
+        else:
+            self._s3_client.complete_multipart_upload(Bucket=self._bucket_name, Key=self._key,
+                                                      UploadId=self._upload_id,
+                                                      MultipartUpload={'Parts': self._etag_parts})
+
+
+    def _abort(self):
+        self._single_part = None
+        if self._upload_id is not None:
+            self._s3_client.abort_multipart_upload(Bucket=self._bucket_name, Key=self._key, UploadId=self._upload_id)
+
+
+class LocalFileUploadStream(UploadStream):
+    """
+    An UploadStream that appends parts to a temporary file under CLOUD_FILE_LOCAL_DIR and then renames it on completion
+    so that readers never see a partial file. See the "Local files" naming convention above.
+    """
+
+
+    def __init__(self, the_object, part_size, gzip_level=0):
+        super().__init__(the_object, part_size, gzip_level)
+        self._file_path = _local_file_path_for_object(the_object)
+        self._temp_file_path = self._file_path.with_name(self._file_path.name + '.part')
+        self._temp_fp = None  # opened by the first part
+
+
+    def _write_part(self, part, part_number):
+        if self._temp_fp is None:
+            self._file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._temp_fp = open(self._temp_file_path, 'wb')
+        self._temp_fp.write(part)
+
+
+    def _complete(self):
+        self._temp_fp.close()
+        os.replace(self._temp_file_path, self._file_path)
+
+
+    def _abort(self):
+        if self._temp_fp is not None:
+            self._temp_fp.close()
+            self._temp_file_path.unlink(missing_ok=True)
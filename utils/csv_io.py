@@ -1,5 +1,9 @@
+import csv
 import datetime
-from itertools import groupby
+import heapq
+import tempfile
+from contextlib import ExitStack
+from itertools import groupby, islice
 
 from utils.project_queries import CSV_HEADER
 from utils.utilities import YYYY_MM_DD_DATE_FORMAT
@@ -30,6 +34,20 @@ def json_io_dict_from_csv_rows(csv_rows):
     if row0 != CSV_HEADER:
         raise RuntimeError(f"first row was not the proper header. row0 = {row0}, header={CSV_HEADER}")
 
+    csv_rows.sort(key=_unit_target_class_key)  # sorted for groupby(): unit, target, pred_class
+    prediction_dicts = list(_prediction_dicts_for_sorted_rows(csv_rows))
+    return {'meta': {}, 'predictions': prediction_dicts}
+
+
+def _unit_target_class_key(row):
+    return row[0], row[1], row[2]
+
+
+def _prediction_dicts_for_sorted_rows(sorted_rows):
+    """
+    json_io_dict_from_csv_rows() and prediction_dicts_from_csv_fp() helper that yields one prediction dict for each group
+    of rows with the same (unit, target, pred_class). sorted_rows must be sorted by that 3-tuple.
+    """
     pred_class_to_pred_dict_fcn = {'bin': _pred_dict_for_bin_rows,
                                    'named': _pred_dict_for_named_rows,
                                    'point': _pred_dict_for_point_rows,
@@ -38,11 +56,60 @@ def json_io_dict_from_csv_rows(csv_rows):
                                    'mean': _pred_dict_for_point_rows,
                                    'median': _pred_dict_for_point_rows,
                                    'mode': _pred_dict_for_point_rows}
-    prediction_dicts = []
-    csv_rows.sort(key=lambda _: (_[0], _[1], _[2]))  # sorted for groupby(): unit, target, pred_class
-    for (unit, target, pred_class), values_grouper in groupby(csv_rows, key=lambda _: (_[0], _[1], _[2])):
-        prediction_dicts.append(pred_class_to_pred_dict_fcn[pred_class](unit, target, pred_class, list(values_grouper)))
-    return {'meta': {}, 'predictions': prediction_dicts}
+    for (unit, target, pred_class), values_grouper in groupby(sorted_rows, key=_unit_target_class_key):
+        if pred_class not in pred_class_to_pred_dict_fcn:
+            raise RuntimeError(f"invalid pred_class: {pred_class!r}. must be one of: "
+                               f"{list(pred_class_to_pred_dict_fcn.keys())}")
+
+        yield pred_class_to_pred_dict_fcn[pred_class](unit, target, pred_class, list(values_grouper))
+
+
+#
+# prediction_dicts_from_csv_fp()
+#
+
+# the number of CSV rows that prediction_dicts_from_csv_fp() sorts in memory at a time. files with more rows than this
+# are sorted in chunks that are spilled to temporary files and then merged
+CSV_SORT_CHUNK_NUM_ROWS = 100_000
+
+
+def prediction_dicts_from_csv_fp(csv_fp, chunk_num_rows=CSV_SORT_CHUNK_NUM_ROWS):
+    """
+    A streaming version of json_io_dict_from_csv_rows() that reads rows from csv_fp and yields prediction dicts (i.e.,
+    the items in a "JSON IO dict"'s 'predictions' list) one at a time rather than building the entire list in memory.
+    Rows are grouped by (unit, target, pred_class) via an external merge sort: csv_fp is read in chunks of
+    `chunk_num_rows` rows, each chunk is sorted and (if there is more than one) written to a temporary file, and then
+    the sorted chunks are merged. Thus peak memory is bounded by `chunk_num_rows` rather than by the file's size.
+
+    Like json_io_dict_from_csv_rows(), rows within a group keep their file order, and this function terminates on the
+    first error.
+
+    :param csv_fp: an open file-like object in zoltar-specific CSV format. columns: 12 (see CSV_HEADER)
+    :param chunk_num_rows: the maximum number of rows to sort in memory at once
+    :return: a generator of prediction dicts
+    """
+    csv_reader = csv.reader(csv_fp)
+    row0 = next(csv_reader, [])
+    if row0 != CSV_HEADER:
+        raise RuntimeError(f"first row was not the proper header. row0 = {row0}, header={CSV_HEADER}")
+
+    # sort the first chunk. if it is the only one then we are done and there is no need to spill to disk
+    chunk_rows = sorted(islice(csv_reader, chunk_num_rows), key=_unit_target_class_key)
+    if len(chunk_rows) < chunk_num_rows:
+        yield from _prediction_dicts_for_sorted_rows(chunk_rows)
+        return
+
+    # spill sorted chunks ("runs") to temp files and then merge them. heapq.merge() is stable with respect to the order
+    # of the runs, so rows within a group stay in file order
+    with ExitStack() as exit_stack:
+        sorted_runs = []
+        while chunk_rows:
+            run_fp = exit_stack.enter_context(tempfile.TemporaryFile(mode='w+', newline=''))
+            csv.writer(run_fp).writerows(chunk_rows)
+            run_fp.seek(0)
+            sorted_runs.append(csv.reader(run_fp))
+            chunk_rows = sorted(islice(csv_reader, chunk_num_rows), key=_unit_target_class_key)
+        yield from _prediction_dicts_for_sorted_rows(heapq.merge(*sorted_runs, key=_unit_target_class_key))
 
 
 def _pred_dict_for_bin_rows(unit, target, pred_class, values_rows):
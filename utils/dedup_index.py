@@ -0,0 +1,93 @@
+import struct
+
+from forecast_app.models import Forecast, PredictionElement
+
+
+#
+# DedupIndex
+#
+
+class DedupIndex:
+    """
+    Holds the prediction element keys of all existing versions of a forecast's (forecast_model, time_zero) so that
+    forecast loading can skip duplicate prediction elements and validate the "cannot load data that's a subset of
+    previous data" rule in memory rather than by joining every previous version against a temp table of the incoming
+    rows. Loading one takes two queries. Each key is packed into a single bytes object of (pred_class, unit_id,
+    target_id, is_retract, data_hash) to keep the index compact. Indexes are not cached across loads b/c the versions
+    they reflect can be changed by other processes (new versions, deletions, and rehash_forecast()).
+    """
+
+
+    def __init__(self, forecast):
+        """
+        :param forecast: the new, empty Forecast being inserted into
+        """
+        prev_forecast_ids = set(Forecast.objects.filter(forecast_model_id=forecast.forecast_model_id,
+                                                        time_zero_id=forecast.time_zero_id,
+                                                        issued_at__lt=forecast.issued_at)
+                                .values_list('id', flat=True))
+        self.keys = set()  # keys hashed with PredictionElement.CURRENT_HASH_VERSION, plus all retractions
+        self.legacy_keys = set()  # keys hashed with PredictionElement.MD5_JSON_HASH_VERSION
+        self.prev_unit_target_pred_classes = set()  # (unit_id, target_id, pred_class) of versions before `forecast`
+        pred_ele_qs = PredictionElement.objects \
+            .filter(forecast__forecast_model_id=forecast.forecast_model_id,
+                    forecast__time_zero_id=forecast.time_zero_id) \
+            .values_list('forecast_id', 'pred_class', 'unit_id', 'target_id', 'is_retract', 'data_hash',
+                         'hash_version')
+        for forecast_id, pred_class, unit_id, target_id, is_retract, data_hash, hash_version in pred_ele_qs.iterator():
+            # retractions have no hash, and so match regardless of hash_version
+            keys = self.legacy_keys \
+                if (not is_retract) and (hash_version == PredictionElement.MD5_JSON_HASH_VERSION) else self.keys
+            keys.add(_pred_ele_key(pred_class, unit_id, target_id, is_retract, data_hash))
+            if forecast_id in prev_forecast_ids:
+                self.prev_unit_target_pred_classes.add((unit_id, target_id, pred_class))
+
+
+    def __repr__(self):
+        return str((len(self.keys), len(self.legacy_keys), len(self.prev_unit_target_pred_classes)))
+
+
+    @property
+    def is_legacy_hash(self):
+        """
+        :return: True if any existing non-retracted prediction elements were hashed with a hash_version other than
+            PredictionElement.CURRENT_HASH_VERSION, i.e., if legacy hashes are needed to detect duplicates
+        """
+        return bool(self.legacy_keys)
+
+
+    def is_duplicate(self, pred_class, unit_id, target_id, is_retract, data_hash, legacy_data_hash):
+        """
+        Note that we are not testing against issued_at, which would be wrong b/c duplicates should be skipped if they
+        exist in /any/ version.
+
+        :return: True if the passed prediction element exists in any version. args are as returned by
+            utils.forecast._hashes_for_prediction_data()
+        """
+        return (_pred_ele_key(pred_class, unit_id, target_id, is_retract, data_hash) in self.keys) \
+            or (bool(legacy_data_hash)
+                and (_pred_ele_key(pred_class, unit_id, target_id, is_retract, legacy_data_hash) in self.legacy_keys))
+
+
+    def unique_pred_ele_rows(self, pred_ele_rows):
+        """
+        :param pred_ele_rows: list of 7-tuples as returned by utils.forecast._validated_pred_ele_rows_for_pred_dicts():
+            (forecast_id, pred_class_int, unit_id, target_id, is_retract, data_hash, legacy_data_hash)
+        :return: the rows in pred_ele_rows that are not duplicates (see is_duplicate()), in the same order
+        """
+        return [pred_ele_row for pred_ele_row in pred_ele_rows if not self.is_duplicate(*pred_ele_row[1:])]
+
+
+    def is_subset_of_prev_versions(self, unit_target_pred_classes):
+        """
+        :param unit_target_pred_classes: a set of (unit_id, target_id, pred_class) 3-tuples of all of the new forecast's
+            candidate prediction elements, including duplicates
+        :return: True if they are a subset of those of the forecast's previous versions, i.e., if there are implicit
+            retractions
+        """
+        return not (self.prev_unit_target_pred_classes <= unit_target_pred_classes)
+
+
+def _pred_ele_key(pred_class, unit_id, target_id, is_retract, data_hash):
+    # DedupIndex helper. data_hash is '' for retractions
+    return struct.pack('<hqq?', pred_class, unit_id, target_id, is_retract) + bytes.fromhex(data_hash)
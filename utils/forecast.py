@@ -4,19 +4,29 @@ import io
 import json
 import logging
 import math
+import multiprocessing
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+import numpy as np
 
 from django.db import connection, transaction
 from django.db.models import Count
 from django.shortcuts import get_object_or_404
 
 from forecast_app.models import Forecast, Target, ForecastMetaPrediction, ForecastMetaUnit, ForecastMetaTarget, \
-    ForecastModel, PredictionElement, PredictionData
+    ForecastModel, PredictionElement, PredictionData, HashedPredictionData, Project, LatestPredictionElement
+from forecast_app.models.prediction_data import packed_pred_data, unpacked_pred_data
 from forecast_app.models.prediction_element import PRED_CLASS_NAME_TO_INT, PRED_CLASS_INT_TO_NAME
+from forecast_app.models.project import update_project_data_version
+from forecast_repo.settings.base import VALIDATION_NUM_WORKERS
 from utils.project import _target_dict_for_target, targets_for_group_name
-from utils.project_queries import _query_forecasts_sql_for_pred_class
+from utils.project_queries import _query_forecasts_sql_for_pred_class, _decoded_pred_data
 from utils.project_truth import POSTGRES_NULL_VALUE
-from utils.utilities import YYYY_MM_DD_DATE_FORMAT, batched_rows
+from utils.dedup_index import DedupIndex
+from utils.utilities import YYYY_MM_DD_DATE_FORMAT, batched_rows, streaming_cursor
+from utils.validation_context import validation_context_for_project
 
 
 logger = logging.getLogger(__name__)
@@ -62,20 +72,22 @@ def json_io_dict_from_forecast(forecast, request, is_include_retract=False):
     unit_id_to_obj = {unit.pk: unit for unit in forecast.forecast_model.project.units.all()}
     target_id_to_obj = {target.pk: target for target in forecast.forecast_model.project.targets.all()}
     sql = _query_forecasts_sql_for_pred_class([], [forecast.forecast_model.pk], [], [], [forecast.time_zero.pk],
-                                              forecast.issued_at, False, is_include_retract)
-    with connection.cursor() as cursor:
+                                              _as_of_for_forecast(forecast), False, is_include_retract)
+    with streaming_cursor() as cursor:
         cursor.execute(sql, (forecast.forecast_model.project.pk,))
-        # counterintuitively must use json.loads per https://code.djangoproject.com/ticket/31991
         prediction_dicts = [
             {'unit': unit_id_to_obj[unit_id].abbreviation,
              'target': target_id_to_obj[target_id].name,
              'class': PRED_CLASS_INT_TO_NAME[pred_class],
-             'prediction': json.loads(pred_data) if not is_retract else None}
-            # 'prediction': json.loads(pred_data) if pred_data is not None else None}
-            for fm_id, tz_id, pred_class, unit_id, target_id, is_retract, pred_data in batched_rows(cursor)]
+             'prediction': _decoded_pred_data(pred_data, pred_data_packed) if not is_retract else None}
+            for fm_id, tz_id, pred_class, unit_id, target_id, is_retract, pred_data, pred_data_packed
+            in batched_rows(cursor)]
 
-    # done
-    return {'meta': meta, 'predictions': sorted(prediction_dicts, key=lambda _: (_['unit'], _['target']))}
+    # done. sort by class too (in PredictionElement.PRED_CLASS_CHOICES order) so that the order does not depend on the
+    # query plan
+    return {'meta': meta,
+            'predictions': sorted(prediction_dicts,
+                                  key=lambda _: (_['unit'], _['target'], PRED_CLASS_NAME_TO_INT[_['class']]))}
 
 
 #
@@ -83,11 +95,12 @@ def json_io_dict_from_forecast(forecast, request, is_include_retract=False):
 #
 
 BIN_SUM_REL_TOL = 0.001  # hard-coded magic number for prediction probability sums
+QUANTILE_VALUE_REL_TOL = 1e-05  # "" for comparing quantile values for monotonicity
 
 
 @transaction.atomic
 def load_predictions_from_json_io_dict(forecast, json_io_dict, is_skip_validation=False, is_validate_cats=True,
-                                       is_subset_allowed=False):
+                                       is_subset_allowed=False, num_workers=VALIDATION_NUM_WORKERS):
     """
     Top-level function that loads the prediction data into forecast from json_io_dict. Validates the forecast data. Note
     that we ignore the 'meta' portion of json_io_dict. Errors if any referenced Units and Targets do not exist in
@@ -114,8 +127,10 @@ def load_predictions_from_json_io_dict(forecast, json_io_dict, is_skip_validatio
     :param is_skip_validation: bypasses all validation of `json_io_dict`, including `is_validate_cats`. used for truth
         loading
     :param is_validate_cats: True if bin cat values should be validated against their Target.cats. used for testing
-    :param is_subset_allowed: controls whether `_is_pred_eles_subset_prev_versions()` is called:
+    :param is_subset_allowed: controls whether `DedupIndex.is_subset_of_prev_versions()` is called:
         True: don't call, False: do call.
+    :param num_workers: the number of processes to validate large forecasts with. see
+        `_validated_pred_ele_rows_for_pred_dicts()`
     """
     if forecast.pred_eles.count() != 0:
         raise RuntimeError(f"cannot load data into a non-empty forecast: {forecast}")
@@ -130,53 +145,99 @@ def load_predictions_from_json_io_dict(forecast, json_io_dict, is_skip_validatio
     # passes:
     # 1) iterate over incoming prediction dicts, validating them and generating rows to insert into the
     #    PredictionElement table
-    # 2) load those just-inserted rows from the database so we can get their PRIMARY KEY (autoincrement) IDs, and then
-    #    re-iterate over prediction dict data (cached in memory) to generate rows to insert into the PredictionData
-    #    table
+    # 2) use the PRIMARY KEY (autoincrement) IDs returned by that INSERT (via `RETURNING`, so there's no need to re-read
+    #    the just-inserted rows) to generate rows to insert into the PredictionData table from the prediction dict
+    #    data (cached in memory)
 
-    # pass 1/2. NB: `_insert_pred_ele_rows()` does some rule validation b/c it creates a temp table of the incoming
-    # forecast's prediction elements to work with
+    # pass 1/2. NB: `_insert_pred_ele_rows()` does some rule validation b/c it compares the incoming forecast's
+    # prediction elements to those of previous versions via `dedup_index`
+    dedup_index = DedupIndex(forecast)
     data_hash_to_pred_data, pred_ele_rows = \
         _validated_pred_ele_rows_for_pred_dicts(forecast, json_io_dict['predictions'], is_skip_validation,
-                                                is_validate_cats)
+                                                is_validate_cats, num_workers, dedup_index)
     del json_io_dict  # hopefully frees up memory
-    # raises. tests version rules then inserts, deleting any dups first
-    _insert_pred_ele_rows(forecast, pred_ele_rows, is_subset_allowed)
+    # raises. tests version rules then inserts, skipping any dups
+    pred_ele_id_hash_rows = _insert_pred_ele_rows(forecast, pred_ele_rows, is_subset_allowed, dedup_index)
+    del pred_ele_rows
 
     # pass 2/2
-    pred_data_rows = []  # appended-to next
-    pred_ele_qs = PredictionElement.objects \
-        .filter(forecast=forecast, is_retract=False) \
-        .values_list('id', 'data_hash')
-    for pred_ele_id, data_hash in pred_ele_qs.iterator():
-        prediction_data = data_hash_to_pred_data[data_hash]
-        pred_data_rows.append((pred_ele_id, prediction_data))
+    is_packed = _is_packed_pred_data_encoding(forecast)
+    if _is_hashed_pred_data_storage(forecast):
+        _insert_hashed_pred_data_rows({data_hash: data_hash_to_pred_data[data_hash]
+                                       for _, data_hash in pred_ele_id_hash_rows
+                                       if data_hash}.items(), is_packed)  # retractions have no hash
+        return
+
+    pred_data_rows = [(pred_ele_id, data_hash_to_pred_data[data_hash])
+                      for pred_ele_id, data_hash in pred_ele_id_hash_rows
+                      if data_hash]  # retractions have no hash
     if pred_data_rows:
-        _insert_pred_data_rows(pred_data_rows)  # pred_ele_id, prediction_data
+        _insert_pred_data_rows(pred_data_rows, is_packed)  # pred_ele_id, prediction_data
 
 
-def _validated_pred_ele_rows_for_pred_dicts(forecast, prediction_dicts, is_skip_validation, is_validate_cats):
+def _validated_pred_ele_rows_for_pred_dicts(forecast, prediction_dicts, is_skip_validation, is_validate_cats,
+                                            num_workers=1, dedup_index=None):
     """
     Validates prediction_dicts and returns a list of rows suitable for bulk-loading into the PredictionElement table.
+    If num_workers > 1 and there are at least PARALLEL_VALIDATION_MIN_NUM_PRED_DICTS prediction_dicts then the work is
+    sharded by unit across that many processes - see _unit_shard_pred_ele_rows_parallel().
 
     :param forecast: a Forecast that's used to validate against
     :param prediction_dicts: the 'predictions' portion of a "JSON IO dict" as returned by
-        json_io_dict_from_cdc_csv_file()
+        json_io_dict_from_cdc_csv_file(). must be a list (it is iterated over more than once)
     :param is_skip_validation: same as load_predictions_from_json_io_dict()
     :param is_validate_cats: ""
+    :param num_workers: ""
+    :param dedup_index: optional DedupIndex for forecast. used to decide whether legacy hashes are needed, which
+        otherwise costs a query
     :return: a 2-tuple: (data_hash_to_pred_data, pred_ele_rows):
         data_hash_to_pred_data: a dict that maps data_hash -> prediction_data. does not include if is_retract (None)
-        pred_ele_rows: a list of 6-tuples: (forecast_id, pred_class_int, unit_id, target_id, is_retract, data_hash)
+        pred_ele_rows: a list of 7-tuples: (forecast_id, pred_class_int, unit_id, target_id, is_retract, data_hash,
+            legacy_data_hash). see _hashes_for_prediction_data() re: the latter
+    """
+    validation_context = validation_context_for_project(forecast.forecast_model.project)
+    is_legacy_hash = dedup_index.is_legacy_hash if dedup_index else _is_legacy_hash_prev_versions(forecast)
+    if (num_workers > 1) and (len(prediction_dicts) >= PARALLEL_VALIDATION_MIN_NUM_PRED_DICTS):
+        shard_rows = _unit_shard_pred_ele_rows_parallel(prediction_dicts, validation_context, is_skip_validation,
+                                                        is_validate_cats, is_legacy_hash, num_workers)
+    else:
+        shard_rows = _unit_shard_pred_ele_rows(prediction_dicts, validation_context, is_skip_validation,
+                                               is_validate_cats, is_legacy_hash)
+
+    data_hash_to_pred_data = {}  # return value
+    pred_ele_rows = []  # ""
+    for prediction_dict, (pred_class_int, unit_id, target_id, is_retract, data_hash, legacy_data_hash) \
+            in zip(prediction_dicts, shard_rows):
+        # we store '' if is_retract b/c there is no PredictionData and therefore no hash
+        if not is_retract:
+            data_hash_to_pred_data[data_hash] = prediction_dict['prediction']
+        pred_ele_rows.append((forecast.pk, pred_class_int, unit_id, target_id, is_retract, data_hash,
+                              legacy_data_hash))
+    return data_hash_to_pred_data, pred_ele_rows
+
+
+def _unit_shard_pred_ele_rows(prediction_dicts, validation_context, is_skip_validation, is_validate_cats,
+                              is_legacy_hash=False):
     """
-    unit_abbrev_to_obj = {unit.abbreviation: unit for unit in forecast.forecast_model.project.units.all()}
-    target_name_to_obj = {target.name: target for target in forecast.forecast_model.project.targets.all()}
+    _validated_pred_ele_rows_for_pred_dicts() helper that does the actual validation and hashing of prediction_dicts.
+    "Prediction"-level validation is done here too, which is why callers that shard prediction_dicts must keep all of a
+    unit's prediction dicts in the same shard.
+
+    :param prediction_dicts: a list of prediction dicts
+    :param validation_context: the forecast's project's ValidationContext
+    :param is_skip_validation: same as load_predictions_from_json_io_dict()
+    :param is_validate_cats: ""
+    :param is_legacy_hash: passed to _hashes_for_prediction_data()
+    :return: a list of 6-tuples, one for each of prediction_dicts and in the same order:
+        (pred_class_int, unit_id, target_id, is_retract, data_hash, legacy_data_hash)
+    """
+    if not is_skip_validation:
+        _validate_prediction_dicts(prediction_dicts, validation_context, is_validate_cats)  # raises o/w
 
     # this variable helps to do "prediction"-level validations at the end of this function. it maps 2-tuples to a list
     # of prediction classes (strs):
     loc_targ_to_pred_classes = defaultdict(list)  # (unit_abbrev, target_name) -> [prediction_class1, ...]
-
-    data_hash_to_pred_data = {}  # return value
-    pred_ele_rows = []  # ""
+    shard_rows = []  # return value
     for prediction_dict in prediction_dicts:
         unit_abbrev = prediction_dict['unit']
         target_name = prediction_dict['target']
@@ -184,119 +245,425 @@ def _validated_pred_ele_rows_for_pred_dicts(forecast, prediction_dicts, is_skip_
         prediction_data = prediction_dict['prediction']  # None if a "retracted" prediction -> insert a single NULL row
         is_retract = prediction_data is None
         loc_targ_to_pred_classes[(unit_abbrev, target_name)].append(pred_class)
-        if not is_skip_validation:
-            # validate prediction class, and unit and target names (applies to all prediction classes)
-            if unit_abbrev not in unit_abbrev_to_obj:
-                raise RuntimeError(f"prediction_dict referred to an undefined Unit. unit_abbrev={unit_abbrev!r}. "
-                                   f"existing_unit_abbrevs={unit_abbrev_to_obj.keys()}")
-            elif target_name not in target_name_to_obj:
-                raise RuntimeError(f"prediction_dict referred to an undefined Target. target_name={target_name!r}. "
-                                   f"existing_target_names={target_name_to_obj.keys()}")
-
-            if pred_class not in PRED_CLASS_NAME_TO_INT:
-                raise RuntimeError(f"invalid pred_class: {pred_class!r}. must be one of: "
-                                   f"{list(PRED_CLASS_INT_TO_NAME.values())}. "
-                                   f"prediction_dict={prediction_dict}")
-
-            # do class-specific validation per the table at https://docs.zoltardata.com/targets/#valid-prediction-types-by-target-type
-            target = target_name_to_obj[target_name]
-            if (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.BIN_CLASS]) \
-                    and not is_retract:
-                _validate_bin_prediction_dict(is_validate_cats, prediction_dict, target)  # raises o/w
-            elif (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.NAMED_CLASS]) \
-                    and not is_retract:
-                family_abbrev = prediction_data['family']
-                _validate_named_prediction_dict(family_abbrev, prediction_dict, target)  # raises o/w
-            elif ((pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.POINT_CLASS])
-                  or (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.MODE_CLASS])) \
-                    and not is_retract:
-                # point and mode prediction classes are valid for all target types, so no need to validate
-                _validate_point_prediction_dict(prediction_dict, target, prediction_data['value'])  # raises o/w
-            elif ((pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.MEAN_CLASS])
-                  and not is_retract):
-                # mean prediction class is valid for these target types: continuous, discrete, and date. i.e., is NOT
-                # nominal or binary
-                if (target.type == Target.NOMINAL_TARGET_TYPE) or (target.type == Target.BINARY_TARGET_TYPE):
-                    raise RuntimeError(f"pred_class={pred_class} is not valid for target.type={target.type}. "
-                                       f"prediction_dict={prediction_dict}")
-                else:
-                    _validate_point_prediction_dict(prediction_dict, target, prediction_data['value'])  # raises o/w
-            elif ((pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.MEDIAN_CLASS])
-                  and not is_retract):
-                # median prediction class is valid for these target types: continuous, discrete, binary, and date. i.e.,
-                # is NOT nominal
-                if target.type == Target.NOMINAL_TARGET_TYPE:
-                    raise RuntimeError(f"pred_class={pred_class} is not valid for target.type={target.type}. "
-                                       f"prediction_dict={prediction_dict}")
-                else:
-                    _validate_point_prediction_dict(prediction_dict, target, prediction_data['value'])  # raises o/w
-            elif (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.SAMPLE_CLASS]) \
-                    and not is_retract:
-                _validate_sample_prediction_dict(prediction_dict, target)  # raises o/w
-            elif (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.QUANTILE_CLASS]) \
-                    and not is_retract:
-                _validate_quantile_prediction_dict(prediction_dict, target)  # raises o/w
-
-        # valid, so update data_hash_to_pred_data and append the row. we store '' if is_retract b/c there is no
-        # PredictionData and therefore no hash
-        data_hash = PredictionElement.hash_for_prediction_data_dict(prediction_data) if not is_retract else ''
-        if not is_retract:
-            data_hash_to_pred_data[data_hash] = prediction_data
-        pred_ele_rows.append((forecast.pk, PRED_CLASS_NAME_TO_INT[pred_class],
-                              unit_abbrev_to_obj[unit_abbrev].pk, target_name_to_obj[target_name].pk,
-                              is_retract, data_hash))
+        data_hash, legacy_data_hash = _hashes_for_prediction_data(prediction_data, is_legacy_hash)
+        shard_rows.append((PRED_CLASS_NAME_TO_INT[pred_class], validation_context.unit_abbrev_to_id[unit_abbrev],
+                           validation_context.target_name_to_target[target_name].pk, is_retract, data_hash,
+                           legacy_data_hash))
 
     # finally, do "prediction"-level validation. recall that "prediction" is defined as "a group of a prediction
     # elements(s) specific to a unit and target"
     if not is_skip_validation:
-        # validate: "Within a Prediction, there cannot be more than 1 Prediction Element of the same type".
-        duplicate_unit_target_tuples = [(unit, target, pred_classes) for (unit, target), pred_classes
-                                        in loc_targ_to_pred_classes.items()
-                                        if len(pred_classes) != len(set(pred_classes))]
-        if duplicate_unit_target_tuples:
-            raise RuntimeError(f"Within a Prediction, there cannot be more than 1 Prediction Element of the same "
-                               f"class. Found these duplicate unit/target tuples: {duplicate_unit_target_tuples}")
-
-        # validate: (for both continuous and discrete target types): Within one prediction, there can be at most one of
-        # the following prediction elements, but not both: {`Named`, `Bin`}.
-        named_bin_conflict_tuples = [(unit, target, pred_classes) for (unit, target), pred_classes
-                                     in loc_targ_to_pred_classes.items()
-                                     if (PRED_CLASS_INT_TO_NAME[
-                                             PredictionElement.BIN_CLASS] in pred_classes)
-                                     and (PRED_CLASS_INT_TO_NAME[
-                                              PredictionElement.NAMED_CLASS] in pred_classes)]
-        if named_bin_conflict_tuples:
-            raise RuntimeError(f"Within one prediction, there can be at most one of the following prediction elements, "
-                               f"but not both: `Named`, `Bin`. Found these conflicting unit/target tuples: "
-                               f"{named_bin_conflict_tuples}")
+        _validate_loc_targ_to_pred_classes(loc_targ_to_pred_classes)  # raises o/w
 
     # done!
-    return data_hash_to_pred_data, pred_ele_rows
+    return shard_rows
+
+
+def _hashes_for_prediction_data(prediction_data, is_legacy_hash):
+    """
+    Returns a prediction element's data_hash, which uses PredictionElement.CURRENT_HASH_VERSION, plus the hash that it
+    would have had if it had been loaded before hash_version existed (PredictionElement.MD5_JSON_HASH_VERSION). The
+    latter lets DedupIndex skip duplicates of previous versions that have not been re-hashed (see
+    rehash_forecast()). Both are '' for retractions b/c there is no PredictionData and therefore no hash.
+
+    :param prediction_data: a prediction dict's 'prediction' value. None if a "retracted" prediction
+    :param is_legacy_hash: True if the legacy hash is needed (see DedupIndex.is_legacy_hash). '' is returned o/w
+    :return: a 2-tuple: (data_hash, legacy_data_hash)
+    """
+    if prediction_data is None:
+        return '', ''
+
+    data_hash = PredictionElement.hash_for_prediction_data_dict(prediction_data)
+    legacy_data_hash = PredictionElement.hash_for_prediction_data_dict(prediction_data,
+                                                                       PredictionElement.MD5_JSON_HASH_VERSION) \
+        if is_legacy_hash else ''
+    return data_hash, legacy_data_hash
+
+
+def _is_legacy_hash_prev_versions(forecast):
+    """
+    :param forecast: the new, empty Forecast being inserted into
+    :return: True if any of forecast's previous versions have non-retracted prediction elements that were hashed with a
+        hash_version other than PredictionElement.CURRENT_HASH_VERSION, i.e., if legacy hashes are needed to detect
+        duplicates
+    """
+    return PredictionElement.objects.filter(forecast__forecast_model=forecast.forecast_model,
+                                            forecast__time_zero=forecast.time_zero,
+                                            is_retract=False) \
+        .exclude(hash_version=PredictionElement.CURRENT_HASH_VERSION) \
+        .exists()
+
+
+#
+# parallel validation
+#
+
+# the minimum number of prediction dicts for which _validated_pred_ele_rows_for_pred_dicts() uses multiple processes.
+# below this, process startup costs more than it saves
+PARALLEL_VALIDATION_MIN_NUM_PRED_DICTS = 20_000
+
+# the arguments to _unit_shard_pred_ele_rows() for each shard, keyed by shard index. set in each worker process by
+# _init_shard_worker() so that the prediction dicts are inherited via fork() rather than pickled
+_SHARD_IDX_TO_ARGS = None
+
+
+def _unit_shard_pred_ele_rows_parallel(prediction_dicts, validation_context, is_skip_validation, is_validate_cats,
+                                       is_legacy_hash, num_workers):
+    """
+    A parallel version of _unit_shard_pred_ele_rows() that partitions prediction_dicts into num_workers shards by unit
+    (balancing shard sizes), validates and hashes each shard in its own process, and then merges the results back
+    into prediction_dicts order. Each worker process is fork()ed, which means it inherits prediction_dicts and
+    validation_context rather than having them pickled, and it does not use the database. If more than one shard is
+    invalid then the error reported is from the lowest-numbered invalid shard, which might not be the first invalid
+    prediction dict in the file.
+
+    :param num_workers: the number of worker processes
+    :return: same as _unit_shard_pred_ele_rows()
+    """
+    # assign units to shards, largest first, each to the currently smallest shard
+    unit_abbrev_to_idxs = defaultdict(list)
+    for idx, prediction_dict in enumerate(prediction_dicts):
+        unit_abbrev_to_idxs[prediction_dict['unit']].append(idx)
+    shard_idxs_list = [[] for _ in range(min(num_workers, len(unit_abbrev_to_idxs)))]
+    for idxs in sorted(unit_abbrev_to_idxs.values(), key=len, reverse=True):
+        min(shard_idxs_list, key=len).extend(idxs)
+
+    shard_idx_to_args = {shard_idx: ([prediction_dicts[idx] for idx in shard_idxs], validation_context,
+                                     is_skip_validation, is_validate_cats, is_legacy_hash)
+                         for shard_idx, shard_idxs in enumerate(shard_idxs_list)}
+    with ProcessPoolExecutor(max_workers=len(shard_idxs_list), mp_context=multiprocessing.get_context('fork'),
+                             initializer=_init_shard_worker, initargs=(shard_idx_to_args,)) as executor:
+        futures = [executor.submit(_shard_worker, shard_idx) for shard_idx in range(len(shard_idxs_list))]
+        shard_rows = [None] * len(prediction_dicts)  # return value
+        for shard_idxs, future in zip(shard_idxs_list, futures):
+            for idx, row in zip(shard_idxs, future.result()):  # raises the worker's RuntimeError, if any
+                shard_rows[idx] = row
+    return shard_rows
+
+
+def _init_shard_worker(shard_idx_to_args):
+    # _unit_shard_pred_ele_rows_parallel() process initializer
+    global _SHARD_IDX_TO_ARGS
+    _SHARD_IDX_TO_ARGS = shard_idx_to_args
+
+
+def _shard_worker(shard_idx):
+    # _unit_shard_pred_ele_rows_parallel() worker function
+    return _unit_shard_pred_ele_rows(*_SHARD_IDX_TO_ARGS[shard_idx])
+
+
+def _validate_prediction_dict(prediction_dict, validation_context, is_validate_cats):
+    """
+    Validates a single prediction dict, raising a RuntimeError if invalid. Does not do "prediction"-level validation -
+    see _validate_loc_targ_to_pred_classes().
+
+    :param prediction_dict: an item in the 'predictions' portion of a "JSON IO dict"
+    :param validation_context: the forecast's project's ValidationContext
+    :param is_validate_cats: same as load_predictions_from_json_io_dict()
+    """
+    unit_abbrev = prediction_dict['unit']
+    target_name = prediction_dict['target']
+    pred_class = prediction_dict['class']
+    prediction_data = prediction_dict['prediction']
+    is_retract = prediction_data is None
+
+    # validate prediction class, and unit and target names (applies to all prediction classes)
+    if unit_abbrev not in validation_context.unit_abbrev_to_id:
+        raise RuntimeError(f"prediction_dict referred to an undefined Unit. unit_abbrev={unit_abbrev!r}. "
+                           f"existing_unit_abbrevs={validation_context.unit_abbrev_to_id.keys()}")
+    elif target_name not in validation_context.target_name_to_target:
+        raise RuntimeError(f"prediction_dict referred to an undefined Target. target_name={target_name!r}. "
+                           f"existing_target_names={validation_context.target_name_to_target.keys()}")
+
+    if pred_class not in PRED_CLASS_NAME_TO_INT:
+        raise RuntimeError(f"invalid pred_class: {pred_class!r}. must be one of: "
+                           f"{list(PRED_CLASS_INT_TO_NAME.values())}. "
+                           f"prediction_dict={prediction_dict}")
+
+    # validate the class for the target's type per the table at
+    # https://docs.zoltardata.com/targets/#valid-prediction-types-by-target-type . named predictions are validated by
+    # family instead, which gives a more specific error
+    target = validation_context.target_name_to_target[target_name]  # a TargetInfo
+    if (not is_retract) and (pred_class != PRED_CLASS_INT_TO_NAME[PredictionElement.NAMED_CLASS]) \
+            and (pred_class not in validation_context.target_type_to_pred_classes[target.type]):
+        raise RuntimeError(f"pred_class={pred_class} is not valid for target.type={target.type}. "
+                           f"prediction_dict={prediction_dict}")
+
+    # do class-specific validation
+    if (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.BIN_CLASS]) \
+            and not is_retract:
+        _validate_bin_prediction_dict(is_validate_cats, prediction_dict, target)  # raises o/w
+    elif (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.NAMED_CLASS]) \
+            and not is_retract:
+        family_abbrev = prediction_data['family']
+        _validate_named_prediction_dict(family_abbrev, prediction_dict, target,
+                                        validation_context.target_type_to_named_families[target.type])  # raises o/w
+    elif ((pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.POINT_CLASS])
+          or (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.MODE_CLASS])
+          or (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.MEAN_CLASS])
+          or (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.MEDIAN_CLASS])) \
+            and not is_retract:
+        _validate_point_prediction_dict(prediction_dict, target, prediction_data['value'])  # raises o/w
+    elif (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.SAMPLE_CLASS]) \
+            and not is_retract:
+        _validate_sample_prediction_dict(prediction_dict, target)  # raises o/w
+    elif (pred_class == PRED_CLASS_INT_TO_NAME[PredictionElement.QUANTILE_CLASS]) \
+            and not is_retract:
+        _validate_quantile_prediction_dict(prediction_dict, target)  # raises o/w
+
+
+#
+# _validate_prediction_dicts()
+#
+
+# the value types allowed for the target types whose bin, quantile, and sample predictions _validate_prediction_dicts()
+# screens in batches. predictions for other target types (and other prediction classes) are always validated one at a
+# time
+_BATCH_TARGET_TYPE_TO_VALUE_TYPES = {Target.CONTINUOUS_TARGET_TYPE: {int, float},
+                                     Target.DISCRETE_TARGET_TYPE: {int}}
+
+_MAX_EXACT_FLOAT_INT = 2 ** 53  # larger ints lose precision as float64s, so batch screens pass them to scalar checks
+
+
+def _validate_prediction_dicts(prediction_dicts, validation_context, is_validate_cats):
+    """
+    Validates prediction_dicts, raising a RuntimeError for the first invalid one found. Equivalent to calling
+    _validate_prediction_dict() on each one, but much faster for large forecasts: bin, quantile, and sample predictions
+    for continuous and discrete targets are grouped by class and screened as a batch using NumPy array operations, and
+    only the ones that a screen flags are passed to _validate_prediction_dict() to get its error message (which
+    identifies the offending unit and target). The screens are at least as strict as _validate_prediction_dict(), so
+    the latter remains the final word on what's valid. Does not do "prediction"-level validation.
+
+    :param prediction_dicts: a list of prediction dicts
+    :param validation_context: same as _validate_prediction_dict()
+    :param is_validate_cats: ""
+    """
+    pred_class_to_screen_fcn = {PRED_CLASS_INT_TO_NAME[PredictionElement.BIN_CLASS]: _screen_bin_batch,
+                                PRED_CLASS_INT_TO_NAME[PredictionElement.QUANTILE_CLASS]: _screen_quantile_batch,
+                                PRED_CLASS_INT_TO_NAME[PredictionElement.SAMPLE_CLASS]: _screen_sample_batch}
+    pred_class_to_batch = defaultdict(list)  # pred_class -> [(prediction_dict, target), ...]. target is a TargetInfo
+    for prediction_dict in prediction_dicts:
+        target = validation_context.target_name_to_target.get(prediction_dict['target'])
+        if (prediction_dict['class'] in pred_class_to_screen_fcn) \
+                and (prediction_dict['unit'] in validation_context.unit_abbrev_to_id) \
+                and target and (target.type in _BATCH_TARGET_TYPE_TO_VALUE_TYPES) \
+                and isinstance(prediction_dict['prediction'], dict):  # None if retracted
+            pred_class_to_batch[prediction_dict['class']].append((prediction_dict, target))
+        else:
+            _validate_prediction_dict(prediction_dict, validation_context, is_validate_cats)  # raises o/w
+
+    batch_targets = {target for batch in pred_class_to_batch.values() for _, target in batch}
+    target_id_to_range = {target.pk: target.range or (-math.inf, math.inf) for target in batch_targets}
+    target_id_to_cats = {target.pk: target.cats for target in batch_targets} if is_validate_cats else None
+    for pred_class, batch in pred_class_to_batch.items():
+        for flagged_idx in pred_class_to_screen_fcn[pred_class](batch, target_id_to_range, target_id_to_cats):
+            prediction_dict = batch[flagged_idx][0]
+            _validate_prediction_dict(prediction_dict, validation_context, is_validate_cats)  # raises o/w
+
+
+def _flat_rows_arrays(value_lists):
+    """
+    Batch screen helper that flattens value_lists (a list of lists of ints or floats) into a 2-tuple of NumPy arrays:
+    (values, row_idxs), where row_idxs[i] is the index into value_lists of values[i].
+    """
+    lengths = np.fromiter(map(len, value_lists), dtype=int, count=len(value_lists))
+    values = np.fromiter(chain.from_iterable(value_lists), dtype=float, count=lengths.sum())
+    row_idxs = np.repeat(np.arange(len(value_lists)), lengths)
+    return values, row_idxs
 
 
-def _insert_pred_ele_rows(forecast, pred_ele_rows, is_subset_allowed):
+def _is_bad_number(values):
+    # batch screen helper that flags NaNs, infinities, and ints too large to compare exactly as float64s
+    return ~np.isfinite(values) | (np.abs(values) > _MAX_EXACT_FLOAT_INT)
+
+
+def _range_arrays(targets, target_id_to_range):
+    # batch screen helper that returns a 2-tuple of NumPy arrays: (lower bounds, upper bounds), one per target
+    ranges = [target_id_to_range[target.pk] for target in targets]
+    return np.array([range_tuple[0] for range_tuple in ranges], dtype=float), \
+        np.array([range_tuple[1] for range_tuple in ranges], dtype=float)
+
+
+def _screen_bin_batch(batch, target_id_to_range, target_id_to_cats):
+    """
+    A _validate_prediction_dicts() screen for bin predictions.
+
+    :param batch: a list of (prediction_dict, target) 2-tuples
+    :param target_id_to_range: maps each batch Target's id to its range, or (-inf, inf) if none
+    :param target_id_to_cats: maps each batch Target's id to its cats. None if not is_validate_cats
+    :return: a sorted list of the indexes of the items in batch that might be invalid
+    """
+    flagged_idxs = set()
+    ok_idxs, prob_lists = [], []  # only those passing the per-row checks
+    for idx, (prediction_dict, target) in enumerate(batch):
+        cats = prediction_dict['prediction'].get('cat')
+        probs = prediction_dict['prediction'].get('prob')
+        if isinstance(cats, list) and isinstance(probs, list) and probs and (len(cats) == len(probs)) \
+                and (set(map(type, cats)) <= _BATCH_TARGET_TYPE_TO_VALUE_TYPES[target.type]) \
+                and (set(map(type, probs)) <= {int, float}) \
+                and ((target_id_to_cats is None) or (set(cats) <= target_id_to_cats[target.pk])):
+            ok_idxs.append(idx)
+            prob_lists.append(probs)
+        else:
+            flagged_idxs.add(idx)
+    if not ok_idxs:
+        return sorted(flagged_idxs)
+
+    ok_idxs = np.array(ok_idxs)
+    probs, row_idxs = _flat_rows_arrays(prob_lists)
+    is_bad_prob = ~((0.0 <= probs) & (probs <= 1.0))  # also catches NaN
+    flagged_idxs.update(ok_idxs[row_idxs[is_bad_prob]].tolist())
+
+    # flag sums that are not within BIN_SUM_REL_TOL of 1 per math.isclose(). we tighten the tolerance slightly b/c
+    # np.bincount() sums in a different order than sum() does, and so might differ in the last few bits
+    prob_sums = np.bincount(row_idxs, weights=probs, minlength=len(ok_idxs))
+    is_bad_sum = ~(np.abs(1.0 - prob_sums) <= BIN_SUM_REL_TOL * np.maximum(1.0, np.abs(prob_sums)) * (1 - 1e-06))
+    flagged_idxs.update(ok_idxs[is_bad_sum].tolist())
+    return sorted(flagged_idxs)
+
+
+def _screen_quantile_batch(batch, target_id_to_range, target_id_to_cats):
+    """
+    A _validate_prediction_dicts() screen for quantile predictions. Args and return value are as for
+    _screen_bin_batch().
+    """
+    flagged_idxs = set()
+    ok_idxs, quantile_lists, value_lists, ok_targets = [], [], [], []  # only those passing the per-row checks
+    for idx, (prediction_dict, target) in enumerate(batch):
+        quantiles = prediction_dict['prediction'].get('quantile')
+        values = prediction_dict['prediction'].get('value')
+        if isinstance(quantiles, list) and isinstance(values, list) and quantiles \
+                and (len(quantiles) == len(values)) \
+                and (set(map(type, quantiles)) <= {int, float}) \
+                and (set(map(type, values)) <= _BATCH_TARGET_TYPE_TO_VALUE_TYPES[target.type]):
+            ok_idxs.append(idx)
+            quantile_lists.append(quantiles)
+            value_lists.append(values)
+            ok_targets.append(target)
+        else:
+            flagged_idxs.add(idx)
+    if not ok_idxs:
+        return sorted(flagged_idxs)
+
+    ok_idxs = np.array(ok_idxs)
+    quantiles, row_idxs = _flat_rows_arrays(quantile_lists)
+    values, _ = _flat_rows_arrays(value_lists)
+    range_lowers, range_uppers = _range_arrays(ok_targets, target_id_to_range)
+    is_bad = ~((0.0 <= quantiles) & (quantiles <= 1.0)) | _is_bad_number(values) \
+             | ~((range_lowers[row_idxs] <= values) & (values < range_uppers[row_idxs]))
+    flagged_idxs.update(ok_idxs[row_idxs[is_bad]].tolist())
+
+    # sort each row by quantile, then flag duplicate quantiles and decreasing values. the latter is per
+    # _le_with_tolerance()
+    sort_idxs = np.lexsort((quantiles, row_idxs))
+    quantiles, values, row_idxs = quantiles[sort_idxs], values[sort_idxs], row_idxs[sort_idxs]
+    is_same_row = row_idxs[1:] == row_idxs[:-1]
+    values_a, values_b = values[:-1], values[1:]
+    is_le = (values_a <= values_b) \
+            | (np.abs(values_b - values_a) <= QUANTILE_VALUE_REL_TOL * np.maximum(np.abs(values_a), np.abs(values_b)))
+    is_bad_pair = is_same_row & ((quantiles[1:] == quantiles[:-1]) | ~is_le)
+    flagged_idxs.update(ok_idxs[row_idxs[1:][is_bad_pair]].tolist())
+    return sorted(flagged_idxs)
+
+
+def _screen_sample_batch(batch, target_id_to_range, target_id_to_cats):
+    """
+    A _validate_prediction_dicts() screen for sample predictions. Args and return value are as for
+    _screen_bin_batch().
+    """
+    flagged_idxs = set()
+    ok_idxs, sample_lists, ok_targets = [], [], []  # only those passing the per-row checks
+    for idx, (prediction_dict, target) in enumerate(batch):
+        samples = prediction_dict['prediction'].get('sample')
+        if isinstance(samples, list) and (set(map(type, samples)) <= _BATCH_TARGET_TYPE_TO_VALUE_TYPES[target.type]):
+            ok_idxs.append(idx)
+            sample_lists.append(samples)
+            ok_targets.append(target)
+        else:
+            flagged_idxs.add(idx)
+    if not ok_idxs:
+        return sorted(flagged_idxs)
+
+    ok_idxs = np.array(ok_idxs)
+    samples, row_idxs = _flat_rows_arrays(sample_lists)
+    range_lowers, range_uppers = _range_arrays(ok_targets, target_id_to_range)
+    is_bad = _is_bad_number(samples) | ~((range_lowers[row_idxs] <= samples) & (samples < range_uppers[row_idxs]))
+    flagged_idxs.update(ok_idxs[row_idxs[is_bad]].tolist())
+    return sorted(flagged_idxs)
+
+
+def _validate_loc_targ_to_pred_classes(loc_targ_to_pred_classes):
+    """
+    Does "prediction"-level validation, raising a RuntimeError if invalid.
+
+    :param loc_targ_to_pred_classes: a dict that maps 2-tuples to a list of prediction classes (strs):
+        (unit_abbrev, target_name) -> [prediction_class1, ...]
+    """
+    # validate: "Within a Prediction, there cannot be more than 1 Prediction Element of the same type".
+    duplicate_unit_target_tuples = [(unit, target, pred_classes) for (unit, target), pred_classes
+                                    in loc_targ_to_pred_classes.items()
+                                    if len(pred_classes) != len(set(pred_classes))]
+    if duplicate_unit_target_tuples:
+        raise RuntimeError(f"Within a Prediction, there cannot be more than 1 Prediction Element of the same "
+                           f"class. Found these duplicate unit/target tuples: {duplicate_unit_target_tuples}")
+
+    # validate: (for both continuous and discrete target types): Within one prediction, there can be at most one of
+    # the following prediction elements, but not both: {`Named`, `Bin`}.
+    named_bin_conflict_tuples = [(unit, target, pred_classes) for (unit, target), pred_classes
+                                 in loc_targ_to_pred_classes.items()
+                                 if (PRED_CLASS_INT_TO_NAME[
+                                         PredictionElement.BIN_CLASS] in pred_classes)
+                                 and (PRED_CLASS_INT_TO_NAME[
+                                          PredictionElement.NAMED_CLASS] in pred_classes)]
+    if named_bin_conflict_tuples:
+        raise RuntimeError(f"Within one prediction, there can be at most one of the following prediction elements, "
+                           f"but not both: `Named`, `Bin`. Found these conflicting unit/target tuples: "
+                           f"{named_bin_conflict_tuples}")
+
+
+def _insert_pred_ele_rows(forecast, pred_ele_rows, is_subset_allowed, dedup_index):
     """
     Validates forecast against previous data and then loads pred_ele_rows into the PredictionElement table. Skips
     duplicate prediction elements in `forecast`'s model. See note in _insert_pred_data_rows() re: postgres vs. sqlite.
 
     :param forecast: the new, empty Forecast being inserted into
     :param pred_ele_rows: as returned by _validated_pred_ele_rows_for_pred_dicts():
-        list of 6-tuples: (forecast_id, pred_class_int, unit_id, target_id, is_retract, data_hash)
-    :param is_subset_allowed: controls whether `_is_pred_eles_subset_prev_versions()` is called:
+        list of 7-tuples: (forecast_id, pred_class_int, unit_id, target_id, is_retract, data_hash, legacy_data_hash)
+    :param is_subset_allowed: controls whether `DedupIndex.is_subset_of_prev_versions()` is called:
         True: don't call, False: do call.
+    :param dedup_index: a DedupIndex for forecast
+    :return: list of 2-tuples for the inserted rows: (pred_ele_id, data_hash). data_hash is '' for retractions
     :raises RuntimeError: if forecast version is invalid
     """
     # in order to validate and to skip inserting duplicate rows, we insert in these steps:
-    # - create a temp table with the same structure as PredictionElement
-    # - insert `pred_ele_rows` into the temp table (some might be duplicates)
     # - validate forecast against previous data
-    # - delete duplicates from the temp table
+    # - remove duplicates from `pred_ele_rows`
+    # - create a temp table with the same structure as PredictionElement
+    # - insert the remaining rows into the temp table
     # - insert the temp table into PredictionElement
     # - drop the temp table
+
+    # validate the rule: "cannot load data that's a subset of previous data"
+    if (not is_subset_allowed) and dedup_index.is_subset_of_prev_versions(
+            {(unit_id, target_id, pred_class_int) for _, pred_class_int, unit_id, target_id, *_ in pred_ele_rows}):
+        raise RuntimeError(f"new data is a subset of previous. forecast={forecast}")
+
+    # validate the rule: "cannot load 100% duplicate data"
+    pred_ele_rows = [pred_ele_row[:6] for pred_ele_row in dedup_index.unique_pred_ele_rows(pred_ele_rows)]
+    if not pred_ele_rows:
+        raise RuntimeError(f"cannot load 100% duplicate data. forecast={forecast}")
+
     temp_table_name = 'pred_ele_temp'
-    pred_ele_table_name = PredictionElement._meta.db_table
+    _create_pred_ele_temp_table(temp_table_name)
+    _copy_pred_ele_rows_to_temp_table(temp_table_name, pred_ele_rows)
+    return _insert_pred_ele_temp_table(forecast, temp_table_name, is_return_ids=True)
+
 
-    # create temp table
+def _create_pred_ele_temp_table(temp_table_name):
+    """
+    _insert_pred_ele_rows() helper that (re)creates an empty temp table with the same columns as PredictionElement
+    (sans id and hash_version).
+    """
     with connection.cursor() as cursor:
         cursor.execute(f"DROP TABLE IF EXISTS {temp_table_name};")
 
@@ -308,13 +675,20 @@ def _insert_pred_ele_rows(forecast, pred_ele_rows, is_subset_allowed):
                pred_ele.target_id,
                pred_ele.is_retract,
                pred_ele.data_hash
-        FROM {pred_ele_table_name} AS pred_ele
+        FROM {PredictionElement._meta.db_table} AS pred_ele
         LIMIT 0;
     """
     with connection.cursor() as cursor:
         cursor.execute(sql)
 
-    # insert rows into temp table
+
+def _copy_pred_ele_rows_to_temp_table(temp_table_name, pred_ele_rows):
+    """
+    _insert_pred_ele_rows() helper that bulk-inserts pred_ele_rows into temp_table_name.
+
+    :param temp_table_name: as created by _create_pred_ele_temp_table()
+    :param pred_ele_rows: list of 6-tuples: (forecast_id, pred_class_int, unit_id, target_id, is_retract, data_hash)
+    """
     columns_names = [PredictionElement._meta.get_field('forecast').column,
                      PredictionElement._meta.get_field('pred_class').column,
                      PredictionElement._meta.get_field('unit').column,
@@ -337,80 +711,38 @@ def _insert_pred_ele_rows(forecast, pred_ele_rows, is_subset_allowed):
                     """
             cursor.executemany(sql, pred_ele_rows)
 
-    # validate the rule: "cannot load data that's a subset of previous data"
-    if (not is_subset_allowed) and _is_pred_eles_subset_prev_versions(forecast, temp_table_name):
-        raise RuntimeError(f"new data is a subset of previous. forecast={forecast}")
 
-    # delete duplicates from temp table. note that we are not testing against issued_at, which would be wrong b/c
-    # duplicates should be skipped if they exist in /any/ version
-    sql = f"""
-        DELETE
-        FROM {temp_table_name}
-        WHERE EXISTS(SELECT *
-                     FROM {pred_ele_table_name} AS pred_ele
-                              JOIN {Forecast._meta.db_table} AS f ON pred_ele.forecast_id = f.id
-                     WHERE f.forecast_model_id = %s
-                       AND f.time_zero_id = %s
-                       AND {temp_table_name}.pred_class = pred_ele.pred_class
-                       AND {temp_table_name}.unit_id = pred_ele.unit_id
-                       AND {temp_table_name}.target_id = pred_ele.target_id
-                       AND {temp_table_name}.is_retract = pred_ele.is_retract
-                       AND {temp_table_name}.data_hash = pred_ele.data_hash);
+def _insert_pred_ele_temp_table(forecast, temp_table_name, is_return_ids=False):
     """
-    with connection.cursor() as cursor:
-        cursor.execute(sql, (forecast.forecast_model.pk, forecast.time_zero.pk))
-
-    # validate the rule: "cannot load 100% duplicate data"
-    sql = f"""
-        SELECT NOT EXISTS(SELECT * FROM {temp_table_name});
-     """
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        is_empty = cursor.fetchone()[0]
-        if is_empty:
-            raise RuntimeError(f"cannot load 100% duplicate data. forecast={forecast}")
-
-    # step 5/6: insert temp table into PredictionElement
+    _insert_pred_ele_rows() helper that inserts temp_table_name's rows (which must have already been validated and
+    de-duplicated against previous versions) into PredictionElement, updates PredictionElement.valid_to and
+    LatestPredictionElement, and then drops temp_table_name.
+
+    :param forecast: the Forecast being inserted into
+    :param temp_table_name: as created by _create_pred_ele_temp_table()
+    :param is_return_ids: True if the inserted rows' ids should be returned. False saves holding them in memory
+    :return: if is_return_ids then the same as _insert_pred_ele_rows(). None o/w
+    """
+    # insert temp table into PredictionElement, returning the new ids so callers need not re-read them
+    returning = "RETURNING id, data_hash" if is_return_ids else ""
     sql = f"""
-        INSERT INTO {pred_ele_table_name} AS pred_ele (forecast_id, pred_class, unit_id, target_id,
-                                                       is_retract, data_hash)
-        SELECT %s, pred_class, unit_id, target_id, is_retract, data_hash
-        FROM {temp_table_name};
+        INSERT INTO {PredictionElement._meta.db_table} AS pred_ele (forecast_id, pred_class, unit_id, target_id,
+                                                                    is_retract, data_hash, hash_version)
+        SELECT %s, pred_class, unit_id, target_id, is_retract, data_hash, %s
+        FROM {temp_table_name}
+        {returning};
     """
     with connection.cursor() as cursor:
-        cursor.execute(sql, (forecast.pk,))
+        cursor.execute(sql, (forecast.pk, PredictionElement.CURRENT_HASH_VERSION))
+        pred_ele_id_hash_rows = cursor.fetchall() if is_return_ids else None
+    _update_pred_ele_valid_tos(forecast)
+    _update_latest_pred_eles([forecast.pk])
+    update_project_data_version(Project.objects.filter(models__forecasts=forecast))
 
     # drop temp table
     with connection.cursor() as cursor:
         cursor.execute(f"DROP TABLE IF EXISTS {temp_table_name};")
-
-
-def _is_pred_eles_subset_prev_versions(forecast, temp_table_name):
-    """
-    :param forecast: the new, empty Forecast being inserted into
-    :param temp_table_name: contains `forecast`'s candidate prediction elements
-    :return: True if temp_table_name's PredictionElements are a subset of those of prev_or_next_version, i.e., if there
-        are implicit retractions
-    """
-    sql = f"""
-        WITH except_rows AS (
-            SELECT unit_id, target_id, pred_class
-            FROM {PredictionElement._meta.db_table} AS pred_ele
-                        JOIN {Forecast._meta.db_table} AS f
-            ON pred_ele.forecast_id = f.id
-            WHERE f.forecast_model_id = %s
-              AND f.time_zero_id = %s
-              AND f.issued_at < %s
-                EXCEPT
-            SELECT unit_id, target_id, pred_class
-            FROM {temp_table_name}
-        )
-        SELECT EXISTS(SELECT * FROM except_rows);
-    """
-    with connection.cursor() as cursor:
-        cursor.execute(sql, (forecast.forecast_model.pk, forecast.time_zero.pk, forecast.issued_at,))
-        is_subset = cursor.fetchone()[0]
-        return is_subset
+    return pred_ele_id_hash_rows
 
 
 def _validate_bin_prediction_dict(is_validate_cats, prediction_dict, target):
@@ -440,7 +772,7 @@ def _validate_bin_prediction_dict(is_validate_cats, prediction_dict, target):
 
     # validate: "Entries in `cat` must be a subset of `Target.cats` from the target definition".
     # note: for date targets we format as strings for the comparison (incoming are strings)
-    cats_values = set(target.cats_values())  # datetime.date instances for date targets
+    cats_values = target.cats  # datetime.date instances for date targets
     pred_data_cat_parsed = [datetime.datetime.strptime(cat, YYYY_MM_DD_DATE_FORMAT).date()
                             for cat in prediction_data['cat']] \
         if target.type == Target.DATE_TARGET_TYPE else prediction_data['cat']  # valid - see is_all_compatible above
@@ -475,7 +807,8 @@ def _validate_bin_prediction_dict(is_validate_cats, prediction_dict, target):
                            f"prediction_dict={prediction_dict}")
 
 
-def _validate_named_prediction_dict(family_abbrev, prediction_dict, target):
+def _validate_named_prediction_dict(family_abbrev, prediction_dict, target, target_named_families):
+    # target_named_families: the family abbreviations allowed for target's type. see ValidationContext
     prediction_data = prediction_dict['prediction']
 
     # validate: "`family`: must be one of the abbreviations shown in the table below"
@@ -486,8 +819,8 @@ def _validate_named_prediction_dict(family_abbrev, prediction_dict, target):
                            f"prediction_dict={prediction_dict}")
 
     # validate: "The Prediction's class must be valid for its target's type"
-    if not Target.is_valid_named_family_for_target_type(family_abbrev, target.type):
-        raise RuntimeError(f"family {family_abbrev!r} is not valid for {target.type_as_str()!r} "
+    if family_abbrev not in target_named_families:
+        raise RuntimeError(f"family {family_abbrev!r} is not valid for {Target.str_for_target_type(target.type)!r} "
                            f"target types. prediction_dict={prediction_dict}")
 
     # validate: "The number of param columns with non-NULL entries count must match family definition"
@@ -543,7 +876,7 @@ def _validate_point_prediction_dict(prediction_dict, target, value):
     # validate: "if `range` is specified, any values in `Point` or `Sample` Prediction Elements should be contained
     # within `range`". recall: "The range is assumed to be inclusive on the lower bound and open on the upper bound,
     # e.g. [a, b)."
-    range_tuple = target.range_tuple()
+    range_tuple = target.range
     if range_tuple and not (range_tuple[0] <= value < range_tuple[1]):
         raise RuntimeError(f"if `range` is specified, any values in `Point` Prediction Elements should be contained "
                            f"within `range`. value={value!r}, range_tuple={range_tuple}, "
@@ -573,7 +906,7 @@ def _validate_sample_prediction_dict(prediction_dict, target):
     # validate: "if `range` is specified, any values in `Point` or `Sample` Prediction Elements should be contained
     # within `range`". recall: "The range is assumed to be inclusive on the lower bound and open on the upper bound,
     # e.g. [a, b)."
-    range_tuple = target.range_tuple()
+    range_tuple = target.range
     if range_tuple:
         is_all_in_range = all([range_tuple[0] <= sample < range_tuple[1] for sample in prediction_data['sample']])
         if not is_all_in_range:
@@ -585,7 +918,7 @@ def _validate_sample_prediction_dict(prediction_dict, target):
 def _le_with_tolerance(a, b):  # a <= b ?
     # `_validate_quantile_prediction_dict()` helper
     if type(a) in {int, float}:
-        return True if math.isclose(a, b, rel_tol=1e-05) else a <= b  # default: rel_tol=1e-09
+        return True if math.isclose(a, b, rel_tol=QUANTILE_VALUE_REL_TOL) else a <= b  # default: rel_tol=1e-09
     else:  # date
         return a <= b
 
@@ -593,11 +926,7 @@ def _le_with_tolerance(a, b):  # a <= b ?
 def _validate_quantile_prediction_dict(prediction_dict, target):
     prediction_data = prediction_dict['prediction']
 
-    # validate: "The Prediction's class must be valid for its target's type". note that only named and quantile
-    # predictions are constrained; all other target_type/prediction_class combinations are valid
-    if (target.type == Target.NOMINAL_TARGET_TYPE) or (target.type == Target.BINARY_TARGET_TYPE):
-        raise RuntimeError(f"quantile data is not valid for target type={target.type}. "
-                           f"prediction_dict={prediction_dict}")
+    # NB: "The Prediction's class must be valid for its target's type" is validated by _validate_prediction_dict()
 
     # validate: "The number of elements in the `quantile` and `value` vectors should be identical."
     pred_data_quantiles = prediction_data['quantile']
@@ -608,7 +937,10 @@ def _validate_quantile_prediction_dict(prediction_dict, target):
                            f"prediction_dict={prediction_dict}")
 
     # validate the quantile list (two validations)
-    _validate_quantile_list(pred_data_quantiles)
+    try:
+        _validate_quantile_list(pred_data_quantiles)
+    except RuntimeError as rte:
+        raise RuntimeError(f"{rte}. prediction_dict={prediction_dict}")
 
     # validate: "The data format of `value` should correspond or be translatable to the `type` as in the target
     # definition."
@@ -637,7 +969,7 @@ def _validate_quantile_prediction_dict(prediction_dict, target):
 
     # validate: "Entries in `value` must obey existing ranges for targets." recall: "The range is assumed to be
     # inclusive on the lower bound and open on the upper bound, # e.g. [a, b)."
-    range_tuple = target.range_tuple()
+    range_tuple = target.range
     if range_tuple:
         is_all_in_range = all([range_tuple[0] <= value < range_tuple[1] for value in pred_data_values])
         if not is_all_in_range:
@@ -668,7 +1000,7 @@ def _validate_quantile_list(quantile_list):
         raise RuntimeError(f"`quantile`s must be unique. quantile_list={quantile_list}")
 
 
-def _insert_pred_data_rows(rows):
+def _insert_pred_data_rows(rows, is_packed=False):
     """
     Does the actual INSERT of rows into the database table corresponding to pred_data_class. For speed, we directly
     insert via SQL rather than the ORM. We use psycopg2 extensions to the DB API if we're connected to a Postgres
@@ -677,11 +1009,13 @@ def _insert_pred_data_rows(rows):
 
     :param rows: list of 2-tuples: (pred_ele_id, prediction_data), where pred_ele_id is a PredictionElement.pk, and
         prediction_data is the "raw" prediction_data dict, i.e., the prediction_element dict's "prediction" dict.
+    :param is_packed: True if prediction_data should be packed. see _encoded_pred_data()
     """
     # serialize to json. NB: assumes no CR or LFs in dicts!
-    rows = [(idx, json.dumps(pred_data)) for idx, pred_data in rows]
+    rows = [(idx, *_encoded_pred_data(pred_data, is_packed)) for idx, pred_data in rows]
     table_name = PredictionData._meta.db_table
-    columns_names = PredictionData._meta.get_field('pred_ele').column, PredictionData._meta.get_field('data').column
+    columns_names = PredictionData._meta.get_field('pred_ele').column, PredictionData._meta.get_field('data').column, \
+        PredictionData._meta.get_field('packed').column
     with connection.cursor() as cursor:
         if connection.vendor == 'postgresql':
             # bulk insert via COPY FROM. to avoid possible problems with CSV quoting and delimiters, we follow this
@@ -705,6 +1039,697 @@ def _insert_pred_data_rows(rows):
             cursor.executemany(sql, rows)
 
 
+#
+# HashedPredictionData support
+#
+
+def _is_hashed_pred_data_storage(forecast):
+    """
+    :return: True if forecast's data should be stored as HashedPredictionData rather than as PredictionData
+    """
+    return forecast.forecast_model.project.pred_data_storage == Project.HASHED_PRED_DATA_STORAGE
+
+
+def _insert_hashed_pred_data_rows(rows, is_packed=False):
+    """
+    The HashedPredictionData version of _insert_pred_data_rows() that inserts the rows whose data_hash is not already
+    stored. Existing payloads are skipped before they are copied to the database.
+
+    :param rows: iterable of 2-tuples: (data_hash, prediction_data) with unique data_hashes, where prediction_data is
+        the "raw" prediction_data dict
+    :param is_packed: same as _insert_pred_data_rows()
+    """
+    temp_table_name = 'pred_data_temp'
+    _create_pred_data_temp_table(temp_table_name)
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, PREDICTION_DICTS_CHUNK_SIZE))
+        if not batch:
+            break
+
+        existing_data_hashes = _existing_hashed_pred_data_hashes([data_hash for data_hash, _ in batch])
+        _copy_pred_data_rows_to_temp_table(temp_table_name,
+                                           [(data_hash, *_encoded_pred_data(prediction_data, is_packed))
+                                            for data_hash, prediction_data in batch
+                                            if data_hash not in existing_data_hashes])
+    _insert_hashed_pred_data_temp_table(temp_table_name)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {temp_table_name};")
+
+
+def _existing_hashed_pred_data_hashes(data_hashes):
+    """
+    :param data_hashes: a list of data_hashes
+    :return: the set of data_hashes that have HashedPredictionData
+    """
+    return set(HashedPredictionData.objects.filter(data_hash__in=data_hashes).values_list('data_hash', flat=True))
+
+
+def _insert_hashed_pred_data_temp_table(temp_table_name, is_packed_column=True):
+    """
+    Inserts temp_table_name's rows into HashedPredictionData, skipping existing data_hashes, including ones that are
+    inserted concurrently by other loads.
+
+    :param temp_table_name: a table with `data_hash` and `data` (serialized prediction data json) columns, e.g., as
+        created by _create_pred_data_temp_table(). data_hashes may repeat
+    :param is_packed_column: True if temp_table_name also has a `packed` column as created by
+        _create_pred_data_temp_table()
+    """
+    hashed_table_name = HashedPredictionData._meta.db_table
+    data_column = "MIN(data)::jsonb" if connection.vendor == 'postgresql' else "MIN(data)"
+    packed_column = _packed_temp_column_sql("MIN(packed)") if is_packed_column else "NULL"
+    sql = f"""
+        INSERT INTO {hashed_table_name} (data_hash, data, packed)
+        SELECT data_hash, {data_column}, {packed_column}
+        FROM {temp_table_name}
+        WHERE NOT EXISTS(SELECT *
+                         FROM {hashed_table_name} AS hashed_pred_data
+                         WHERE hashed_pred_data.data_hash = {temp_table_name}.data_hash)
+        GROUP BY data_hash
+        ON CONFLICT (data_hash) DO NOTHING;
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+
+
+#
+# PredictionData.packed support
+#
+
+def _is_packed_pred_data_encoding(forecast):
+    """
+    :return: True if forecast's data should be packed. see packed_pred_data()
+    """
+    return forecast.forecast_model.project.pred_data_encoding == Project.PACKED_PRED_DATA_ENCODING
+
+
+def _encoded_pred_data(prediction_data, is_packed):
+    """
+    Encodes prediction_data for bulk-loading into PredictionData, HashedPredictionData, or a pred_data temp table via
+    COPY (postgres) or executemany() (sqlite, etc.)
+
+    :param prediction_data: the "raw" prediction_data dict
+    :param is_packed: True if prediction_data's numeric lists should be packed. see packed_pred_data()
+    :return: a 2-tuple: (data_json, packed) where packed is a vendor-specific representation of the packed bytes: a
+        bytea hex-format string for postgres (e.g., '\\x0102'), and bytes otherwise. None if nothing was packed
+    """
+    data, packed = packed_pred_data(prediction_data) if is_packed else (prediction_data, None)
+    if (packed is not None) and (connection.vendor == 'postgresql'):
+        packed = '\\x' + packed.hex()
+    return json.dumps(data), packed
+
+
+def _packed_temp_column_sql(packed_column):
+    """
+    :param packed_column: an SQL expression for a pred_data temp table's packed column. see
+        _create_pred_data_temp_table()
+    :return: SQL that converts packed_column to a value for PredictionData.packed
+    """
+    return f"{packed_column}::bytea" if connection.vendor == 'postgresql' else packed_column
+
+
+#
+# load_predictions_from_prediction_dicts()
+#
+
+# per-upload choice of how `views._upload_forecast_worker()` loads a forecast file: 'default' reads the entire file into
+# memory and calls load_predictions_from_json_io_dict(), while 'streaming' calls
+# load_predictions_from_prediction_dicts(), whose memory use does not grow with the file's size
+INGEST_MODE_DEFAULT = 'default'
+INGEST_MODE_STREAMING = 'streaming'
+INGEST_MODES = (INGEST_MODE_DEFAULT, INGEST_MODE_STREAMING)
+
+# the number of prediction dicts that load_predictions_from_prediction_dicts() validates and copies to the database at
+# a time
+PREDICTION_DICTS_CHUNK_SIZE = 10_000
+
+
+@transaction.atomic
+def load_predictions_from_prediction_dicts(forecast, prediction_dicts, is_skip_validation=False, is_validate_cats=True,
+                                           is_subset_allowed=False, chunk_size=PREDICTION_DICTS_CHUNK_SIZE):
+    """
+    A bounded-memory version of load_predictions_from_json_io_dict() that takes an iterable of prediction dicts (e.g.,
+    the generator returned by utils.csv_io.prediction_dicts_from_csv_fp()) rather than an entire "JSON IO dict".
+    Whereas load_predictions_from_json_io_dict() keeps all rows and prediction data in memory until the final INSERTs,
+    this function validates `chunk_size` prediction dicts at a time and copies them into two temp tables: one of
+    prediction elements and one of (data_hash, prediction data json) rows, skipping duplicates of previous versions
+    (see DedupIndex). The PredictionData rows are then created by joining the latter against the newly-inserted
+    PredictionElements, so the only per-prediction state kept in memory is what's needed for "prediction"-level
+    validation and the forecast version rules. (The DedupIndex grows with the size of the previous versions, not with
+    that of `prediction_dicts`.)
+
+    Enforces the same FORECAST VERSION RULES as load_predictions_from_json_io_dict(), and args are the same except:
+
+    :param prediction_dicts: an iterable of prediction dicts, i.e., items in a "JSON IO dict"'s 'predictions' list
+    :param chunk_size: the number of prediction dicts to process at a time
+    """
+    if forecast.pred_eles.count() != 0:
+        raise RuntimeError(f"cannot load data into a non-empty forecast: {forecast}")
+
+    validation_context = validation_context_for_project(forecast.forecast_model.project)
+    loc_targ_to_pred_classes = defaultdict(list)  # (unit_abbrev, target_name) -> [prediction_class1, ...]
+    unit_target_pred_classes = set()  # (unit_id, target_id, pred_class_int) of all rows, including duplicates
+    dedup_index = DedupIndex(forecast)
+    is_legacy_hash = dedup_index.is_legacy_hash
+    is_hashed_pred_data = _is_hashed_pred_data_storage(forecast)
+    is_packed = _is_packed_pred_data_encoding(forecast)
+
+    pred_ele_temp_table_name = 'pred_ele_temp'
+    pred_data_temp_table_name = 'pred_data_temp'
+    _create_pred_ele_temp_table(pred_ele_temp_table_name)
+    _create_pred_data_temp_table(pred_data_temp_table_name)
+
+    # pass 1/2: validate and copy each chunk into the temp tables
+    prediction_dicts = iter(prediction_dicts)
+    is_empty = True
+    is_all_duplicates = True
+    while True:
+        chunk = list(islice(prediction_dicts, chunk_size))
+        if not chunk:
+            break
+
+        is_empty = False
+        if not is_skip_validation:
+            _validate_prediction_dicts(chunk, validation_context, is_validate_cats)  # raises o/w
+
+        data_hash_to_encoded = {}  # only for this chunk. duplicates across chunks are handled by the INSERT below
+        pred_ele_rows = []
+        for prediction_dict in chunk:
+            unit_abbrev = prediction_dict['unit']
+            target_name = prediction_dict['target']
+            pred_class = prediction_dict['class']
+            prediction_data = prediction_dict['prediction']  # None if a "retracted" prediction
+            is_retract = prediction_data is None
+            loc_targ_to_pred_classes[(unit_abbrev, target_name)].append(pred_class)
+            pred_class_int = PRED_CLASS_NAME_TO_INT[pred_class]
+            unit_id = validation_context.unit_abbrev_to_id[unit_abbrev]
+            target_id = validation_context.target_name_to_target[target_name].pk
+            unit_target_pred_classes.add((unit_id, target_id, pred_class_int))
+            data_hash, legacy_data_hash = _hashes_for_prediction_data(prediction_data, is_legacy_hash)
+            if dedup_index.is_duplicate(pred_class_int, unit_id, target_id, is_retract, data_hash, legacy_data_hash):
+                continue
+
+            if not is_retract:
+                data_hash_to_encoded[data_hash] = _encoded_pred_data(prediction_data, is_packed)
+            pred_ele_rows.append((forecast.pk, pred_class_int, unit_id, target_id, is_retract, data_hash))
+        is_all_duplicates = is_all_duplicates and not pred_ele_rows
+        if is_hashed_pred_data:  # skip copying payloads that are already stored
+            for data_hash in _existing_hashed_pred_data_hashes(list(data_hash_to_encoded)):
+                del data_hash_to_encoded[data_hash]
+        _copy_pred_ele_rows_to_temp_table(pred_ele_temp_table_name, pred_ele_rows)
+        _copy_pred_data_rows_to_temp_table(pred_data_temp_table_name,
+                                           [(data_hash, data_json, packed)
+                                            for data_hash, (data_json, packed) in data_hash_to_encoded.items()])
+
+    if is_empty:  # validate the rule: "cannot load empty data"
+        raise RuntimeError(f"cannot load empty data")
+
+    if not is_skip_validation:
+        _validate_loc_targ_to_pred_classes(loc_targ_to_pred_classes)  # raises o/w
+
+    # validate the rule: "cannot load data that's a subset of previous data"
+    if (not is_subset_allowed) and dedup_index.is_subset_of_prev_versions(unit_target_pred_classes):
+        raise RuntimeError(f"new data is a subset of previous. forecast={forecast}")
+
+    # validate the rule: "cannot load 100% duplicate data"
+    if is_all_duplicates:
+        raise RuntimeError(f"cannot load 100% duplicate data. forecast={forecast}")
+
+    # drops pred_ele_temp_table_name
+    _insert_pred_ele_temp_table(forecast, pred_ele_temp_table_name)
+
+    # pass 2/2: insert PredictionData via the just-inserted PredictionElements' ids, or HashedPredictionData via their
+    # data_hashes
+    if is_hashed_pred_data:
+        _insert_hashed_pred_data_temp_table(pred_data_temp_table_name)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {pred_data_temp_table_name};")
+        return
+
+    data_column = f"{pred_data_temp_table_name}.data::jsonb" if connection.vendor == 'postgresql' \
+        else f"{pred_data_temp_table_name}.data"
+    packed_column = _packed_temp_column_sql(f"{pred_data_temp_table_name}.packed")
+    sql = f"""
+        INSERT INTO {PredictionData._meta.db_table} (pred_ele_id, data, packed)
+        SELECT pred_ele.id, {data_column}, {packed_column}
+        FROM {PredictionElement._meta.db_table} AS pred_ele
+                 JOIN (SELECT data_hash, MIN(data) AS data, MIN(packed) AS packed
+                       FROM {pred_data_temp_table_name}
+                       GROUP BY data_hash) AS {pred_data_temp_table_name}
+                      ON pred_ele.data_hash = {pred_data_temp_table_name}.data_hash
+        WHERE pred_ele.forecast_id = %s
+          AND NOT pred_ele.is_retract;
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (forecast.pk,))
+        cursor.execute(f"DROP TABLE IF EXISTS {pred_data_temp_table_name};")
+
+
+def _create_pred_data_temp_table(temp_table_name):
+    """
+    load_predictions_from_prediction_dicts() helper that (re)creates an empty temp table of (data_hash, data, packed)
+    rows, where data is serialized prediction data json and packed is as returned by _encoded_pred_data(). packed is
+    TEXT for postgres b/c there is no MIN() for BYTEA - see _packed_temp_column_sql().
+    """
+    packed_type = 'TEXT' if connection.vendor == 'postgresql' else 'BLOB'
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {temp_table_name};")
+        cursor.execute(f"CREATE TEMP TABLE {temp_table_name} (data_hash VARCHAR(32), data TEXT, packed {packed_type});")
+
+
+def _copy_pred_data_rows_to_temp_table(temp_table_name, rows):
+    """
+    load_predictions_from_prediction_dicts() helper that bulk-inserts rows into temp_table_name. See
+    _insert_pred_data_rows() re: postgres COPY quoting.
+
+    :param temp_table_name: as created by _create_pred_data_temp_table()
+    :param rows: iterable of 3-tuples: (data_hash, prediction_data_json, packed). the latter two are as returned by
+        _encoded_pred_data()
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            string_io = io.StringIO()
+            csv_writer = csv.writer(string_io, quotechar=chr(1), delimiter=chr(2))
+            csv_writer.writerows(rows)
+            string_io.seek(0)
+            sql = f"""
+                COPY {temp_table_name}(data_hash, data, packed) FROM STDIN WITH CSV QUOTE e'\x01' DELIMITER e'\x02';
+            """
+            cursor.copy_expert(sql, string_io)
+        else:  # 'sqlite', etc.
+            sql = f"""
+                    INSERT INTO {temp_table_name} (data_hash, data, packed)
+                    VALUES (%s, %s, %s);
+                    """
+            cursor.executemany(sql, list(rows))
+
+
+#
+# LatestPredictionElement and PredictionElement.valid_to maintenance
+#
+
+def _update_latest_pred_eles(forecast_ids):
+    """
+    Updates LatestPredictionElement for prediction elements that were just inserted into the passed forecasts: each
+    one becomes the latest for its (forecast_model, time_zero, unit, target, pred_class) unless an existing latest one
+    is from a newer version. The latter happens when loading into an older (empty) version. Duplicates that were
+    skipped during loading were not inserted, and so the versions they were in remain the latest for them.
+
+    :param forecast_ids: a list of Forecast ids. at most one per (forecast_model, time_zero)
+    """
+    if not forecast_ids:
+        return
+
+    latest_table_name = LatestPredictionElement._meta.db_table
+    pred_ele_table_name = PredictionElement._meta.db_table
+    forecast_table_name = Forecast._meta.db_table
+    forecast_ids_percent_s = ', '.join(['%s'] * len(forecast_ids))
+    sql = f"""
+        INSERT INTO {latest_table_name} (pred_ele_id, forecast_model_id, time_zero_id, unit_id, target_id, pred_class)
+        SELECT pred_ele.id, f.forecast_model_id, f.time_zero_id, pred_ele.unit_id, pred_ele.target_id,
+               pred_ele.pred_class
+        FROM {pred_ele_table_name} AS pred_ele
+                 JOIN {forecast_table_name} AS f ON pred_ele.forecast_id = f.id
+        WHERE pred_ele.forecast_id IN ({forecast_ids_percent_s})
+        ON CONFLICT (forecast_model_id, time_zero_id, unit_id, target_id, pred_class)
+            DO UPDATE SET pred_ele_id = excluded.pred_ele_id
+            WHERE (SELECT f.issued_at
+                   FROM {pred_ele_table_name} AS pred_ele
+                            JOIN {forecast_table_name} AS f ON pred_ele.forecast_id = f.id
+                   WHERE pred_ele.id = excluded.pred_ele_id)
+                      > (SELECT f.issued_at
+                         FROM {pred_ele_table_name} AS pred_ele
+                                  JOIN {forecast_table_name} AS f ON pred_ele.forecast_id = f.id
+                         WHERE pred_ele.id = {latest_table_name}.pred_ele_id);
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, forecast_ids)
+
+
+def _insert_missing_latest_pred_eles(forecast_model_id, time_zero_id):
+    """
+    Called after a forecast is deleted, inserts LatestPredictionElement rows for the prediction elements of the
+    (forecast_model, time_zero)'s remaining versions that are now the latest. The deleted forecast's rows were deleted
+    along with its prediction elements. Because only the newest version can be deleted, existing rows stay correct.
+
+    :param forecast_model_id: the deleted forecast's ForecastModel id
+    :param time_zero_id: "" TimeZero id
+    """
+    latest_table_name = LatestPredictionElement._meta.db_table
+    sql = f"""
+        INSERT INTO {latest_table_name} (pred_ele_id, forecast_model_id, time_zero_id, unit_id, target_id, pred_class)
+        SELECT ranked_rows.pred_ele_id, %s, %s, ranked_rows.unit_id, ranked_rows.target_id, ranked_rows.pred_class
+        FROM (SELECT pred_ele.id          AS pred_ele_id,
+                     pred_ele.unit_id     AS unit_id,
+                     pred_ele.target_id   AS target_id,
+                     pred_ele.pred_class  AS pred_class,
+                     RANK() OVER (
+                         PARTITION BY pred_ele.unit_id, pred_ele.target_id, pred_ele.pred_class
+                         ORDER BY f.issued_at DESC) AS rownum
+              FROM {PredictionElement._meta.db_table} AS pred_ele
+                       JOIN {Forecast._meta.db_table} AS f ON pred_ele.forecast_id = f.id
+              WHERE f.forecast_model_id = %s
+                AND f.time_zero_id = %s) AS ranked_rows
+        WHERE ranked_rows.rownum = 1
+          AND NOT EXISTS(SELECT *
+                         FROM {latest_table_name} AS latest
+                         WHERE latest.forecast_model_id = %s
+                           AND latest.time_zero_id = %s
+                           AND latest.unit_id = ranked_rows.unit_id
+                           AND latest.target_id = ranked_rows.target_id
+                           AND latest.pred_class = ranked_rows.pred_class);
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (forecast_model_id, time_zero_id) * 3)
+
+
+def _update_pred_ele_valid_tos(forecast):
+    """
+    Updates PredictionElement.valid_to for prediction elements that were just inserted into forecast: the elements of
+    previous versions that the new ones mask (or retract) are now valid only until forecast.issued_at. The new ones are
+    valid until further notice unless forecast is not the newest version (i.e., when loading into an older, empty
+    version), in which case the version's intervals are recomputed.
+
+    :param forecast: the Forecast that was inserted into
+    """
+    if not _is_newest_forecast_version(forecast):
+        _update_version_pred_ele_valid_tos(forecast.forecast_model_id, forecast.time_zero_id)
+        return
+
+    pred_ele_table_name = PredictionElement._meta.db_table
+    forecast_table_name = Forecast._meta.db_table
+    sql = f"""
+        UPDATE {pred_ele_table_name}
+        SET valid_to = (SELECT f.issued_at FROM {forecast_table_name} AS f WHERE f.id = %s)
+        WHERE {pred_ele_table_name}.forecast_id IN (SELECT f.id
+                                                     FROM {forecast_table_name} AS f
+                                                     WHERE f.forecast_model_id = %s
+                                                       AND f.time_zero_id = %s
+                                                       AND f.id != %s)
+          AND {pred_ele_table_name}.valid_to IS NULL
+          AND EXISTS(SELECT *
+                     FROM {pred_ele_table_name} AS new_pred_ele
+                     WHERE new_pred_ele.forecast_id = %s
+                       AND new_pred_ele.unit_id = {pred_ele_table_name}.unit_id
+                       AND new_pred_ele.target_id = {pred_ele_table_name}.target_id
+                       AND new_pred_ele.pred_class = {pred_ele_table_name}.pred_class);
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (forecast.pk, forecast.forecast_model_id, forecast.time_zero_id, forecast.pk,
+                             forecast.pk))
+
+
+def _update_version_pred_ele_valid_tos(forecast_model_id, time_zero_id):
+    """
+    Recomputes PredictionElement.valid_to for all of a (forecast_model, time_zero)'s versions. Used when the order of
+    its elements' intervals can't be updated incrementally: after a forecast is deleted or its issued_at is edited, and
+    when loading into an older version.
+
+    :param forecast_model_id: a ForecastModel id
+    :param time_zero_id: a TimeZero id
+    """
+    pred_ele_table_name = PredictionElement._meta.db_table
+    sql = f"""
+        UPDATE {pred_ele_table_name}
+        SET valid_to = intervals.next_issued_at
+        FROM (SELECT pred_ele.id AS pred_ele_id,
+                     LEAD(f.issued_at) OVER (
+                         PARTITION BY pred_ele.unit_id, pred_ele.target_id, pred_ele.pred_class
+                         ORDER BY f.issued_at) AS next_issued_at
+              FROM {pred_ele_table_name} AS pred_ele
+                       JOIN {Forecast._meta.db_table} AS f ON pred_ele.forecast_id = f.id
+              WHERE f.forecast_model_id = %s
+                AND f.time_zero_id = %s) AS intervals
+        WHERE {pred_ele_table_name}.id = intervals.pred_ele_id;
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (forecast_model_id, time_zero_id))
+
+
+def _update_forecasts_pred_ele_valid_tos(forecast_ids):
+    """
+    The set-based version of _update_pred_ele_valid_tos() for loads that insert into many forecasts at once (e.g.,
+    truth data, which has one oracle forecast per timezero): recomputes PredictionElement.valid_to for all versions of
+    each passed forecast's (forecast_model, time_zero) in a single UPDATE, regardless of the number of forecasts or
+    whether they are the newest versions.
+
+    :param forecast_ids: a list of Forecast ids
+    """
+    if not forecast_ids:
+        return
+
+    pred_ele_table_name = PredictionElement._meta.db_table
+    forecast_table_name = Forecast._meta.db_table
+    forecast_ids_percent_s = ', '.join(['%s'] * len(forecast_ids))
+    sql = f"""
+        UPDATE {pred_ele_table_name}
+        SET valid_to = intervals.next_issued_at
+        FROM (SELECT pred_ele.id AS pred_ele_id,
+                     LEAD(f.issued_at) OVER (
+                         PARTITION BY f.forecast_model_id, f.time_zero_id, pred_ele.unit_id, pred_ele.target_id,
+                             pred_ele.pred_class
+                         ORDER BY f.issued_at) AS next_issued_at
+              FROM {pred_ele_table_name} AS pred_ele
+                       JOIN {forecast_table_name} AS f ON pred_ele.forecast_id = f.id
+              WHERE EXISTS(SELECT *
+                           FROM {forecast_table_name} AS new_f
+                           WHERE new_f.id IN ({forecast_ids_percent_s})
+                             AND new_f.forecast_model_id = f.forecast_model_id
+                             AND new_f.time_zero_id = f.time_zero_id)) AS intervals
+        WHERE {pred_ele_table_name}.id = intervals.pred_ele_id;
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, forecast_ids)
+
+
+def _is_newest_forecast_version(forecast):
+    """
+    :return: True if forecast is the newest version of its (forecast_model, time_zero), i.e., if its merged data is
+        what LatestPredictionElement has
+    """
+    return not Forecast.objects.filter(forecast_model_id=forecast.forecast_model_id,
+                                       time_zero_id=forecast.time_zero_id,
+                                       issued_at__gt=forecast.issued_at).exists()
+
+
+def _as_of_for_forecast(forecast):
+    """
+    :return: the as_of to pass to _query_forecasts_sql_for_pred_class() to get forecast's merged data: None (which
+        uses LatestPredictionElement) if forecast is the newest version, and its issued_at o/w
+    """
+    return None if _is_newest_forecast_version(forecast) else forecast.issued_at
+
+
+#
+# rehash_forecast()
+#
+
+# the number of prediction elements that rehash_forecast() updates at a time
+REHASH_BATCH_SIZE = 10_000
+
+
+@transaction.atomic
+def rehash_forecast(forecast, batch_size=REHASH_BATCH_SIZE):
+    """
+    Top-level function that re-computes the data_hash of each of forecast's prediction elements whose hash_version is
+    not PredictionElement.CURRENT_HASH_VERSION, using their PredictionData. Re-hashing is optional - duplicate
+    detection works across hash versions (see _hashes_for_prediction_data()) - but loading a new version is faster once
+    all of its previous versions have been re-hashed. Safe to run while other forecasts are being loaded.
+
+    :param forecast: a Forecast
+    :param batch_size: the number of prediction elements to update at a time
+    :return: the number of prediction elements that were re-hashed
+    """
+    pred_ele_qs = PredictionElement.objects \
+        .filter(forecast=forecast) \
+        .exclude(hash_version=PredictionElement.CURRENT_HASH_VERSION) \
+        .values_list('id', 'pred_data__data', 'pred_data__packed')  # data is None for retractions
+    sql = f"""
+        UPDATE {PredictionElement._meta.db_table}
+        SET data_hash = %s, hash_version = %s
+        WHERE id = %s;
+    """
+    num_rehashed = 0
+    pred_ele_id_data_rows = pred_ele_qs.iterator(chunk_size=batch_size)
+    with connection.cursor() as cursor:
+        while True:
+            rows = list(islice(pred_ele_id_data_rows, batch_size))
+            if not rows:
+                break
+
+            cursor.executemany(sql, [(_hashes_for_prediction_data(unpacked_pred_data(data, packed) if data is not None
+                                                                  else None, False)[0],
+                                      PredictionElement.CURRENT_HASH_VERSION, pred_ele_id)
+                                     for pred_ele_id, data, packed in rows])
+            num_rehashed += len(rows)
+    return num_rehashed
+
+
+def _rehash_forecast_worker(forecast_pk):
+    """
+    enqueue() helper function
+    """
+    forecast = get_object_or_404(Forecast, pk=forecast_pk)
+    try:
+        logger.debug(f"_rehash_forecast_worker(): 1/2 starting: forecast_pk={forecast_pk}")
+        num_rehashed = rehash_forecast(forecast)
+        logger.debug(f"_rehash_forecast_worker(): 2/2 done: forecast_pk={forecast_pk}, num_rehashed={num_rehashed}")
+    except Exception as ex:
+        logger.error(f"_rehash_forecast_worker(): error: {ex!r}. forecast={forecast}")
+
+
+#
+# hash_forecast_pred_data() and other HashedPredictionData maintenance
+#
+
+@transaction.atomic
+def hash_forecast_pred_data(forecast):
+    """
+    Top-level function that moves forecast's PredictionData to HashedPredictionData, which is how existing data is
+    migrated after changing a project's pred_data_storage to Project.HASHED_PRED_DATA_STORAGE. Only prediction elements
+    whose hash_version is PredictionElement.CURRENT_HASH_VERSION are moved, so forecasts with legacy hashes should be
+    re-hashed first (see rehash_forecast()). Queries return the same results before and after. Safe to run while other
+    forecasts are being loaded.
+
+    :param forecast: a Forecast
+    :return: the number of prediction elements whose data was moved
+    """
+    pred_ele_table_name = PredictionElement._meta.db_table
+    pred_data_table_name = PredictionData._meta.db_table
+    hashed_table_name = HashedPredictionData._meta.db_table
+    sql = f"""
+        INSERT INTO {hashed_table_name} (data_hash, data, packed)
+        SELECT pred_ele.data_hash, pred_data.data, pred_data.packed
+        FROM {pred_ele_table_name} AS pred_ele
+                 JOIN {pred_data_table_name} AS pred_data ON pred_ele.id = pred_data.pred_ele_id
+        WHERE pred_ele.id IN (SELECT MIN(pred_ele.id)
+                              FROM {pred_ele_table_name} AS pred_ele
+                                       JOIN {pred_data_table_name} AS pred_data ON pred_ele.id = pred_data.pred_ele_id
+                              WHERE pred_ele.forecast_id = %s
+                                AND pred_ele.hash_version = %s
+                              GROUP BY pred_ele.data_hash)
+          AND NOT EXISTS(SELECT *
+                         FROM {hashed_table_name} AS hashed_pred_data
+                         WHERE hashed_pred_data.data_hash = pred_ele.data_hash)
+        ON CONFLICT (data_hash) DO NOTHING;
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (forecast.pk, PredictionElement.CURRENT_HASH_VERSION))
+
+    sql = f"""
+        DELETE
+        FROM {pred_data_table_name}
+        WHERE pred_ele_id IN (SELECT pred_ele.id
+                              FROM {pred_ele_table_name} AS pred_ele
+                              WHERE pred_ele.forecast_id = %s
+                                AND pred_ele.hash_version = %s);
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (forecast.pk, PredictionElement.CURRENT_HASH_VERSION))
+        return cursor.rowcount
+
+
+def _hash_forecast_pred_data_worker(forecast_pk):
+    """
+    enqueue() helper function
+    """
+    forecast = get_object_or_404(Forecast, pk=forecast_pk)
+    try:
+        logger.debug(f"_hash_forecast_pred_data_worker(): 1/2 starting: forecast_pk={forecast_pk}")
+        num_moved = hash_forecast_pred_data(forecast)
+        logger.debug(f"_hash_forecast_pred_data_worker(): 2/2 done: forecast_pk={forecast_pk}, num_moved={num_moved}")
+    except Exception as ex:
+        logger.error(f"_hash_forecast_pred_data_worker(): error: {ex!r}. forecast={forecast}")
+
+
+def pack_forecast_pred_data(forecast):
+    """
+    Top-level function that packs forecast's existing prediction data (see packed_pred_data()), which is how existing
+    data is migrated after changing a project's pred_data_encoding to Project.PACKED_PRED_DATA_ENCODING. Packs both
+    forecast's PredictionData and the HashedPredictionData that its prediction elements reference. Data that is
+    already packed or that has nothing to pack is left as-is. Queries return the same results before and after.
+
+    :param forecast: a Forecast
+    :return: the number of PredictionData and HashedPredictionData rows that were packed
+    """
+    hashed_data_hashes = forecast.pred_eles.filter(pred_data__isnull=True, is_retract=False).values('data_hash')
+    num_packed = 0
+    for pred_data_qs in (PredictionData.objects.filter(pred_ele__forecast=forecast, packed__isnull=True),
+                         HashedPredictionData.objects.filter(data_hash__in=hashed_data_hashes, packed__isnull=True)):
+        pred_datas = pred_data_qs.only('pk', 'data').iterator(chunk_size=PREDICTION_DICTS_CHUNK_SIZE)
+        while True:
+            chunk = list(islice(pred_datas, PREDICTION_DICTS_CHUNK_SIZE))
+            if not chunk:
+                break
+
+            packed_pred_datas = []
+            for pred_data in chunk:
+                pred_data.data, pred_data.packed = packed_pred_data(pred_data.data)
+                if pred_data.packed is not None:
+                    packed_pred_datas.append(pred_data)
+            pred_data_qs.model.objects.bulk_update(packed_pred_datas, ['data', 'packed'])
+            num_packed += len(packed_pred_datas)
+    return num_packed
+
+
+def _pack_forecast_pred_data_worker(forecast_pk):
+    """
+    enqueue() helper function
+    """
+    forecast = get_object_or_404(Forecast, pk=forecast_pk)
+    try:
+        logger.debug(f"_pack_forecast_pred_data_worker(): 1/2 starting: forecast_pk={forecast_pk}")
+        num_packed = pack_forecast_pred_data(forecast)
+        logger.debug(f"_pack_forecast_pred_data_worker(): 2/2 done: forecast_pk={forecast_pk}, "
+                     f"num_packed={num_packed}")
+    except Exception as ex:
+        logger.error(f"_pack_forecast_pred_data_worker(): error: {ex!r}. forecast={forecast}")
+
+
+def delete_unreferenced_hashed_pred_data():
+    """
+    Deletes HashedPredictionData rows that no PredictionElement references, e.g., after the forecasts that used them
+    were deleted. Rows are not deleted along with their PredictionElements b/c other elements might share them. Not
+    safe to run while forecasts are being loaded into projects that use Project.HASHED_PRED_DATA_STORAGE.
+
+    :return: the number of rows deleted
+    """
+    sql = f"""
+        DELETE
+        FROM {HashedPredictionData._meta.db_table}
+        WHERE NOT EXISTS(SELECT *
+                         FROM {PredictionElement._meta.db_table} AS pred_ele
+                         WHERE pred_ele.data_hash = {HashedPredictionData._meta.db_table}.data_hash);
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.rowcount
+
+
+def pred_data_storage_report(project):
+    """
+    :param project: a Project
+    :return: a dict that summarizes how project's prediction data is stored, with these keys:
+        - 'num_pred_eles': the number of non-retracted prediction elements
+        - 'num_pred_data': the number of PredictionData rows
+        - 'num_hashed_pred_eles': the number of non-retracted prediction elements without PredictionData, i.e., whose
+            data is a HashedPredictionData
+        - 'num_hashed_pred_data': the number of distinct HashedPredictionData that those elements reference
+        - 'dedup_ratio': num_pred_eles / (num_pred_data + num_hashed_pred_data), i.e., the number of prediction
+            elements per stored data dict. 1.0 means no savings. None if there are no prediction elements
+    """
+    pred_ele_qs = PredictionElement.objects.filter(forecast__forecast_model__project=project, is_retract=False)
+    hashed_pred_ele_qs = pred_ele_qs.filter(pred_data__isnull=True)
+    num_pred_eles = pred_ele_qs.count()
+    num_pred_data = PredictionData.objects.filter(pred_ele__forecast__forecast_model__project=project).count()
+    num_hashed_pred_data = hashed_pred_ele_qs.values('data_hash').distinct().count()
+    return {'num_pred_eles': num_pred_eles,
+            'num_pred_data': num_pred_data,
+            'num_hashed_pred_eles': hashed_pred_ele_qs.count(),
+            'num_hashed_pred_data': num_hashed_pred_data,
+            'dedup_ratio': num_pred_eles / (num_pred_data + num_hashed_pred_data) if num_pred_eles else None}
+
+
 #
 # data_rows_from_forecast()
 #
@@ -734,13 +1759,13 @@ def data_rows_from_forecast(forecast, unit, target):
     # which does the necessary work of merging versions and picking latest issued_at data.
     # args: pred_classes, model_ids, unit_ids, target_ids, timezero_ids, as_of, is_exclude_oracle:
     sql = _query_forecasts_sql_for_pred_class([], [forecast.forecast_model.pk], [unit.pk], [target.pk],
-                                              [forecast.time_zero.pk], forecast.issued_at, False)
-    with connection.cursor() as cursor:
+                                              [forecast.time_zero.pk], _as_of_for_forecast(forecast), False)
+    with streaming_cursor() as cursor:
         cursor.execute(sql, (forecast.forecast_model.project.pk,))
-        for fm_id, tz_id, pred_class, unit_id, target_id, is_retract, pred_data in batched_rows(cursor):
-            # we do not have to check is_retract b/c we pass `is_include_retract=False`, which skips retractions.
-            # counterintuitively must use json.loads per https://code.djangoproject.com/ticket/31991
-            pred_data = json.loads(pred_data)
+        for fm_id, tz_id, pred_class, unit_id, target_id, is_retract, pred_data, pred_data_packed \
+                in batched_rows(cursor):
+            # we do not have to check is_retract b/c we pass `is_include_retract=False`, which skips retractions
+            pred_data = _decoded_pred_data(pred_data, pred_data_packed)
             if pred_class == PredictionElement.BIN_CLASS:
                 for cat, prob in zip(pred_data['cat'], pred_data['prob']):
                     data_rows_bin.append((unit.abbreviation, target.name, cat, prob))
@@ -785,29 +1810,15 @@ def cache_forecast_metadata(forecast):
 
 
 def _cache_forecast_metadata_predictions(forecast):
-    # cache one ForecastMetaPrediction row for forecast.
-    # about the query: see _query_forecasts_sql_for_pred_class() for a description of a similar query
+    # cache one ForecastMetaPrediction row for forecast
+    from_where_sql, params = _cache_forecast_metadata_from_where_sql(forecast)
     sql = f"""
-        WITH ranked_rows AS (
-            SELECT pred_ele.pred_class             AS pred_class,
-                   pred_ele.is_retract             AS is_retract,
-                   RANK() OVER (
-                       PARTITION BY f.forecast_model_id, f.time_zero_id, pred_ele.unit_id, pred_ele.target_id, pred_ele.pred_class
-                       ORDER BY f.issued_at DESC) AS rownum
-            FROM {PredictionElement._meta.db_table} AS pred_ele
-                     JOIN {Forecast._meta.db_table} AS f ON pred_ele.forecast_id = f.id
-            WHERE f.forecast_model_id = %s
-              AND f.time_zero_id = %s
-              AND f.issued_at <= %s
-        )
-        SELECT ranked_rows.pred_class, COUNT(*)
-        FROM ranked_rows
-        WHERE ranked_rows.rownum = 1
-          AND NOT is_retract
-        GROUP BY ranked_rows.pred_class;
+        SELECT pred_ele.pred_class, COUNT(*)
+        {from_where_sql}
+        GROUP BY pred_ele.pred_class;
     """
-    with connection.cursor() as cursor:
-        cursor.execute(sql, (forecast.forecast_model.pk, forecast.time_zero.pk, forecast.issued_at,))
+    with streaming_cursor() as cursor:
+        cursor.execute(sql, params)
         pred_class_to_counts = defaultdict(int)
         for pred_class, count in batched_rows(cursor):
             pred_class_to_counts[pred_class] = count
@@ -825,9 +1836,9 @@ def _cache_forecast_metadata_predictions(forecast):
 def _cache_forecast_metadata_units(forecast):
     # cache ForecastMetaUnit rows for forecast
     unit_id_to_obj = {unit.id: unit for unit in forecast.forecast_model.project.units.all()}
-    sql = _cache_forecast_metadata_sql_for_forecast(True)
-    with connection.cursor() as cursor:
-        cursor.execute(sql, (forecast.forecast_model.pk, forecast.time_zero.pk, forecast.issued_at,))
+    sql, params = _cache_forecast_metadata_sql_for_forecast(forecast, True)
+    with streaming_cursor() as cursor:
+        cursor.execute(sql, params)
         for unit_id in batched_rows(cursor):
             ForecastMetaUnit.objects.create(forecast=forecast, unit=unit_id_to_obj[unit_id[0]])
 
@@ -835,39 +1846,58 @@ def _cache_forecast_metadata_units(forecast):
 def _cache_forecast_metadata_targets(forecast):
     # cache ForecastMetaTarget rows for forecast
     target_id_to_object = {target.id: target for target in forecast.forecast_model.project.targets.all()}
-    sql = _cache_forecast_metadata_sql_for_forecast(False)
-    with connection.cursor() as cursor:
-        cursor.execute(sql, (forecast.forecast_model.pk, forecast.time_zero.pk, forecast.issued_at,))
+    sql, params = _cache_forecast_metadata_sql_for_forecast(forecast, False)
+    with streaming_cursor() as cursor:
+        cursor.execute(sql, params)
         for target_id in batched_rows(cursor):
             ForecastMetaTarget.objects.create(forecast=forecast, target=target_id_to_object[target_id[0]])
 
 
-def _cache_forecast_metadata_sql_for_forecast(is_units):
+def _cache_forecast_metadata_sql_for_forecast(forecast, is_units):
     """
     _cache_forecast_metadata_units() and _cache_forecast_metadata_targets() helper that returns a common SQL query
     string based on my args. The query returns DISTINCT unit or target IDs for the latest version of `forecast`.
+
+    :return: a 2-tuple: (sql, params)
     """
-    # about the query: see _query_forecasts_sql_for_pred_class() for a description of a similar query
     select_column = 'pred_ele.unit_id' if is_units else 'pred_ele.target_id'
+    from_where_sql, params = _cache_forecast_metadata_from_where_sql(forecast)
     sql = f"""
-        WITH ranked_rows AS (
-            SELECT {select_column}                 AS unit_or_target_id,
-                   pred_ele.is_retract             AS is_retract,
-                   RANK() OVER (
-                       PARTITION BY f.forecast_model_id, f.time_zero_id, pred_ele.unit_id, pred_ele.target_id, pred_ele.pred_class
-                       ORDER BY f.issued_at DESC) AS rownum
-            FROM {PredictionElement._meta.db_table} AS pred_ele
-                     JOIN {Forecast._meta.db_table} AS f ON pred_ele.forecast_id = f.id
-            WHERE f.forecast_model_id = %s
-              AND f.time_zero_id = %s
-              AND f.issued_at <= %s
-        )
-        SELECT DISTINCT ranked_rows.unit_or_target_id
-        FROM ranked_rows
-        WHERE ranked_rows.rownum = 1
-          AND NOT is_retract;
+        SELECT DISTINCT {select_column}
+        {from_where_sql};
+    """
+    return sql, params
+
+
+def _cache_forecast_metadata_from_where_sql(forecast):
+    """
+    _cache_forecast_metadata_*() helper that returns the FROM and WHERE clauses of a query of forecast's merged,
+    non-retracted prediction elements, which are aliased `pred_ele`. Uses LatestPredictionElement if forecast is the
+    newest version, and PredictionElement.valid_to o/w.
+
+    :return: a 2-tuple: (sql, params)
+    """
+    # about the query: see _query_forecasts_sql_for_pred_class() for a description of a similar query
+    if _is_newest_forecast_version(forecast):
+        sql = f"""
+            FROM {LatestPredictionElement._meta.db_table} AS latest
+                     JOIN {PredictionElement._meta.db_table} AS pred_ele ON latest.pred_ele_id = pred_ele.id
+            WHERE latest.forecast_model_id = %s
+              AND latest.time_zero_id = %s
+              AND NOT pred_ele.is_retract
+        """
+        return sql, (forecast.forecast_model.pk, forecast.time_zero.pk)
+
+    sql = f"""
+        FROM {PredictionElement._meta.db_table} AS pred_ele
+                 JOIN {Forecast._meta.db_table} AS f ON pred_ele.forecast_id = f.id
+        WHERE f.forecast_model_id = %s
+          AND f.time_zero_id = %s
+          AND f.issued_at <= %s
+          AND (pred_ele.valid_to IS NULL OR pred_ele.valid_to > %s)
+          AND NOT pred_ele.is_retract
     """
-    return sql
+    return sql, (forecast.forecast_model.pk, forecast.time_zero.pk, forecast.issued_at, forecast.issued_at)
 
 
 def clear_forecast_metadata(forecast):
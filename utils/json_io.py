@@ -0,0 +1,137 @@
+import json
+
+
+#
+# prediction_dicts_from_json_fp()
+#
+
+# the number of characters that prediction_dicts_from_json_fp() reads from its file at a time
+JSON_READ_SIZE = 2 ** 16
+
+# the chars that can legally follow a json value
+_JSON_VALUE_DELIMITERS = ',:]} \t\r\n'
+
+
+def prediction_dicts_from_json_fp(json_fp, read_size=JSON_READ_SIZE):
+    """
+    An incremental alternative to `json.load(json_fp)['predictions']` that yields the prediction dicts in a
+    "JSON IO dict"'s 'predictions' list one at a time as they are parsed, rather than building the entire list in
+    memory first. Top-level keys other than 'predictions' (e.g., 'meta') are parsed and then ignored. Memory use is
+    bounded by the size of the largest single prediction dict (or 'meta' value) plus `read_size`.
+
+    :param json_fp: an open text file-like object containing a "JSON IO dict"
+    :param read_size: the number of characters to read from json_fp at a time
+    :return: a generator of prediction dicts
+    :raises RuntimeError: if json_fp's content is not a dict, has no 'predictions' key, or is not valid json
+    """
+    reader = _JsonStreamReader(json_fp, read_size)
+    if reader.peek_char() != '{':
+        raise RuntimeError(f"json_io_dict was not a dict")
+
+    reader.expect_char('{')
+    is_found_predictions = False
+    if reader.peek_char() == '}':
+        reader.expect_char('}')
+    else:
+        while True:
+            key = reader.decode_value()
+            reader.expect_char(':')
+            if (key == 'predictions') and not is_found_predictions:
+                is_found_predictions = True
+                if reader.peek_char() != '[':
+                    raise RuntimeError(f"'predictions' was not a list")
+
+                reader.expect_char('[')
+                if reader.peek_char() == ']':
+                    reader.expect_char(']')
+                else:
+                    while True:
+                        yield reader.decode_value()
+                        if reader.expect_char(',', ']') == ']':
+                            break
+            else:
+                reader.decode_value()  # e.g., 'meta'. discarded
+            if reader.expect_char(',', '}') == '}':
+                break
+
+    if reader.peek_char() != '':
+        raise RuntimeError(f"extra data after json_io_dict")
+    elif not is_found_predictions:
+        raise RuntimeError(f"json_io_dict had no 'predictions' key")
+
+
+class _JsonStreamReader:
+    """
+    prediction_dicts_from_json_fp() helper that maintains a read buffer over a text file and decodes one json value at
+    a time from it via `json.JSONDecoder.raw_decode()`, reading more of the file as needed.
+    """
+
+
+    def __init__(self, json_fp, read_size):
+        self.json_fp = json_fp
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0  # index into buffer of the next unconsumed char
+        self.is_eof = False
+
+
+    def _read_more(self):
+        """
+        Appends the next chunk of the file to the buffer, first discarding consumed chars. Sets is_eof if nothing read.
+        """
+        chunk = self.json_fp.read(self.read_size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        if not chunk:
+            self.is_eof = True
+
+
+    def peek_char(self):
+        """
+        :return: the next non-whitespace char without consuming it, or '' at end of file
+        """
+        while True:
+            while (self.pos < len(self.buffer)) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if (self.pos < len(self.buffer)) or self.is_eof:
+                return self.buffer[self.pos:self.pos + 1]
+
+            self._read_more()
+
+
+    def expect_char(self, *chars):
+        """
+        Consumes the next non-whitespace char, which must be one of `chars`.
+
+        :return: the consumed char
+        """
+        char = self.peek_char()
+        if char not in chars:
+            raise RuntimeError(f"invalid json: expected one of {list(chars)} but found {char!r} near: "
+                               f"{self.buffer[self.pos:self.pos + 40]!r}")
+
+        self.pos += 1
+        return char
+
+
+    def decode_value(self):
+        """
+        Decodes and consumes the next json value, reading more of the file until a complete value is available. Note
+        that a decoded value that is not followed by a delimiter might be incomplete (e.g., a number like "6.5e3" split
+        across reads decodes as 6), so in that case we read more before accepting it.
+
+        :return: the decoded value
+        """
+        self.peek_char()  # skip whitespace
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                if ((end < len(self.buffer)) and (self.buffer[end] in _JSON_VALUE_DELIMITERS)) or self.is_eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as jde:
+                if self.is_eof:
+                    raise RuntimeError(f"invalid json: {jde}")
+
+            self._read_more()
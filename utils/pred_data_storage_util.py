@@ -0,0 +1,111 @@
+import click
+import django
+import django_rq
+from django.shortcuts import get_object_or_404
+
+
+# set up django. must be done before loading models. NB: requires DJANGO_SETTINGS_MODULE to be set
+django.setup()
+
+from utils.forecast import _hash_forecast_pred_data_worker, _pack_forecast_pred_data_worker, \
+    delete_unreferenced_hashed_pred_data, hash_forecast_pred_data, pack_forecast_pred_data, pred_data_storage_report
+
+from forecast_app.models import Forecast, PredictionElement, Project
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command(name="print")
+@click.option('--project-pk')
+def print_storage(project_pk):
+    """
+    A subcommand that prints how one or all projects' prediction data is stored, including the dedup ratio. See
+    `pred_data_storage_report()`. Runs in the calling thread and therefore blocks.
+
+    :param project_pk: if a valid Project pk then only that project is printed. o/w prints all
+    """
+    projects = [get_object_or_404(Project, pk=project_pk)] if project_pk else Project.objects.all()
+    pred_data_storage_to_name = dict(Project.PRED_DATA_STORAGE_CHOICES)
+    for project in projects:
+        report = pred_data_storage_report(project)
+        dedup_ratio = f"{report['dedup_ratio']:.2f}" if report['dedup_ratio'] is not None else 'n/a'
+        click.echo(f"* {project}: storage={pred_data_storage_to_name.get(project.pred_data_storage, '!?')}, "
+                   f"pred_eles={report['num_pred_eles']}, pred_data={report['num_pred_data']}, "
+                   f"hashed_pred_eles={report['num_hashed_pred_eles']}, "
+                   f"hashed_pred_data={report['num_hashed_pred_data']}, dedup_ratio={dedup_ratio}")
+
+
+@cli.command()
+@click.option('--project-pk', required=True)
+@click.option('--no-enqueue', is_flag=True, default=False)
+def update(project_pk, no_enqueue):
+    """
+    A subcommand that switches a project to Project.HASHED_PRED_DATA_STORAGE and then moves its existing forecasts'
+    PredictionData to HashedPredictionData. See `hash_forecast_pred_data()`. Forecasts with legacy hashes are only
+    partially moved - run `rehash_util.py update` first to move them fully.
+
+    :param project_pk: a valid Project pk
+    :param no_enqueue: controls whether moving will be immediate in the calling thread (blocks), or enqueued for RQ
+    """
+    from forecast_repo.settings.base import HASH_PRED_DATA_QUEUE_NAME  # avoid circular imports
+
+
+    queue = django_rq.get_queue(HASH_PRED_DATA_QUEUE_NAME)
+    project = get_object_or_404(Project, pk=project_pk)
+    Project.objects.filter(pk=project.pk).update(pred_data_storage=Project.HASHED_PRED_DATA_STORAGE)
+    click.echo(f"moving prediction data: {project}")
+    forecasts = Forecast.objects \
+        .filter(forecast_model__project=project, pred_eles__hash_version=PredictionElement.CURRENT_HASH_VERSION,
+                pred_eles__pred_data__isnull=False) \
+        .distinct()
+    for forecast in forecasts:
+        if no_enqueue:
+            click.echo(f"- moved {hash_forecast_pred_data(forecast)} prediction elements' data (no enqueue): "
+                       f"{forecast}")
+        else:
+            click.echo(f"- enqueuing move: {forecast}")
+            queue.enqueue(_hash_forecast_pred_data_worker, forecast.pk)
+    click.echo("update done")
+
+
+@cli.command()
+@click.option('--project-pk', required=True)
+@click.option('--no-enqueue', is_flag=True, default=False)
+def pack(project_pk, no_enqueue):
+    """
+    A subcommand that switches a project to Project.PACKED_PRED_DATA_ENCODING and then packs its existing forecasts'
+    prediction data. See `pack_forecast_pred_data()`.
+
+    :param project_pk: a valid Project pk
+    :param no_enqueue: controls whether packing will be immediate in the calling thread (blocks), or enqueued for RQ
+    """
+    from forecast_repo.settings.base import PACK_PRED_DATA_QUEUE_NAME  # avoid circular imports
+
+
+    queue = django_rq.get_queue(PACK_PRED_DATA_QUEUE_NAME)
+    project = get_object_or_404(Project, pk=project_pk)
+    Project.objects.filter(pk=project.pk).update(pred_data_encoding=Project.PACKED_PRED_DATA_ENCODING)
+    click.echo(f"packing prediction data: {project}")
+    for forecast in Forecast.objects.filter(forecast_model__project=project):
+        if no_enqueue:
+            click.echo(f"- packed {pack_forecast_pred_data(forecast)} prediction data (no enqueue): {forecast}")
+        else:
+            click.echo(f"- enqueuing pack: {forecast}")
+            queue.enqueue(_pack_forecast_pred_data_worker, forecast.pk)
+    click.echo("pack done")
+
+
+@cli.command()
+def clean():
+    """
+    A subcommand that deletes HashedPredictionData that is no longer referenced. See
+    `delete_unreferenced_hashed_pred_data()`. Runs in the calling thread and therefore blocks.
+    """
+    click.echo(f"deleted {delete_unreferenced_hashed_pred_data()} unreferenced hashed prediction data")
+
+
+if __name__ == '__main__':
+    cli()
@@ -10,7 +10,7 @@ from django.db import connection
 from django.db import transaction
 
 from forecast_app.models import Project, Unit, Target, Forecast, ForecastModel, ForecastMetaUnit, ForecastMetaTarget
-from forecast_app.models.project import TimeZero
+from forecast_app.models.project import TimeZero, deferred_project_version_updates
 from forecast_app.models.target import reference_date_type_for_name, reference_date_type_for_id
 from utils.utilities import YYYY_MM_DD_DATE_FORMAT
 
@@ -175,14 +175,15 @@ def create_project_from_json(proj_config_file_path_or_dict, owner, is_validate_o
         project = _create_project(project_dict, owner)
         logger.info(f"- created Project: {project}")
 
-    units = _validate_and_create_units(project, project_dict, is_validate_only)
-    logger.info(f"- created {len(units)} Units: {units}")
+    with deferred_project_version_updates():  # one version update for all units, targets, and timezeros
+        units = _validate_and_create_units(project, project_dict, is_validate_only)
+        logger.info(f"- created {len(units)} Units: {units}")
 
-    targets = _validate_and_create_targets(project, project_dict, is_validate_only)
-    logger.info(f"- created {len(targets)} Targets: {targets}")
+        targets = _validate_and_create_targets(project, project_dict, is_validate_only)
+        logger.info(f"- created {len(targets)} Targets: {targets}")
 
-    timezeros = _validate_and_create_timezeros(project, project_dict, is_validate_only)
-    logger.info(f"- created {len(timezeros)} TimeZeros: {timezeros}")
+        timezeros = _validate_and_create_timezeros(project, project_dict, is_validate_only)
+        logger.info(f"- created {len(timezeros)} TimeZeros: {timezeros}")
 
     logger.info(f"* create_project_from_json(): done!")
     return project
@@ -5,7 +5,7 @@ from itertools import groupby
 from django.db import transaction
 
 from forecast_app.models import Unit, Target, PredictionElement
-from forecast_app.models.project import TimeZero
+from forecast_app.models.project import TimeZero, deferred_project_version_updates
 from forecast_app.models.target import reference_date_type_for_name
 from utils.project import create_project_from_json, _validate_and_create_units, _validate_and_create_targets, \
     _validate_and_create_timezeros
@@ -380,6 +380,11 @@ def execute_project_config_diff(project, changes):
     :param project: the Project that's being modified
     :param changes: list of Changes as returned by project_config_diff()
     """
+    with deferred_project_version_updates():  # one version update for all changes
+        _execute_project_config_diff(project, changes)
+
+
+def _execute_project_config_diff(project, changes):
     objects_to_save = set()
     for change in order_project_config_diff(changes):
         if change.change_type == ChangeType.OBJ_ADDED:
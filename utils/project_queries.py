@@ -1,9 +1,14 @@
 import csv
 import io
 import json
+import pickle
 import statistics
+import tempfile
+import threading
 import timeit
-from itertools import groupby
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby, islice
 
 import dateutil
 import numpy
@@ -13,12 +18,18 @@ from django.db import connection, transaction
 from rest_framework.generics import get_object_or_404
 from rq.timeouts import JobTimeoutException
 
-from forecast_app.models import Job, Project, Forecast, ForecastModel, PredictionElement, PredictionData, Target
+from forecast_app.models import Job, Project, Forecast, ForecastModel, PredictionElement, PredictionData, Target, \
+    HashedPredictionData, LatestPredictionElement
+from forecast_app.models.prediction_data import unpacked_pred_data
 from forecast_app.models.prediction_element import PRED_CLASS_NAME_TO_INT, PRED_CLASS_INT_TO_NAME
-from forecast_repo.settings.base import MAX_NUM_QUERY_ROWS
+from forecast_repo.settings.base import MAX_NUM_QUERY_ROWS, QUERY_GZIP_LEVEL, QUERY_NUM_WORKERS
 from utils.project import logger
 from utils.project_truth import TRUTH_CSV_HEADER, oracle_model_for_project
-from utils.utilities import YYYY_MM_DD_DATE_FORMAT, batched_rows
+from utils.query_cache import complete_follower_jobs, store_query_cache_entry
+from utils.query_output import OUTPUT_FORMAT_ARROW, OUTPUT_FORMAT_PARQUET, query_output_format, \
+    validate_output_format, write_query_rows
+from utils.utilities import YYYY_MM_DD_DATE_FORMAT, batched_rows, streaming_cursor
+from utils.validation_context import validation_context_for_project
 
 
 #
@@ -32,10 +43,15 @@ CSV_HEADER = ['unit', 'target', 'class', 'value', 'cat', 'prob', 'sample', 'quan
 # for outputting forecast query data as CSV:
 FORECAST_CSV_HEADER = ['model', 'timezero', 'season'] + CSV_HEADER
 
+# the first columns of 'wide' forecast queries' rows. the rest are one per quantile level - see forecasts_query_header()
+WIDE_FORECAST_CSV_HEADER = ['model', 'timezero', 'season', 'unit', 'target']
 
-def query_forecasts_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS):
+
+def query_forecasts_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS, num_workers=QUERY_NUM_WORKERS,
+                                partition_by=None):
     """
-    Top-level function for querying forecasts within project. Runs in the calling thread and therefore blocks.
+    Top-level function for querying forecasts within project. Runs in the calling thread and therefore blocks, though
+    with num_workers > 1 it runs partitions of the query in worker threads.
 
     Returns a list of rows in a Zoltar-specific CSV row format. The columns are defined in FORECAST_CSV_HEADER. Note
     that the csv is 'sparse': not every row uses all columns, and unused ones are empty (''). However, the first four
@@ -44,7 +60,7 @@ def query_forecasts_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS)
     The 'class' of each row is named to be the same as Zoltar's utils.forecast.PRED_CLASS_INT_TO_NAME
     variable. Column ordering is FORECAST_CSV_HEADER.
 
-    `query` is documented at https://docs.zoltardata.com/, but briefly, it is a dict of up to seven keys, five of which
+    `query` is documented at https://docs.zoltardata.com/, but briefly, it is a dict of up to eleven keys, five of which
     are lists of strings. all are optional:
 
     - 'models': Pass zero or more model abbreviations in the models field.
@@ -61,7 +77,23 @@ def query_forecasts_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS)
     the referred-to objects are not found. NB: If multiple objects are found with the same name then the program will
     arbitrarily choose one.
 
-    The seventh key specifies query *options*:
+    Two more keys select parts of the output. Unlike filtering rows afterward, they are applied to prediction data in
+    the database where possible (json data), or else as it is decoded (packed data), so unselected data is never
+    expanded into rows:
+    - 'quantiles': a list of unique numbers in [0, 1]. quantile rows are limited to those quantile levels
+    - 'columns': a list of unique FORECAST_CSV_HEADER column names. rows (including the header) have only those
+      columns, in that order
+
+    The 'wide' key is a boolean that, if true, changes the rows' format: quantile predictions are output as one row per
+    (model, timezero, unit, target) with one column per 'quantiles' level, in increasing order, rather than one row per
+    quantile (see forecasts_query_header()). 'quantiles' is then required, 'types' can only be ['quantile'], 'columns'
+    is not allowed, and other prediction types are not output. max_num_rows counts the wide rows. Wide 'parquet' and
+    'arrow' queries' quantile columns are float64, so they cannot include date targets.
+
+    The 'output_format' key selects the format that query jobs write the rows in - see utils.query_output. It does not
+    affect this function's rows.
+
+    The last key specifies query *options*:
     - 'options': a dict that acts like a flat dot-namespaced registry ala Firefox's Configuration Editor (about:config
       page). keys are period-delimited strings and values are options-specific values (all single values). for example,
       'convert.bin' and 'convert.point'.
@@ -69,27 +101,40 @@ def query_forecasts_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS)
     Currently, the only options are ones controlling auto-conversion of prediction types. Each one provides two pieces
     of information: 1) that the conversion TO that prediction type is desired, and 2) type-specific options for that
     conversion. Zoltar uses rules to do the conversion based on what "source" predictions are available. Briefly, these
-    are the ultimately supported conversions (NB: see below for what's currently implemented):
+    are the supported conversions, which are implemented for continuous and discrete targets (see
+    _is_type_conversion()):
 
-      B <- NS   # can convert named or samples to bin. options: none
+      B <- N    # can convert named to bin. options: none. requires the target to have cats. todo samples
       N <- n/a  # no conversion possible
       P <- NS   # can convert named or samples to point. options: 'mean' or 'median'
       Q <- NS   # "" samples. options: list of quantiles
       S <- N    # can convert named to samples. options: number of samples
+      Mean, Median <- NS  # "" samples. options: none
 
     Here then are the valid options:
     - 'convert.bin': a boolean if conversion TO bin is desired
     - 'convert.point': a string if conversion TO points is desired: either 'mean' or 'median'
     - 'convert.quantile': a number if conversion TO quantiles is desired: a list of unique numbers in [0, 1]
     - 'convert.sample': an int if conversion TO samples is desired: an int >0
+    - 'convert.mean', 'convert.median': a boolean if conversion TO mean or median is desired
+
+    Conversions from named distributions are only done to types that are listed in 'types'. They are exact where they
+    have a closed form (e.g., means, and norm and lnorm quantiles), and are o/w estimated from
+    NAMED_CONVERSION_NUM_SAMPLES samples drawn with a fixed seed (see _converted_named()).
 
     :param project: a Project
     :param query: a dict specifying the query parameters as described above
-    :param max_num_rows: the number of rows at which this function raises a RuntimeError
+    :param max_num_rows: the number of rows at which this function raises a RuntimeError. counts prediction elements
+        (wide rows for wide queries) rather than the rows they are output as, e.g., a bin prediction's several rows
+    :param num_workers: if >1, the query is split into up to that many partitions (see _query_partitions()) that are
+        run concurrently, and the rows are ordered by partition. o/w it is run in the calling thread
+    :param partition_by: PARTITION_BY_MODEL or PARTITION_BY_TIMEZERO if num_workers > 1. None picks the one with more
+        ids to split
     :return: a list of CSV rows including the header
     """
     start_time = timeit.default_timer()
-    logger.debug(f"query_forecasts_for_project(): entered. project={project}, query={query}")
+    logger.debug(f"query_forecasts_for_project(): entered. project={project}, query={query}, "
+                 f"num_workers={num_workers}")
 
     # validate query
     error_messages, (model_ids, unit_ids, target_ids, timezero_ids, type_ints, as_of) = \
@@ -97,6 +142,9 @@ def query_forecasts_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS)
     if error_messages:
         raise RuntimeError(f"invalid query. query={query}, errors={error_messages}")
 
+    if query.get('wide'):
+        type_ints = [PredictionElement.QUANTILE_CLASS]
+
     forecast_model_id_to_obj = {forecast_model.pk: forecast_model for forecast_model in project.models.all()}
     timezero_id_to_obj = {timezero.pk: timezero for timezero in project.timezeros.all()}
     unit_id_to_obj = {unit.pk: unit for unit in project.units.all()}
@@ -104,19 +152,191 @@ def query_forecasts_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS)
     timezero_to_season_name = project.timezero_to_season_name()
 
     # dispatch to one of two implementations based on whether prediction type conversion is requested
-    if ('options' in query) and query['options']:
-        yield from _query_forecasts_for_project_yes_type_convert(
-            project, query, max_num_rows, model_ids, unit_ids, target_ids, timezero_ids, type_ints, as_of,
-            forecast_model_id_to_obj, timezero_id_to_obj, unit_id_to_obj, target_id_to_obj, timezero_to_season_name,
-            query['options'])
-    else:
-        yield from _query_forecasts_for_project_no_type_convert(
-            project, query, max_num_rows, model_ids, unit_ids, target_ids, timezero_ids, type_ints, as_of,
-            forecast_model_id_to_obj, timezero_id_to_obj, unit_id_to_obj, target_id_to_obj, timezero_to_season_name)
+    def query_rows(partition_model_ids, partition_timezero_ids, shared_row_count=None):
+        if ('options' in query) and query['options']:
+            return _query_forecasts_for_project_yes_type_convert(
+                project, query, max_num_rows, partition_model_ids, unit_ids, target_ids, partition_timezero_ids,
+                type_ints, as_of, forecast_model_id_to_obj, timezero_id_to_obj, unit_id_to_obj, target_id_to_obj,
+                timezero_to_season_name, query['options'], shared_row_count)
+        else:
+            return _query_forecasts_for_project_no_type_convert(
+                project, query, max_num_rows, partition_model_ids, unit_ids, target_ids, partition_timezero_ids,
+                type_ints, as_of, forecast_model_id_to_obj, timezero_id_to_obj, unit_id_to_obj, target_id_to_obj,
+                timezero_to_season_name, shared_row_count)
+
+
+    partitions = _query_partitions(model_ids, timezero_ids, forecast_model_id_to_obj, timezero_id_to_obj, num_workers,
+                                   partition_by) if num_workers > 1 else []
+    rows = _query_forecasts_for_project_parallel(query_rows, partitions, num_workers, forecasts_query_header(query)) \
+        if len(partitions) > 1 else query_rows(model_ids, timezero_ids)
+    if 'columns' in query:
+        column_idxs = [FORECAST_CSV_HEADER.index(column) for column in query['columns']]
+        rows = ([row[column_idx] for column_idx in column_idxs] for row in rows)
+    yield from rows
     delta_secs = timeit.default_timer() - start_time
     logger.debug(f"query_forecasts_for_project(): done. delta_secs={delta_secs}, project={project}, query={query}")
 
 
+def forecasts_query_header(query):
+    """
+    :param query: a valid forecast query
+    :return: the header row of query's rows (before any 'columns' selection): FORECAST_CSV_HEADER, or if query is
+        'wide' then WIDE_FORECAST_CSV_HEADER plus one column per quantile level, named like 'q0.025'
+    """
+    if query.get('wide'):
+        return WIDE_FORECAST_CSV_HEADER + [f'q{quantile}' for quantile in sorted(query['quantiles'])]
+    else:
+        return FORECAST_CSV_HEADER
+
+
+#
+# parallel query
+#
+
+# partition_by values for query_forecasts_for_project()
+PARTITION_BY_MODEL = 'model'
+PARTITION_BY_TIMEZERO = 'timezero'
+
+# the number of rows that a _query_forecasts_for_project_parallel() partition writes to its temporary file at a time
+PARTITION_BATCH_NUM_ROWS = 1000
+
+
+class _SharedRowCount(object):
+    """
+    A thread-safe row counter shared by a parallel query's partitions so that max_num_rows applies to the whole query.
+    """
+
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+
+    def increment(self):
+        """
+        :return: the count after incrementing it
+        """
+        with self._lock:
+            self.count += 1
+            return self.count
+
+
+def _query_partitions(model_ids, timezero_ids, forecast_model_id_to_obj, timezero_id_to_obj, num_workers,
+                      partition_by):
+    """
+    query_forecasts_for_project() helper that splits a validated query into partitions that select disjoint sets of
+    prediction elements, splitting either its models or its timezeros. Empty ids (i.e., all of them) are first replaced
+    by all of the project's, excluding its oracle model. Ids are assigned round-robin in id order, which tends to
+    balance partitions because timezeros are usually created in date order and models accumulate forecasts similarly.
+
+    :param model_ids: validated model ids. empty means all
+    :param timezero_ids: validated timezero ids. "" all
+    :param num_workers: the maximum number of partitions
+    :param partition_by: PARTITION_BY_MODEL, PARTITION_BY_TIMEZERO, or None to split whichever has more ids
+    :return: a list of up to num_workers 2-tuples: (model_ids, timezero_ids)
+    """
+    if partition_by not in [None, PARTITION_BY_MODEL, PARTITION_BY_TIMEZERO]:
+        raise RuntimeError(f"invalid partition_by: {partition_by!r}")
+
+    model_ids = sorted(model_ids) if model_ids \
+        else sorted(model_id for model_id, forecast_model in forecast_model_id_to_obj.items()
+                    if not forecast_model.is_oracle)  # oracle excluded by _query_forecasts_sql_for_pred_class()
+    timezero_ids = sorted(timezero_ids) if timezero_ids else sorted(timezero_id_to_obj.keys())
+    if partition_by is None:
+        partition_by = PARTITION_BY_MODEL if len(model_ids) >= len(timezero_ids) else PARTITION_BY_TIMEZERO
+    split_ids = model_ids if partition_by == PARTITION_BY_MODEL else timezero_ids
+    num_partitions = min(num_workers, len(split_ids))
+    return [(split_ids[idx::num_partitions], timezero_ids) if partition_by == PARTITION_BY_MODEL
+            else (model_ids, split_ids[idx::num_partitions])
+            for idx in range(num_partitions)]
+
+
+def _query_forecasts_for_project_parallel(query_rows_fcn, partitions, num_workers, header=FORECAST_CSV_HEADER):
+    """
+    query_forecasts_for_project() helper that runs each of partitions in its own thread and then yields their rows
+    (after a single header) in partition order. Each thread has its own database connection, so partitions' SQL runs
+    concurrently, as does row generation to the extent that it's spent in the database driver. Each thread writes its
+    rows in pickled batches to a temporary file, which means that memory use does not depend on the number of rows, and
+    which keeps the rows' Python types. Threads are used rather than processes because a partition's time is mostly
+    spent waiting on the database, and because Django connections are per-thread.
+
+    :param query_rows_fcn: a function of (model_ids, timezero_ids, shared_row_count) that returns a row generator,
+        starting with the header
+    :param partitions: as returned by _query_partitions()
+    :param num_workers: the number of threads
+    :param header: the header row, which replaces the partitions' ones
+    """
+    shared_row_count = _SharedRowCount()
+    executor = ThreadPoolExecutor(max_workers=num_workers)
+    futures = []
+    try:
+        futures = [executor.submit(_query_partition_worker, query_rows_fcn, model_ids, timezero_ids, shared_row_count)
+                   for model_ids, timezero_ids in partitions]
+        yield header
+        for future in futures:
+            with future.result() as rows_file:  # raises the partition's error, if any, e.g., max_num_rows exceeded
+                while True:
+                    try:
+                        yield from pickle.load(rows_file)
+                    except EOFError:
+                        break
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in futures:  # close the temporary files of partitions that were not consumed
+            if future.done() and not future.cancelled() and not future.exception():
+                future.result().close()
+
+
+def _query_partition_worker(query_rows_fcn, model_ids, timezero_ids, shared_row_count):
+    """
+    _query_forecasts_for_project_parallel() thread function. Applies the same postgres timeouts as _run_query_job() to
+    this thread's connection, which is closed when done.
+
+    :return: a temporary file containing pickled lists of rows, positioned at its start
+    """
+    rows_file = tempfile.TemporaryFile()
+    try:
+        if connection.vendor == 'postgresql':
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL statement_timeout = '{QUERY_FORECAST_STATEMENT_TIMEOUT}s';")
+                cursor.execute(
+                    f"SET LOCAL idle_in_transaction_session_timeout = '{QUERY_FORECAST_STATEMENT_TIMEOUT}s';")
+                _write_partition_rows(query_rows_fcn(model_ids, timezero_ids, shared_row_count), rows_file)
+        else:
+            _write_partition_rows(query_rows_fcn(model_ids, timezero_ids, shared_row_count), rows_file)
+        rows_file.seek(0)
+        return rows_file
+    except Exception:
+        rows_file.close()
+        raise
+    finally:
+        connection.close()
+
+
+def _write_partition_rows(rows, rows_file):
+    next(rows)  # skip the header
+    while True:
+        rows_batch = list(islice(rows, PARTITION_BATCH_NUM_ROWS))
+        if not rows_batch:
+            break
+
+        pickle.dump(rows_batch, rows_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _incremented_num_rows(num_rows, max_num_rows, shared_row_count):
+    """
+    Counts a row, in shared_row_count if passed (for partitions of a parallel query) and o/w by incrementing num_rows.
+
+    :return: the incremented count
+    :raises RuntimeError: if the count exceeds max_num_rows
+    """
+    num_rows = shared_row_count.increment() if shared_row_count else num_rows + 1
+    if num_rows > max_num_rows:
+        raise RuntimeError(f"number of rows exceeded maximum. num_rows={num_rows}, max_num_rows={max_num_rows}")
+
+    return num_rows
+
+
 #
 # _query_forecasts_for_project_no_type_convert()
 #
@@ -124,33 +344,40 @@ def query_forecasts_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS)
 def _query_forecasts_for_project_no_type_convert(project, query, max_num_rows, model_ids, unit_ids, target_ids,
                                                  timezero_ids, type_ints, as_of, forecast_model_id_to_obj,
                                                  timezero_id_to_obj, unit_id_to_obj, target_id_to_obj,
-                                                 timezero_to_season_name):
+                                                 timezero_to_season_name, shared_row_count=None):
     """
     The query_forecasts_for_project() implementation for the case of no prediction type conversions. yields rows as
     documented in caller
+
+    :param shared_row_count: an optional _SharedRowCount to count rows in, for partitions of a parallel query
     """
-    yield FORECAST_CSV_HEADER
+    yield forecasts_query_header(query)
 
-    # get the SQL then execute and iterate over resulting data
-    sql = _query_forecasts_sql_for_pred_class(type_ints, model_ids, unit_ids, target_ids, timezero_ids, as_of, True)
+    # get the SQL then execute and iterate over resulting data. 'quantiles' and 'columns' are applied to JSON data in
+    # the database, and to packed data as it is decoded
+    quantiles, is_wide = query.get('quantiles'), query.get('wide', False)
+    sql = _query_forecasts_sql_for_pred_class(type_ints, model_ids, unit_ids, target_ids, timezero_ids, as_of, True,
+                                              quantiles=quantiles, columns=query.get('columns'))
     logger.debug(f"_query_forecasts_for_project_no_type_convert(): 1/2 executing sql. type_ints, model_ids, unit_ids, "
                  f"target_ids, timezero_ids, as_of= {type_ints}, {model_ids}, {unit_ids}, {target_ids}, "
                  f"{timezero_ids}, {as_of}")
     num_rows = 0
-    with connection.cursor() as cursor:
+    with streaming_cursor() as cursor:
         cursor.execute(sql, (project.pk,))
-        for fm_id, tz_id, pred_class, unit_id, target_id, is_retract, pred_data in batched_rows(cursor):
-            # we do not have to check is_retract b/c we pass `is_include_retract=False`, which skips retractions
-            num_rows += 1
-            if num_rows > max_num_rows:
-                raise RuntimeError(f"number of rows exceeded maximum. num_rows={num_rows}, "
-                                   f"max_num_rows={max_num_rows}")
-
-            # counterintuitively must use json.loads per https://code.djangoproject.com/ticket/31991
-            pred_data = json.loads(pred_data)
+        for fm_id, tz_id, pred_class, unit_id, target_id, is_retract, pred_data, pred_data_packed \
+                in batched_rows(cursor):
+            # we do not have to check is_retract b/c we pass `is_include_retract=False`, which skips retractions.
+            # wide queries have only quantile PEs, each of which is one row
+            num_rows = _incremented_num_rows(num_rows, max_num_rows, shared_row_count)
+
+            # decode selected quantiles' packed data as arrays so that only the selected items are converted to lists
+            is_packed_quantiles = (quantiles is not None) and (pred_class == PredictionElement.QUANTILE_CLASS) \
+                                  and (pred_data_packed is not None)
+            pred_data = _decoded_pred_data(pred_data, pred_data_packed, is_numpy=is_packed_quantiles)
             yield from _generate_query_rows_no_type_convert(fm_id, tz_id, unit_id, target_id, forecast_model_id_to_obj,
                                                             timezero_id_to_obj, unit_id_to_obj, target_id_to_obj,
-                                                            timezero_to_season_name, pred_class, pred_data)
+                                                            timezero_to_season_name, pred_class, pred_data, quantiles,
+                                                            is_wide, is_packed_quantiles)
 
     # done
     logger.debug(f"_query_forecasts_for_project_no_type_convert(): 2/2 done. num_rows={num_rows}, project={project}, "
@@ -159,20 +386,35 @@ def _query_forecasts_for_project_no_type_convert(project, query, max_num_rows, m
 
 def _generate_query_rows_no_type_convert(fm_id, tz_id, unit_id, target_id, forecast_model_id_to_obj, timezero_id_to_obj,
                                          unit_id_to_obj, target_id_to_obj, timezero_to_season_name, pred_class,
-                                         pred_data):
+                                         pred_data, quantiles=None, is_wide=False, is_select_quantiles=True):
     """
-    Helper that yields one or more CSV rows for the passed data.
+    Helper that yields one or more CSV rows for the passed data. pred_data can lack keys that the query's 'columns' do
+    not need (see _removed_pred_data_keys()), whose cells are then ''.
+
+    :param quantiles: an optional list of quantile levels to limit quantile rows to, as passed in a query's 'quantiles'
+    :param is_wide: True if the query is 'wide'. if so then yields one row in forecasts_query_header()'s format, with
+        quantiles' values taken directly from pred_data's arrays. requires quantiles. pred_class must be QUANTILE_CLASS
+    :param is_select_quantiles: False if pred_data's quantiles were already limited to quantiles in the database (see
+        _quantile_selected_data_sql()). o/w they are selected here
     """
     model_str, timezero_str, season, class_str = _model_tz_season_class_strs(
         forecast_model_id_to_obj[fm_id], timezero_id_to_obj[tz_id], timezero_to_season_name, pred_class)
+    if is_wide:
+        quantile_to_value = dict(_selected_quantile_values(pred_data, quantiles) if is_select_quantiles
+                                 else _zipped_pred_data_lists(pred_data, 'quantile', 'value'))
+        yield [model_str, timezero_str, season, unit_id_to_obj[unit_id].abbreviation,
+               target_id_to_obj[target_id].name] \
+            + [quantile_to_value.get(quantile, '') for quantile in sorted(quantiles)]
+        return
+
     value, cat, prob, sample, quantile, family, param1, param2, param3 = '', '', '', '', '', '', '', '', ''
     if pred_class == PredictionElement.BIN_CLASS:
-        for cat, prob in zip(pred_data['cat'], pred_data['prob']):
+        for cat, prob in _zipped_pred_data_lists(pred_data, 'cat', 'prob'):
             yield [model_str, timezero_str, season, unit_id_to_obj[unit_id].abbreviation,
                    target_id_to_obj[target_id].name, class_str,
                    value, cat, prob, sample, quantile, family, param1, param2, param3]
     elif pred_class == PredictionElement.NAMED_CLASS:
-        family = pred_data['family']
+        family = pred_data.get('family', '')
         param1 = pred_data.get('param1', '')
         param2 = pred_data.get('param2', '')
         param3 = pred_data.get('param3', '')
@@ -183,12 +425,14 @@ def _generate_query_rows_no_type_convert(fm_id, tz_id, unit_id, target_id, forec
           or (pred_class == PredictionElement.MEAN_CLASS)
           or (pred_class == PredictionElement.MEDIAN_CLASS)
           or (pred_class == PredictionElement.MODE_CLASS)):
-        value = pred_data['value']
+        value = pred_data.get('value', '')
         yield [model_str, timezero_str, season, unit_id_to_obj[unit_id].abbreviation,
                target_id_to_obj[target_id].name, class_str,
                value, cat, prob, sample, quantile, family, param1, param2, param3]
     elif pred_class == PredictionElement.QUANTILE_CLASS:
-        for quantile, value in zip(pred_data['quantile'], pred_data['value']):
+        for quantile, value in _selected_quantile_values(pred_data, quantiles) \
+                if (quantiles is not None) and is_select_quantiles \
+                else _zipped_pred_data_lists(pred_data, 'quantile', 'value'):
             yield [model_str, timezero_str, season, unit_id_to_obj[unit_id].abbreviation,
                    target_id_to_obj[target_id].name, class_str,
                    value, cat, prob, sample, quantile, family, param1, param2, param3]
@@ -199,16 +443,46 @@ def _generate_query_rows_no_type_convert(fm_id, tz_id, unit_id, target_id, forec
                    value, cat, prob, sample, quantile, family, param1, param2, param3]
 
 
+def _selected_quantile_values(pred_data, quantiles):
+    """
+    _generate_query_rows_no_type_convert() helper for data that was not selected in the database, i.e., packed data and
+    converted quantiles.
+
+    :param pred_data: a quantile prediction data dict. its lists can be numpy arrays (see unpacked_pred_data())
+    :param quantiles: a list of quantile levels to select
+    :return: a list of (quantile, value) 2-tuples for pred_data's quantiles that are in quantiles
+    """
+    selected_idxs = numpy.flatnonzero(numpy.isin(pred_data['quantile'], quantiles)).tolist()
+    return [(_item_as_python(pred_data['quantile'], idx), _item_as_python(pred_data['value'], idx))
+            for idx in selected_idxs]
+
+
+def _zipped_pred_data_lists(pred_data, key_1, key_2):
+    # zips two of pred_data's parallel lists. either can be missing if the query's 'columns' do not need it (see
+    # _removed_pred_data_keys()), in which case its cells are ''
+    values_1, values_2 = pred_data.get(key_1), pred_data.get(key_2)
+    return zip(values_1 if values_1 is not None else [''] * len(values_2),
+               values_2 if values_2 is not None else [''] * len(values_1))
+
+
+def _item_as_python(values, idx):
+    # returns a list's or numpy array's item at idx as a Python value, e.g., a numpy.float64 as a float
+    value = values[idx]
+    return value.item() if isinstance(value, numpy.generic) else value
+
+
 def _query_forecasts_sql_for_pred_class(pred_classes, model_ids, unit_ids, target_ids, timezero_ids, as_of,
-                                        is_exclude_oracle, is_include_retract=False, is_type_convert=False):
+                                        is_exclude_oracle, is_include_retract=False, is_type_convert=False,
+                                        quantiles=None, columns=None):
     """
     A `query_forecasts_for_project()` helper that returns an SQL query string based on my args that, when executed,
-    returns a list of 6-tuples or 7-tuples depending on `is_type_convert`:
-    - False: (forecast_model_id, timezero_id, pred_class, unit_id, target_id, is_retract, pred_data)
+    returns a list of 8-tuples or 6-tuples depending on `is_type_convert`:
+    - False: (forecast_model_id, timezero_id, pred_class, unit_id, target_id, is_retract, pred_data, pred_data_packed)
     - True: (forecast_model_id, timezero_id, unit_id, target_id, pred_ele_id, pred_class)
     where:
     - pred_class: PRED_CLASS_CHOICES int
-    - data: the stored json
+    - pred_data, pred_data_packed: the stored json and packed data, with json data limited by `quantiles` and `columns`.
+      pass to _decoded_pred_data()
 
     :param pred_classes: list of PredictionElement.PRED_CLASS_CHOICES to include or [] (includes all)
     :param model_ids: list of ForecastsModel IDs to include or None (includes all)
@@ -220,76 +494,181 @@ def _query_forecasts_sql_for_pred_class(pred_classes, model_ids, unit_ids, targe
     :param is_include_retract: as passed to query_forecasts_for_project()
     :param is_type_convert: a flag that indicates the caller is _query_forecasts_for_project_yes_type_convert(), which
         changes the query to ignore `pred_classes`, SELECT different columns, and do an ORDER BY
+    :param quantiles: optional list of quantile levels as passed in a query. see _selected_pred_data_sql()
+    :param columns: "" columns ""
     :return SQL to execute. returns columns as described above
     """
-    # about the query: the ranked_rows CTE groups prediction elements and then ranks them in issued_at order, which
-    # implements our masking (newer issued_ats mask older ones) and merging (discarded duplicates are merged back in
-    # via previous versions) search semantics. it is crucial that the CTE /not/ include is_retract b/c that's how
-    # retractions are implemented: they are ranked higher than the prediction elements they mask if they're newer.
-    # retracted ones are optionally removed in the outer query. the outer query's LEFT JOIN is to cover retractions,
-    # which do not have prediction data.
+    # about the query: it selects the prediction elements that are the newest in issued_at order when grouped by (model,
+    # timezero, unit, target, pred_class), which implements our masking (newer issued_ats mask older ones) and merging
+    # (discarded duplicates are merged back in via previous versions) search semantics. those are found in advance: with
+    # no as_of, LatestPredictionElement has exactly the newest rows. with an as_of, they are the ones whose validity
+    # interval [issued_at, valid_to) contains it (see PredictionElement.valid_to). it is crucial that neither /not/
+    # exclude retractions b/c that's how they are implemented: they mask the prediction elements before them. retracted
+    # ones are optionally removed afterwards. the LEFT JOINs are to cover retractions, which do not have prediction
+    # data, and the two ways that data can be stored (see _pred_data_join_sql()).
+    is_latest = as_of is None
+    pred_ele_table = 'latest' if is_latest else 'pred_ele'  # the table to filter on. the former's columns are indexed
+    fm_id_column, tz_id_column = ('latest.forecast_model_id', 'latest.time_zero_id') if is_latest \
+        else ('f.forecast_model_id', 'f.time_zero_id')
     and_oracle = f"AND NOT fm.is_oracle" if is_exclude_oracle else ""
     and_model_ids = f"AND fm.id IN ({', '.join(map(str, model_ids))})" if model_ids else ""
     and_pred_classes = "" if (is_type_convert or not pred_classes) else \
-        f"AND pred_ele.pred_class IN ({', '.join(map(str, pred_classes))})"
-    and_unit_ids = f"AND pred_ele.unit_id IN ({', '.join(map(str, unit_ids))})" if unit_ids else ""
-    and_target_ids = f"AND pred_ele.target_id IN ({', '.join(map(str, target_ids))})" if target_ids else ""
-    and_timezero_ids = f"AND f.time_zero_id IN ({', '.join(map(str, timezero_ids))})" if timezero_ids else ""
-    and_is_retract = "" if is_include_retract else "AND NOT ranked_rows.is_retract"
+        f"AND {pred_ele_table}.pred_class IN ({', '.join(map(str, pred_classes))})"
+    and_unit_ids = f"AND {pred_ele_table}.unit_id IN ({', '.join(map(str, unit_ids))})" if unit_ids else ""
+    and_target_ids = f"AND {pred_ele_table}.target_id IN ({', '.join(map(str, target_ids))})" if target_ids else ""
+    and_timezero_ids = f"AND {tz_id_column} IN ({', '.join(map(str, timezero_ids))})" if timezero_ids else ""
+    and_is_retract = "" if is_include_retract else "AND NOT pred_ele.is_retract"
 
     # set and_issued_at. NB: `as_of.isoformat()` (e.g., '2021-05-05T16:11:47.302099+00:00') works with postgres but not
     # sqlite. however, the default str ('2021-05-05 16:11:47.302099+00:00') works with both
-    and_issued_at = f"AND f.issued_at <= '{as_of}'" if as_of else ""
+    and_issued_at = f"AND f.issued_at <= '{as_of}' AND (pred_ele.valid_to IS NULL OR pred_ele.valid_to > '{as_of}')" \
+        if as_of else ""
 
-    # set select_from and order_by
+    # set select, pred_data_joins, and order_by
     if is_type_convert:
-        select_from = f"""SELECT ranked_rows.fm_id        AS fm_id,
-                                 ranked_rows.tz_id        AS tz_id,
-                                 ranked_rows.unit_id      AS unit_id,
-                                 ranked_rows.target_id    AS target_id,
-                                 ranked_rows.pred_ele_id  AS pred_ele_id,
-                                 ranked_rows.pred_class   AS pred_class
-                          FROM ranked_rows"""
-        order_by = f"""ORDER BY ranked_rows.fm_id, ranked_rows.tz_id, ranked_rows.unit_id, ranked_rows.target_id"""
+        select = f"""SELECT {fm_id_column}        AS fm_id,
+                            {tz_id_column}        AS tz_id,
+                            pred_ele.unit_id      AS unit_id,
+                            pred_ele.target_id    AS target_id,
+                            pred_ele.id           AS pred_ele_id,
+                            pred_ele.pred_class   AS pred_class"""
+        pred_data_joins = ""
+        order_by = f"ORDER BY {fm_id_column}, {tz_id_column}, pred_ele.unit_id, pred_ele.target_id"
     else:  # not is_type_convert
-        select_from = f"""SELECT ranked_rows.fm_id       AS fm_id,
-                                 ranked_rows.tz_id       AS tz_id,
-                                 ranked_rows.pred_class  AS pred_class,
-                                 ranked_rows.unit_id     AS unit_id,
-                                 ranked_rows.target_id   AS target_id,
-                                 ranked_rows.is_retract  AS is_retract,
-                                 pred_data.data          AS pred_data
-                          FROM ranked_rows
-                                   LEFT JOIN {PredictionData._meta.db_table} AS pred_data
-                                       ON ranked_rows.pred_ele_id = pred_data.pred_ele_id"""
+        data_column, packed_column, pred_data_joins = _pred_data_join_sql('pred_ele.id', 'pred_ele.data_hash')
+        data_column = _selected_pred_data_sql(data_column, packed_column, 'pred_ele.pred_class', quantiles, columns)
+        select = f"""SELECT {fm_id_column}       AS fm_id,
+                            {tz_id_column}       AS tz_id,
+                            pred_ele.pred_class  AS pred_class,
+                            pred_ele.unit_id     AS unit_id,
+                            pred_ele.target_id   AS target_id,
+                            pred_ele.is_retract  AS is_retract,
+                            {data_column}        AS pred_data,
+                            {packed_column}      AS pred_data_packed"""
         order_by = ""
 
-    sql = f"""
-        WITH ranked_rows AS (
-            SELECT f.forecast_model_id  AS fm_id,
-                   f.time_zero_id       AS tz_id,
-                   pred_ele.id          AS pred_ele_id,
-                   pred_ele.pred_class  AS pred_class,
-                   pred_ele.unit_id     AS unit_id,
-                   pred_ele.target_id   AS target_id,
-                   pred_ele.is_retract  AS is_retract,
-                   RANK() OVER (
-                       PARTITION BY fm.id, f.time_zero_id, pred_ele.unit_id, pred_ele.target_id, pred_ele.pred_class
-                       ORDER BY f.issued_at DESC) AS rownum
+    if is_latest:
+        from_sql = f"""
+            FROM {LatestPredictionElement._meta.db_table} AS latest
+                     JOIN {PredictionElement._meta.db_table} AS pred_ele ON latest.pred_ele_id = pred_ele.id
+                     JOIN {ForecastModel._meta.db_table} AS fm on latest.forecast_model_id = fm.id
+        """
+    else:
+        from_sql = f"""
             FROM {PredictionElement._meta.db_table} AS pred_ele
-                             JOIN {Forecast._meta.db_table} AS f
-            ON pred_ele.forecast_id = f.id
-                JOIN {ForecastModel._meta.db_table} AS fm on f.forecast_model_id = fm.id
-            WHERE fm.project_id = %s
-                {and_oracle} {and_model_ids} {and_pred_classes} {and_unit_ids} {and_target_ids} {and_timezero_ids} {and_issued_at}
-        )
-        {select_from}
-        WHERE ranked_rows.rownum = 1 {and_is_retract}
+                     JOIN {Forecast._meta.db_table} AS f ON pred_ele.forecast_id = f.id
+                     JOIN {ForecastModel._meta.db_table} AS fm on f.forecast_model_id = fm.id
+        """
+    sql = f"""
+        {select}
+        {from_sql}
+            {pred_data_joins}
+        WHERE fm.project_id = %s
+            {and_oracle} {and_model_ids} {and_pred_classes} {and_unit_ids} {and_target_ids} {and_timezero_ids}
+            {and_issued_at} {and_is_retract}
         {order_by};
     """
     return sql
 
 
+def _pred_data_join_sql(pred_ele_id_column, data_hash_column):
+    """
+    Returns SQL that gets prediction elements' data regardless of whether it's stored in PredictionData or
+    HashedPredictionData. A PredictionElement's HashedPredictionData is used only if it has no PredictionData.
+
+    :param pred_ele_id_column: the qualified name of the column containing PredictionElement ids, e.g., 'pred_ele.id'
+    :param data_hash_column: "" PredictionElement data_hashes
+    :return: a 3-tuple: (data_column, packed_column, pred_data_joins) where data_column and packed_column are
+        expressions for the stored json and packed data (both NULL for retractions, and the latter NULL if nothing was
+        packed), and pred_data_joins is the LEFT JOINs that they require. see _decoded_pred_data()
+    """
+    data_column = "COALESCE(pred_data.data, hashed_pred_data.data)"
+    packed_column = "COALESCE(pred_data.packed, hashed_pred_data.packed)"
+    pred_data_joins = f"""LEFT JOIN {PredictionData._meta.db_table} AS pred_data
+                            ON {pred_ele_id_column} = pred_data.pred_ele_id
+                        LEFT JOIN {HashedPredictionData._meta.db_table} AS hashed_pred_data
+                            ON pred_data.pred_ele_id IS NULL AND {data_hash_column} = hashed_pred_data.data_hash"""
+    return data_column, packed_column, pred_data_joins
+
+
+def _selected_pred_data_sql(data_column, packed_column, pred_class_column, quantiles, columns):
+    """
+    Returns an SQL expression that limits the json data in data_column to what a query's 'quantiles' and 'columns'
+    need, so that unneeded data is neither transferred nor decoded. Packed data (see packed_pred_data()) cannot be
+    limited in SQL, so packed quantiles are selected as they are decoded (see _selected_quantile_values()), and
+    packed keys are never removed.
+
+    :param data_column: as returned by _pred_data_join_sql()
+    :param packed_column: ""
+    :param pred_class_column: the qualified name of the column containing PredictionElement pred_classes
+    :param quantiles: optional list of quantile levels as passed in a query. if passed then quantile data's 'quantile'
+        and 'value' lists are limited to the ones at those levels, in stored order
+    :param columns: optional list of column names as passed in a query. if passed then data keys that none of them
+        need are removed (see _removed_pred_data_keys())
+    :return: data_column if neither quantiles nor columns is passed
+    """
+    selected_data_column = data_column
+    if quantiles is not None:
+        quantile_data_sql = _quantile_selected_data_sql(data_column, quantiles)
+        selected_data_column = f"CASE WHEN {pred_class_column} = {PredictionElement.QUANTILE_CLASS} " \
+                               f"AND {packed_column} IS NULL AND {data_column} IS NOT NULL " \
+                               f"THEN {quantile_data_sql} ELSE {data_column} END"
+    removed_keys = _removed_pred_data_keys(columns) if columns is not None else []
+    if removed_keys:
+        if connection.vendor == 'postgresql':
+            keys_sql = ', '.join(f"'{key}'" for key in removed_keys)
+            selected_data_column = f"(({selected_data_column}) - ARRAY[{keys_sql}]::text[])"
+        else:  # 'sqlite', etc.
+            paths_sql = ', '.join(f"'$.{key}'" for key in removed_keys)
+            selected_data_column = f"json_remove({selected_data_column}, {paths_sql})"
+    return selected_data_column
+
+
+def _quantile_selected_data_sql(data_column, quantiles):
+    # returns an SQL expression for data_column's quantile data that has only the quantile/value pairs at quantiles.
+    # levels are compared numerically so that, e.g., a stored 0.5 matches a requested 0.50
+    levels_sql = ', '.join(repr(float(quantile)) for quantile in quantiles)
+    if connection.vendor == 'postgresql':
+        return f"""(SELECT jsonb_build_object(
+                               'quantile', COALESCE(jsonb_agg(q.level ORDER BY q.idx), '[]'::jsonb),
+                               'value', COALESCE(jsonb_agg({data_column} -> 'value' -> (q.idx - 1)::int
+                                                           ORDER BY q.idx), '[]'::jsonb))
+                    FROM jsonb_array_elements({data_column} -> 'quantile') WITH ORDINALITY AS q(level, idx)
+                    WHERE q.level::numeric IN ({levels_sql}))"""
+    else:  # 'sqlite', etc. json_each() iterates in array order
+        return f"""(SELECT json_object(
+                               'quantile', json_group_array(q.value),
+                               'value', json_group_array(json_extract({data_column}, '$.value[' || q.key || ']')))
+                    FROM json_each({data_column}, '$.quantile') AS q
+                    WHERE q.value IN ({levels_sql}))"""
+
+
+def _removed_pred_data_keys(columns):
+    """
+    :param columns: a list of column names as passed in a query
+    :return: a sorted list of the prediction data keys that no column in columns needs. 'sample' is never removed, and
+        one of each of the bin ('cat', 'prob') and quantile ('quantile', 'value') list pairs is always kept because
+        those determine the number of rows
+    """
+    removed_keys = {'value', 'cat', 'prob', 'quantile', 'family', 'param1', 'param2', 'param3'} - set(columns)
+    if {'cat', 'prob'} <= removed_keys:
+        removed_keys.remove('cat')
+    if {'quantile', 'value'} <= removed_keys:
+        removed_keys.remove('quantile')
+    return sorted(removed_keys)
+
+
+def _decoded_pred_data(pred_data, pred_data_packed, is_numpy=False):
+    """
+    :param pred_data: a row's data_column value as returned by _pred_data_join_sql()
+    :param pred_data_packed: "" packed_column ""
+    :param is_numpy: passed to unpacked_pred_data()
+    :return: the prediction data dict
+    """
+    # counterintuitively must use json.loads per https://code.djangoproject.com/ticket/31991
+    return unpacked_pred_data(json.loads(pred_data), pred_data_packed, is_numpy)
+
+
 def _model_tz_season_class_strs(forecast_model, time_zero, timezero_to_season_name, class_int):
     from utils.forecast import PRED_CLASS_INT_TO_NAME  # avoid circular imports
 
@@ -331,7 +710,8 @@ def validate_forecasts_query(project, query):
 
     # validate keys
     actual_keys = set(query.keys())
-    expected_keys = {'models', 'units', 'targets', 'timezeros', 'types', 'as_of', 'options'}
+    expected_keys = {'models', 'units', 'targets', 'timezeros', 'types', 'as_of', 'quantiles', 'columns', 'wide',
+                     'options', 'output_format'}
     if not (actual_keys <= expected_keys):
         error_messages.append(f"one or more query keys were invalid. query={query}, actual_keys={actual_keys}, "
                               f"expected_keys={expected_keys}")
@@ -344,6 +724,39 @@ def validate_forecasts_query(project, query):
         error_messages.append(error_message)
         return [error_messages, (model_ids, unit_ids, target_ids, timezero_ids, types, as_of)]
 
+    # validate `output_format` if passed
+    error_message = validate_output_format(query)
+    if error_message:
+        error_messages.append(error_message)
+        return [error_messages, (model_ids, unit_ids, target_ids, timezero_ids, types, as_of)]
+
+    # validate `quantiles` and `columns` if passed
+    if 'quantiles' in query:
+        try:
+            _validate_quantile_list(query['quantiles'])
+        except RuntimeError as rte:
+            error_messages.append(rte.args[0])
+            return [error_messages, (model_ids, unit_ids, target_ids, timezero_ids, types, as_of)]
+
+    if 'columns' in query:
+        columns = query['columns']
+        if (not isinstance(columns, list)) or (not columns) or (len(set(columns)) != len(columns)) \
+                or not (set(columns) <= set(FORECAST_CSV_HEADER)):
+            error_messages.append(f"'columns' was not a non-empty list of unique column names. columns={columns}, "
+                                  f"valid columns={FORECAST_CSV_HEADER}, query={query}")
+            return [error_messages, (model_ids, unit_ids, target_ids, timezero_ids, types, as_of)]
+
+    # validate `wide` if passed
+    if 'wide' in query:
+        if not isinstance(query['wide'], bool):
+            error_messages.append(f"'wide' was not a boolean. wide={query['wide']}, query={query}")
+            return [error_messages, (model_ids, unit_ids, target_ids, timezero_ids, types, as_of)]
+        elif query['wide'] and (('quantiles' not in query) or ('columns' in query)
+                                or (query.get('types', ['quantile']) != ['quantile'])):
+            error_messages.append(f"'wide' queries require 'quantiles', do not allow 'columns', and only allow "
+                                  f"['quantile'] 'types'. query={query}")
+            return [error_messages, (model_ids, unit_ids, target_ids, timezero_ids, types, as_of)]
+
     # validate `options` if passed
     if 'options' in query:
         options = query['options']
@@ -416,6 +829,15 @@ def validate_forecasts_query(project, query):
 
         types = [PRED_CLASS_NAME_TO_INT[class_name] for class_name in types]
 
+    # validate that wide columnar queries' quantile columns can be float64, i.e., that no date targets are included
+    if (not error_messages) and query.get('wide') \
+            and (query_output_format(query) in [OUTPUT_FORMAT_PARQUET, OUTPUT_FORMAT_ARROW]):
+        targets_qs = project.targets.filter(pk__in=target_ids) if target_ids else project.targets.all()
+        date_target_names = list(targets_qs.filter(type=Target.DATE_TARGET_TYPE).values_list('name', flat=True))
+        if date_target_names:
+            error_messages.append(f"'wide' {query_output_format(query)!r} queries cannot include date targets. "
+                                  f"date targets={date_target_names}, query={query}")
+
     # done (may or may not be valid)
     return [error_messages, (model_ids, unit_ids, target_ids, timezero_ids, types, as_of)]
 
@@ -448,17 +870,33 @@ def _validate_as_of(query):
 # _query_forecasts_for_project_yes_type_convert()
 #
 
+# the number of sample and named prediction elements that _query_forecasts_for_project_yes_type_convert() collects
+# before converting them together. bounds the memory used by a batch's samples
+SAMPLE_CONVERSION_BATCH_SIZE = 10_000
+
+# the maximum number of values in an array of samples that _generate_query_rows_yes_type_convert() converts at once.
+# bounds the memory used by samples drawn from named distributions
+MAX_CONVERSION_ARRAY_SIZE = 2_000_000
+
+# the number of samples drawn from a named distribution to estimate conversions that have no closed form, and the seed
+# for drawing them. see _converted_named()
+NAMED_CONVERSION_NUM_SAMPLES = 10_000
+
+NAMED_CONVERSION_SEED = 42
+
+
 def _query_forecasts_for_project_yes_type_convert(project, query, max_num_rows, model_ids, unit_ids, target_ids,
                                                   timezero_ids, type_ints, as_of, forecast_model_id_to_obj,
                                                   timezero_id_to_obj, unit_id_to_obj, target_id_to_obj,
-                                                  timezero_to_season_name, query_options):
+                                                  timezero_to_season_name, query_options, shared_row_count=None):
     """
     The query_forecasts_for_project() implementation for the case of prediction type conversions. yields rows as
     documented in caller. Unlike _query_forecasts_for_project_no_type_convert(), this implementation requires two
     queries: one to get all prediction element (PE) rows that match all constraints in `query` EXCEPT type_ints, then
-    second to get those PEs' data. It unsurprisingly ends up being slower than the no-convert implementation.
+    second to get those PEs' data. It unsurprisingly ends up being slower than the no-convert implementation. Rows are
+    counted as PEs in the first query, except for wide queries, which count the PEs that are output, i.e., wide rows.
     """
-    yield FORECAST_CSV_HEADER
+    yield forecasts_query_header(query)
 
     # get PE rows that match all constraints in `query` EXCEPT type_ints. these are candidate rows for the final
     # prediction data query. we analyze by grouping all PEs for a particular combination of (fm_id, tz_id, unit_id,
@@ -467,12 +905,16 @@ def _query_forecasts_for_project_yes_type_convert(project, query, max_num_rows,
     # OR b) is a valid "source" that can generate the requested destination. recall that validation of `query` requires
     # that it includes `types` to be valid if there are any `options`
     pe_id_dst_pred_classes = []  # 2-tuples: (pe_id, dst_pred_class). filled next
+    target_id_to_cats = {target.pk: sorted(target.cats_values()) for target in target_id_to_obj.values()
+                         if target.type in [Target.CONTINUOUS_TARGET_TYPE, Target.DISCRETE_TARGET_TYPE]} \
+        if query_options.get('convert.bin') else {}  # for bin conversions
     sql = _query_forecasts_sql_for_pred_class(type_ints, model_ids, unit_ids, target_ids, timezero_ids, as_of, True,
                                               is_type_convert=True)
     logger.debug(f"_query_forecasts_for_project_yes_type_convert(): 1/4 getting filtered PEs. model_ids, unit_ids, "
                  f"target_ids, timezero_ids, as_of= {model_ids}, {unit_ids}, {target_ids}, {timezero_ids}, {as_of}")
+    is_wide = query.get('wide', False)
     num_rows = 0
-    with connection.cursor() as cursor:
+    with streaming_cursor() as cursor:
         cursor.execute(sql, (project.pk,))
         for (fm_id, tz_id, unit_id, target_id), pe_id_class_grouper in \
                 groupby(batched_rows(cursor), key=lambda _: (_[0], _[1], _[2], _[3])):
@@ -481,52 +923,36 @@ def _query_forecasts_for_project_yes_type_convert(project, query, max_num_rows,
             # counting rows. we need the former to decide which PEs to get data for in the second loop. conveniently we
             # can index directly into it using src_pred_class (PRED_CLASS_CHOICES) - we know there's only one prediction
             # of a particular type per group.
-            # NB: todo currently we only support: 1) target types: continuous, discrete. 2) conversions: P <- S
+            # NB: todo currently we only support: 1) target types: continuous, discrete. 2) conversions from samples and
+            # named distributions (see _is_type_conversion())
             src_bnpsqmmm_ids = [None, None, None, None, None, None, None, None]  # PRED_CLASS_CHOICES order
 
             # pass 1/2: collect available ("source") PE types:
             for _, _, _, _, pe_id, src_pred_class in pe_id_class_grouper:
-                num_rows += 1
-                if num_rows > max_num_rows:
-                    raise RuntimeError(f"number of rows exceeded maximum. num_rows={num_rows}, "
-                                       f"max_num_rows={max_num_rows}")
-
+                if not is_wide:
+                    num_rows = _incremented_num_rows(num_rows, max_num_rows, shared_row_count)
                 src_bnpsqmmm_ids[src_pred_class] = pe_id
 
             # pass 2/2: loop over requested ("destination") PE types. expand type_ints [] to all if nec. check if we
-            # can convert. NB: these elifs must match those in `_generate_query_rows_yes_type_convert()`
+            # can convert, preferring samples to named distributions as the source b/c they're the model's own. named
+            # distributions are only converted to types that are explicitly requested
             for dst_pred_class in list(PRED_CLASS_INT_TO_NAME.keys()) if not type_ints else type_ints:
                 if src_bnpsqmmm_ids[dst_pred_class] is not None:
                     # we have the requested type - no conversion needed
                     pe_id_dst_pred_classes.append((src_bnpsqmmm_ids[dst_pred_class], dst_pred_class))
-                elif (target_id_to_obj[target_id].type in [Target.CONTINUOUS_TARGET_TYPE,
-                                                           Target.DISCRETE_TARGET_TYPE]) \
-                        and (src_bnpsqmmm_ids[PredictionElement.SAMPLE_CLASS] is not None) \
-                        and (dst_pred_class == PredictionElement.POINT_CLASS) \
-                        and ('convert.point' in query_options):
-                    # sample -> point
-                    pe_id_dst_pred_classes.append((src_bnpsqmmm_ids[PredictionElement.SAMPLE_CLASS], dst_pred_class))
-                elif (target_id_to_obj[target_id].type in [Target.CONTINUOUS_TARGET_TYPE,
-                                                           Target.DISCRETE_TARGET_TYPE]) \
-                        and (src_bnpsqmmm_ids[PredictionElement.SAMPLE_CLASS] is not None) \
-                        and (dst_pred_class == PredictionElement.MEAN_CLASS) \
-                        and ('convert.mean' in query_options):
-                    # sample -> mean
-                    pe_id_dst_pred_classes.append((src_bnpsqmmm_ids[PredictionElement.SAMPLE_CLASS], dst_pred_class))
-                elif (target_id_to_obj[target_id].type in [Target.CONTINUOUS_TARGET_TYPE,
-                                                           Target.DISCRETE_TARGET_TYPE]) \
-                        and (src_bnpsqmmm_ids[PredictionElement.SAMPLE_CLASS] is not None) \
-                        and (dst_pred_class == PredictionElement.MEDIAN_CLASS) \
-                        and ('convert.median' in query_options):
-                    # sample -> median
-                    pe_id_dst_pred_classes.append((src_bnpsqmmm_ids[PredictionElement.SAMPLE_CLASS], dst_pred_class))
-                elif (target_id_to_obj[target_id].type in [Target.CONTINUOUS_TARGET_TYPE,
-                                                           Target.DISCRETE_TARGET_TYPE]) \
-                        and (src_bnpsqmmm_ids[PredictionElement.SAMPLE_CLASS] is not None) \
-                        and (dst_pred_class == PredictionElement.QUANTILE_CLASS) \
-                        and ('convert.quantile' in query_options):
-                    # sample -> quantile
-                    pe_id_dst_pred_classes.append((src_bnpsqmmm_ids[PredictionElement.SAMPLE_CLASS], dst_pred_class))
+                    if is_wide:
+                        num_rows = _incremented_num_rows(num_rows, max_num_rows, shared_row_count)
+                    continue
+
+                for src_pred_class in [PredictionElement.SAMPLE_CLASS, PredictionElement.NAMED_CLASS] \
+                        if dst_pred_class in type_ints else [PredictionElement.SAMPLE_CLASS]:
+                    if (src_bnpsqmmm_ids[src_pred_class] is not None) \
+                            and _is_type_conversion(target_id_to_obj[target_id], target_id_to_cats.get(target_id),
+                                                    src_pred_class, dst_pred_class, query_options):
+                        pe_id_dst_pred_classes.append((src_bnpsqmmm_ids[src_pred_class], dst_pred_class))
+                        if is_wide:
+                            num_rows = _incremented_num_rows(num_rows, max_num_rows, shared_row_count)
+                        break
 
     # insert the PE rows (pe_id_dst_pred_classes) into a TEMP TABLE for the final JOIN. we use the same insert method as
     # in `_insert_pred_ele_rows()`: dispatch based on vendor
@@ -557,88 +983,281 @@ def _query_forecasts_for_project_yes_type_convert(project, query, max_num_rows,
 
     # JOIN temp table with PredictionData to get the final CSV-ready rows
     logger.debug(f"_query_forecasts_for_project_yes_type_convert(): 3/4 getting final PEs with data")
+    # unconverted PEs' data is limited by 'quantiles' and 'columns' as in the no-convert case. conversions' sources need
+    # all of theirs
+    data_column, packed_column, pred_data_joins = _pred_data_join_sql('pred_ele.id', 'pred_ele.data_hash')
+    quantiles = query.get('quantiles')
+    selected_data_column = _selected_pred_data_sql(data_column, packed_column, 'pred_ele.pred_class', quantiles,
+                                                   query.get('columns'))
+    if selected_data_column != data_column:
+        data_column = f"CASE WHEN pred_ele.pred_class = {temp_table_name}.dst_class " \
+                      f"THEN {selected_data_column} ELSE {data_column} END"
     sql = f"""
         SELECT f.forecast_model_id          AS fm_id,
                f.time_zero_id               AS tz_id,
                pred_ele.unit_id             AS unit_id,
                pred_ele.target_id           AS target_id,
                pred_ele.pred_class          AS pred_class,
-               pred_data.data               AS pred_data,
+               {data_column}                AS pred_data,
+               {packed_column}              AS pred_data_packed,
                {temp_table_name}.dst_class  AS dst_class
         FROM {temp_table_name}
                  JOIN {PredictionElement._meta.db_table} AS pred_ele
                      ON {temp_table_name}.pe_id = pred_ele.id
-                 JOIN {PredictionData._meta.db_table} AS pred_data
-                     ON pred_ele.id = pred_data.pred_ele_id
+                 {pred_data_joins}
                  JOIN {Forecast._meta.db_table} AS f
                      ON pred_ele.forecast_id = f.id
         WHERE pred_ele.id IN (SELECT pe_id FROM {temp_table_name});
     """
-    with connection.cursor() as cursor:
+    # conversions are batched so that each batch's samples can be converted with a few vectorized numpy calls rather
+    # than one or more calls per prediction element. converted rows are therefore yielded after unconverted ones
+    # 7-tuples: (fm_id, tz_id, unit_id, target_id, src_class, dst_class, pred_data). converted when full
+    conversions = []
+    with streaming_cursor() as cursor:
         cursor.execute(sql)
-        for fm_id, tz_id, unit_id, target_id, pred_class, pred_data, dst_class in batched_rows(cursor):
-            # counterintuitively must use json.loads per https://code.djangoproject.com/ticket/31991
-            pred_data = json.loads(pred_data)
+        for fm_id, tz_id, unit_id, target_id, pred_class, pred_data, pred_data_packed, dst_class \
+                in batched_rows(cursor):
             if pred_class == dst_class:  # no conversion needed
+                is_packed_quantiles = (quantiles is not None) and (pred_class == PredictionElement.QUANTILE_CLASS) \
+                                      and (pred_data_packed is not None)
+                pred_data = _decoded_pred_data(pred_data, pred_data_packed, is_numpy=is_packed_quantiles)
                 yield from _generate_query_rows_no_type_convert(
                     fm_id, tz_id, unit_id, target_id, forecast_model_id_to_obj, timezero_id_to_obj, unit_id_to_obj,
-                    target_id_to_obj, timezero_to_season_name, pred_class, pred_data)
-            else:  # need to convert FROM pred_class ("source") TO dst_class ("destination")
-                yield from _generate_query_rows_yes_type_convert(
-                    fm_id, tz_id, unit_id, target_id, forecast_model_id_to_obj, timezero_id_to_obj, unit_id_to_obj,
-                    target_id_to_obj, timezero_to_season_name, pred_class, pred_data, dst_class, query_options)
+                    target_id_to_obj, timezero_to_season_name, pred_class, pred_data, quantiles, is_wide,
+                    is_packed_quantiles)
+            elif _is_type_conversion(target_id_to_obj[target_id], target_id_to_cats.get(target_id), pred_class,
+                                     dst_class, query_options):
+                # need to convert FROM pred_class ("source") TO dst_class ("destination")
+                pred_data = _decoded_pred_data(pred_data, pred_data_packed, is_numpy=True)
+                conversions.append((fm_id, tz_id, unit_id, target_id, pred_class, dst_class, pred_data))
+                if len(conversions) >= SAMPLE_CONVERSION_BATCH_SIZE:
+                    yield from _generate_query_rows_yes_type_convert(
+                        conversions, forecast_model_id_to_obj, timezero_id_to_obj, unit_id_to_obj, target_id_to_obj,
+                        timezero_to_season_name, target_id_to_cats, query_options, quantiles, is_wide)
+                    conversions = []
+    yield from _generate_query_rows_yes_type_convert(
+        conversions, forecast_model_id_to_obj, timezero_id_to_obj, unit_id_to_obj, target_id_to_obj,
+        timezero_to_season_name, target_id_to_cats, query_options, quantiles, is_wide)
 
     logger.debug(f"_query_forecasts_for_project_yes_type_convert(): 4/4 done. num_rows={num_rows}, project={project}, "
                  f"query={query}")
 
 
-def _generate_query_rows_yes_type_convert(fm_id, tz_id, unit_id, target_id, forecast_model_id_to_obj,
-                                          timezero_id_to_obj, unit_id_to_obj, target_id_to_obj, timezero_to_season_name,
-                                          src_pred_class, pred_data, dst_pred_class, query_options):
-    """
-    A _query_forecasts_for_project_yes_type_convert() helper that converts FROM src_pred_class ("source") TO
-    dst_pred_class ("destination"), using _generate_query_rows_no_type_convert() for the final yield. Factors in the
-    prediction element's Target type. NB: this function's logic must match the elifs in
-    `_query_forecasts_for_project_yes_type_convert()`.
-    """
-    target = target_id_to_obj[target_id]
-    out_pred_data = None  # for now we use None to indicate unimplemented. todo implement others
-    if (target.type in [Target.CONTINUOUS_TARGET_TYPE, Target.DISCRETE_TARGET_TYPE]) \
-            and (src_pred_class == PredictionElement.SAMPLE_CLASS) \
-            and (dst_pred_class == PredictionElement.POINT_CLASS) \
-            and ('convert.point' in query_options):
-        # sample -> point
-        samples = pred_data['sample']
-        out_pred_data = {"value": statistics.mean(samples)} if query_options['convert.point'] == 'mean' \
-            else {"value": statistics.median(samples)}
-    elif (target.type in [Target.CONTINUOUS_TARGET_TYPE, Target.DISCRETE_TARGET_TYPE]) \
-            and (src_pred_class == PredictionElement.SAMPLE_CLASS) \
-            and (dst_pred_class == PredictionElement.MEAN_CLASS) \
-            and ('convert.mean' in query_options):
-        # sample -> mean
-        samples = pred_data['sample']
-        out_pred_data = {"value": statistics.mean(samples)}
-    elif (target.type in [Target.CONTINUOUS_TARGET_TYPE, Target.DISCRETE_TARGET_TYPE]) \
-            and (src_pred_class == PredictionElement.SAMPLE_CLASS) \
-            and (dst_pred_class == PredictionElement.MEDIAN_CLASS) \
-            and ('convert.median' in query_options):
-        # sample -> median
-        samples = pred_data['sample']
-        out_pred_data = {"value": statistics.median(samples)}
-    elif (target.type in [Target.CONTINUOUS_TARGET_TYPE, Target.DISCRETE_TARGET_TYPE]) \
-            and (src_pred_class == PredictionElement.SAMPLE_CLASS) \
-            and (dst_pred_class == PredictionElement.QUANTILE_CLASS) \
-            and ('convert.quantile' in query_options):
-        # sample -> quantile
-        samples = pred_data['sample']
+def _is_type_conversion(target, target_cats, src_pred_class, dst_pred_class, query_options):
+    """
+    :param target: the prediction element's Target
+    :param target_cats: target's sorted cats. only needed for bin conversions
+    :return: True if query_options requests converting a src_pred_class prediction element of target to
+        dst_pred_class, and we support it. NB: todo currently we only support: 1) target types: continuous, discrete.
+        2) conversions from samples and named distributions, as documented in query_forecasts_for_project()
+    """
+    if (target.type not in [Target.CONTINUOUS_TARGET_TYPE, Target.DISCRETE_TARGET_TYPE]) \
+            or (src_pred_class not in [PredictionElement.SAMPLE_CLASS, PredictionElement.NAMED_CLASS]):
+        return False
+    elif dst_pred_class == PredictionElement.BIN_CLASS:  # todo samples -> bin
+        return (src_pred_class == PredictionElement.NAMED_CLASS) and bool(query_options.get('convert.bin')) \
+            and bool(target_cats)
+    elif dst_pred_class == PredictionElement.SAMPLE_CLASS:
+        return (src_pred_class == PredictionElement.NAMED_CLASS) and ('convert.sample' in query_options)
+    else:
+        return ((dst_pred_class == PredictionElement.POINT_CLASS) and ('convert.point' in query_options)) \
+            or ((dst_pred_class == PredictionElement.MEAN_CLASS) and ('convert.mean' in query_options)) \
+            or ((dst_pred_class == PredictionElement.MEDIAN_CLASS) and ('convert.median' in query_options)) \
+            or ((dst_pred_class == PredictionElement.QUANTILE_CLASS) and ('convert.quantile' in query_options))
+
+
+def _generate_query_rows_yes_type_convert(conversions, forecast_model_id_to_obj, timezero_id_to_obj, unit_id_to_obj,
+                                          target_id_to_obj, timezero_to_season_name, target_id_to_cats, query_options,
+                                          quantiles=None, is_wide=False):
+    """
+    A _query_forecasts_for_project_yes_type_convert() helper that converts a batch of sample and named prediction
+    elements TO their dst_pred_class ("destination"), using _generate_query_rows_no_type_convert() for the final yield.
+    Elements are grouped so that each group is converted by a few vectorized numpy calls: samples by their number (so
+    that they stack into a 2-D array with one row per element) and named distributions by their family (so that their
+    params form 1-D arrays). Bin conversions are also grouped by target b/c they depend on its cats.
+
+    :param conversions: a list of 7-tuples: (fm_id, tz_id, unit_id, target_id, src_pred_class, dst_pred_class,
+        pred_data), each of which has passed _is_type_conversion()
+    :param quantiles: passed to _generate_query_rows_no_type_convert()
+    :param is_wide: ""
+    """
+    group_key_to_conversions = defaultdict(list)
+    for conversion in conversions:
+        _, _, _, target_id, src_pred_class, dst_pred_class, pred_data = conversion
+        group_key_to_conversions[(src_pred_class, dst_pred_class,
+                                  len(pred_data['sample']) if src_pred_class == PredictionElement.SAMPLE_CLASS
+                                  else pred_data['family'],
+                                  target_id if dst_pred_class == PredictionElement.BIN_CLASS else None)] \
+            .append(conversion)
+    for (src_pred_class, dst_pred_class, num_samples_or_family, target_id), group_conversions \
+            in group_key_to_conversions.items():
+        target_cats = target_id_to_cats.get(target_id)
+        if src_pred_class == PredictionElement.SAMPLE_CLASS:
+            num_values = num_samples_or_family
+        elif dst_pred_class == PredictionElement.SAMPLE_CLASS:
+            num_values = query_options['convert.sample']
+        else:
+            num_values = NAMED_CONVERSION_NUM_SAMPLES
+        chunk_size = max(1, MAX_CONVERSION_ARRAY_SIZE // num_values)
+        for chunk_start in range(0, len(group_conversions), chunk_size):
+            chunk_conversions = group_conversions[chunk_start:chunk_start + chunk_size]
+            pred_datas = [pred_data for _, _, _, _, _, _, pred_data in chunk_conversions]
+            if src_pred_class == PredictionElement.SAMPLE_CLASS:
+                out_pred_datas = _converted_samples(numpy.array([pred_data['sample'] for pred_data in pred_datas]),
+                                                    dst_pred_class, target_cats, query_options)
+            else:
+                out_pred_datas = _converted_named(num_samples_or_family,
+                                                  numpy.array([pred_data.get('param1') for pred_data in pred_datas],
+                                                              dtype=float),
+                                                  numpy.array([pred_data.get('param2', numpy.nan)
+                                                               for pred_data in pred_datas], dtype=float),
+                                                  dst_pred_class, target_cats, query_options)
+            for (fm_id, tz_id, unit_id, target_id, _, _, _), out_pred_data in zip(chunk_conversions, out_pred_datas):
+                yield from _generate_query_rows_no_type_convert(fm_id, tz_id, unit_id, target_id,
+                                                                forecast_model_id_to_obj, timezero_id_to_obj,
+                                                                unit_id_to_obj, target_id_to_obj,
+                                                                timezero_to_season_name, dst_pred_class, out_pred_data,
+                                                                quantiles, is_wide)
+
+
+def _converted_samples(samples_2d, dst_pred_class, target_cats, query_options, is_discrete=False):
+    """
+    _generate_query_rows_yes_type_convert() helper.
+
+    :param samples_2d: a 2-D numpy array with one row of samples per prediction element
+    :param target_cats: the elements' target's sorted cats. only needed for bin conversions
+    :param is_discrete: True if the samples are from a discrete named distribution, in which case quantiles are
+        chosen from the samples rather than interpolated between them
+    :return: a list of dst_pred_class prediction data dicts, one per row of samples_2d
+    """
+    if dst_pred_class == PredictionElement.BIN_CLASS:
+        return _binned_samples(samples_2d, target_cats)
+    elif dst_pred_class == PredictionElement.SAMPLE_CLASS:  # named -> sample
+        return [{"sample": samples} for samples in samples_2d.tolist()]
+    elif dst_pred_class == PredictionElement.QUANTILE_CLASS:
         quantiles = sorted(query_options['convert.quantile'])  # assume validated via `_validate_quantile_list()`
-        quant_value = numpy.quantile(samples, quantiles)
-        out_pred_data = {"quantile": quantiles, "value": quant_value}
+        quant_values = numpy.quantile(samples_2d, quantiles, axis=1,
+                                      method='inverted_cdf' if is_discrete else 'linear').T  # one row per element
+        return [{"quantile": quantiles, "value": values} for values in quant_values]
+
+    is_mean = (dst_pred_class == PredictionElement.MEAN_CLASS) \
+        or ((dst_pred_class == PredictionElement.POINT_CLASS) and (query_options['convert.point'] == 'mean'))
+    values = numpy.mean(samples_2d, axis=1) if is_mean else numpy.median(samples_2d, axis=1)
+    return [{"value": value} for value in values.tolist()]
+
+
+def _binned_samples(samples_2d, target_cats):
+    """
+    _converted_samples() helper that estimates bin probabilities from samples. Follows TargetLwr: cats are sorted bin
+    lower bounds, and each bin extends to the next one's, with the last bin extending to infinity. Samples below the
+    first cat are counted in the first bin so that probabilities sum to one. Zero-probability bins are omitted.
+
+    :return: a list of bin prediction data dicts, one per row of samples_2d
+    """
+    num_elements, num_samples, num_cats = samples_2d.shape[0], samples_2d.shape[1], len(target_cats)
+    bin_idxs = numpy.clip(numpy.searchsorted(target_cats, samples_2d, side='right') - 1, 0, num_cats - 1)
+    # count all elements' bins in one call by offsetting each element's bin indexes by its row
+    counts = numpy.bincount((bin_idxs + numpy.arange(num_elements)[:, numpy.newaxis] * num_cats).ravel(),
+                            minlength=num_elements * num_cats).reshape(num_elements, num_cats)
+    probs = counts / num_samples
+    out_pred_datas = []
+    for element_probs in probs.tolist():
+        cat_probs = [(cat, prob) for cat, prob in zip(target_cats, element_probs) if prob > 0]
+        out_pred_datas.append({"cat": [cat for cat, _ in cat_probs], "prob": [prob for _, prob in cat_probs]})
+    return out_pred_datas
+
+
+def _converted_named(family, param1s, param2s, dst_pred_class, target_cats, query_options):
+    """
+    _generate_query_rows_yes_type_convert() helper that converts elements of one named distribution family. Means are
+    always exact, as are norm and lnorm medians and quantiles (via the standard normal's inverse CDF). Everything else
+    is done by drawing samples from each element's distribution with a fixed seed (NAMED_CONVERSION_SEED) rather than
+    randomly, and passing them to _converted_samples(). Distribution parameters are as documented
+    at https://docs.zoltardata.com/ , with nbinom being (r, p) ala R's (size, prob), and nbinom2 being (mean, disp) with
+    variance = mean + disp * mean^2.
+
+    :param family: one of NamedData.FAMILY_CHOICES
+    :param param1s: a 1-D numpy array of the elements' param1s
+    :param param2s: "" param2s. nan for families that have no param2
+    :return: a list of dst_pred_class prediction data dicts, one per element
+    """
+    from utils.forecast import NamedData  # avoid circular imports
+
+
+    is_mean = (dst_pred_class == PredictionElement.MEAN_CLASS) \
+        or ((dst_pred_class == PredictionElement.POINT_CLASS) and (query_options['convert.point'] == 'mean'))
+    is_median = (dst_pred_class == PredictionElement.MEDIAN_CLASS) \
+        or ((dst_pred_class == PredictionElement.POINT_CLASS) and (query_options['convert.point'] == 'median'))
+    if is_mean:
+        return [{"value": value} for value in _named_means(family, param1s, param2s).tolist()]
+    elif (family in [NamedData.NORM_DIST, NamedData.LNORM_DIST]) \
+            and (is_median or (dst_pred_class == PredictionElement.QUANTILE_CLASS)):
+        quantiles = [0.5] if is_median else sorted(query_options['convert.quantile'])
+        std_norm = statistics.NormalDist()
+        z_scores = numpy.array([std_norm.inv_cdf(quantile) if 0 < quantile < 1
+                                else (-numpy.inf if quantile == 0 else numpy.inf) for quantile in quantiles])
+        quant_values = param1s[:, numpy.newaxis] + param2s[:, numpy.newaxis] * z_scores  # one row per element
+        if family == NamedData.LNORM_DIST:
+            quant_values = numpy.exp(quant_values)
+        return [{"value": values[0]} for values in quant_values.tolist()] if is_median \
+            else [{"quantile": quantiles, "value": values} for values in quant_values]
+
+    num_samples = query_options['convert.sample'] if dst_pred_class == PredictionElement.SAMPLE_CLASS \
+        else NAMED_CONVERSION_NUM_SAMPLES
+    samples_2d = _named_samples(family, param1s, param2s, num_samples, numpy.random.default_rng(NAMED_CONVERSION_SEED))
+    return _converted_samples(samples_2d, dst_pred_class, target_cats, query_options,
+                              is_discrete=family in [NamedData.POIS_DIST, NamedData.NBINOM_DIST,
+                                                     NamedData.NBINOM2_DIST])
+
+
+def _named_means(family, param1s, param2s):
+    """
+    :return: a 1-D numpy array of the means of family's distributions with the passed params. see _converted_named()
+    """
+    from utils.forecast import NamedData  # avoid circular imports
+
+
+    if family in [NamedData.NORM_DIST, NamedData.POIS_DIST, NamedData.NBINOM2_DIST]:
+        return param1s
+    elif family == NamedData.LNORM_DIST:
+        return numpy.exp(param1s + param2s ** 2 / 2)
+    elif family == NamedData.GAMMA_DIST:  # shape, rate
+        return param1s / param2s
+    elif family == NamedData.BETA_DIST:
+        return param1s / (param1s + param2s)
+    elif family == NamedData.NBINOM_DIST:  # r, p
+        return param1s * (1 - param2s) / param2s
+    else:
+        raise RuntimeError(f"invalid family: {family!r}")
+
 
-    if out_pred_data is not None:
-        yield from _generate_query_rows_no_type_convert(fm_id, tz_id, unit_id, target_id, forecast_model_id_to_obj,
-                                                        timezero_id_to_obj, unit_id_to_obj, target_id_to_obj,
-                                                        timezero_to_season_name, dst_pred_class, out_pred_data)
+def _named_samples(family, param1s, param2s, num_samples, rng):
+    """
+    :param rng: a numpy.random.Generator
+    :return: a 2-D numpy array with num_samples samples from each of family's distributions with the passed params, one
+        row per distribution. see _converted_named()
+    """
+    from utils.forecast import NamedData  # avoid circular imports
+
+
+    param1s, param2s = param1s[:, numpy.newaxis], param2s[:, numpy.newaxis]  # broadcast one row per distribution
+    size = (len(param1s), num_samples)
+    if family == NamedData.NORM_DIST:
+        return rng.normal(param1s, param2s, size)
+    elif family == NamedData.LNORM_DIST:
+        return rng.lognormal(param1s, param2s, size)
+    elif family == NamedData.GAMMA_DIST:  # shape, rate
+        return rng.gamma(param1s, 1 / param2s, size)
+    elif family == NamedData.BETA_DIST:
+        return rng.beta(param1s, param2s, size)
+    elif family == NamedData.POIS_DIST:
+        return rng.poisson(param1s, size)
+    elif family == NamedData.NBINOM_DIST:  # r, p
+        return rng.negative_binomial(param1s, param2s, size)
+    elif family == NamedData.NBINOM2_DIST:  # mean, disp -> r = 1 / disp, p = r / (r + mean)
+        return rng.negative_binomial(1 / param2s, 1 / (1 + param2s * param1s), size)
+    else:
+        raise RuntimeError(f"invalid family: {family!r}")
 
 
 #
@@ -681,7 +1300,7 @@ def _validate_query_ids(project, query):
         # look up Unit IDs corresponding to abbreviations. note that unit names are NOT currently enforced to be unique.
         # HOWEVER we do not check for multiple ones here b/c we anticipate enforcement will be added soon. thus we pick
         # an arbitrary one if there are duplicates
-        unit_abbrev_to_id = {unit.abbreviation: unit.id for unit in project.units.all()}
+        unit_abbrev_to_id = validation_context_for_project(project).unit_abbrev_to_id
         for unit_abbrev in unit_abbrevs:
             if unit_abbrev not in unit_abbrev_to_id:
                 error_messages.append(f"unit with name not found. abbreviation={unit_abbrev}, "
@@ -714,7 +1333,8 @@ def _validate_query_ids(project, query):
 
         # look up Target IDs corresponding to names. like Units, Target names are NOT currently enforced to be unique,
         # and are handled as above with Units
-        target_name_to_id = {target.name: target.id for target in project.targets.all()}
+        target_name_to_id = {target_name: target.pk for target_name, target
+                             in validation_context_for_project(project).target_name_to_target.items()}
         for target_name in target_names:
             if target_name not in target_name_to_id:
                 error_messages.append(f"target with name not found. name={target_name}, "
@@ -770,16 +1390,33 @@ def _forecasts_query_worker(job_pk):
 
 
 def _query_worker(job_pk, query_project_fcn):
+    job = get_object_or_404(Job, pk=job_pk)
+    try:
+        _run_query_job(job, query_project_fcn)
+    finally:
+        # give jobs that followed this one (identical queries submitted while it was in flight) the same results
+        try:
+            num_followers = complete_follower_jobs(job)
+            if num_followers:
+                logger.debug(f"_query_worker(): completed {num_followers} follower jobs. job={job}")
+        except Exception as ex:
+            logger.error(f"_query_worker(): error completing follower jobs: {ex!r}. job={job}")
+
+
+def _run_query_job(job, query_project_fcn):
+    """
+    _query_worker() helper that runs job's query and uploads the results, setting job's status.
+    """
     # imported here so that tests can patch via mock:
-    from utils.cloud_file import upload_file
+    from utils.cloud_file import upload_stream
 
 
     # run the query
-    job = get_object_or_404(Job, pk=job_pk)
     project = get_object_or_404(Project, pk=job.input_json['project_pk'])
     query = job.input_json['query']
+    data_version = project.data_version  # read before querying. see store_query_cache_entry()
     try:
-        logger.debug(f"_query_worker(): 1/4 querying rows. query={query}. job={job}")
+        logger.debug(f"_query_worker(): 1/3 querying rows. query={query}. job={job}")
         # use a transaction to set the scope of the postgres `statement_timeout` parameter. statement_timeout raises
         # this error: django.db.utils.OperationalError ('canceling statement due to statement timeout'). Similarly,
         # idle_in_transaction_session_timeout raises django.db.utils.InternalError . todo does not consistently work!
@@ -803,41 +1440,43 @@ def _query_worker(job_pk, query_project_fcn):
         logger.error(job.failure_message + f". job={job}")
         return
 
-    # upload the file to cloud storage
+    # stream the rows to cloud storage. rows is a generator, so this is also where the query is actually executed.
+    # upload_stream() uploads the file in fixed-size parts as the rows are generated and written in the query's output
+    # format (see write_query_rows()), so memory use does not depend on the number of rows. the file is gzipped unless
+    # it's parquet, which is already compressed. output_json['content_encoding'] records this for downloads
     try:
-        # we need a BytesIO for upload_file() (o/w it errors: "Unicode-objects must be encoded before hashing"), but
-        # writerows() needs a StringIO (o/w "a bytes-like object is required, not 'str'" error), so we use
-        # TextIOWrapper. BUT: https://docs.python.org/3.6/library/io.html#io.TextIOWrapper :
-        #     Text I/O over a binary storage (such as a file) is significantly slower than binary I/O over the same
-        #     storage, because it requires conversions between unicode and binary data using a character codec. This can
-        #     become noticeable handling huge amounts of text data like large log files.
-
-        # note: using a context is required o/w is closed and becomes unusable:
-        # per https://stackoverflow.com/questions/59079354/how-to-write-utf-8-csv-into-bytesio-in-python3 :
-        with io.BytesIO() as bytes_io:
-            logger.debug(f"_query_worker(): 2/4 writing rows. job={job}")
-            text_io_wrapper = io.TextIOWrapper(bytes_io, 'utf-8', newline='')
-            rows = IterCounter(rows)
-            csv.writer(text_io_wrapper).writerows(rows)
-            text_io_wrapper.flush()
-            bytes_io.seek(0)
-
-            logger.debug(f"_query_worker(): 3/4 uploading file. job={job}")
-            upload_file(job, bytes_io)  # might raise S3 exception
-            job.output_json = {'num_rows': rows.count}
-            job.status = Job.SUCCESS
-            job.save()
-            logger.debug(f"_query_worker(): 4/4 done. job={job}")
+        output_format = query_output_format(query)
+        gzip_level = 0 if output_format == OUTPUT_FORMAT_PARQUET else QUERY_GZIP_LEVEL
+        logger.debug(f"_query_worker(): 2/3 writing and uploading rows. output_format={output_format}, "
+                     f"gzip_level={gzip_level}, job={job}")
+        rows = IterCounter(rows)
+        with upload_stream(job, gzip_level=gzip_level) as stream:  # might raise S3 exception
+            write_query_rows(stream, rows, output_format)
+        job.output_json = {**(job.output_json or {}), 'num_rows': rows.count}  # keep 'query_cache', if any
+        if gzip_level:
+            job.output_json['content_encoding'] = 'gzip'
+        job.status = Job.SUCCESS
+        job.save()
+        logger.debug(f"_query_worker(): 3/3 done. num_parts={stream.num_parts}, num_bytes={stream.num_bytes}. "
+                     f"job={job}")
     except (BotoCoreError, Boto3Error, ClientError, ConnectionClosedError) as aws_exc:
         job.status = Job.FAILED
         job.failure_message = f"_query_worker(): error: {aws_exc!r}"
         job.save()
         logger.error(job.failure_message + f". job={job}")
+        return
     except Exception as ex:
         job.status = Job.FAILED
         job.failure_message = f"_query_worker(): error: {ex!r}"
         logger.error(job.failure_message + f". job={job}")
         job.save()
+        return
+
+    # make the results available to later jobs with the same query. failing to do so does not fail the job
+    try:
+        store_query_cache_entry(job, data_version, stream.num_bytes)
+    except Exception as ex:
+        logger.error(f"_query_worker(): error storing query cache entry: {ex!r}. job={job}")
 
 
 #
@@ -850,7 +1489,7 @@ def query_truth_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS):
     Returns a list of rows in a Zoltar-specific CSV row format. The columns are defined in TRUTH_CSV_HEADER, as detailed
     at https://docs.zoltardata.com/fileformats/#truth-data-format-csv .
 
-    `query` is documented at https://docs.zoltardata.com/, but briefly, it is a dict of up to four keys, three of which
+    `query` is documented at https://docs.zoltardata.com/, but briefly, it is a dict of up to five keys, three of which
     are lists of strings:
 
     - 'units': "" Unit.abbreviation strings
@@ -861,6 +1500,8 @@ def query_truth_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS):
     - 'as_of': Passing a datetime string in the optional as_of field causes the query to return only those forecast
         versions whose issued_at is <= the as_of datetime (AKA timestamp).
 
+    An optional fifth key, 'output_format', is as documented in query_forecasts_for_project().
+
     Note that _strings_ are passed to refer to object *contents*, not database IDs, which means validation will fail if
     the referred-to objects are not found. NB: If multiple objects are found with the same name then the program will
     arbitrarily choose one.
@@ -897,17 +1538,17 @@ def query_truth_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS):
     logger.debug(f"query_truth_for_project(): 2/3 executing sql. model_ids, unit_ids, target_ids, timezero_ids, "
                  f"as_of= {model_ids}, {unit_ids}, {target_ids}, {timezero_ids}, {as_of}")
     num_rows = 0
-    with connection.cursor() as cursor:
+    with streaming_cursor() as cursor:
         cursor.execute(sql, (project.pk,))
-        for fm_id, tz_id, pred_class, unit_id, target_id, is_retract, pred_data in batched_rows(cursor):
+        for fm_id, tz_id, pred_class, unit_id, target_id, is_retract, pred_data, pred_data_packed \
+                in batched_rows(cursor):
             # we do not have to check is_retract b/c we pass `is_include_retract=False`, which skips retractions
             num_rows += 1
             if num_rows > max_num_rows:
                 raise RuntimeError(f"number of rows exceeded maximum. num_rows={num_rows}, "
                                    f"max_num_rows={max_num_rows}")
 
-            # counterintuitively must use json.loads per https://code.djangoproject.com/ticket/31991
-            pred_data = json.loads(pred_data)
+            pred_data = _decoded_pred_data(pred_data, pred_data_packed)
             tz_date = timezero_id_to_obj[tz_id].timezero_date.strftime(YYYY_MM_DD_DATE_FORMAT)
             yield [tz_date, unit_id_to_obj[unit_id].abbreviation, target_id_to_obj[target_id].name, pred_data['value']]
 
@@ -920,7 +1561,8 @@ def query_truth_for_project(project, query, max_num_rows=MAX_NUM_QUERY_ROWS):
 def validate_truth_query(project, query):
     """
     Validates `query` according to the parameters documented at https://docs.zoltardata.com/ . Nearly identical to
-    validate_forecasts_query() except only validates "units", "targets", "timezeros", and "as_of".
+    validate_forecasts_query() except only validates "units", "targets", "timezeros", "as_of", and
+    "output_format".
 
     :param project: as passed from `query_forecasts_for_project()`
     :param query: ""
@@ -936,7 +1578,7 @@ def validate_truth_query(project, query):
 
     # validate keys
     actual_keys = set(query.keys())
-    expected_keys = {'units', 'targets', 'timezeros', 'as_of'}
+    expected_keys = {'units', 'targets', 'timezeros', 'as_of', 'output_format'}
     if not (actual_keys <= expected_keys):
         error_messages.append(f"one or more query keys were invalid. query={query}, actual_keys={actual_keys}, "
                               f"expected_keys={expected_keys}")
@@ -949,6 +1591,12 @@ def validate_truth_query(project, query):
         error_messages.append(error_message)
         return [error_messages, (unit_ids, target_ids, timezero_ids, as_of)]
 
+    # validate output_format if passed
+    error_message = validate_output_format(query)
+    if error_message:
+        error_messages.append(error_message)
+        return [error_messages, (unit_ids, target_ids, timezero_ids, as_of)]
+
     # validate object IDs that strings refer to
     error_messages, (model_ids, unit_ids, target_ids, timezero_ids) = _validate_query_ids(project, query)
 
@@ -1,14 +1,16 @@
 import csv
 import datetime
 import io
+import json
 import logging
 from collections import defaultdict
 
 import dateutil
+import django
 from django.db import transaction, connection
 
-from forecast_app.models import PredictionElement
-from forecast_app.models.prediction_element import PRED_CLASS_INT_TO_NAME
+from forecast_app.models import PredictionElement, Project
+from forecast_app.models.project import update_project_data_version
 from utils.utilities import YYYY_MM_DD_DATE_FORMAT, batched_rows
 
 
@@ -103,7 +105,7 @@ def get_truth_data_preview(project):
     :return: view helper function that returns a preview of my truth data in the form of a table that's
         represented as a nested list of rows. each row: [timezero_date, unit_name, target_name, truth_value]
     """
-    from forecast_app.models import PredictionData  # avoid circular imports
+    from forecast_app.models import HashedPredictionData, PredictionData  # avoid circular imports
 
 
     oracle_model = oracle_model_for_project(project)
@@ -111,14 +113,17 @@ def get_truth_data_preview(project):
         return PredictionData.objects.none()
 
     # note: https://code.djangoproject.com/ticket/32483 sqlite3 json query bug -> we manually access field instead of
-    # using 'data__value'
-    pred_data_qs = PredictionData.objects \
-                       .filter(pred_ele__forecast__forecast_model=oracle_model) \
-                       .values_list('pred_ele__forecast__time_zero__timezero_date', 'pred_ele__unit__abbreviation',
-                                    'pred_ele__target__name',
-                                    'data')[:10]
-    return [(tz_date, unit__name, target__name, data['value'])
-            for tz_date, unit__name, target__name, data in pred_data_qs]
+    # using 'data__value'. data is None if it's a HashedPredictionData, which we then get via data_hash
+    pred_ele_rows = list(PredictionElement.objects
+                         .filter(forecast__forecast_model=oracle_model, is_retract=False)
+                         .values_list('forecast__time_zero__timezero_date', 'unit__abbreviation', 'target__name',
+                                      'data_hash', 'pred_data__data')[:10])
+    data_hash_to_data = dict(HashedPredictionData.objects
+                             .filter(data_hash__in=[data_hash for _, _, _, data_hash, data in pred_ele_rows
+                                                    if data is None])
+                             .values_list('data_hash', 'data'))
+    return [(tz_date, unit__name, target__name, (data if data is not None else data_hash_to_data[data_hash])['value'])
+            for tz_date, unit__name, target__name, data_hash, data in pred_ele_rows]
 
 
 #
@@ -195,85 +200,224 @@ def load_truth_data(project, truth_file_path_or_fp, file_name=None, is_convert_n
 @transaction.atomic
 def _load_truth_data(project, oracle_model, truth_file_fp, file_name, is_convert_na_none, issued_at):
     from forecast_app.models import Forecast  # avoid circular imports
-    from utils.forecast import load_predictions_from_json_io_dict  # ""
+    from utils.validation_context import validation_context_for_project  # ""
 
 
     # load, validate, and replace with objects and parsed values.
-    # rows: (timezero, unit, target, parsed_value) (first three are objects)
+    # rows: (timezero, unit_abbrev, target, parsed_value) (timezero is a TimeZero and target is a TargetInfo)
     logger.debug(f"_load_truth_data(): entered. calling _read_truth_data_rows()")
     rows, missing_time_zeros, missing_units, missing_targets = \
         _read_truth_data_rows(project, truth_file_fp, is_convert_na_none)
     if not rows:
         return 0, rows, missing_time_zeros, missing_units, missing_targets
 
-    # group rows by timezero and then create and load oracle Forecasts for each group, passing them as
-    # json_io_dicts. we leverage _load_truth_data_rows_for_forecast() by creating a json_io_dict for the truth data
-    # where each truth row becomes its own 'point' prediction element. notes:
-    # - these forecasts are identified as coming from the same truth file (aka "batch") via all forecasts setting the
-    #   same source and issued_at at the end
-    # - we collect "cannot load 100% duplicate data" RuntimeErrors so that we can count them at the end. the rule is
-    #   that there must be at least one oracle forecast that did not get that error
-    timezero_groups = defaultdict(list)
-    for timezero, unit, target, parsed_value in rows:
-        timezero_groups[timezero].append([unit, target, parsed_value])
-
-    source = file_name if file_name else ''
-    forecasts = []  # ones created
-    forecasts_100pct_dup = []  # ones that raised RuntimeError "cannot load 100% duplicate data"
-    logger.debug(f"_load_truth_data(): creating and loading {len(timezero_groups)} forecasts. source={source!r}")
-    for timezero, timezero_rows in timezero_groups.items():
-        forecast = Forecast.objects.create(forecast_model=oracle_model, source=source, time_zero=timezero,
-                                           notes=f"oracle forecast")
-        prediction_dicts = [{'unit': unit.abbreviation, 'target': target.name,
-                             'class': PRED_CLASS_INT_TO_NAME[PredictionElement.MODE_CLASS],
-                             'prediction': {
-                                 'value': parsed_value.strftime(YYYY_MM_DD_DATE_FORMAT)
-                                 if isinstance(parsed_value, datetime.date) else parsed_value}}
-                            for unit, target, parsed_value in timezero_rows]
-        try:
-            load_predictions_from_json_io_dict(forecast, {'meta': {}, 'predictions': prediction_dicts},
-                                               is_skip_validation=True, is_subset_allowed=True)  # NB: is_subset_allowed
-            forecasts.append(forecast)
-        except RuntimeError as rte:
-            # todo instead of testing for a string, load_predictions_from_json_io_dict() should raise an application-
-            # specific RuntimeError subclass
-            if rte.args[0].startswith('cannot load 100% duplicate data'):
-                forecasts_100pct_dup.append(forecast)
-            else:
-                raise rte
-
-    # delete duplicate forecasts
-    if forecasts_100pct_dup:
-        Forecast.objects.filter(id__in=[f.id for f in forecasts_100pct_dup]) \
-            .delete()
-
-    # error if all oracle forecasts were 100% duplicate data
-    if forecasts_100pct_dup and not forecasts:
-        raise RuntimeError(f"cannot load 100% duplicate data (all {len(forecasts_100pct_dup)} oracle forecasts were "
+    # load all rows at once rather than one oracle Forecast at a time. each truth row becomes its own 'mode' prediction
+    # element in the oracle Forecast for its timezero. we:
+    # - copy all rows into a temp table, keyed by timezero rather than by forecast
+    # - delete rows that duplicate existing truth for any timezero, in one statement
+    # - create one oracle Forecast for each timezero that has remaining rows, with the final source and issued_at. these
+    #   forecasts are identified as coming from the same truth file (aka "batch") via their shared source and issued_at
+    # - insert the remaining rows' PredictionElements and PredictionData for all of those forecasts at once
+    # the rule is that there must be at least one oracle forecast that is not 100% duplicate data. note that, like
+    # before, subsets of previous versions are allowed
+    validation_context = validation_context_for_project(project)
+    time_zero_ids = list({time_zero.pk: None for time_zero, _, _, _ in rows})  # unique and in file order
+    temp_table_name = 'truth_temp'
+    _create_truth_temp_table(temp_table_name)
+    _copy_truth_rows_to_temp_table(temp_table_name, _truth_temp_rows(oracle_model, validation_context, rows))
+    _delete_truth_temp_table_duplicates(oracle_model, temp_table_name)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT DISTINCT time_zero_id FROM {temp_table_name};")
+        new_time_zero_ids = {time_zero_id for time_zero_id, in cursor.fetchall()}
+    if not new_time_zero_ids:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {temp_table_name};")
+        raise RuntimeError(f"cannot load 100% duplicate data (all {len(time_zero_ids)} oracle forecasts were "
                            f"100% duplicate data)")
 
-    # set all issued_ats to be the same - this avoids an edge case where midnight is spanned and some are a day later.
-    # arbitrarily use the first forecast's issued_at
-    if forecasts:
-        # NB: parse() call matches issued_at validation in api_views.TruthDetail.post
-        issued_at = dateutil.parser.parse(issued_at) if issued_at is not None else forecasts[0].issued_at
-        logger.debug(f"_load_truth_data(): setting issued_ats to {issued_at}. # forecasts={len(forecasts)}, "
-                     f"# 100% dup data forecasts={len(forecasts_100pct_dup)}")
-        for forecast in forecasts:
-            forecast.issued_at = issued_at
-            forecast.save()
+    # validate the rule: "you cannot position a new forecast before any existing versions". we check it here b/c
+    # bulk_create() does not send the pre_save signal that Forecast.objects.create() would
+    # NB: parse() call matches issued_at validation in api_views.TruthDetail.post
+    issued_at = dateutil.parser.parse(issued_at) if issued_at is not None else django.utils.timezone.now()
+    newer_version = Forecast.objects.filter(forecast_model=oracle_model, time_zero_id__in=new_time_zero_ids,
+                                            issued_at__gt=issued_at) \
+        .order_by('issued_at') \
+        .first()
+    if newer_version:
+        raise RuntimeError(f"you cannot position a new forecast before any existing versions. issued_at={issued_at}, "
+                           f"earlier_version={newer_version}")
+
+    source = file_name if file_name else ''
+    logger.debug(f"_load_truth_data(): creating and loading {len(new_time_zero_ids)} forecasts. source={source!r}, "
+                 f"issued_at={issued_at}, # 100% dup data forecasts={len(time_zero_ids) - len(new_time_zero_ids)}")
+    forecasts = Forecast.objects.bulk_create(
+        [Forecast(forecast_model=oracle_model, source=source, time_zero_id=time_zero_id, issued_at=issued_at,
+                  notes=f"oracle forecast")
+         for time_zero_id in time_zero_ids if time_zero_id in new_time_zero_ids])
+    _insert_truth_temp_table(temp_table_name, [forecast.pk for forecast in forecasts],
+                             project.pred_data_storage == project.HASHED_PRED_DATA_STORAGE)
 
     logger.debug(f"_load_truth_data(): done")
     return len(rows), forecasts, missing_time_zeros, missing_units, missing_targets
 
 
+def _truth_temp_rows(oracle_model, validation_context, rows):
+    """
+    _load_truth_data() helper that converts rows to ones for _copy_truth_rows_to_temp_table().
+
+    :param oracle_model: the project's oracle ForecastModel
+    :param validation_context: the project's utils.validation_context.ValidationContext
+    :param rows: as returned by _read_truth_data_rows()
+    :return: a list of 6-tuples: (time_zero_id, unit_id, target_id, data_hash, legacy_data_hash, prediction_data_json)
+    """
+    from utils.forecast import _hashes_for_prediction_data  # avoid circular imports
+
+
+    # legacy hashes are only needed if some existing truth was hashed before hash_version existed
+    is_legacy_hash = PredictionElement.objects.filter(forecast__forecast_model=oracle_model, is_retract=False) \
+        .exclude(hash_version=PredictionElement.CURRENT_HASH_VERSION) \
+        .exists()
+    truth_temp_rows = []
+    for time_zero, unit_abbrev, target, parsed_value in rows:
+        prediction_data = {'value': parsed_value.strftime(YYYY_MM_DD_DATE_FORMAT)
+                           if isinstance(parsed_value, datetime.date) else parsed_value}
+        data_hash, legacy_data_hash = _hashes_for_prediction_data(prediction_data, is_legacy_hash)
+        truth_temp_rows.append((time_zero.pk, validation_context.unit_abbrev_to_id[unit_abbrev], target.pk, data_hash,
+                                legacy_data_hash, json.dumps(prediction_data)))
+    return truth_temp_rows
+
+
+def _create_truth_temp_table(temp_table_name):
+    """
+    _load_truth_data() helper that (re)creates an empty temp table of truth rows. data is serialized prediction data
+    json.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {temp_table_name};")
+        cursor.execute(f"CREATE TEMP TABLE {temp_table_name} (time_zero_id INTEGER, unit_id INTEGER, "
+                       f"target_id INTEGER, data_hash VARCHAR(32), legacy_data_hash VARCHAR(32), data TEXT);")
+
+
+def _copy_truth_rows_to_temp_table(temp_table_name, rows):
+    """
+    _load_truth_data() helper that bulk-inserts rows into temp_table_name. See utils.forecast._insert_pred_data_rows()
+    re: postgres COPY quoting.
+
+    :param temp_table_name: as created by _create_truth_temp_table()
+    :param rows: as returned by _truth_temp_rows()
+    """
+    column_names = 'time_zero_id, unit_id, target_id, data_hash, legacy_data_hash, data'
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            string_io = io.StringIO()
+            csv_writer = csv.writer(string_io, quotechar=chr(1), delimiter=chr(2))
+            csv_writer.writerows(rows)
+            string_io.seek(0)
+            sql = f"""
+                COPY {temp_table_name}({column_names}) FROM STDIN WITH CSV QUOTE e'\x01' DELIMITER e'\x02';
+            """
+            cursor.copy_expert(sql, string_io)
+        else:  # 'sqlite', etc.
+            sql = f"""
+                    INSERT INTO {temp_table_name} ({column_names})
+                    VALUES (%s, %s, %s, %s, %s, %s);
+                    """
+            cursor.executemany(sql, rows)
+
+
+def _delete_truth_temp_table_duplicates(oracle_model, temp_table_name):
+    """
+    _load_truth_data() helper that deletes rows from temp_table_name that duplicate existing truth for the same
+    timezero. Like utils.dedup_index.DedupIndex, existing rows are compared using the hash that matches
+    their hash_version, and rows are skipped if they exist in /any/ version.
+    """
+    from forecast_app.models import Forecast  # avoid circular imports
+
+
+    sql = f"""
+        DELETE
+        FROM {temp_table_name}
+        WHERE EXISTS(SELECT *
+                     FROM {PredictionElement._meta.db_table} AS pred_ele
+                              JOIN {Forecast._meta.db_table} AS f ON pred_ele.forecast_id = f.id
+                     WHERE f.forecast_model_id = %s
+                       AND f.time_zero_id = {temp_table_name}.time_zero_id
+                       AND pred_ele.pred_class = %s
+                       AND pred_ele.unit_id = {temp_table_name}.unit_id
+                       AND pred_ele.target_id = {temp_table_name}.target_id
+                       AND NOT pred_ele.is_retract
+                       AND ((pred_ele.hash_version = %s AND {temp_table_name}.data_hash = pred_ele.data_hash)
+                           OR (pred_ele.hash_version = %s
+                               AND {temp_table_name}.legacy_data_hash = pred_ele.data_hash)));
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (oracle_model.pk, PredictionElement.MODE_CLASS, PredictionElement.CURRENT_HASH_VERSION,
+                             PredictionElement.MD5_JSON_HASH_VERSION))
+
+
+def _insert_truth_temp_table(temp_table_name, forecast_ids, is_hashed_pred_data):
+    """
+    _load_truth_data() helper that inserts temp_table_name's rows into the PredictionElement and PredictionData (or
+    HashedPredictionData) tables for the new oracle forecasts, joining on their timezeros, and updates
+    PredictionElement.valid_to and LatestPredictionElement. Drops temp_table_name when done.
+
+    :param forecast_ids: the new oracle Forecasts' ids. there is one per timezero in temp_table_name
+    :param is_hashed_pred_data: True if the project uses Project.HASHED_PRED_DATA_STORAGE
+    """
+    from forecast_app.models import Forecast, PredictionData  # avoid circular imports
+    from utils.forecast import _insert_hashed_pred_data_temp_table, _update_latest_pred_eles, \
+        _update_forecasts_pred_ele_valid_tos  # ""
+
+
+    pred_ele_table_name = PredictionElement._meta.db_table
+    forecast_ids_percent_s = ', '.join(['%s'] * len(forecast_ids))
+    sql = f"""
+        INSERT INTO {pred_ele_table_name} (forecast_id, pred_class, unit_id, target_id, is_retract, data_hash,
+                                           hash_version)
+        SELECT f.id, %s, {temp_table_name}.unit_id, {temp_table_name}.target_id, %s, {temp_table_name}.data_hash, %s
+        FROM {temp_table_name}
+                 JOIN {Forecast._meta.db_table} AS f ON f.time_zero_id = {temp_table_name}.time_zero_id
+        WHERE f.id IN ({forecast_ids_percent_s});
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [PredictionElement.MODE_CLASS, False, PredictionElement.CURRENT_HASH_VERSION]
+                       + forecast_ids)
+    _update_forecasts_pred_ele_valid_tos(forecast_ids)
+    _update_latest_pred_eles(forecast_ids)
+    update_project_data_version(Project.objects.filter(models__forecasts__id__in=forecast_ids))
+
+    # the same as load_predictions_from_prediction_dicts(): join the new PredictionElements to their data via data_hash
+    if is_hashed_pred_data:
+        _insert_hashed_pred_data_temp_table(temp_table_name, is_packed_column=False)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {temp_table_name};")
+        return
+
+    data_column = f"{temp_table_name}.data::jsonb" if connection.vendor == 'postgresql' else f"{temp_table_name}.data"
+    sql = f"""
+        INSERT INTO {PredictionData._meta.db_table} (pred_ele_id, data)
+        SELECT pred_ele.id, {data_column}
+        FROM {pred_ele_table_name} AS pred_ele
+                 JOIN (SELECT data_hash, MIN(data) AS data
+                       FROM {temp_table_name}
+                       GROUP BY data_hash) AS {temp_table_name}
+                      ON pred_ele.data_hash = {temp_table_name}.data_hash
+        WHERE pred_ele.forecast_id IN ({forecast_ids_percent_s});
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, forecast_ids)
+        cursor.execute(f"DROP TABLE IF EXISTS {temp_table_name};")
+
+
 def _read_truth_data_rows(project, csv_file_fp, is_convert_na_none):
     """
     Similar to _cleaned_rows_from_cdc_csv_file(), loads, validates, and cleans the rows in csv_file_fp.
 
-    :return: a list of 4-tuples: (timezero, unit, target, parsed_value) (first three are objects)
+    :return: a list of 4-tuples: (timezero, unit_abbrev, target, parsed_value) (timezero is a TimeZero and target is
+        a utils.validation_context.TargetInfo)
     """
     from forecast_app.models import Target  # avoid circular imports
+    from utils.validation_context import validation_context_for_project  # ""
 
 
     csv_reader = csv.reader(csv_file_fp, delimiter=',')
@@ -296,11 +440,12 @@ def _read_truth_data_rows(project, csv_file_fp, is_convert_na_none):
     unit_to_missing_count = defaultdict(int)
     target_to_missing_count = defaultdict(int)
 
-    unit_abbrev_to_obj = {unit.abbreviation: unit for unit in project.units.all()}
-    target_name_to_obj = {target.name: target for target in project.targets.all()}
-    timezero_date_to_obj = {}  # caches Project.time_zero_for_timezero_date()
-    target_to_cats_values = {}  # caches Target.cats_values()
-    range_to_range_tuple = {}  # caches Target.range_tuple()
+    validation_context = validation_context_for_project(project)
+    timezero_date_to_obj = {}  # caches the timezero_date str lookups below
+    date_to_time_zero = {}  # project's TimeZeros in one query. same "first" rule as time_zero_for_timezero_date()
+    for time_zero in project.timezeros.order_by('id'):
+        date_to_time_zero.setdefault(time_zero.timezero_date, time_zero)
+    target_to_range_tuple = {}  # caches implicit ranges
     for row in csv_reader:
         if len(row) != 4:
             raise RuntimeError("Invalid row (wasn't 4 columns): {!r}".format(row))
@@ -311,8 +456,8 @@ def _read_truth_data_rows(project, csv_file_fp, is_convert_na_none):
         if timezero_date in timezero_date_to_obj:
             time_zero = timezero_date_to_obj[timezero_date]
         else:
-            time_zero = project.time_zero_for_timezero_date(datetime.datetime.strptime(
-                timezero_date, YYYY_MM_DD_DATE_FORMAT))  # might be None
+            time_zero = date_to_time_zero.get(datetime.datetime.strptime(
+                timezero_date, YYYY_MM_DD_DATE_FORMAT).date())  # might be None
             timezero_date_to_obj[timezero_date] = time_zero
 
         if not time_zero:
@@ -320,18 +465,18 @@ def _read_truth_data_rows(project, csv_file_fp, is_convert_na_none):
             continue
 
         # validate unit and target
-        if unit_abbrev not in unit_abbrev_to_obj:
+        if unit_abbrev not in validation_context.unit_abbrev_to_id:
             unit_to_missing_count[unit_abbrev] += 1
             continue
 
-        if target_name not in target_name_to_obj:
+        if target_name not in validation_context.target_name_to_target:
             target_to_missing_count[target_name] += 1
             continue
 
         # validate `value`. note that at this point value is a str, so we ask
         # Target.is_value_compatible_with_target_type needs to try converting to the correct data type
-        target = target_name_to_obj[target_name]
-        data_types = target.data_types()  # python types. recall the first is the preferred one
+        target = validation_context.target_name_to_target[target_name]
+        data_types = Target.data_types_for_target_type(target.type)  # python types. the first is the preferred one
         is_compatible, parsed_value = Target.is_value_compatible_with_target_type(target.type, value, is_coerce=True,
                                                                                   is_convert_na_none=is_convert_na_none)
         if not is_compatible:
@@ -343,17 +488,12 @@ def _read_truth_data_rows(project, csv_file_fp, is_convert_na_none):
         #   within the `range` of valid values for the target. If `cats` is specified but `range` is not, then there is
         #   an implicit range for the ground truth value, and that is between min(`cats`) and \infty.
         # recall: "The range is assumed to be inclusive on the lower bound and open on the upper bound, # e.g. [a, b)."
-        if target in target_to_cats_values:
-            cats_values = target_to_cats_values[target]
-        else:
-            cats_values = target.cats_values()  # datetime.date instances for date targets
-            target_to_cats_values[target] = cats_values
-
-        if target in range_to_range_tuple:
-            range_tuple = range_to_range_tuple[target]
+        cats_values = target.cats  # datetime.date instances for date targets
+        if target.pk in target_to_range_tuple:
+            range_tuple = target_to_range_tuple[target.pk]
         else:
-            range_tuple = target.range_tuple() or (min(cats_values), float('inf')) if cats_values else None
-            range_to_range_tuple[target] = range_tuple
+            range_tuple = target.range or (min(cats_values), float('inf')) if cats_values else None
+            target_to_range_tuple[target.pk] = range_tuple
 
         if (target.type in [Target.DISCRETE_TARGET_TYPE, Target.CONTINUOUS_TARGET_TYPE]) and range_tuple \
                 and (parsed_value is not None) and not (range_tuple[0] <= parsed_value < range_tuple[1]):
@@ -364,7 +504,6 @@ def _read_truth_data_rows(project, csv_file_fp, is_convert_na_none):
         # validate: For `nominal` and `date` target_types:
         #  - The entry in the `cat` column for a specific `target`-`unit`-`timezero` combination must be contained
         #    within the set of valid values for the target, as defined by the project config file.
-        cats_values = set(cats_values)  # datetime.date instances for date targets
         if (target.type in [Target.NOMINAL_TARGET_TYPE, Target.DATE_TARGET_TYPE]) and cats_values \
                 and (parsed_value not in cats_values):
             raise RuntimeError(f"The entry in the `cat` column for a specific `target`-`unit`-`timezero` "
@@ -372,7 +511,7 @@ def _read_truth_data_rows(project, csv_file_fp, is_convert_na_none):
                                f"parsed_value={parsed_value}, cats_values={cats_values}")
 
         # valid
-        rows.append((time_zero, unit_abbrev_to_obj[unit_abbrev], target, parsed_value))
+        rows.append((time_zero, unit_abbrev, target, parsed_value))
 
     # report warnings
     for time_zero, count in timezero_to_missing_count.items():
@@ -400,8 +539,8 @@ def truth_batches(project):
     """
     Returns a list of "batches" of truth uploads. We define a batch as all of the oracle Forecasts that originated from
     the same file. Recall that `load_truth_data()` breaks the incoming truth file into groups based on shared timezeros
-    and the loads each of those groups into its own oracle Forecast. Importantly, it finishes by setting all of the
-    Forecasts' `source` and `issued_at` values to be the same, thus implicitly creating a batch. This means batches are
+    and the loads each of those groups into its own oracle Forecast. Importantly, it creates all of the Forecasts with
+    the same `source` and `issued_at` values, thus implicitly creating a batch. This means batches are
     identified by grouping oracle Forecasts by what's effectively the composite primary key `(source, issued_at)`.
 
     :param project: the Project to get batches from
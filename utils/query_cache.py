@@ -0,0 +1,200 @@
+import datetime
+import hashlib
+import json
+import logging
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, When
+from django.utils import timezone
+
+from forecast_app.models import Job, Project, QueryCacheEntry
+from forecast_repo.settings.base import QUERY_CACHE_MAX_BYTES, QUERY_CACHE_MAX_ENTRIES
+from utils.query_output import OUTPUT_FORMAT_CSV, query_output_format
+
+
+logger = logging.getLogger(__name__)
+
+
+#
+# This file implements a cache of forecast and truth query results. A result is a query Job's cloud file, which is
+# reused by later Jobs for the same project and query as long as the project's data has not changed since it was
+# created. Jobs that hit the cache are completed immediately, without being enqueued, and point to the original Job
+# via output_json['artifact_job_pk'] (see Job.artifact_job()). The flow is:
+#
+# - api_views._query_endpoint() calls query_cache_key() on the validated query and then lookup_query_cache()
+# - on a miss, if an identical query is already in flight then follow_leader_job() makes the Job a follower of it rather
+#   than enqueuing it. o/w the Job is enqueued as the entry's new leader
+# - the enqueued Job has input_json['cache_key'] set, and _query_worker() calls store_query_cache_entry() when it
+#   succeeds, passing the Project.data_version it read before running the query. it then calls complete_follower_jobs()
+#   however it finished
+#
+
+# leaders older than this are assumed to have been lost (e.g., their worker was killed), and are no longer followed
+MAX_LEADER_JOB_AGE = datetime.timedelta(hours=1)
+
+
+def query_cache_key(query_job_type, validated_values, query):
+    """
+    Returns a canonical key for a validated query. Queries that differ only in ways that don't affect their results
+    have the same key, e.g., the order of their models or an as_of's timezone. NB: the key does not include the project,
+    or its data version - see lookup_query_cache().
+
+    :param query_job_type: JOB_TYPE_QUERY_FORECAST or JOB_TYPE_QUERY_TRUTH
+    :param validated_values: the second item returned by validate_forecasts_query() or validate_truth_query() for
+        `query`, i.e., a tuple of lists of ids plus an as_of
+    :param query: a valid forecast or truth query. only its 'options', 'quantiles', 'columns', 'wide', and
+        'output_format' are used
+    :return: a sha256 hex digest
+    """
+    canonical_values = []
+    for value in validated_values:
+        if isinstance(value, list):
+            canonical_values.append(sorted(set(value)))
+        elif isinstance(value, datetime.datetime):
+            canonical_values.append(value.astimezone(datetime.timezone.utc).isoformat())
+        else:
+            canonical_values.append(value)
+    canonical_query = {'type': query_job_type, 'values': canonical_values, 'options': query.get('options', {})}
+    if 'quantiles' in query:
+        canonical_query['quantiles'] = sorted(query['quantiles'])
+    if 'columns' in query:  # order matters
+        canonical_query['columns'] = query['columns']
+    if query.get('wide'):
+        canonical_query['wide'] = True
+    if query_output_format(query) != OUTPUT_FORMAT_CSV:  # the default, whether passed or not
+        canonical_query['output_format'] = query_output_format(query)
+    return hashlib.sha256(json.dumps(canonical_query, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def lookup_query_cache(project_pk, cache_key):
+    """
+    Looks up cache_key in project_pk's entries, counting the lookup as a hit or miss.
+
+    :param project_pk: a Project's pk
+    :param cache_key: as returned by query_cache_key()
+    :return: a 2-tuple: (is_hit, entry) where entry is cache_key's QueryCacheEntry, which is created if necessary.
+        entry's job is the one to use if is_hit. returns (False, None) if the cache is disabled
+    """
+    if not QUERY_CACHE_MAX_ENTRIES:
+        return False, None
+
+    data_version = Project.objects.filter(pk=project_pk).values_list('data_version', flat=True).first()
+    entry, _ = QueryCacheEntry.objects.get_or_create(project_id=project_pk, cache_key=cache_key)
+    is_hit = (entry.job_id is not None) and (entry.data_version == data_version)
+    counter_name = 'num_hits' if is_hit else 'num_misses'
+    QueryCacheEntry.objects.filter(pk=entry.pk).update(**{counter_name: F(counter_name) + 1},
+                                                       last_used_at=timezone.now())
+    entry.refresh_from_db()
+    return is_hit, entry
+
+
+def query_cache_output_json(entry, is_hit):
+    """
+    :return: the 'query_cache' value of a query Job's output_json: its lookup's result and its entry's counts
+    """
+    return {'is_hit': is_hit, 'num_hits': entry.num_hits, 'num_misses': entry.num_misses}
+
+
+def follow_leader_job(entry, job):
+    """
+    Coalesces job with an identical query that is already in flight: if entry has a leader Job that is still queued or
+    running, and that was queued at the project's current data_version, then job becomes its follower by saving
+    Job.leader. O/w job becomes entry's new leader, and the caller should enqueue it. Locks entry so
+    that a follower can't be added after its leader has completed its followers (see complete_follower_jobs()).
+
+    :param entry: the QueryCacheEntry returned by lookup_query_cache() for job's cache_key
+    :param job: a saved query Job that missed the cache
+    :return: the leader Job that job is now following, or None if job is now the leader
+    """
+    data_version = Project.objects.filter(pk=entry.project_id).values_list('data_version', flat=True).first()
+    with transaction.atomic():
+        entry = QueryCacheEntry.objects.select_for_update().get(pk=entry.pk)
+        leader_job = entry.leader_job
+        if leader_job and (leader_job.status in [Job.PENDING, Job.QUEUED]) \
+                and (entry.leader_data_version == data_version) \
+                and (leader_job.created_at >= timezone.now() - MAX_LEADER_JOB_AGE):
+            job.leader = leader_job
+            job.save()
+            return leader_job
+
+        entry.leader_job = job
+        entry.leader_data_version = data_version
+        entry.save()
+        return None
+
+
+def complete_follower_jobs(leader_job):
+    """
+    Called when a query Job finishes, however it finished, to give its followers (see follow_leader_job()) the same
+    status and results: on success they point to leader_job's cloud file like a cache hit does.
+
+    :param leader_job: a query Job that has finished
+    :return: the number of completed followers
+    """
+    with transaction.atomic():
+        entry = QueryCacheEntry.objects.select_for_update() \
+            .filter(project_id=leader_job.input_json['project_pk'], cache_key=leader_job.input_json.get('cache_key'),
+                    leader_job=leader_job) \
+            .first()
+        if entry:  # no longer take followers
+            entry.leader_job = None
+            entry.save()
+        follower_jobs = list(leader_job.follower_jobs().filter(status__in=[Job.PENDING, Job.QUEUED]))
+
+    for follower_job in follower_jobs:
+        follower_job.status = leader_job.status
+        if leader_job.status == Job.SUCCESS:
+            follower_job.output_json = {**(follower_job.output_json or {}),
+                                        'num_rows': leader_job.output_json['num_rows'],
+                                        'artifact_job_pk': leader_job.pk}
+        else:
+            follower_job.failure_message = f"leader job {leader_job.pk} did not succeed: {leader_job.failure_message}"
+        follower_job.save()  # sends notifications, if any
+    return len(follower_jobs)
+
+
+def store_query_cache_entry(job, data_version, num_bytes):
+    """
+    Called when a query Job that missed the cache succeeds, to make it the result for its cache_key. Evicts entries as
+    needed afterward. Does nothing if job has no cache_key.
+
+    :param job: a successful query Job. its input_json has 'project_pk', and 'cache_key' if it was looked up
+    :param data_version: the Project.data_version that was read before running job's query. the entry is not a hit
+        if the project's data has changed since then, including while the query was running
+    :param num_bytes: the size of job's cloud file
+    """
+    if ('cache_key' not in job.input_json) or not QUERY_CACHE_MAX_ENTRIES:
+        return
+
+    QueryCacheEntry.objects.update_or_create(
+        project_id=job.input_json['project_pk'], cache_key=job.input_json['cache_key'],
+        defaults={'job': job, 'data_version': data_version, 'num_rows': job.output_json['num_rows'],
+                  'num_bytes': num_bytes, 'last_used_at': timezone.now()})
+    evict_query_cache_entries()
+
+
+def evict_query_cache_entries(max_entries=QUERY_CACHE_MAX_ENTRIES, max_bytes=QUERY_CACHE_MAX_BYTES):
+    """
+    Deletes QueryCacheEntries so that at most max_entries of them are left, with a total num_bytes of at most max_bytes.
+    Entries are kept in order of preference - current ones (whose data_version is still their project's) before stale
+    ones, and then most recently used first - skipping ones that don't fit. NB: Jobs' cloud files are not deleted -
+    they belong to their Jobs, which users can still download.
+
+    :return: the number of deleted entries
+    """
+    entry_pk_num_bytes = QueryCacheEntry.objects \
+        .annotate(is_current=Case(When(data_version=F('project__data_version'), then=1), default=0,
+                                  output_field=IntegerField())) \
+        .order_by('-is_current', '-last_used_at') \
+        .values_list('pk', 'num_bytes')
+    num_entries, total_bytes, evict_entry_pks = 0, 0, []
+    for entry_pk, num_bytes in entry_pk_num_bytes:
+        if (num_entries + 1 > max_entries) or (total_bytes + num_bytes > max_bytes):
+            evict_entry_pks.append(entry_pk)
+        else:
+            num_entries += 1
+            total_bytes += num_bytes
+    if evict_entry_pks:
+        logger.debug(f"evict_query_cache_entries(): evicting {len(evict_entry_pks)} entries")
+        QueryCacheEntry.objects.filter(pk__in=evict_entry_pks).delete()
+    return len(evict_entry_pks)
@@ -0,0 +1,131 @@
+import csv
+import json
+from itertools import islice
+
+
+#
+# This file implements the formats that forecast and truth query Jobs can write their results in. A query's optional
+# 'output_format' key selects one of OUTPUT_FORMATS, defaulting to CSV. All formats are written incrementally from the
+# query's row generator (see _run_query_job()), whose first row is the header:
+#
+# - 'csv': the query's sparse CSV, as documented at https://docs.zoltardata.com/fileformats/
+# - 'parquet' and 'arrow': Apache Parquet and Arrow IPC files. rows are written in row groups (record batches for Arrow)
+#   of OUTPUT_ROW_GROUP_SIZE rows. unused (empty) cells are nulls. columns in FLOAT_COLUMNS and wide forecast queries'
+#   quantile columns are float64, and the rest are strings, because e.g. 'value' and 'cat' hold different types for
+#   different targets
+# - 'ndjson': newline-delimited JSON, one object per row, keyed by column name. unused cells are omitted
+#
+
+OUTPUT_FORMAT_CSV = 'csv'
+OUTPUT_FORMAT_PARQUET = 'parquet'
+OUTPUT_FORMAT_ARROW = 'arrow'
+OUTPUT_FORMAT_NDJSON = 'ndjson'
+
+# maps each output format to a 2-tuple: (content_type, file_extension)
+OUTPUT_FORMATS = {
+    OUTPUT_FORMAT_CSV: ('text/csv', 'csv'),
+    OUTPUT_FORMAT_PARQUET: ('application/vnd.apache.parquet', 'parquet'),
+    OUTPUT_FORMAT_ARROW: ('application/vnd.apache.arrow.file', 'arrow'),
+    OUTPUT_FORMAT_NDJSON: ('application/x-ndjson', 'ndjson'),
+}
+
+OUTPUT_ROW_GROUP_SIZE = 100_000
+
+# columns that are always numeric when used. these are float64 columns in the columnar formats
+FLOAT_COLUMNS = {'prob', 'quantile', 'param1', 'param2', 'param3'}
+
+
+def validate_output_format(query):
+    """
+    :param query: a forecast or truth query dict
+    :return: an error message if query's 'output_format' (if any) is invalid, or None o/w
+    """
+    if ('output_format' in query) and (query['output_format'] not in OUTPUT_FORMATS):
+        return f"'output_format' was invalid. output_format={query['output_format']!r}, " \
+               f"valid formats={list(OUTPUT_FORMATS)}, query={query}"
+
+    return None
+
+
+def query_output_format(query):
+    """
+    :param query: a valid forecast or truth query dict
+    :return: query's output format, one of OUTPUT_FORMATS' keys
+    """
+    return query.get('output_format', OUTPUT_FORMAT_CSV)
+
+
+def write_query_rows(stream, rows, output_format):
+    """
+    Writes a query's rows to stream in output_format.
+
+    :param stream: a binary file-like object, e.g., an UploadStream
+    :param rows: an iterator of rows whose first row is the header, as returned by query_forecasts_for_project() and
+        query_truth_for_project()
+    :param output_format: one of OUTPUT_FORMATS' keys
+    """
+    if output_format == OUTPUT_FORMAT_CSV:
+        csv.writer(stream).writerows(rows)
+    elif output_format == OUTPUT_FORMAT_NDJSON:
+        _write_ndjson_rows(stream, rows)
+    elif output_format in [OUTPUT_FORMAT_PARQUET, OUTPUT_FORMAT_ARROW]:
+        _write_columnar_rows(stream, rows, output_format)
+    else:
+        raise RuntimeError(f"invalid output_format: {output_format!r}")
+
+
+def _write_ndjson_rows(stream, rows):
+    rows = iter(rows)
+    header = next(rows)
+    for row in rows:
+        stream.write(json.dumps({column: cell for column, cell in zip(header, row) if cell not in ('', None)},
+                                separators=(',', ':')) + '\n')
+
+
+def _write_columnar_rows(stream, rows, output_format):
+    # imported here so that only the workers that write these formats load pyarrow
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+
+    rows = iter(rows)
+    header = next(rows)
+    schema = pyarrow.schema([(column, pyarrow.float64() if _is_float_column(column) else pyarrow.string())
+                             for column in header])
+    is_parquet = output_format == OUTPUT_FORMAT_PARQUET
+    writer = pyarrow.parquet.ParquetWriter(stream, schema, compression='zstd') if is_parquet \
+        else pyarrow.ipc.new_file(stream, schema)
+    while True:
+        batch_rows = list(islice(rows, OUTPUT_ROW_GROUP_SIZE))
+        if not batch_rows:
+            break
+
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(_columnar_cells(cells, pyarrow.types.is_floating(field.type)), type=field.type)
+             for cells, field in zip(zip(*batch_rows), schema)], schema=schema)
+        if is_parquet:
+            writer.write_table(pyarrow.Table.from_batches([batch]))  # one row group
+        else:
+            writer.write_batch(batch)
+    writer.close()  # writes the file's footer. does not close stream
+
+
+def _is_float_column(column):
+    # a wide forecast query's quantile columns are named like 'q0.025' (see forecasts_query_header()). validation
+    # ensures that their values are numeric for the columnar formats
+    if column in FLOAT_COLUMNS:
+        return True
+
+    try:
+        return column.startswith('q') and (0 <= float(column[1:]) <= 1)
+    except ValueError:
+        return False
+
+
+def _columnar_cells(cells, is_float):
+    # returns cells as values for a float64 or string column: unused cells are nulls, and strings match the CSV's cells
+    if is_float:
+        return [None if cell in ('', None) else float(cell) for cell in cells]
+    else:
+        return [None if cell in ('', None) else str(cell) for cell in cells]
@@ -0,0 +1,76 @@
+import click
+import django
+import django_rq
+from django.db.models import Count
+from django.shortcuts import get_object_or_404
+
+
+# set up django. must be done before loading models. NB: requires DJANGO_SETTINGS_MODULE to be set
+django.setup()
+
+from utils.forecast import _rehash_forecast_worker, rehash_forecast
+
+from forecast_app.models import Forecast, PredictionElement, Project
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command(name="print")
+@click.option('--project-pk')
+def print_hash_versions(project_pk):
+    """
+    A subcommand that prints the number of prediction elements per PredictionElement.hash_version for one or all
+    projects. Runs in the calling thread and therefore blocks.
+
+    :param project_pk: if a valid Project pk then only that project is printed. o/w prints all
+    """
+    projects = [get_object_or_404(Project, pk=project_pk)] if project_pk else Project.objects.all()
+    hash_version_to_name = dict(PredictionElement.HASH_VERSION_CHOICES)
+    for project in projects:
+        hash_version_counts = PredictionElement.objects \
+            .filter(forecast__forecast_model__project=project) \
+            .values_list('hash_version') \
+            .annotate(count=Count('id')) \
+            .order_by('hash_version')
+        click.echo(f"* {project}: " + ', '.join([f"{hash_version_to_name.get(hash_version, '!?')}={count}"
+                                                  for hash_version, count in hash_version_counts]))
+
+
+@cli.command()
+@click.option('--project-pk')
+@click.option('--no-enqueue', is_flag=True, default=False)
+def update(project_pk, no_enqueue):
+    """
+    A subcommand that re-hashes the prediction elements of one or all projects' forecasts that are not hashed with
+    PredictionElement.CURRENT_HASH_VERSION. See `rehash_forecast()`.
+
+    :param project_pk: if a valid Project pk then only that project's forecasts are re-hashed. o/w re-hashes all
+    :param no_enqueue: controls whether the re-hash will be immediate in the calling thread (blocks), or enqueued for RQ
+    """
+    from forecast_repo.settings.base import REHASH_FORECAST_QUEUE_NAME  # avoid circular imports
+
+
+    queue = django_rq.get_queue(REHASH_FORECAST_QUEUE_NAME)
+    old_hash_versions = [hash_version for hash_version, _ in PredictionElement.HASH_VERSION_CHOICES
+                         if hash_version != PredictionElement.CURRENT_HASH_VERSION]
+    projects = [get_object_or_404(Project, pk=project_pk)] if project_pk else Project.objects.all()
+    click.echo("re-hashing forecasts")
+    for project in projects:
+        click.echo(f"* {project}")
+        forecasts = Forecast.objects \
+            .filter(forecast_model__project=project, pred_eles__hash_version__in=old_hash_versions) \
+            .distinct()
+        for forecast in forecasts:
+            if no_enqueue:
+                click.echo(f"- re-hashed {rehash_forecast(forecast)} prediction elements (no enqueue): {forecast}")
+            else:
+                click.echo(f"- enqueuing re-hash: {forecast}")
+                queue.enqueue(_rehash_forecast_worker, forecast.pk)
+    click.echo("update done")
+
+
+if __name__ == '__main__':
+    cli()
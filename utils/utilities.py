@@ -1,11 +1,14 @@
 import logging
 
+from django.db import connection
 from django.template import Template, Context
 
 
 logger = logging.getLogger(__name__)
 from django.contrib.auth.models import User
 
+from forecast_repo.settings.base import QUERY_CURSOR_ITERSIZE
+
 
 #
 # __str__()-related functions
@@ -96,16 +99,35 @@ def get_or_create_super_po_mo_users(is_create_super):
 # SQL utilities
 #
 
-# "chunk" size of rows to fetch. used by batched_rows(cursor). value from `chunk_size=2000`:
+# "chunk" size of rows to fetch. used by batched_rows(cursor). default value from `chunk_size=2000`:
 # https://docs.djangoproject.com/en/2.2/ref/models/querysets/#iterator
-SQL_ROWS_BATCH_SIZE = 2000
+SQL_ROWS_BATCH_SIZE = QUERY_CURSOR_ITERSIZE
+
+
+def streaming_cursor():
+    """
+    Returns a cursor whose query results are streamed from the database rather than transferred all at once when the
+    query is executed, which is what a default (client-side) psycopg2 cursor does. Use it for queries whose results can
+    be large, retrieving rows via batched_rows() - each batch is then one round trip to the database. For postgres it
+    is a server-side (named) cursor, the same as `QuerySet.iterator()` uses (so it honors DISABLE_SERVER_SIDE_CURSORS).
+    For other databases (e.g., sqlite for tests) it is a regular cursor. NB: a server-side cursor can only execute one
+    statement, and must be closed. Use it as a context manager, e.g.,
+
+        with streaming_cursor() as cursor:
+            cursor.execute(sql, params)
+            for row in batched_rows(cursor):
+                ...
+
+    :return: a cursor
+    """
+    return connection.chunked_cursor()
 
 
 def batched_rows(cursor):
     """
     Generator that retrieves rows from `cursor` in batches of size SQL_ROWS_BATCH_SIZE.
 
-    :param cursor: a cursor
+    :param cursor: a cursor, e.g., as returned by streaming_cursor()
     :return: next row from cursor
     """
     while True:
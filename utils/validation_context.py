@@ -0,0 +1,121 @@
+from collections import defaultdict, namedtuple
+
+from forecast_app.models import Project, Target, PredictionElement
+from forecast_app.models.prediction_element import PRED_CLASS_INT_TO_NAME
+from forecast_app.models.target import TargetCat, TargetRange
+
+
+#
+# ValidationContext
+#
+
+# the validation-related parts of a Target. cats is a frozenset of the target's cats_values() (datetime.date instances
+# for date targets), and range is its range_tuple() (None if it has no range)
+TargetInfo = namedtuple('TargetInfo', ['pk', 'name', 'type', 'cats', 'range'])
+
+# the prediction classes that are valid for each target type, per the table at
+# https://docs.zoltardata.com/targets/#valid-prediction-types-by-target-type . named ones are further limited by
+# family - see Target.is_valid_named_family_for_target_type()
+_TARGET_TYPE_TO_PRED_CLASSES = {
+    Target.CONTINUOUS_TARGET_TYPE: list(PRED_CLASS_INT_TO_NAME.keys()),
+    Target.DISCRETE_TARGET_TYPE: list(PRED_CLASS_INT_TO_NAME.keys()),
+    Target.NOMINAL_TARGET_TYPE: [PredictionElement.BIN_CLASS, PredictionElement.POINT_CLASS,
+                                 PredictionElement.SAMPLE_CLASS, PredictionElement.MODE_CLASS],
+    Target.BINARY_TARGET_TYPE: [PredictionElement.BIN_CLASS, PredictionElement.POINT_CLASS,
+                                PredictionElement.SAMPLE_CLASS, PredictionElement.MEDIAN_CLASS,
+                                PredictionElement.MODE_CLASS],
+    Target.DATE_TARGET_TYPE: [PredictionElement.BIN_CLASS, PredictionElement.POINT_CLASS,
+                              PredictionElement.SAMPLE_CLASS, PredictionElement.QUANTILE_CLASS,
+                              PredictionElement.MEAN_CLASS, PredictionElement.MEDIAN_CLASS,
+                              PredictionElement.MODE_CLASS],
+}
+
+
+class ValidationContext:
+    """
+    Holds the parts of a project's configuration that forecast, truth, and query validation need - unit abbreviations,
+    target names, types, cats, and ranges, and the prediction classes and named families that are allowed for its
+    target types - so that validators can look them up in memory rather than querying the database or recomputing them
+    once or more per prediction. Loading one takes a constant number of queries regardless of the number of
+    units and targets. Get instances via validation_context_for_project(), which caches them.
+    """
+
+
+    def __init__(self, project, config_version):
+        """
+        :param project: the Project to load
+        :param config_version: project's Project.config_version at the time of loading
+        """
+        self.project_pk = project.pk
+        self.config_version = config_version
+        self.unit_abbrev_to_id = dict(project.units.order_by('id').values_list('abbreviation', 'id'))
+
+        target_rows = list(project.targets.order_by('id').values_list('id', 'name', 'type'))
+        target_id_to_data_type = {target_id: Target.data_types_for_target_type(target_type)[0]  # the preferred one
+                                  for target_id, _, target_type in target_rows}
+        target_id_to_cats = defaultdict(set)
+        data_type_to_idx = {Target.INTEGER_DATA_TYPE: 0, Target.FLOAT_DATA_TYPE: 1, Target.TEXT_DATA_TYPE: 2,
+                            Target.DATE_DATA_TYPE: 3, Target.BOOLEAN_DATA_TYPE: 4}
+        for target_id, *cat_values in TargetCat.objects.filter(target__project=project) \
+                .values_list('target_id', 'cat_i', 'cat_f', 'cat_t', 'cat_d', 'cat_b'):
+            # same as Target.cats_values(): use only the field corresponding to the target's type
+            target_id_to_cats[target_id].add(cat_values[data_type_to_idx[target_id_to_data_type[target_id]]])
+
+        target_id_to_range_values = defaultdict(list)
+        for target_id, value_i, value_f in TargetRange.objects.filter(target__project=project) \
+                .order_by('id') \
+                .values_list('target_id', 'value_i', 'value_f'):
+            target_id_to_range_values[target_id].append(Target.first_non_none_value(value_i, value_f, None, None, None))
+
+        self.target_name_to_target = {}  # name -> TargetInfo
+        for target_id, name, target_type in target_rows:
+            range_values = target_id_to_range_values[target_id][:2]  # same as Target.range_tuple()
+            range_tuple = (min(range_values), max(range_values)) if range_values else None
+            self.target_name_to_target[name] = TargetInfo(target_id, name, target_type,
+                                                          frozenset(target_id_to_cats[target_id]), range_tuple)
+
+        # target type -> frozenset of allowed prediction class names and named family abbreviations. includes only the
+        # project's target types
+        from utils.forecast import NamedData  # avoid circular imports
+
+
+        target_types = {target_type for _, _, target_type in target_rows}
+        self.target_type_to_named_families = {
+            target_type: frozenset(family_abbrev for family_abbrev in NamedData.FAMILY_CHOICES
+                                   if Target.is_valid_named_family_for_target_type(family_abbrev, target_type))
+            for target_type in target_types}
+        self.target_type_to_pred_classes = {
+            target_type: frozenset(PRED_CLASS_INT_TO_NAME[pred_class]
+                                   for pred_class in _TARGET_TYPE_TO_PRED_CLASSES[target_type])
+            for target_type in target_types}
+
+
+    def __repr__(self):
+        return str((self.project_pk, self.config_version, len(self.unit_abbrev_to_id),
+                    len(self.target_name_to_target)))
+
+
+#
+# validation_context_for_project()
+#
+
+# the in-process cache used by validation_context_for_project(). maps Project.pk -> ValidationContext
+_PROJECT_ID_TO_VALIDATION_CONTEXT = {}
+
+
+def validation_context_for_project(project):
+    """
+    Returns a ValidationContext for project. Contexts are cached per process and are re-used as long as the project's
+    config_version is unchanged, which costs one query per call. Because config_version is stored in the database
+    (and is replaced by update_project_versions() whenever units, targets, cats, or ranges change), a cached context is
+    never used after its project's configuration was changed by this or any other process.
+
+    :param project: a Project
+    :return: a ValidationContext for project
+    """
+    config_version = Project.objects.filter(pk=project.pk).values_list('config_version', flat=True).first()
+    validation_context = _PROJECT_ID_TO_VALIDATION_CONTEXT.get(project.pk)
+    if (validation_context is None) or (validation_context.config_version != config_version):
+        validation_context = ValidationContext(project, config_version)
+        _PROJECT_ID_TO_VALIDATION_CONTEXT[project.pk] = validation_context
+    return validation_context
@@ -260,6 +260,10 @@ def _viz_truth_for_target_unit_ref_date(project, one_step_ahead_target, unit_abb
 # _viz_data_forecasts()
 #
 
+# the quantile levels that viz displays: the point prediction and 50% and 95% prediction intervals
+VIZ_QUANTILES = [0.025, 0.25, 0.5, 0.75, 0.975]
+
+
 def _viz_data_forecasts(project, target_key, unit_abbrev, reference_date):
     """
     args are as passed to viz_data()
@@ -306,7 +310,8 @@ def _viz_data_forecasts(project, target_key, unit_abbrev, reference_date):
              'units': [unit_abbrev],
              'targets': [target.name for target in targets],
              'timezeros': timezeros,
-             'types': ['quantile']}  # NB: no point, just quantile
+             'types': ['quantile'],  # NB: no point, just quantile
+             'quantiles': VIZ_QUANTILES}  # viz only wants five quantiles. todo xx generalize?
     rows = list(query_forecasts_for_project(project, query))  # `list` makes this much faster than without!
     rows.pop(0)  # header
 
@@ -333,11 +338,7 @@ def _viz_data_forecasts(project, target_key, unit_abbrev, reference_date):
 
             viz_dict[model]['target_end_date'].append(target_end_date)
             for _, _, _, _, _, _, value, _, _, _, quantile, _, _, _, _ in quantile_grouper:
-                quantile_key = f"q{quantile}"  # e.g., 'q0.025'
-                if quantile_key not in ["q0.025", "q0.25", "q0.5", "q0.75", "q0.975"]:
-                    continue  # viz only wants five quantiles. todo xx generalize?
-
-                viz_dict[model][quantile_key].append(value)
+                viz_dict[model][f"q{quantile}"].append(value)  # e.g., 'q0.025'
 
     return viz_dict
 